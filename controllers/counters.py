@@ -0,0 +1,123 @@
+"""
+High-rate counters and cheap packet classification for packet-in handlers
+
+ShardedCounter gives every thread (or greenlet, once eventlet has patched
+``threading``) its own shard, so incrementing takes no lock and never touches
+memory another thread writes. Readers add the shards up on demand, which is
+cheap because reads happen on a timer, not per packet. A finalizer on each
+thread's local marks its shard retired when the thread exits, and the next
+read folds the shard into a base count, so short-lived threads don't leave
+shards behind. The finalizer only appends to a list: it may run during
+garbage collection on a thread that holds the counter's lock.
+
+``classify`` looks only at the EtherType of a raw frame through a memoryview,
+so a packet-in can be counted by protocol without decoding the packet.
+"""
+
+import threading
+import weakref
+
+ETH_TYPE_8021Q = 0x8100
+ETH_TYPE_8021AD = 0x88a8
+ETH_TYPES = {
+    0x0800: 'ipv4',
+    0x86dd: 'ipv6',
+    0x0806: 'arp',
+    0x88cc: 'lldp',
+}
+
+
+def ethertype(data):
+    """EtherType of a raw Ethernet frame, looking past VLAN tags; None if truncated"""
+    view = memoryview(data)
+    offset = 12
+    while len(view) >= offset + 2:
+        value = view[offset] << 8 | view[offset + 1]
+        if value != ETH_TYPE_8021Q and value != ETH_TYPE_8021AD:
+            return value
+        offset += 4
+    return None
+
+
+def classify(data):
+    """Protocol name for a raw frame: ipv4, ipv6, arp, lldp, other or truncated"""
+    value = ethertype(data)
+    if value is None:
+        return 'truncated'
+    return ETH_TYPES.get(value, 'other')
+
+
+class ShardedCounter:
+    """Counter, optionally keyed, with one lock-free shard per thread.
+
+    ``set`` overwrites the total and bumps ``epoch``. Increments racing with a
+    ``set`` may land on either side of it.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = []
+        self._base = {}
+        self.epoch = 0
+
+    def _shard(self):
+        shard = {}
+        with self._lock:
+            self._fold()
+            self._shards.append(shard)
+        # Dropped with the thread's local when the thread exits
+        owner = _ShardOwner(shard)
+        weakref.finalize(owner, self._retired.append, shard)
+        self._local.owner = owner
+        return shard
+
+    def _fold(self):
+        """Move retired shards into the base count; call with the lock held"""
+        while self._retired:
+            shard = self._retired.pop()
+            for key, count in shard.items():
+                self._base[key] = self._base.get(key, 0) + count
+            self._shards.remove(shard)
+
+    def inc(self, n=1, key=None):
+        try:
+            shard = self._local.owner.shard
+        except AttributeError:
+            shard = self._shard()
+        shard[key] = shard.get(key, 0) + n
+
+    def values(self):
+        """``{key: total}`` merged over every shard"""
+        with self._lock:
+            self._fold()
+            totals = dict(self._base)
+            shards = list(self._shards)
+        for shard in shards:
+            # Copy first: the owning thread may add a key while we iterate
+            for key, count in shard.copy().items():
+                totals[key] = totals.get(key, 0) + count
+        return totals
+
+    def value(self, key=None):
+        return self.values().get(key, 0)
+
+    def total(self):
+        return sum(self.values().values())
+
+    def set(self, value, key=None):
+        """Overwrite the total for ``key``"""
+        with self._lock:
+            self._fold()
+            current = self._base.get(key, 0) + sum(shard.get(key, 0) for shard in self._shards)
+            self._base[key] = self._base.get(key, 0) + value - current
+        self.epoch += 1
+
+
+class _ShardOwner:
+    """Holds a thread's shard in its local; finalizing it retires the shard"""
+    __slots__ = ('shard', '__weakref__')
+
+    def __init__(self, shard):
+        self.shard = shard
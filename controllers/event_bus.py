@@ -0,0 +1,144 @@
+"""
+In-process event bus with Server-Sent Events fan-out
+
+Producers (flow table, monitors, topology) publish small change events. Each
+event is encoded to its SSE wire form once, at publish time, and kept in a
+bounded ring, so a change costs one encode however many clients are
+listening. A client stream just waits on a condition variable and writes the
+pre-encoded bytes of every event after the last one it has seen.
+
+Event ids are ``<instance>-<seq>``. A client reconnecting with
+``Last-Event-ID`` resumes right after that event. If the id belongs to
+another server process, or the ring no longer reaches back that far, the
+client gets a ``resync`` event and should re-read the full state.
+
+Every open stream holds a server thread, so ``open_stream`` admits at most
+``max_streams`` at once (None if full, for the server to answer 503) and
+ends each one after ``lifetime`` seconds. The stream's ``retry:`` line makes
+the browser reconnect with its ``Last-Event-ID`` and resume without loss,
+and the thread is free in between for other requests.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+
+HEARTBEAT_INTERVAL = 15.0
+STREAM_LIFETIME = 300.0
+
+
+class EventBus:
+    def __init__(self, log_size=10000, max_streams=None):
+        self.instance = os.urandom(4).hex()
+        self.seq = 0
+        self._log = deque(maxlen=log_size)
+        self._cond = threading.Condition()
+        self.published = 0
+        self.max_streams = max_streams
+        self.streams = 0
+        self.rejected = 0
+
+    def publish(self, kind, data):
+        with self._cond:
+            self.seq += 1
+            payload = json.dumps(data, separators=(',', ':'), default=str)
+            encoded = f"id: {self.instance}-{self.seq}\nevent: {kind}\ndata: {payload}\n\n".encode()
+            self._log.append((self.seq, encoded))
+            self.published += 1
+            self._cond.notify_all()
+        return self.seq
+
+    def parse_id(self, event_id):
+        """Sequence number of an event id from this process, else None"""
+        instance, _, seq = (event_id or '').rpartition('-')
+        if instance != self.instance or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def since(self, seq):
+        """Encoded events after ``seq``, or None if they are no longer all held"""
+        with self._cond:
+            return self._since(seq)
+
+    def _since(self, seq):
+        if seq >= self.seq:
+            return []
+        if not self._log or self._log[0][0] > seq + 1:
+            return None
+        start = seq + 1 - self._log[0][0]
+        return [self._log[i][1] for i in range(start, len(self._log))]
+
+    def wait(self, seq, timeout):
+        """Block until there are events after ``seq`` or ``timeout`` passes"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.seq > seq, timeout)
+            return self._since(seq)
+
+    def _control(self, kind, data):
+        return f"event: {kind}\ndata: {json.dumps(data)}\n\n".encode()
+
+    def open_stream(self, last_event_id=None, heartbeat=HEARTBEAT_INTERVAL, lifetime=STREAM_LIFETIME):
+        """A client stream that frees its slot when closed, or None when
+        ``max_streams`` are already open"""
+        with self._cond:
+            if self.max_streams is not None and self.streams >= self.max_streams:
+                self.rejected += 1
+                return None
+            self.streams += 1
+        return _Stream(self, self.stream(last_event_id, heartbeat, lifetime=lifetime))
+
+    def _release(self):
+        with self._cond:
+            self.streams -= 1
+
+    def stream(self, last_event_id=None, heartbeat=HEARTBEAT_INTERVAL, running=lambda: True, lifetime=None):
+        """Generator of SSE bytes for one client, ending after ``lifetime`` seconds"""
+        deadline = None if lifetime is None else time.monotonic() + lifetime
+        seq = self.parse_id(last_event_id) if last_event_id else None
+        if seq is None or self.since(seq) is None:
+            # New client, restarted server or a gap we cannot fill: start from now
+            seq = self.seq
+            kind = 'resync' if last_event_id else 'hello'
+            yield f"id: {self.instance}-{seq}\n".encode() + self._control(kind, {"seq": seq})
+        # Reconnect quickly after a dropped connection or the end of the lifetime
+        yield b"retry: 2000\n\n"
+        while running():
+            timeout = heartbeat
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.monotonic())
+                if timeout <= 0:
+                    return
+            events = self.wait(seq, timeout)
+            if events is None:
+                seq = self.seq
+                yield f"id: {self.instance}-{seq}\n".encode() + self._control('resync', {"seq": seq})
+                continue
+            if not events:
+                yield b": keepalive " + str(int(time.time())).encode() + b"\n\n"
+                continue
+            seq += len(events)
+            yield b''.join(events)
+
+
+class _Stream:
+    """Iterator over one client's SSE bytes; closing it (as the WSGI server
+    does when the response ends) gives its slot back to the bus"""
+
+    def __init__(self, bus, chunks):
+        self._bus = bus
+        self._chunks = chunks
+        self._open = True
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._chunks)
+
+    def close(self):
+        if self._open:
+            self._open = False
+            self._chunks.close()
+            self._bus._release()
@@ -0,0 +1,184 @@
+"""
+Filtered, paginated and projected queries over a FlowTable
+
+A query picks its candidates from the smallest matching table index (source
+prefix, destination prefix or priority) and filters the rest in one pass.
+Pages are keyset-paginated: the cursor carries the sort mode and the sort
+key of the last row returned (a cursor from another sort mode, or with a key
+of the wrong shape, is rejected with ValueError rather than compared), and
+the next page is the ``limit`` smallest keys after it, found with a bounded
+heap. A page therefore costs O(candidates * log limit) time and O(limit)
+memory, however large the table, and a cursor stays valid while flows are
+added and removed around it.
+
+``iter_json`` renders a page in chunks, so the response is written as it is
+produced rather than built up as one string.
+"""
+
+import base64
+import heapq
+import ipaddress
+import json
+import time
+
+from controllers.flow_table import ip_to_int
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 10000
+SORTS = ('id', 'traffic')
+# Types of the sort key elements, per sort mode
+_KEY_TYPES = {'id': (str,), 'traffic': (int, str)}
+FIELDS = ('src', 'dst', 'priority', 'demand_mbps', 'created_at', 'last_seen_packets', 'path')
+_CHUNK = 256
+
+
+def encode_cursor(sort, key):
+    data = json.dumps([sort] + key, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    """The sort key in ``cursor``; raises ValueError unless it was made for ``sort``"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("invalid cursor")
+    if not isinstance(data, list) or not data or data[0] not in SORTS:
+        raise ValueError("invalid cursor")
+    if data[0] != sort:
+        raise ValueError(f"cursor is for sort={data[0]}, not sort={sort}")
+    key, types = data[1:], _KEY_TYPES[sort]
+    if len(key) != len(types) or any(isinstance(v, bool) or not isinstance(v, t)
+                                     for v, t in zip(key, types)):
+        raise ValueError("invalid cursor")
+    return key
+
+
+def _number(args, name, cast=float):
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return cast(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number")
+
+
+class FlowQuery:
+    def __init__(self, src=None, dst=None, priority=None, min_age=None, max_age=None,
+                 min_packets=None, max_packets=None, fields=None, sort='id', limit=DEFAULT_LIMIT,
+                 cursor=None):
+        if sort not in SORTS:
+            raise ValueError(f"sort must be one of {', '.join(SORTS)}")
+        if not 1 <= limit <= MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+        unknown = set(fields or ()) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"unknown fields: {', '.join(sorted(unknown))}")
+        self.src = ipaddress.IPv4Network(src, strict=False) if src else None
+        self.dst = ipaddress.IPv4Network(dst, strict=False) if dst else None
+        self.priority = priority
+        self.min_age = min_age
+        self.max_age = max_age
+        self.min_packets = min_packets
+        self.max_packets = max_packets
+        self.fields = tuple(fields) if fields else FIELDS
+        self.sort = sort
+        self.limit = limit
+        self.after = decode_cursor(cursor, sort) if cursor else None
+
+    @classmethod
+    def from_args(cls, args):
+        """Build a query from request arguments; raises ValueError on bad input"""
+        fields = args.get('fields')
+        limit = _number(args, 'limit', int)
+        return cls(src=args.get('src'), dst=args.get('dst'),
+                   priority=_number(args, 'priority', int),
+                   min_age=_number(args, 'min_age'), max_age=_number(args, 'max_age'),
+                   min_packets=_number(args, 'min_packets', int),
+                   max_packets=_number(args, 'max_packets', int),
+                   fields=[f for f in fields.split(',') if f] if fields else None,
+                   sort=args.get('sort', 'id'),
+                   limit=DEFAULT_LIMIT if limit is None else limit,
+                   cursor=args.get('cursor'))
+
+    def _candidates(self, table):
+        """Records from the most selective index available, or the whole table"""
+        choices = []
+        if self.src is not None:
+            choices.append(table.by_src_prefix(str(self.src)))
+        if self.dst is not None:
+            choices.append(table.by_dst_prefix(str(self.dst)))
+        if self.priority is not None:
+            choices.append(table.by_priority(self.priority))
+        if choices:
+            return min(choices, key=len)
+        return table.snapshot().values()
+
+    def _matches(self, record, now):
+        if self.src is not None and not self._in(record.src, self.src):
+            return False
+        if self.dst is not None and not self._in(record.dst, self.dst):
+            return False
+        if self.priority is not None and record.priority != self.priority:
+            return False
+        if self.min_age is not None or self.max_age is not None:
+            if record.created_at is None:
+                return False
+            age = now - record.created_at
+            if self.min_age is not None and age < self.min_age:
+                return False
+            if self.max_age is not None and age > self.max_age:
+                return False
+        if self.min_packets is not None or self.max_packets is not None:
+            packets = record.last_seen_packets or 0
+            if self.min_packets is not None and packets < self.min_packets:
+                return False
+            if self.max_packets is not None and packets > self.max_packets:
+                return False
+        return True
+
+    @staticmethod
+    def _in(address, network):
+        return ip_to_int(address) & int(network.netmask) == int(network.network_address)
+
+    def sort_key(self, record):
+        if self.sort == 'traffic':
+            return [-(record.last_seen_packets or 0), record.flow_id]
+        return [record.flow_id]
+
+    def run(self, table, now=None):
+        """``(records, next_cursor)`` for one page; next_cursor is None on the last page"""
+        now = time.time() if now is None else now
+        after = self.after
+        key = self.sort_key
+        matches = self._candidates(table)
+        if any(v is not None for v in (self.src, self.dst, self.priority, self.min_age,
+                                        self.max_age, self.min_packets, self.max_packets)):
+            matches = (r for r in matches if self._matches(r, now))
+        if after is not None:
+            matches = (r for r in matches if key(r) > after)
+        page = heapq.nsmallest(self.limit + 1, matches, key=key)
+        next_cursor = None
+        if len(page) > self.limit:
+            page = page[:self.limit]
+            next_cursor = encode_cursor(self.sort, key(page[-1]))
+        return page, next_cursor
+
+    def project(self, record):
+        item = {"id": record.flow_id}
+        for field in self.fields:
+            value = getattr(record, field)
+            if value is not None:
+                item[field] = list(value) if field == 'path' else value
+        return item
+
+    def iter_json(self, page, next_cursor):
+        """Render a page as JSON in chunks"""
+        yield '{"flows":['
+        for start in range(0, len(page), _CHUNK):
+            chunk = ','.join(json.dumps(self.project(r), separators=(',', ':'))
+                             for r in page[start:start + _CHUNK])
+            yield chunk if start == 0 else ',' + chunk
+        yield f'],"count":{len(page)},"next_cursor":{json.dumps(next_cursor)}}}'
@@ -0,0 +1,221 @@
+"""
+Write-ahead log and snapshots for a FlowTable
+
+Every flow write is appended to a WAL segment as one JSON line holding the
+full record, so replaying a segment is idempotent. Lines carry the sequence
+number the table gave the write under its lock. Writers notify the store
+after releasing that lock and can arrive out of order, so a line is held
+back until every earlier one has been written, and replay applies each
+segment in sequence order. Once ``snapshot_every``
+writes have been logged, a background checkpoint starts a new segment,
+writes a compact snapshot of the table, and deletes the older snapshot and
+segments. Because the segment is switched before the table is copied, every
+write in an old segment is also in the snapshot. Writes logged to the new
+segment may already be in it, and replaying them just applies them again.
+
+Snapshots are column lists serialised with ``marshal``. Restoring loads the
+newest readable snapshot, replays the later segments into a plain dict, and
+hands the result to ``FlowTable.load`` in one step. The cyclic garbage
+collector is paused while the records are created, because otherwise it
+rescans them over and over. Index building is left to the table.
+
+WAL lines are flushed to the OS on every write, so they survive a controller
+crash. Pass ``sync=True`` to also fsync each write to survive power loss.
+"""
+
+import gc
+import json
+import logging
+import marshal
+import os
+import re
+import threading
+import time
+
+from controllers.flow_table import FlowRecord
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b'SDNFLOW1'
+SNAPSHOT_EVERY = 50000
+_SEGMENT = re.compile(r'^(wal|snapshot)-(\d{8})\.(log|bin)$')
+
+
+class FlowStore:
+    def __init__(self, directory, snapshot_every=SNAPSHOT_EVERY, sync=False):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.sync = sync
+        self.table = None
+        self.segment = 0
+        self.logged = 0
+        self.checkpoints = 0
+        self._wal = None
+        self._next_seq = 1
+        self._pending = {}
+        self._since_snapshot = 0
+        self._lock = threading.Lock()
+        self._checkpointing = False
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, kind, segment):
+        ext = 'log' if kind == 'wal' else 'bin'
+        return os.path.join(self.directory, f"{kind}-{segment:08d}.{ext}")
+
+    def _files(self, kind):
+        """``[(segment, path)]`` of snapshots or WAL segments, oldest first"""
+        found = []
+        for name in os.listdir(self.directory):
+            match = _SEGMENT.match(name)
+            if match and match.group(1) == kind:
+                found.append((int(match.group(2)), os.path.join(self.directory, name)))
+        return sorted(found)
+
+    # -- restore ------------------------------------------------------------
+
+    def restore(self, table):
+        """Load the persisted flows into ``table``; returns a summary dict"""
+        start = time.perf_counter()
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            flows, segment = self._load_snapshot()
+            replayed = self._replay(flows, segment)
+            count = table.load(flows)
+        finally:
+            if enabled:
+                gc.enable()
+        wal = self._files('wal')
+        self.segment = max([segment] + [s + 1 for s, _ in wal])
+        elapsed = time.perf_counter() - start
+        logger.info(f"Restored {count} flows (snapshot segment {segment}, "
+                    f"{replayed} WAL entries) in {elapsed * 1000:.0f} ms")
+        return {"flows": count, "snapshot_segment": segment, "wal_entries": replayed,
+                "seconds": elapsed}
+
+    def _load_snapshot(self):
+        for segment, path in reversed(self._files('snapshot')):
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                if not data.startswith(SNAPSHOT_MAGIC):
+                    raise ValueError("bad magic")
+                # marshal.load on a file object reads piecemeal and is many times slower
+                columns = marshal.loads(memoryview(data)[len(SNAPSHOT_MAGIC):])
+            except (OSError, ValueError, EOFError, TypeError) as e:
+                logger.warning(f"Skipping unreadable snapshot {path}: {e}")
+                continue
+            ids = columns[0]
+            return dict(zip(ids, map(FlowRecord, *columns))), segment
+        return {}, 0
+
+    def _replay(self, flows, segment):
+        replayed = 0
+        for number, path in self._files('wal'):
+            if number < segment:
+                continue
+            entries = []
+            with open(path, 'rb') as f:
+                for line_no, line in enumerate(f, 1):
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash mid-write; nothing after it is usable
+                        logger.warning(f"Stopping replay of {path} at line {line_no}: not valid JSON")
+                        break
+                    entries.append(entry)
+            entries.sort(key=lambda entry: entry[0])
+            for _, op, flow_id, data in entries:
+                if op == 'remove':
+                    flows.pop(flow_id, None)
+                else:
+                    flows[flow_id] = FlowRecord.from_dict(flow_id, data)
+                replayed += 1
+        return replayed
+
+    # -- logging ------------------------------------------------------------
+
+    def attach(self, table):
+        """Log every later write to ``table``; call after ``restore``"""
+        self.table = table
+        with self._lock:
+            self._open_segment(self.segment)
+            self._next_seq = table.sequence + 1
+            self._pending = {}
+        table.subscribe(self._log, sequenced=True)
+
+    def _open_segment(self, segment):
+        if self._wal is not None:
+            self._wal.close()
+        self.segment = segment
+        self._wal = open(self._path('wal', segment), 'ab')
+
+    def _log(self, seq, op, flow_id, record):
+        data = None if op == 'remove' else record.to_dict()
+        line = json.dumps([seq, op, flow_id, data], separators=(',', ':')).encode() + b'\n'
+        with self._lock:
+            if self._wal is None:
+                return
+            # Write only the unbroken run from the next sequence number
+            pending = self._pending
+            pending[seq] = line
+            written = 0
+            while self._next_seq in pending:
+                self._wal.write(pending.pop(self._next_seq))
+                self._next_seq += 1
+                written += 1
+            if not written:
+                return
+            self._wal.flush()
+            if self.sync:
+                os.fsync(self._wal.fileno())
+            self.logged += written
+            self._since_snapshot += written
+            start = self._since_snapshot >= self.snapshot_every and not self._checkpointing
+            if start:
+                self._checkpointing = True
+        if start:
+            threading.Thread(target=self.checkpoint, name="FlowStoreCheckpoint", daemon=True).start()
+
+    # -- checkpoints --------------------------------------------------------
+
+    def checkpoint(self):
+        """Snapshot the attached table and drop the WAL it makes redundant"""
+        try:
+            with self._lock:
+                segment = self.segment + 1
+                self._open_segment(segment)
+                self._since_snapshot = 0
+            # Taken after the switch: everything in older segments is in it
+            flows = self.table.snapshot()
+            self._write_snapshot(flows, segment)
+            for kind in ('snapshot', 'wal'):
+                for number, path in self._files(kind):
+                    if number < segment:
+                        os.remove(path)
+            self.checkpoints += 1
+            logger.info(f"Flow store checkpoint: {len(flows)} flows at segment {segment}")
+        finally:
+            with self._lock:
+                self._checkpointing = False
+
+    def _write_snapshot(self, flows, segment):
+        records = list(flows.values())
+        columns = [[r.flow_id for r in records], [r.src for r in records], [r.dst for r in records],
+                   [r.priority for r in records], [r.demand_mbps for r in records],
+                   [r.created_at for r in records], [r.last_seen_packets for r in records],
+                   [r.path for r in records], [r.extra for r in records]]
+        path = self._path('snapshot', segment)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(SNAPSHOT_MAGIC)
+            f.write(marshal.dumps(columns))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def close(self):
+        with self._lock:
+            if self._wal is not None:
+                self._wal.close()
+                self._wal = None
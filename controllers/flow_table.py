@@ -0,0 +1,388 @@
+"""
+Indexed, thread-safe flow table
+
+Flow records are immutable once stored: an update swaps in a new record, so a
+snapshot is a shallow copy of the id -> record mapping that stays consistent
+however the table changes afterwards. Writers serialise on one lock and keep
+secondary indexes by source prefix, destination prefix, priority and
+traversed link, so lookups such as "which flows cross switch1-switch2" cost
+O(matches) instead of a full scan. Subscribers are told about every write
+after the lock is released. Every change also gets a sequence number under
+the lock, for subscribers such as the write-ahead log that must see changes
+in the order they were applied even when writers race to notify them.
+Ordered subscribers get that order without handling sequence numbers: a
+change that reaches them early is held until the ones before it arrive.
+
+``load`` replaces the whole table in one step (used when restoring from
+disk) and defers building the indexes until something first needs them, so
+a restored table can serve gets and snapshots straight away.
+"""
+
+import ipaddress
+import socket
+import struct
+import threading
+from collections import defaultdict
+
+_FIELDS = ('src', 'dst', 'priority', 'demand_mbps', 'created_at', 'last_seen_packets', 'path')
+_FIELD_SET = frozenset(_FIELDS)
+
+# Many flows share a path: keep one links tuple per distinct path
+_PATH_LINKS = {}
+_PATH_LINKS_LIMIT = 1 << 16
+
+
+def ip_to_int(address):
+    return struct.unpack('!I', socket.inet_aton(address))[0]
+
+
+def link_key(a, b):
+    """Direction-independent key for the link between two switches"""
+    return (a, b) if a <= b else (b, a)
+
+
+def path_links(path):
+    links = _PATH_LINKS.get(path)
+    if links is None:
+        links = tuple(link_key(a, b) for a, b in zip(path, path[1:]))
+        if len(_PATH_LINKS) >= _PATH_LINKS_LIMIT:
+            _PATH_LINKS.clear()
+        _PATH_LINKS[path] = links
+    return links
+
+
+class FlowRecord:
+    __slots__ = _FIELDS + ('flow_id', 'extra', 'links')
+
+    def __init__(self, flow_id, src, dst, priority=0, demand_mbps=None, created_at=None,
+                 last_seen_packets=None, path=None, extra=None):
+        self.flow_id = flow_id
+        self.src = src
+        self.dst = dst
+        self.priority = priority
+        self.demand_mbps = demand_mbps
+        self.created_at = created_at
+        self.last_seen_packets = last_seen_packets
+        self.extra = extra
+        if path:
+            self.path = tuple(path)
+            self.links = path_links(self.path)
+        else:
+            self.path = None
+            self.links = ()
+
+    @classmethod
+    def from_dict(cls, flow_id, data):
+        get = data.get
+        extra = None
+        if not _FIELD_SET.issuperset(data):
+            extra = {k: v for k, v in data.items() if k not in _FIELD_SET}
+        return cls(flow_id, get('src'), get('dst'), get('priority', 0), get('demand_mbps'),
+                   get('created_at'), get('last_seen_packets'), get('path'), extra)
+
+    def replace(self, **changes):
+        fields = {k: getattr(self, k) for k in _FIELDS}
+        fields['extra'] = dict(self.extra) if self.extra else None
+        for key, value in changes.items():
+            if key in fields and key != 'extra':
+                fields[key] = value
+            else:
+                fields['extra'] = fields['extra'] or {}
+                fields['extra'][key] = value
+        return FlowRecord(self.flow_id, **fields)
+
+    def to_dict(self):
+        data = {k: getattr(self, k) for k in _FIELDS if getattr(self, k) is not None}
+        if self.path is not None:
+            data['path'] = list(self.path)
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+class _InOrder:
+    """Sequenced subscriber that passes changes on in sequence order"""
+
+    def __init__(self, callback, next_seq):
+        self.callback = callback
+        self._next_seq = next_seq
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, seq, op, flow_id, record):
+        with self._lock:
+            self._pending[seq] = (op, flow_id, record)
+            while self._next_seq in self._pending:
+                change = self._pending.pop(self._next_seq)
+                self._next_seq += 1
+                self.callback(*change)
+
+
+class FlowTable:
+    def __init__(self, prefix_len=24):
+        self.prefix_len = prefix_len
+        self.version = 0
+        self.sequence = 0
+        self._lock = threading.Lock()
+        self._flows = {}
+        self._by_src = defaultdict(set)
+        self._by_dst = defaultdict(set)
+        self._by_priority = defaultdict(set)
+        self._by_link = defaultdict(set)
+        self._snapshot = {}
+        self._snapshot_version = 0
+        self._subscribers = []
+        self._sequenced = []
+        self._unindexed = False
+
+    def __len__(self):
+        return len(self._flows)
+
+    def __contains__(self, flow_id):
+        return flow_id in self._flows
+
+    def subscribe(self, callback, sequenced=False, ordered=False):
+        """Call ``callback(op, flow_id, record)`` after every write; op is add, update or remove.
+
+        With ``sequenced`` the call is ``callback(seq, op, flow_id, record)``.
+        Concurrent writes may be delivered out of order; ``seq`` is their order.
+        With ``ordered`` the calls are made in that order, one at a time.
+        """
+        if ordered:
+            with self._lock:
+                self._sequenced.append(_InOrder(callback, self.sequence + 1))
+        else:
+            (self._sequenced if sequenced else self._subscribers).append(callback)
+
+    def _next_sequence(self, count):
+        """First of ``count`` sequence numbers; call with the lock held"""
+        first = self.sequence + 1
+        self.sequence += count
+        return first
+
+    def _notify(self, changes, first_seq):
+        for callback in self._sequenced:
+            for seq, (op, flow_id, record) in enumerate(changes, first_seq):
+                callback(seq, op, flow_id, record)
+        for callback in self._subscribers:
+            for op, flow_id, record in changes:
+                callback(op, flow_id, record)
+
+    # -- writes -------------------------------------------------------------
+
+    def add(self, flow_id, data):
+        """Insert or replace a flow from a dict of fields"""
+        record = data if isinstance(data, FlowRecord) else FlowRecord.from_dict(flow_id, data)
+        with self._lock:
+            self._ensure_indexed()
+            old = self._flows.get(flow_id)
+            if old is not None:
+                self._unindex(old)
+            self._flows[flow_id] = record
+            self._index(record)
+            self.version += 1
+            seq = self._next_sequence(1)
+        if self._subscribers or self._sequenced:
+            self._notify([('update' if old is not None else 'add', flow_id, record)], seq)
+        return record
+
+    def add_many(self, items):
+        """Insert ``(flow_id, data)`` pairs under a single lock acquisition"""
+        records = [data if isinstance(data, FlowRecord) else FlowRecord.from_dict(fid, data)
+                   for fid, data in items]
+        changes = [] if self._subscribers or self._sequenced else None
+        with self._lock:
+            self._ensure_indexed()
+            flows = self._flows
+            for record in records:
+                old = flows.get(record.flow_id)
+                if old is not None:
+                    self._unindex(old)
+                flows[record.flow_id] = record
+                self._index(record)
+                if changes is not None:
+                    changes.append(('update' if old is not None else 'add', record.flow_id, record))
+            self.version += 1
+            seq = self._next_sequence(len(records))
+        if changes:
+            self._notify(changes, seq)
+        return len(records)
+
+    def update(self, flow_id, **changes):
+        """Change fields of an existing flow; returns the new record or None"""
+        with self._lock:
+            old = self._flows.get(flow_id)
+            if old is None:
+                return None
+            self._ensure_indexed()
+            record = old.replace(**changes)
+            self._unindex(old)
+            self._flows[flow_id] = record
+            self._index(record)
+            self.version += 1
+            seq = self._next_sequence(1)
+        if self._subscribers or self._sequenced:
+            self._notify([('update', flow_id, record)], seq)
+        return record
+
+    def remove(self, flow_id):
+        with self._lock:
+            record = self._flows.pop(flow_id, None)
+            if record is None:
+                return None
+            self._ensure_indexed()
+            self._unindex(record)
+            self.version += 1
+            seq = self._next_sequence(1)
+        if self._subscribers or self._sequenced:
+            self._notify([('remove', flow_id, record)], seq)
+        return record
+
+    def remove_many(self, flow_ids):
+        """Remove several flows under a single lock acquisition; returns how many existed"""
+        changes = []
+        with self._lock:
+            self._ensure_indexed()
+            flows = self._flows
+            for flow_id in flow_ids:
+                record = flows.pop(flow_id, None)
+                if record is not None:
+                    self._unindex(record)
+                    changes.append(('remove', flow_id, record))
+            if changes:
+                self.version += 1
+            seq = self._next_sequence(len(changes))
+        if changes and (self._subscribers or self._sequenced):
+            self._notify(changes, seq)
+        return len(changes)
+
+    def load(self, flows):
+        """Replace the whole table with ``flows``, a ``{flow_id: FlowRecord}`` the
+        table takes ownership of; subscribers are not told"""
+        with self._lock:
+            self._flows = flows
+            for index in (self._by_src, self._by_dst, self._by_priority, self._by_link):
+                index.clear()
+            self._unindexed = bool(flows)
+            self.version += 1
+        return len(flows)
+
+    def reindex(self):
+        """Build indexes deferred by ``load`` now rather than on first use"""
+        with self._lock:
+            self._ensure_indexed()
+
+    def _ensure_indexed(self):
+        if not self._unindexed:
+            return
+        self._unindexed = False
+        # Group ids per key first: one set per bucket instead of one add per flow and index
+        shift = 32 - self.prefix_len
+        by_src, by_dst = defaultdict(list), defaultdict(list)
+        by_priority, by_links = defaultdict(list), defaultdict(list)
+        for fid, record in self._flows.items():
+            by_src[ip_to_int(record.src) >> shift].append(fid)
+            by_dst[ip_to_int(record.dst) >> shift].append(fid)
+            by_priority[record.priority].append(fid)
+            if record.links:
+                by_links[record.links].append(fid)
+        for index, groups in ((self._by_src, by_src), (self._by_dst, by_dst),
+                              (self._by_priority, by_priority)):
+            for key, fids in groups.items():
+                index[key] = set(fids)
+        for links, fids in by_links.items():
+            for link in links:
+                self._by_link[link].update(fids)
+
+    def _index(self, record):
+        fid = record.flow_id
+        shift = 32 - self.prefix_len
+        self._by_src[ip_to_int(record.src) >> shift].add(fid)
+        self._by_dst[ip_to_int(record.dst) >> shift].add(fid)
+        self._by_priority[record.priority].add(fid)
+        by_link = self._by_link
+        for link in record.links:
+            by_link[link].add(fid)
+
+    def _unindex(self, record):
+        fid = record.flow_id
+        for index, key in ((self._by_src, self._bucket(record.src)),
+                           (self._by_dst, self._bucket(record.dst)),
+                           (self._by_priority, record.priority)):
+            _discard(index, key, fid)
+        for link in record.links:
+            _discard(self._by_link, link, fid)
+
+    def _bucket(self, address):
+        return ip_to_int(address) >> (32 - self.prefix_len)
+
+    # -- reads --------------------------------------------------------------
+
+    def get(self, flow_id):
+        return self._flows.get(flow_id)
+
+    def ids(self):
+        with self._lock:
+            return list(self._flows)
+
+    def snapshot(self):
+        """Consistent ``{flow_id: FlowRecord}`` view; do not mutate it.
+
+        The copy is taken once per table version and shared by every reader
+        until the next write.
+        """
+        with self._lock:
+            if self._snapshot_version != self.version:
+                self._snapshot = dict(self._flows)
+                self._snapshot_version = self.version
+            return self._snapshot
+
+    def to_dict(self):
+        return {fid: record.to_dict() for fid, record in self.snapshot().items()}
+
+    def by_priority(self, priority):
+        with self._lock:
+            self._ensure_indexed()
+            return self._collect(self._by_priority, [priority])
+
+    def by_link(self, a, b):
+        with self._lock:
+            self._ensure_indexed()
+            return self._collect(self._by_link, [link_key(a, b)])
+
+    def by_src_prefix(self, cidr):
+        return self._prefix_lookup(self._by_src, cidr, 'src')
+
+    def by_dst_prefix(self, cidr):
+        return self._prefix_lookup(self._by_dst, cidr, 'dst')
+
+    def _collect(self, index, keys):
+        flows = self._flows
+        return [flows[fid] for key in keys for fid in index.get(key, ())]
+
+    def _prefix_lookup(self, index, cidr, field):
+        network = ipaddress.IPv4Network(cidr, strict=False)
+        base = int(network.network_address)
+        shift = 32 - self.prefix_len
+        with self._lock:
+            self._ensure_indexed()
+            if network.prefixlen >= self.prefix_len:
+                keys = [base >> shift]
+            else:
+                keys = range(base >> shift, (int(network.broadcast_address) >> shift) + 1)
+                # Walking a very wide range costs more than checking the buckets we have
+                if len(keys) > len(index):
+                    keys = [k for k in index if keys.start <= k < keys.stop]
+            found = self._collect(index, keys)
+        if network.prefixlen > self.prefix_len:
+            mask = int(network.netmask)
+            found = [r for r in found if ip_to_int(getattr(r, field)) & mask == base]
+        return found
+
+
+def _discard(index, key, fid):
+    bucket = index.get(key)
+    if bucket is not None:
+        bucket.discard(fid)
+        if not bucket:
+            del index[key]
@@ -0,0 +1,114 @@
+"""
+Idle and hard timeouts for flows, expired in batches off a timer wheel
+
+Each tracked flow has one timer, set for the earlier of its idle deadline
+(last activity + idle timeout) and its hard deadline (start + hard
+timeout). Activity only records a timestamp; the timer is not moved. When
+the timer fires, a flow that has been active since is rescheduled for its
+new idle deadline instead of expiring. Refreshing millions of flows from a
+stats poll therefore costs one dict write per flow, and the wheel is touched
+once per timeout period at most.
+
+Activity comes from ``touch`` (a packet-in or flow-removed style signal) or
+from ``observe_packets`` with a flow's cumulative packet counter from stats.
+"""
+
+import threading
+import time
+
+from controllers.timer_wheel import TimerWheel
+
+IDLE = 'idle'
+HARD = 'hard'
+
+INF = float('inf')
+
+
+class FlowTimeouts:
+    def __init__(self, idle_timeout=0, hard_timeout=0, tick=1.0, now=None):
+        # Defaults for flows added without their own; 0 means no timeout
+        self.idle_timeout = idle_timeout
+        self.hard_timeout = hard_timeout
+        self.wheel = TimerWheel(tick, now=now)
+        self.expired = {IDLE: 0, HARD: 0}
+        # key -> [idle_timeout, hard_deadline, last_active, packets]
+        self._flows = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._flows)
+
+    def __contains__(self, key):
+        return key in self._flows
+
+    def add(self, key, now=None, idle_timeout=None, hard_timeout=None, started_at=None):
+        """Track ``key``; the hard timeout counts from ``started_at`` (default ``now``).
+
+        A flow with neither timeout is not tracked.
+        """
+        now = time.time() if now is None else now
+        idle = self.idle_timeout if idle_timeout is None else idle_timeout
+        hard = self.hard_timeout if hard_timeout is None else hard_timeout
+        with self._lock:
+            if not idle and not hard:
+                self._untrack(key)
+                return
+            start = now if started_at is None else started_at
+            state = [idle, start + hard if hard else INF, now, None]
+            self._flows[key] = state
+            self.wheel.schedule(key, _deadline(state))
+
+    def remove(self, key):
+        with self._lock:
+            return self._untrack(key)
+
+    def _untrack(self, key):
+        self.wheel.cancel(key)
+        return self._flows.pop(key, None) is not None
+
+    def touch(self, key, now=None):
+        """Traffic was seen on ``key``: push its idle deadline back"""
+        state = self._flows.get(key)
+        if state is not None:
+            state[2] = time.time() if now is None else now
+
+    def observe_packets(self, key, packets, now=None):
+        """Feed a cumulative packet counter; a change counts as activity"""
+        state = self._flows.get(key)
+        if state is not None and packets != state[3]:
+            if packets or state[3] is not None:
+                state[2] = time.time() if now is None else now
+            state[3] = packets
+
+    def deadline(self, key):
+        state = self._flows.get(key)
+        return None if state is None else _deadline(state)
+
+    def expire(self, now=None):
+        """Advance to ``now`` and return ``[(key, IDLE or HARD)]`` for every flow that timed out"""
+        now = time.time() if now is None else now
+        expired = []
+        with self._lock:
+            flows, wheel = self._flows, self.wheel
+            for key in wheel.advance(now):
+                state = flows.get(key)
+                if state is None:
+                    continue
+                idle, hard_deadline, last_active, _ = state
+                if now >= hard_deadline:
+                    reason = HARD
+                elif idle and now >= last_active + idle:
+                    reason = IDLE
+                else:
+                    # Active since the timer was set
+                    wheel.schedule(key, _deadline(state))
+                    continue
+                del flows[key]
+                expired.append((key, reason))
+                self.expired[reason] += 1
+        return expired
+
+
+def _deadline(state):
+    idle, hard_deadline, last_active, _ = state
+    return min(last_active + idle if idle else INF, hard_deadline)
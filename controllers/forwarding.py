@@ -0,0 +1,248 @@
+"""
+Proactive and reactive IPv4 forwarding with bounded packet-in load
+
+Proactive mode gives every switch one rule per destination subnet, taken
+from a shortest-path tree towards the switch that owns the subnet. Traffic
+between known subnets then never reaches the controller. Re-running
+``proactive`` after a topology change restages the rules, so only the
+switches whose next hop changed get flow-mods.
+
+Reactive mode sets up a host pair on its first packet-in. The path comes
+from the PathEngine, and exact rules with an idle timeout are staged at
+every hop. Until the rules are in place, later packet-ins for the same
+pair, at any switch on the path, are duplicates. They are answered from a
+pending table with the output port already chosen: no decoding beyond the
+IPv4 addresses, no path query and no flow-mods. A pair whose destination
+is unknown is remembered the same way, so a scan of dead addresses costs
+one lookup per packet. Installed pairs are indexed by the links of their
+path. ``reroute`` moves the pairs crossing a failed link onto a new path, or
+takes their rules out if there is none. Otherwise traffic would keep the
+idle timer of a dead rule alive for ever.
+
+Neither mode bounds the packet-in rate by itself. ``controller_meter``
+builds the OpenFlow meter that the table-miss entry (``table_miss``) sends
+packets through, and that meter caps packet-ins per switch in the data
+plane.
+
+Like FlowProgrammer, this module is driven with the ofproto and parser
+modules it is given, so it runs against fake datapaths in tests.
+"""
+
+import socket
+import time
+from collections import OrderedDict, defaultdict
+
+from controllers.counters import ETH_TYPE_8021AD, ETH_TYPE_8021Q
+from controllers.path_engine import INF
+from controllers.ryu.flow_programmer import flow_key
+
+ETH_TYPE_IPV4 = 0x0800
+
+# Verdicts for a packet-in
+INSTALLED = 'installed'
+SUPPRESSED = 'suppressed'
+UNROUTABLE = 'unroutable'
+IGNORED = 'ignored'
+
+CONTROLLER_METER = 1
+
+
+def ipv4_pair(data):
+    """``(src, dst)`` address strings of a raw IPv4 frame, looking past VLAN
+    tags; None for anything else"""
+    view = memoryview(data)
+    offset = 12
+    while len(view) >= offset + 2:
+        value = view[offset] << 8 | view[offset + 1]
+        if value == ETH_TYPE_8021Q or value == ETH_TYPE_8021AD:
+            offset += 4
+            continue
+        if value != ETH_TYPE_IPV4 or len(view) < offset + 22:
+            return None
+        header = offset + 2
+        return (socket.inet_ntoa(view[header + 12:header + 16]),
+                socket.inet_ntoa(view[header + 16:header + 20]))
+    return None
+
+
+def controller_meter(datapath, rate, burst, meter_id=CONTROLLER_METER):
+    """Meter-mods that leave ``datapath`` with a packet-per-second drop meter.
+
+    An add fails if the meter survived a reconnect and a modify fails if it
+    did not, so both are sent and whichever fails is ignored.
+    """
+    ofproto, parser = datapath.ofproto, datapath.ofproto_parser
+    bands = [parser.OFPMeterBandDrop(rate=rate, burst_size=burst)]
+    flags = ofproto.OFPMF_PKTPS | ofproto.OFPMF_BURST
+    return [parser.OFPMeterMod(datapath, command, flags, meter_id, bands)
+            for command in (ofproto.OFPMC_ADD, ofproto.OFPMC_MODIFY)]
+
+
+def table_miss(programmer, dpid, ofproto, parser, meter_id=CONTROLLER_METER):
+    """Stage the lowest-priority entry sending unmatched packets to the
+    controller through the packet-in meter"""
+    actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER, ofproto.OFPCML_NO_BUFFER)]
+    return programmer.stage(dpid, 0, {}, actions, meter_id=meter_id)
+
+
+class Forwarder:
+    def __init__(self, programmer, path_engine, ofproto, parser, priority=10,
+                 idle_timeout=30, setup_hold=2.0):
+        self.programmer = programmer
+        self.path_engine = path_engine
+        self.ofproto = ofproto
+        self.parser = parser
+        # Subnet rules sit at ``priority``, host pair rules one above
+        self.priority = priority
+        self.idle_timeout = idle_timeout
+        # How long a pair counts as being set up
+        self.setup_hold = setup_hold
+        # (src, dst) -> (deadline, {dpid: output port} or None if unroutable)
+        self._pending = OrderedDict()
+        # (src, dst) -> (ingress dpid, path links, {dpid: output port}) of
+        # pairs with rules staged, and link -> pairs crossing it
+        self._routes = {}
+        self._by_link = defaultdict(set)
+        self.stats = {INSTALLED: 0, SUPPRESSED: 0, UNROUTABLE: 0, IGNORED: 0}
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def proactive(self):
+        """Stage one rule per destination subnet on every switch that can
+        reach it; returns the number of entries staged"""
+        graph = self.path_engine.graph
+        node_dpid = {node: dpid for dpid, node in graph.dpids.items()}
+        count = 0
+        for network, owner in graph.subnets:
+            match = {'eth_type': ETH_TYPE_IPV4,
+                     'ipv4_dst': (str(network.network_address), str(network.netmask))}
+            dist, parent = self.path_engine.shortest_path_tree(owner)
+            for node, dpid in node_dpid.items():
+                if node == owner:
+                    port = self.ofproto.OFPP_NORMAL
+                elif dist[node] < INF and (node, parent[node]) in graph.port_of:
+                    port = graph.port_of[(node, parent[node])]
+                else:
+                    self.programmer.unstage(dpid, self.priority, match)
+                    continue
+                self.programmer.stage(dpid, self.priority, match, [self.parser.OFPActionOutput(port)])
+                count += 1
+        return count
+
+    def packet_in(self, dpid, data, now=None):
+        """Handle a table-miss packet from ``dpid``.
+
+        Returns ``(verdict, port)``: the port to send the packet out of, or
+        None to drop it. On INSTALLED the new entries are staged but not
+        committed.
+        """
+        pair = ipv4_pair(data)
+        if pair is None:
+            self.stats[IGNORED] += 1
+            return IGNORED, None
+        now = time.monotonic() if now is None else now
+        self._expire(now)
+        pending = self._pending.get(pair)
+        if pending is not None:
+            ports = pending[1]
+            if ports is None:
+                self.stats[UNROUTABLE] += 1
+                return UNROUTABLE, None
+            self.stats[SUPPRESSED] += 1
+            return SUPPRESSED, ports.get(dpid)
+        ports = self._setup(dpid, *pair)
+        self._pending[pair] = (now + self.setup_hold, ports)
+        if ports is None:
+            self.stats[UNROUTABLE] += 1
+            return UNROUTABLE, None
+        self.stats[INSTALLED] += 1
+        return INSTALLED, ports[dpid]
+
+    @property
+    def routes(self):
+        return len(self._routes)
+
+    def reroute(self, links):
+        """Re-plan the pairs whose path crosses any of ``links``, which went
+        down: their rules move to a new path, or are removed if none is left.
+        Pairs whose rules the switch has already expired are dropped.
+        Returns the number of pairs re-planned; nothing is committed."""
+        pairs = set()
+        for link in links:
+            pairs |= self._by_link.pop(link, set())
+        moved = 0
+        for pair in pairs:
+            ingress, _, ports = self._forget(pair)
+            match = self._match(*pair)
+            live = self.programmer.unstage(ingress, self.priority + 1, match)
+            for dpid in ports:
+                if dpid != ingress:
+                    self.programmer.unstage(dpid, self.priority + 1, match)
+            self._pending.pop(pair, None)
+            if live:
+                self._setup(ingress, *pair)
+                moved += 1
+        return moved
+
+    def prune(self):
+        """Drop the routes of pairs whose rules the switches have expired;
+        returns how many were dropped"""
+        desired = self.programmer.desired
+        gone = [pair for pair, (ingress, _, _) in self._routes.items()
+                if flow_key(self._match(*pair), self.priority + 1) not in desired.get(ingress, ())]
+        for pair in gone:
+            self._forget(pair)
+        return len(gone)
+
+    def _forget(self, pair):
+        route = self._routes.pop(pair)
+        for link in route[1]:
+            pairs = self._by_link.get(link)
+            if pairs is not None:
+                pairs.discard(pair)
+                if not pairs:
+                    del self._by_link[link]
+        return route
+
+    @staticmethod
+    def _match(src, dst):
+        return {'eth_type': ETH_TYPE_IPV4, 'ipv4_src': src, 'ipv4_dst': dst}
+
+    def _expire(self, now):
+        # Deadlines are added in time order, so expired pairs are at the front
+        pending = self._pending
+        while pending:
+            pair, (deadline, _) = next(iter(pending.items()))
+            if deadline > now:
+                break
+            del pending[pair]
+
+    def _setup(self, dpid, src, dst):
+        graph = self.path_engine.graph
+        ingress, egress = graph.dpids.get(dpid), graph.node_for_host(dst)
+        if ingress is None or egress is None:
+            return None
+        path = self.path_engine.shortest_path(ingress, egress)
+        if path is None:
+            return None
+        ports = {}
+        node_dpid = {node: d for d, node in graph.dpids.items()}
+        nodes = [graph.node_id(n) for n in path.nodes]
+        for node, link in zip(nodes, list(path.links) + [None]):
+            port = self.ofproto.OFPP_NORMAL if link is None else graph.port_of.get((node, link))
+            if port is None or node not in node_dpid:
+                return None
+            ports[node_dpid[node]] = port
+        match = self._match(src, dst)
+        for hop_dpid, port in ports.items():
+            self.programmer.stage(hop_dpid, self.priority + 1, match,
+                                  [self.parser.OFPActionOutput(port)], idle_timeout=self.idle_timeout)
+        pair = (src, dst)
+        if pair in self._routes:
+            self._forget(pair)
+        self._routes[pair] = (dpid, tuple(path.links), ports)
+        for link in path.links:
+            self._by_link[link].add(pair)
+        return ports
@@ -0,0 +1,459 @@
+"""
+Congestion-aware path computation over the WAN topology graph
+
+The topology JSON is parsed once into an integer-indexed adjacency structure
+with numeric bandwidth (Mbps) and latency (ms) columns. PathEngine answers
+shortest, k-shortest and widest path queries weighted by live link
+utilisation. Answers are cached, so a utilisation update only invalidates the
+cached paths that the changed link can actually affect.
+"""
+
+import heapq
+import ipaddress
+import json
+import logging
+import os
+import re
+import threading
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+INF = float('inf')
+
+DEFAULT_TOPOLOGY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                                     'network', 'topology', 'network_topology.json')
+
+_BANDWIDTH_UNITS = {'': 1.0, 'bps': 1e-6, 'kbps': 1e-3, 'mbps': 1.0, 'gbps': 1e3, 'tbps': 1e6}
+_LATENCY_UNITS = {'': 1.0, 'us': 1e-3, 'ms': 1.0, 's': 1e3}
+_QUANTITY_RE = re.compile(r'^\s*([0-9]*\.?[0-9]+)\s*([a-zA-Z]*)\s*$')
+
+# Utilisation is clamped below 1.0 so a saturated link gets a large but finite cost
+_MAX_UTILISATION = 0.99
+
+Path = namedtuple('Path', ['nodes', 'links', 'cost', 'width'])
+
+
+def _parse_quantity(value, units, kind):
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _QUANTITY_RE.match(str(value))
+    if not match or match.group(2).lower() not in units:
+        raise ValueError(f"Invalid {kind} value: {value!r}")
+    return float(match.group(1)) * units[match.group(2).lower()]
+
+
+def parse_bandwidth(value):
+    """Parse a bandwidth such as "100Mbps" or "1Gbps" into Mbps"""
+    return _parse_quantity(value, _BANDWIDTH_UNITS, 'bandwidth')
+
+
+def parse_latency(value):
+    """Parse a latency such as "10ms" or "0.5s" into milliseconds"""
+    return _parse_quantity(value, _LATENCY_UNITS, 'latency')
+
+
+class TopologyGraph:
+    """Compact, integer-indexed undirected graph of switches and links.
+
+    Each physical link is stored once even though the topology file lists it
+    under both endpoints. ``adj[node]`` holds ``(neighbour, link_id)`` pairs.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.index = {}
+        self.adj = []
+        self.link_ends = []
+        self.bandwidth = []
+        self.latency = []
+        # (network, node) for the host subnets attached to each switch
+        self.subnets = []
+        # OpenFlow datapath id -> node, and (node, port_no) <-> link
+        self.dpids = {}
+        self.ports = {}
+        self.port_of = {}
+        self._link_index = {}
+
+    @classmethod
+    def from_dict(cls, data):
+        graph = cls()
+        switches = data.get('topology', data).get('switches', [])
+        for switch in switches:
+            node = graph.add_node(switch['id'])
+            if switch.get('subnet'):
+                graph.subnets.append((ipaddress.ip_network(switch['subnet']), node))
+            if switch.get('dpid') is not None:
+                graph.dpids[int(switch['dpid'])] = node
+        for switch in switches:
+            for link in switch.get('links', []):
+                link_id = graph.add_link(switch['id'], link['target'],
+                                         parse_bandwidth(link['bandwidth']),
+                                         parse_latency(link['latency']))
+                if link.get('port') is not None:
+                    graph.set_port(switch['id'], int(link['port']), link_id)
+        return graph
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'r') as f:
+            return cls.from_dict(json.load(f))
+
+    @property
+    def num_nodes(self):
+        return len(self.names)
+
+    @property
+    def num_links(self):
+        return len(self.link_ends)
+
+    def add_node(self, name):
+        if name not in self.index:
+            self.index[name] = len(self.names)
+            self.names.append(name)
+            self.adj.append([])
+        return self.index[name]
+
+    def add_link(self, a, b, bandwidth, latency):
+        """Add an undirected link, returning its id. Duplicates are merged."""
+        u, v = self.add_node(a), self.add_node(b)
+        key = (u, v) if u < v else (v, u)
+        link_id = self._link_index.get(key)
+        if link_id is not None:
+            return link_id
+        link_id = len(self.link_ends)
+        self._link_index[key] = link_id
+        self.link_ends.append(key)
+        self.bandwidth.append(float(bandwidth))
+        self.latency.append(float(latency))
+        self.adj[u].append((v, link_id))
+        self.adj[v].append((u, link_id))
+        return link_id
+
+    def set_port(self, node, port_no, link_id):
+        """Record that ``port_no`` on ``node`` is attached to ``link_id``"""
+        node = self.node_id(node)
+        self.ports[(node, port_no)] = link_id
+        self.port_of[(node, link_id)] = port_no
+
+    def node_id(self, node):
+        return node if isinstance(node, int) else self.index[node]
+
+    def link_id(self, link):
+        """Resolve a link id from an int id or an ``(a, b)`` endpoint pair"""
+        if isinstance(link, int):
+            return link
+        u, v = self.node_id(link[0]), self.node_id(link[1])
+        key = (u, v) if u < v else (v, u)
+        if key not in self._link_index:
+            raise KeyError(f"No link between {link[0]} and {link[1]}")
+        return self._link_index[key]
+
+    def node_for_host(self, address):
+        """Index of the switch whose subnet contains ``address``, or None"""
+        address = ipaddress.ip_address(address)
+        for network, node in self.subnets:
+            if address in network:
+                return node
+        return None
+
+    def link_name(self, link_id):
+        u, v = self.link_ends[link_id]
+        return f"{self.names[u]}-{self.names[v]}"
+
+
+class PathEngine:
+    """Shortest, k-shortest and widest path queries over a TopologyGraph.
+
+    Link cost is ``latency / (1 - utilisation)`` and residual bandwidth is
+    ``bandwidth * (1 - utilisation)``. Answers are cached per query and indexed
+    by the links they traverse. When ``set_utilisation`` or ``set_link_state``
+    changes a link, an answer is dropped only if it uses that link or if
+    distance bounds from earlier searches show the link could now beat it.
+    Updates and queries may come from different threads; they serialise on
+    one lock. ``frozen`` holds it across several queries that must all see
+    the same graph.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.utilisation = [0.0] * graph.num_links
+        self.link_up = [True] * graph.num_links
+        self.weight = list(graph.latency)
+        self.residual = list(graph.bandwidth)
+        # node -> distances that are lower bounds of the current shortest distances
+        self._dist_bounds = {}
+        # node -> widths that are upper bounds of the current widest-path widths
+        self._width_bounds = {}
+        # ('k', src, dst, k) or ('w', src, dst, 1) -> [Path]
+        self._paths = {}
+        self._path_keys = defaultdict(set)
+        self._lock = threading.RLock()
+
+    # -- link updates -------------------------------------------------------
+
+    def set_utilisation(self, link, utilisation):
+        """Update the measured utilisation (0.0-1.0) of a link"""
+        link_id = self.graph.link_id(link)
+        with self._lock:
+            self.utilisation[link_id] = min(max(float(utilisation), 0.0), _MAX_UTILISATION)
+            self._refresh_link(link_id)
+
+    def update_utilisation(self, utilisations):
+        """Apply a ``{link: utilisation}`` mapping"""
+        with self._lock:
+            for link, utilisation in utilisations.items():
+                self.set_utilisation(link, utilisation)
+
+    def set_link_state(self, link, up):
+        link_id = self.graph.link_id(link)
+        with self._lock:
+            self.link_up[link_id] = bool(up)
+            self._refresh_link(link_id)
+
+    def set_capacity(self, link, bandwidth=None, latency=None):
+        """Change a link's configured bandwidth (Mbps) and/or latency (ms)"""
+        link_id = self.graph.link_id(link)
+        with self._lock:
+            if bandwidth is not None:
+                self.graph.bandwidth[link_id] = float(bandwidth)
+            if latency is not None:
+                self.graph.latency[link_id] = float(latency)
+            self._refresh_link(link_id)
+
+    # -- topology growth ----------------------------------------------------
+
+    def add_node(self, name):
+        with self._lock:
+            if name not in self.graph.index:
+                # Bounds are per-node lists sized for the old graph
+                self._dist_bounds.clear()
+                self._width_bounds.clear()
+            return self.graph.add_node(name)
+
+    def add_link(self, a, b, bandwidth, latency):
+        """Add a link to the graph and return its id.
+
+        A new link starts down; ``set_link_state`` brings it up, which drops
+        exactly the cached paths it could improve.
+        """
+        with self._lock:
+            self.add_node(a)
+            self.add_node(b)
+            link_id = self.graph.add_link(a, b, bandwidth, latency)
+            if link_id == len(self.link_up):
+                self.utilisation.append(0.0)
+                self.link_up.append(False)
+                self.weight.append(INF)
+                self.residual.append(0.0)
+            return link_id
+
+    def _refresh_link(self, link_id):
+        if self.link_up[link_id]:
+            headroom = 1.0 - self.utilisation[link_id]
+            weight = self.graph.latency[link_id] / headroom
+            residual = self.graph.bandwidth[link_id] * headroom
+        else:
+            weight, residual = INF, 0.0
+        old_weight, old_residual = self.weight[link_id], self.residual[link_id]
+        self.weight[link_id], self.residual[link_id] = weight, residual
+        if weight > old_weight:
+            # Distances only grow, so existing bounds stay valid
+            self._drop_paths(k for k in self._path_keys.get(link_id, ()) if k[0] == 'k')
+        elif weight < old_weight:
+            self._cheaper_link(link_id, weight)
+        if residual < old_residual:
+            self._drop_paths(k for k in self._path_keys.get(link_id, ()) if k[0] == 'w')
+        elif residual > old_residual:
+            self._wider_link(link_id, residual)
+
+    def _cheaper_link(self, link_id, weight):
+        u, v = self.graph.link_ends[link_id]
+        bounds = self._dist_bounds
+        stale = []
+        for key, paths in self._paths.items():
+            kind, s, t, k = key
+            if kind != 'k':
+                continue
+            if len(paths) < k or s not in bounds or t not in bounds:
+                stale.append(key)
+                continue
+            # Any path through the link costs at least d(s, u) + w + d(v, t)
+            ds, dt = bounds[s], bounds[t]
+            if weight + min(ds[u] + dt[v], ds[v] + dt[u]) < paths[-1].cost:
+                stale.append(key)
+        self._drop_paths(stale)
+        for node in [n for n, d in bounds.items() if d[u] + weight < d[v] or d[v] + weight < d[u]]:
+            del bounds[node]
+
+    def _wider_link(self, link_id, residual):
+        u, v = self.graph.link_ends[link_id]
+        bounds = self._width_bounds
+        stale = []
+        for key, paths in self._paths.items():
+            kind, s, t, _ = key
+            if kind != 'w':
+                continue
+            if s not in bounds or t not in bounds:
+                stale.append(key)
+                continue
+            ws, wt = bounds[s], bounds[t]
+            best = max(min(ws[u], residual, wt[v]), min(ws[v], residual, wt[u]))
+            if best > (paths[0].width if paths else 0.0):
+                stale.append(key)
+        self._drop_paths(stale)
+        for node in [n for n, w in bounds.items()
+                     if min(w[u], residual) > w[v] or min(w[v], residual) > w[u]]:
+            del bounds[node]
+
+    def _drop_paths(self, keys):
+        for key in list(keys):
+            for path in self._paths.pop(key, ()):
+                for link_id in path.links:
+                    self._path_keys[link_id].discard(key)
+
+    def _cache(self, key, paths):
+        self._paths[key] = paths
+        for path in paths:
+            for link_id in path.links:
+                self._path_keys[link_id].add(key)
+        return list(paths)
+
+    # -- queries ------------------------------------------------------------
+
+    @contextmanager
+    def frozen(self):
+        """Hold off updates and topology growth for the duration of the block"""
+        with self._lock:
+            yield self
+
+    def shortest_path(self, src, dst):
+        """Lowest-cost path from ``src`` to ``dst`` or None if unreachable"""
+        paths = self.k_shortest_paths(src, dst, 1)
+        return paths[0] if paths else None
+
+    def k_shortest_paths(self, src, dst, k=3):
+        """Up to ``k`` loopless paths in increasing cost order (Yen's algorithm)"""
+        s, t = self.graph.node_id(src), self.graph.node_id(dst)
+        key = ('k', s, t, k)
+        with self._lock:
+            if key in self._paths:
+                return list(self._paths[key])
+            dist, parent = self._dijkstra(s)
+            self._dist_bounds[s] = dist
+            if t not in self._dist_bounds:
+                self._dist_bounds[t] = self._dijkstra(t)[0]
+            paths = []
+            if dist[t] < INF:
+                paths = self._yen(t, k, self._walk(parent, s, t))
+            return self._cache(key, paths)
+
+    def widest_path(self, src, dst):
+        """Path maximising the bottleneck residual bandwidth"""
+        s, t = self.graph.node_id(src), self.graph.node_id(dst)
+        key = ('w', s, t, 1)
+        with self._lock:
+            if key not in self._paths:
+                width, parent = self._max_bottleneck(s)
+                self._width_bounds[s] = width
+                if t not in self._width_bounds:
+                    self._width_bounds[t] = self._max_bottleneck(t)[0]
+                paths = [self._make_path(self._walk(parent, s, t))] if width[t] > 0.0 else []
+                self._cache(key, paths)
+            paths = self._paths[key]
+        return paths[0] if paths else None
+
+    def shortest_path_tree(self, root, banned_links=()):
+        """``(dist, parent)`` lists for the lowest-cost paths from every node
+        to ``root`` that avoid ``banned_links``; ``parent[n]`` is the first
+        link on node ``n``'s way to the root, -1 if it has none"""
+        with self._lock:
+            return self._dijkstra(self.graph.node_id(root), banned_links=banned_links)
+
+    # -- internals ----------------------------------------------------------
+
+    def _dijkstra(self, s, target=None, banned_nodes=(), banned_links=()):
+        n = self.graph.num_nodes
+        dist = [INF] * n
+        parent = [-1] * n
+        dist[s] = 0.0
+        heap = [(0.0, s)]
+        adj, weight = self.graph.adj, self.weight
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            if u == target:
+                break
+            for v, link_id in adj[u]:
+                if v in banned_nodes or link_id in banned_links:
+                    continue
+                nd = d + weight[link_id]
+                if nd < dist[v]:
+                    dist[v] = nd
+                    parent[v] = link_id
+                    heapq.heappush(heap, (nd, v))
+        return dist, parent
+
+    def _max_bottleneck(self, s):
+        n = self.graph.num_nodes
+        width = [0.0] * n
+        parent = [-1] * n
+        width[s] = INF
+        heap = [(-INF, s)]
+        adj, residual = self.graph.adj, self.residual
+        while heap:
+            w, u = heapq.heappop(heap)
+            w = -w
+            if w < width[u]:
+                continue
+            for v, link_id in adj[u]:
+                nw = min(w, residual[link_id])
+                if nw > width[v]:
+                    width[v] = nw
+                    parent[v] = link_id
+                    heapq.heappush(heap, (-nw, v))
+        return width, parent
+
+    def _walk(self, parent, s, t):
+        nodes = [t]
+        ends = self.graph.link_ends
+        while nodes[-1] != s:
+            u, v = ends[parent[nodes[-1]]]
+            nodes.append(u if v == nodes[-1] else v)
+        nodes.reverse()
+        return nodes
+
+    def _make_path(self, nodes):
+        links = [self.graph.link_id((a, b)) for a, b in zip(nodes, nodes[1:])]
+        cost = sum(self.weight[l] for l in links)
+        width = min((self.residual[l] for l in links), default=INF)
+        return Path([self.graph.names[n] for n in nodes], links, cost, width)
+
+    def _yen(self, t, k, first):
+        accepted_nodes = [first]
+        accepted = [self._make_path(first)]
+        candidates = []
+        seen = {tuple(first)}
+        while len(accepted) < k:
+            prev = accepted_nodes[-1]
+            for i in range(len(prev) - 1):
+                spur, root = prev[i], prev[:i + 1]
+                banned_links = {self.graph.link_id((p[i], p[i + 1]))
+                                for p in accepted_nodes if p[:i + 1] == root}
+                dist, parent = self._dijkstra(spur, t, set(root[:-1]), banned_links)
+                if dist[t] == INF:
+                    continue
+                nodes = root[:-1] + self._walk(parent, spur, t)
+                if tuple(nodes) in seen:
+                    continue
+                seen.add(tuple(nodes))
+                path = self._make_path(nodes)
+                heapq.heappush(candidates, (path.cost, len(seen), nodes, path))
+            if not candidates:
+                break
+            _, _, nodes, path = heapq.heappop(candidates)
+            accepted.append(path)
+            accepted_nodes.append(nodes)
+        return accepted
@@ -0,0 +1,244 @@
+"""
+Fast-failover protection for flow paths
+
+For every protected flow, each hop of the primary path gets a precomputed
+backup next hop that reaches the destination without using any link of the
+primary path. All backups of a flow come from one shortest-path tree
+towards the destination over the graph minus the primary links. Where two
+detours meet they carry on the same way, so a switch never needs more than
+one detour next hop per flow.
+
+Each protected hop is programmed as an OpenFlow fast-failover (OFPGT_FF)
+group with two buckets, primary port then backup port, each watching its
+own port. When the primary port goes down the switch moves traffic to the
+backup bucket by itself: no controller round trip and no flow-mods.
+Switches that are on a detour and on the primary path match the detour's
+in_port one priority higher, so detoured packets are not sent back onto the
+primary.
+
+``link_down`` only queues the flows that used the link. ``reoptimise``
+re-plans them in batches from the background, and because a flow keeps its
+group ids the new primaries and backups go out as in-place modifies.
+
+Like FlowProgrammer, this module is driven with the ofproto and parser
+modules it is given, so it runs against fake datapaths in tests.
+"""
+
+from collections import OrderedDict, defaultdict, namedtuple
+
+from controllers.path_engine import INF
+
+# One switch's part of a protected flow: send out of ``port`` (None: deliver
+# with the egress actions), falling back to ``backup_port`` when that port is
+# down. ``in_port`` limits a detour entry to packets arriving on the detour.
+Hop = namedtuple('Hop', ['node', 'in_port', 'port', 'backup_port'])
+
+
+class ProtectionPlan:
+    __slots__ = ('nodes', 'hops', 'links', 'unprotected')
+
+    def __init__(self, nodes, hops, links, unprotected):
+        # Primary path as node indexes
+        self.nodes = nodes
+        self.hops = hops
+        # Every link the plan forwards over, primary and detours
+        self.links = links
+        # Primary hops with no link-disjoint way to the destination
+        self.unprotected = unprotected
+
+
+def plan_protection(path_engine, nodes):
+    """ProtectionPlan for a primary path given as a list of node indexes"""
+    graph = path_engine.graph
+    port_of = graph.port_of
+    primary = [graph.link_id((a, b)) for a, b in zip(nodes, nodes[1:])]
+    dst = nodes[-1]
+    dist, parent = path_engine.shortest_path_tree(dst, set(primary))
+
+    def port(node, link):
+        port_no = port_of.get((node, link))
+        if port_no is None:
+            raise ValueError(f"No port on {graph.names[node]} for link {graph.link_name(link)}")
+        return port_no
+
+    hops, links, unprotected = [], set(primary), 0
+    # node -> tree link towards dst; node -> links detoured traffic arrives on
+    detour_next, arrivals = {}, defaultdict(set)
+    for node, link in zip(nodes, primary):
+        backup = parent[node] if dist[node] < INF and node != dst else -1
+        if backup < 0 or (node, backup) not in port_of:
+            unprotected += 1
+            hops.append(Hop(node, None, port(node, link), None))
+            continue
+        hops.append(Hop(node, None, port(node, link), port_of[(node, backup)]))
+        u, via = node, backup
+        while True:
+            links.add(via)
+            a, b = graph.link_ends[via]
+            u = b if a == u else a
+            arrivals[u].add(via)
+            if u == dst or u in detour_next:
+                break
+            via = detour_next[u] = parent[u]
+    hops.append(Hop(dst, None, None, None))
+
+    on_primary = set(nodes)
+    for node, link in detour_next.items():
+        if node in on_primary:
+            for via in arrivals[node]:
+                hops.append(Hop(node, port(node, via), port(node, link), None))
+        else:
+            hops.append(Hop(node, None, port(node, link), None))
+    return ProtectionPlan(nodes, hops, links, unprotected)
+
+
+class _Protected:
+    __slots__ = ('match', 'priority', 'src', 'dst', 'plan', 'entries', 'groups')
+
+    def __init__(self, match, priority, src, dst):
+        self.match = match
+        self.priority = priority
+        self.src = src
+        self.dst = dst
+        self.plan = None
+        # (dpid, flow key) -> (priority, match) of every staged entry
+        self.entries = {}
+        # dpid -> group id, kept across re-plans so changes are modifies
+        self.groups = {}
+
+
+class ProtectionManager:
+    """Protected flows staged on a FlowProgrammer; the caller commits"""
+
+    def __init__(self, programmer, path_engine, ofproto, parser, egress_actions=None):
+        self.programmer = programmer
+        self.path_engine = path_engine
+        self.ofproto = ofproto
+        self.parser = parser
+        # What the last switch does with the flow's packets
+        self.egress_actions = egress_actions or [parser.OFPActionOutput(ofproto.OFPP_NORMAL)]
+        self.flows = {}
+        # link id -> flows whose plan forwards over it
+        self._by_link = defaultdict(set)
+        self._pending = OrderedDict()
+        self._free_groups = defaultdict(list)
+        self._next_group = defaultdict(lambda: 1)
+
+    def __len__(self):
+        return len(self.flows)
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def flows_on_link(self, link):
+        return set(self._by_link.get(self.path_engine.graph.link_id(link), ()))
+
+    def protect(self, flow_id, match, priority, src, dst, path=None):
+        """Stage a flow from switch ``src`` to ``dst`` along ``path`` (node
+        names; default the current shortest path) with backups at every hop.
+        Returns the ProtectionPlan, or None if ``dst`` is unreachable.
+        """
+        flow = self.flows.get(flow_id)
+        if flow is None:
+            flow = self.flows[flow_id] = _Protected(match, priority, src, dst)
+        else:
+            flow.match, flow.priority, flow.src, flow.dst = match, priority, src, dst
+        return self._plan(flow_id, flow, path)
+
+    def unprotect(self, flow_id):
+        flow = self.flows.pop(flow_id, None)
+        if flow is None:
+            return False
+        self._pending.pop(flow_id, None)
+        self._unindex(flow_id, flow)
+        self._restage(flow, {}, {})
+        return True
+
+    def link_down(self, link):
+        """Queue every flow that forwarded over ``link`` for re-planning.
+
+        Nothing is sent: the fast-failover groups already moved the traffic.
+        """
+        affected = self._by_link.get(self.path_engine.graph.link_id(link), ())
+        for flow_id in affected:
+            self._pending[flow_id] = None
+        return len(affected)
+
+    def reoptimise(self, batch_size=None):
+        """Re-plan up to ``batch_size`` queued flows over the current
+        topology; returns their ids"""
+        done = []
+        while self._pending and (batch_size is None or len(done) < batch_size):
+            flow_id, _ = self._pending.popitem(last=False)
+            flow = self.flows.get(flow_id)
+            if flow is not None:
+                self._plan(flow_id, flow, None)
+                done.append(flow_id)
+        return done
+
+    # -- internals ----------------------------------------------------------
+
+    def _plan(self, flow_id, flow, path):
+        graph = self.path_engine.graph
+        if path is None:
+            found = self.path_engine.shortest_path(flow.src, flow.dst)
+            path = found.nodes if found else None
+        self._unindex(flow_id, flow)
+        if not path:
+            flow.plan = None
+            self._restage(flow, {}, {})
+            return None
+        plan = plan_protection(self.path_engine, [graph.node_id(n) for n in path])
+        flow.plan = plan
+        for link in plan.links:
+            self._by_link[link].add(flow_id)
+        self._stage(flow, plan)
+        return plan
+
+    def _unindex(self, flow_id, flow):
+        if flow.plan is not None:
+            for link in flow.plan.links:
+                self._by_link[link].discard(flow_id)
+
+    def _stage(self, flow, plan):
+        node_dpid = {node: dpid for dpid, node in self.path_engine.graph.dpids.items()}
+        ofproto, parser, programmer = self.ofproto, self.parser, self.programmer
+        entries, groups = {}, {}
+        for hop in plan.hops:
+            dpid = node_dpid[hop.node]
+            match, priority = flow.match, flow.priority
+            if hop.in_port is not None:
+                match, priority = dict(match, in_port=hop.in_port), priority + 1
+            if hop.port is None:
+                actions = self.egress_actions
+            elif hop.backup_port is None:
+                actions = [parser.OFPActionOutput(hop.port)]
+            else:
+                group_id = flow.groups.get(dpid) or self._allocate_group(dpid)
+                groups[dpid] = group_id
+                programmer.stage_group(dpid, group_id, 'ff', [
+                    (hop.port, [parser.OFPActionOutput(hop.port)]),
+                    (hop.backup_port, [parser.OFPActionOutput(hop.backup_port)])])
+                actions = [parser.OFPActionGroup(group_id)]
+            entry = programmer.stage(dpid, priority, match, actions)
+            entries[(dpid, entry.key)] = (priority, match)
+            flow.entries.pop((dpid, entry.key), None)
+        self._restage(flow, entries, groups)
+
+    def _restage(self, flow, entries, groups):
+        """Drop what the previous plan staged and the new one does not use"""
+        for (dpid, _), (priority, match) in flow.entries.items():
+            self.programmer.unstage(dpid, priority, match)
+        for dpid, group_id in flow.groups.items():
+            if groups.get(dpid) != group_id:
+                self.programmer.unstage_group(dpid, group_id)
+                self._free_groups[dpid].append(group_id)
+        flow.entries, flow.groups = entries, groups
+
+    def _allocate_group(self, dpid):
+        if self._free_groups[dpid]:
+            return self._free_groups[dpid].pop()
+        group_id = self._next_group[dpid]
+        self._next_group[dpid] = group_id + 1
+        return group_id
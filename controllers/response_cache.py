@@ -0,0 +1,112 @@
+"""
+Versioned response cache for the REST API
+
+A resource is serialised to JSON once per state key (a version number, or a
+tuple of them) and the encoded body is shared by every request until the key
+changes. Each body gets an ETag, so a client that already holds the current
+version gets a bodyless 304. Large bodies are compressed with gzip, or with
+brotli when the ``brotli`` package is installed and the client accepts it.
+Each encoding is computed at most once per version, on first demand.
+"""
+
+import gzip
+import json
+import os
+import threading
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+MIN_COMPRESS_SIZE = 1024
+
+
+def accepts(header, coding):
+    """Whether an Accept-Encoding header allows ``coding``"""
+    for part in (header or '').split(','):
+        name, _, params = part.partition(';')
+        if name.strip().lower() not in (coding, '*'):
+            continue
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+class CachedBody:
+    __slots__ = ('key', 'etag', 'body', '_encoded', '_lock')
+
+    def __init__(self, key, etag, body):
+        self.key = key
+        self.etag = etag
+        self.body = body
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    def encoded(self, coding):
+        body = self._encoded.get(coding)
+        if body is None:
+            with self._lock:
+                body = self._encoded.get(coding)
+                if body is None:
+                    if coding == 'br':
+                        body = brotli.compress(self.body, quality=5)
+                    else:
+                        body = gzip.compress(self.body, compresslevel=6, mtime=0)
+                    self._encoded[coding] = body
+        return body
+
+
+class ResponseCache:
+    def __init__(self, min_compress_size=MIN_COMPRESS_SIZE):
+        self.min_compress_size = min_compress_size
+        # Distinguishes ETags of this process from those of a previous run
+        self._instance = os.urandom(4).hex()
+        self._entries = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.hits = 0
+
+    def get(self, name, key, build):
+        """CachedBody for ``name`` at state ``key``; ``build()`` makes the payload on a miss"""
+        entry = self._entries.get(name)
+        if entry is not None and entry.key == key:
+            self.hits += 1
+            return entry
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or entry.key != key:
+                body = json.dumps(build(), separators=(',', ':')).encode()
+                self._generation += 1
+                entry = CachedBody(key, f'"{self._instance}-{self._generation}"', body)
+                self._entries[name] = entry
+                self.builds += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def respond(self, name, key, build, request):
+        """Flask response for ``request``: 304, or the cached body in the best encoding"""
+        entry = self.get(name, key, build)
+        headers = {'ETag': entry.etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+        if entry.etag in request.headers.get('If-None-Match', ''):
+            return Response(status=304, headers=headers)
+        body = entry.body
+        if len(body) >= self.min_compress_size:
+            accept = request.headers.get('Accept-Encoding', '')
+            if brotli is not None and accepts(accept, 'br'):
+                body = entry.encoded('br')
+                headers['Content-Encoding'] = 'br'
+            elif accepts(accept, 'gzip'):
+                body = entry.encoded('gzip')
+                headers['Content-Encoding'] = 'gzip'
+        return Response(body, mimetype='application/json', headers=headers)
@@ -0,0 +1,378 @@
+"""
+Wildcard rule aggregation for per-switch flow tables
+
+Flows are exact (ipv4_src, ipv4_dst) pairs with a priority and, on each
+switch they cross, an action (an output port or next hop). The compiler
+keeps the minimal-ish set of masked rules that gives every flow its action,
+and updates it as flows come and go.
+
+Aggregation never crosses a host block (``block_len``, the /24 host subnets
+by default). A block sits behind one switch, so sending the unused
+addresses of a block the same way as its known hosts is what routing would
+do anyway. Inside a block pair, each (priority, action) class is covered in
+two passes over a binary trie of the address bits. The first pass covers
+each source's destinations with the shortest prefixes; the second merges
+sources that ended up with the same destination prefix. A trie node is
+only taken as a rule if it holds no *conflicting* flow: one with another
+action at the same or a lower priority, which the wider rule would capture.
+Flows of a higher priority do not conflict, since their own rules still win.
+Rules of the same priority with different actions must not overlap at all,
+not even on unused addresses, since a switch may pick either of them there.
+Each rule is therefore carved around the rules already taken at its
+priority by other classes, keeping only the pieces that hold its flows.
+
+Updates are incremental. A new flow that an existing rule of its class
+already covers, with no other-action rule of the same or a higher priority
+over it, only bumps that rule's user count. A removed flow whose rule still
+has other users does the same in reverse. Anything else recompiles just that
+block pair on that switch. Every update reports the rule adds, modifies and
+deletes, next to the flow-mods one exact rule per flow would have needed.
+"""
+
+import socket
+import struct
+import threading
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+
+from controllers.flow_table import ip_to_int
+
+
+def int_to_ip(value):
+    return socket.inet_ntoa(struct.pack('!I', value))
+
+
+def _prefix_field(prefix):
+    address, length = prefix
+    if length == 32:
+        return int_to_ip(address)
+    return int_to_ip(address), int_to_ip((0xffffffff << (32 - length)) & 0xffffffff)
+
+
+class Rule(namedtuple('Rule', ['priority', 'src', 'dst', 'action'])):
+    """``src`` and ``dst`` are ``(address, prefix_len)`` with integer addresses"""
+    __slots__ = ()
+
+    @property
+    def key(self):
+        return self.priority, self.src, self.dst
+
+    def match(self):
+        """OpenFlow 1.3 match fields; masked prefixes are ``(address, mask)``"""
+        return {'eth_type': 0x0800, 'ipv4_src': _prefix_field(self.src),
+                'ipv4_dst': _prefix_field(self.dst)}
+
+    def __str__(self):
+        return (f"{int_to_ip(self.src[0])}/{self.src[1]} -> {int_to_ip(self.dst[0])}/{self.dst[1]} "
+                f"prio {self.priority}: {self.action}")
+
+
+class RuleUpdate:
+    """What one update changed, per switch, and what it saved"""
+
+    def __init__(self):
+        # switch -> [Rule]
+        self.adds = defaultdict(list)
+        self.modifies = defaultdict(list)
+        self.deletes = defaultdict(list)
+        # Flow-mods one exact rule per flow would have cost
+        self.exact_flow_mods = 0
+        self.compression_ratio = 1.0
+
+    @property
+    def flow_mods(self):
+        return sum(len(rules) for changes in (self.adds, self.modifies, self.deletes)
+                   for rules in changes.values())
+
+    @property
+    def saved(self):
+        return self.exact_flow_mods - self.flow_mods
+
+    def switches(self):
+        return set(self.adds) | set(self.modifies) | set(self.deletes)
+
+    def to_dict(self):
+        return {
+            'flow_mods': self.flow_mods,
+            'exact_flow_mods': self.exact_flow_mods,
+            'flow_mods_saved': self.saved,
+            'compression_ratio': round(self.compression_ratio, 3),
+        }
+
+    def __repr__(self):
+        return (f"RuleUpdate(flow_mods={self.flow_mods}, exact={self.exact_flow_mods}, "
+                f"ratio={self.compression_ratio:.2f})")
+
+
+def cover(base, length, points, blocked, out):
+    """Append to ``out`` the shortest prefixes under ``base/length`` that
+    together cover ``points`` and contain no address in ``blocked``.
+
+    Both lists are sorted integer addresses inside the prefix. This walks the
+    binary trie of the address bits, descending only where both kinds of
+    address are present.
+    """
+    if not blocked or length == 32:
+        out.append((base, length))
+        return
+    mid = base + (1 << (31 - length))
+    p, b = bisect_left(points, mid), bisect_left(blocked, mid)
+    if p:
+        cover(base, length + 1, points[:p], blocked[:b], out)
+    if p < len(points):
+        cover(mid, length + 1, points[p:], blocked[b:], out)
+
+
+def _contains(prefix, address):
+    base, length = prefix
+    return (address ^ base) >> (32 - length) == 0
+
+
+def _overlaps(a, b):
+    return _contains(a, b[0]) or _contains(b, a[0])
+
+
+def carve(src, dst, points, taken, out):
+    """Append to ``out`` the ``(src, dst, points)`` pieces of the rule
+    ``src -> dst`` that still hold its ``points`` but overlap none of the
+    ``taken`` ``(src, dst)`` prefix pairs.
+
+    ``points`` must lie outside every taken pair. A rule that overlaps one is
+    halved along a dimension in which the taken prefix is narrower, and only
+    halves holding points are kept.
+    """
+    clash = next(((s, d) for s, d in taken if _overlaps(src, s) and _overlaps(dst, d)), None)
+    if clash is None:
+        out.append((src, dst, points))
+        return
+    if clash[0][1] > src[1]:
+        length = src[1] + 1
+        halves = [((src[0], length), dst), ((src[0] | 1 << (32 - length), length), dst)]
+    else:
+        length = dst[1] + 1
+        halves = [(src, (dst[0], length)), (src, (dst[0] | 1 << (32 - length), length))]
+    for half_src, half_dst in halves:
+        inside = [(s, d) for s, d in points if _contains(half_src, s) and _contains(half_dst, d)]
+        if inside:
+            carve(half_src, half_dst, inside, taken, out)
+
+
+def compile_block(flows, base_src, base_dst, block_len):
+    """``(rule, points)`` pairs for the flows of one block pair, given as
+    ``{(src, dst, priority): action}`` with integer addresses; ``points`` are
+    the ``(src, dst)`` the rule is there for"""
+    classes = defaultdict(list)
+    for (src, dst, priority), action in flows.items():
+        classes[(priority, action)].append((src, dst))
+    rules = {}
+    # priority -> (src, dst) of the rules of the classes compiled so far
+    taken = defaultdict(list)
+    for (priority, action), points in classes.items():
+        others = taken[priority][:]
+        own = set(points)
+        conflicts = [(s, d) for (s, d, q), other in flows.items()
+                     if other != action and q <= priority and (s, d) not in own]
+        # Pass 1: each source's destinations
+        dsts, blocked_dsts = defaultdict(list), defaultdict(list)
+        for s, d in points:
+            dsts[s].append(d)
+        for s, d in conflicts:
+            if s in dsts:
+                blocked_dsts[s].append(d)
+        srcs_by_prefix = defaultdict(list)
+        for s, ds in dsts.items():
+            prefixes = []
+            cover(base_dst, block_len, sorted(ds), sorted(blocked_dsts.get(s, ())), prefixes)
+            for prefix in prefixes:
+                srcs_by_prefix[prefix].append(s)
+        # Pass 2: sources sharing a destination prefix
+        for dst_prefix, srcs in srcs_by_prefix.items():
+            blocked = sorted({s for s, d in conflicts if _contains(dst_prefix, d)})
+            prefixes = []
+            cover(base_src, block_len, sorted(srcs), blocked, prefixes)
+            for src_prefix in prefixes:
+                pieces = []
+                carve(src_prefix, dst_prefix, [(s, d) for s in srcs if _contains(src_prefix, s)
+                                               for d in dsts[s] if _contains(dst_prefix, d)],
+                      others, pieces)
+                for src_piece, dst_piece, covered in pieces:
+                    rule = Rule(priority, src_piece, dst_piece, action)
+                    # Carving can cut two of the class's rules down to one piece
+                    rules.setdefault(rule.key, (rule, []))[1].extend(covered)
+                    taken[priority].append((src_piece, dst_piece))
+    return list(rules.values())
+
+
+class RuleCompiler:
+    def __init__(self, block_len=24):
+        self.block_len = block_len
+        # (switch, flow_id) -> (src, dst, priority, action)
+        self._entries = {}
+        # flow_id -> switches it has an entry on
+        self._switches = defaultdict(set)
+        # (switch, src block, dst block) -> {flow_id} and -> {rule key: Rule}
+        self._block_flows = defaultdict(set)
+        self._block_rules = {}
+        # (switch, src block, dst block) -> {rule key: flows using the rule}
+        self._rule_users = {}
+        self._rule_count = defaultdict(int)
+        self._lock = threading.Lock()
+        # Totals since start
+        self.flow_mods = 0
+        self.exact_flow_mods = 0
+
+    @property
+    def num_entries(self):
+        return len(self._entries)
+
+    @property
+    def num_rules(self):
+        return sum(self._rule_count.values())
+
+    @property
+    def compression_ratio(self):
+        """Exact entries per installed rule"""
+        rules = self.num_rules
+        return len(self._entries) / rules if rules else 1.0
+
+    def rules(self, switch):
+        with self._lock:
+            return [rule for (sw, _, _), rules in self._block_rules.items() if sw == switch
+                    for rule in rules.values()]
+
+    def place(self, flow_id, src, dst, priority, actions):
+        """Give ``flow_id`` the per-switch ``actions`` (``{switch: action}``);
+        switches it no longer crosses drop it"""
+        return self.apply([(flow_id, (src, dst, priority, actions))])
+
+    def remove(self, flow_id):
+        return self.apply([(flow_id, None)])
+
+    def apply(self, changes):
+        """Apply ``(flow_id, (src, dst, priority, {switch: action}) or None)``
+        changes in one pass and return the RuleUpdate"""
+        update = RuleUpdate()
+        with self._lock:
+            dirty = set()
+            for flow_id, spec in changes:
+                if spec is None:
+                    wanted = {}
+                else:
+                    src, dst, priority, actions = spec
+                    src, dst = ip_to_int(src), ip_to_int(dst)
+                    wanted = {switch: (src, dst, priority, action) for switch, action in actions.items()}
+                for switch in list(self._switches.get(flow_id, ())):
+                    if switch not in wanted:
+                        self._drop(switch, flow_id, dirty)
+                        update.exact_flow_mods += 1
+                for switch, entry in wanted.items():
+                    old = self._entries.get((switch, flow_id))
+                    if old == entry:
+                        continue
+                    if old is not None:
+                        self._drop(switch, flow_id, dirty)
+                    self._add(switch, flow_id, entry, dirty)
+                    # A changed action is a modify, a changed match a delete and an add
+                    update.exact_flow_mods += 1 if old is None or old[:3] == entry[:3] else 2
+                if not self._switches.get(flow_id):
+                    self._switches.pop(flow_id, None)
+            for block in dirty:
+                self._recompile(block, update)
+            self.flow_mods += update.flow_mods
+            self.exact_flow_mods += update.exact_flow_mods
+            update.compression_ratio = self.compression_ratio
+        return update
+
+    def summary(self):
+        with self._lock:
+            switches = defaultdict(lambda: {'flows': 0, 'rules': 0})
+            for switch, _ in self._entries:
+                switches[switch]['flows'] += 1
+            for switch, count in self._rule_count.items():
+                if count:
+                    switches[switch]['rules'] = count
+            return {
+                'switches': dict(switches),
+                'entries': len(self._entries),
+                'rules': self.num_rules,
+                'compression_ratio': round(self.compression_ratio, 3),
+                'flow_mods': self.flow_mods,
+                'flow_mods_saved': self.exact_flow_mods - self.flow_mods,
+            }
+
+    # -- internals ----------------------------------------------------------
+
+    def _block(self, switch, entry):
+        shift = 32 - self.block_len
+        return switch, entry[0] >> shift, entry[1] >> shift
+
+    def _home(self, block, entry):
+        """Key of the rule of ``entry``'s class that gives it its action, or
+        None if there is none or an other-action rule would take it"""
+        src, dst, priority, action = entry
+        home = None
+        for key, rule in self._block_rules.get(block, {}).items():
+            if _contains(rule.src, src) and _contains(rule.dst, dst):
+                if rule.action != action:
+                    if rule.priority >= priority:
+                        return None
+                elif rule.priority == priority:
+                    home = key
+        return home
+
+    def _add(self, switch, flow_id, entry, dirty):
+        self._entries[(switch, flow_id)] = entry
+        self._switches[flow_id].add(switch)
+        block = self._block(switch, entry)
+        self._block_flows[block].add(flow_id)
+        if block not in dirty:
+            home = self._home(block, entry)
+            if home is not None:
+                self._rule_users[block][home] += 1
+                return
+        dirty.add(block)
+
+    def _drop(self, switch, flow_id, dirty):
+        entry = self._entries.pop((switch, flow_id))
+        self._switches[flow_id].discard(switch)
+        block = self._block(switch, entry)
+        self._block_flows[block].discard(flow_id)
+        if block not in dirty:
+            home = self._home(block, entry)
+            # Dropping the rule's last user would leave it covering nothing
+            if home is not None and self._rule_users[block][home] > 1:
+                self._rule_users[block][home] -= 1
+                return
+        dirty.add(block)
+
+    def _recompile(self, block, update):
+        switch, src_block, dst_block = block
+        flow_ids = self._block_flows.get(block)
+        flows, counts = {}, defaultdict(int)
+        for flow_id in sorted(flow_ids or (), key=str):
+            src, dst, priority, action = self._entries[(switch, flow_id)]
+            flows[(src, dst, priority)] = action
+            counts[(src, dst, priority)] += 1
+        shift = 32 - self.block_len
+        new, users = {}, {}
+        for rule, points in compile_block(flows, src_block << shift, dst_block << shift, self.block_len):
+            new[rule.key] = rule
+            users[rule.key] = sum(counts[(s, d, rule.priority)] for s, d in points)
+        old = self._block_rules.get(block, {})
+        for key, rule in new.items():
+            have = old.get(key)
+            if have is None:
+                update.adds[switch].append(rule)
+            elif have.action != rule.action:
+                update.modifies[switch].append(rule)
+        for key, rule in old.items():
+            if key not in new:
+                update.deletes[switch].append(rule)
+        self._rule_count[switch] += len(new) - len(old)
+        if new:
+            self._block_rules[block] = new
+            self._rule_users[block] = users
+        else:
+            self._block_rules.pop(block, None)
+            self._rule_users.pop(block, None)
+            self._block_flows.pop(block, None)
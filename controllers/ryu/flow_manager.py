@@ -1,8 +1,29 @@
+import contextlib
+import time
+
 from ryu.base import app_manager
 from ryu.controller import ofp_event
-from ryu.controller.handler import MAIN_DISPATCHER, set_ev_cls
+from ryu.controller.handler import MAIN_DISPATCHER, DEAD_DISPATCHER, set_ev_cls
 from ryu.lib import hub
-from ryu.ofproto import ofproto_v1_3
+from ryu.ofproto import ofproto_v1_3, ofproto_v1_3_parser
+
+from controllers.flow_timeouts import FlowTimeouts
+from controllers.protection import ProtectionManager
+from controllers.rule_compiler import RuleCompiler
+from controllers.ryu.flow_programmer import FlowProgrammer, flow_key
+from controllers.topology_compiler import load_topology
+from controllers.topology_store import LINK_DOWN, LINK_REMOVE
+from monitoring.collectors.poll_scheduler import PollScheduler
+
+RECONCILE_TIMEOUT = 10
+# Flow stats are polled this often to see which timed entries are still in use
+STATS_INTERVAL = 15
+MONITOR_TICK = 1
+# Extra time a switch gets to report a timeout before the controller assumes it
+FLOW_REMOVED_GRACE = 2 * STATS_INTERVAL
+# Protected flows hit by a failure are re-planned this many at a time
+REOPTIMISE_BATCH = 500
+REOPTIMISE_INTERVAL = 1
 
 
 class FlowManager(app_manager.RyuApp):
@@ -11,40 +32,260 @@ class FlowManager(app_manager.RyuApp):
     def __init__(self, *args, **kwargs):
         super(FlowManager, self).__init__(*args, **kwargs)
         self.datapaths = {}
+        self.programmer = FlowProgrammer()
+        self._batch_depth = 0
+        # dpid -> (requested_at, stats so far) while waiting for a flow stats reply
+        self._reconciling = {}
+        default_flow = load_topology().meta.get('default_flow', {})
+        self.default_timeouts = {'idle_timeout': default_flow.get('idle_timeout', 0),
+                                 'hard_timeout': default_flow.get('hard_timeout', 0)}
+        # Switches enforce timeouts and send flow-removed messages. These
+        # timers, refreshed from flow stats, forget entries whose message was lost
+        self.timeouts = FlowTimeouts()
+        # Flow stats replies reach every app, so FlowStatsCollector's polls
+        # refresh the timers. Without it, this app polls on its own jittered
+        # schedule rather than asking every switch at once
+        self.scheduler = PollScheduler(kinds=('flow',), base_interval=STATS_INTERVAL,
+                                       min_interval=STATS_INTERVAL, max_interval=STATS_INTERVAL)
+        self.rule_compiler = RuleCompiler()
+        # RuleCompiler actions are hashable keys; these are the actions behind them
+        self._rule_actions = {}
+        self._topology = None
+        self._protection = None
         self.monitor_thread = hub.spawn(self._monitor)
+        hub.spawn(self._reoptimise)
 
-    @set_ev_cls(ofp_event.EventOFPStateChange, [MAIN_DISPATCHER])
+    @set_ev_cls(ofp_event.EventOFPStateChange, [MAIN_DISPATCHER, DEAD_DISPATCHER])
     def _state_change_handler(self, ev):
         datapath = ev.datapath
         if ev.state == MAIN_DISPATCHER:
             self.datapaths[datapath.id] = datapath
-        else:
+            # Find out what the switch already carries (it may have kept its
+            # table across a controller restart) before programming it
+            self._reconciling[datapath.id] = (time.time(), [])
+            datapath.send_msg(datapath.ofproto_parser.OFPFlowStatsRequest(datapath))
+            self.scheduler.register(datapath.id)
+        elif datapath.id in self.datapaths:
             del self.datapaths[datapath.id]
+            self._reconciling.pop(datapath.id, None)
+            self.scheduler.unregister(datapath.id)
+            self.programmer.forget(datapath.id)
 
-    def add_flow(self, datapath, priority, match, actions):
-        ofproto = datapath.ofproto
-        parser = datapath.ofproto_parser
+    @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
+    def _flow_stats_reply_handler(self, ev):
+        msg = ev.msg
+        dpid = msg.datapath.id
+        for stat in msg.body:
+            self.timeouts.observe_packets((dpid, flow_key(stat.match, stat.priority, stat.table_id)),
+                                          stat.packet_count)
+        self.scheduler.reply(dpid, msg.xid, bool(msg.flags & msg.datapath.ofproto.OFPMPF_REPLY_MORE))
+        pending = self._reconciling.get(dpid)
+        if pending is None:
+            return
+        pending[1].extend(msg.body)
+        if not msg.flags & msg.datapath.ofproto.OFPMPF_REPLY_MORE:
+            self._reconcile(msg.datapath, pending[1])
 
-        # Create flow entry
-        inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, actions)]
-        flow_mod = parser.OFPFlowMod(datapath=datapath, priority=priority,
-                                      match=match, instructions=inst)
-        datapath.send_msg(flow_mod)
+    def _reconcile(self, datapath, stats):
+        del self._reconciling[datapath.id]
+        matching = self.programmer.reconcile(datapath, stats)
+        sent = self.programmer.commit({datapath.id: datapath}).get(datapath.id, 0)
+        self.logger.info("Switch %s reconciled: %d entries already in place, %d flow-mods sent",
+                         datapath.id, matching, sent)
+
+    @set_ev_cls(ofp_event.EventOFPFlowRemoved, MAIN_DISPATCHER)
+    def _flow_removed_handler(self, ev):
+        msg = ev.msg
+        dpid = msg.datapath.id
+        key = flow_key(msg.match, msg.priority, msg.table_id)
+        self.timeouts.remove((dpid, key))
+        if self.programmer.expired(dpid, key):
+            self.logger.debug("Flow %s on switch %s removed by the switch (reason %s)",
+                              key, dpid, msg.reason)
+
+    @set_ev_cls(ofp_event.EventOFPBarrierReply, MAIN_DISPATCHER)
+    def _barrier_reply_handler(self, ev):
+        self.programmer.barrier_reply(ev.msg.datapath.id, ev.msg.xid)
+
+    @set_ev_cls(ofp_event.EventOFPErrorMsg, MAIN_DISPATCHER)
+    def _error_msg_handler(self, ev):
+        msg = ev.msg
+        if self.programmer.error(msg.datapath.id, msg.xid):
+            self.logger.warning("Flow-mod %s rejected by switch %s: type=%s code=%s",
+                                msg.xid, msg.datapath.id, msg.type, msg.code)
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Coalesce every flow change made inside the block into one commit"""
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self.commit()
+
+    def commit(self):
+        """Push pending flow changes to all connected, reconciled switches"""
+        return self.programmer.commit({dpid: dp for dpid, dp in self.datapaths.items()
+                                       if dpid not in self._reconciling})
+
+    def _commit(self, datapath):
+        if not self._batch_depth and datapath.id not in self._reconciling:
+            self.programmer.commit({datapath.id: datapath})
+
+    def add_flow(self, datapath, priority, match, actions, **kwargs):
+        """Install an entry; idle and hard timeouts default to the switch config's default_flow"""
+        for name, value in self.default_timeouts.items():
+            kwargs.setdefault(name, value)
+        entry = self.programmer.stage(datapath.id, priority, match, actions, **kwargs)
+        self.timeouts.add((datapath.id, entry.key),
+                          idle_timeout=entry.idle_timeout and entry.idle_timeout + FLOW_REMOVED_GRACE,
+                          hard_timeout=entry.hard_timeout and entry.hard_timeout + FLOW_REMOVED_GRACE)
+        self._commit(datapath)
 
     def delete_flow(self, datapath, match):
+        if self.programmer.unstage_match(datapath.id, match):
+            self._commit(datapath)
+            return
+        # Not programmed through this app: fall back to a non-strict delete
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
-
-        # Create flow deletion
         flow_mod = parser.OFPFlowMod(datapath=datapath, command=ofproto.OFPFC_DELETE,
-                                      match=match)
+                                     out_port=ofproto.OFPP_ANY, out_group=ofproto.OFPG_ANY,
+                                     match=match)
         datapath.send_msg(flow_mod)
 
-    def modify_flow(self, datapath, priority, match, actions):
-        self.delete_flow(datapath, match)
-        self.add_flow(datapath, priority, match, actions)
+    def modify_flow(self, datapath, priority, match, actions, **kwargs):
+        # Staging over an installed entry emits a single OFPFC_MODIFY_STRICT
+        self.add_flow(datapath, priority, match, actions, **kwargs)
+
+    def reroute(self, changes):
+        """Apply ``(dpid, priority, match, actions)`` changes as one batch.
+
+        ``actions=None`` removes the entry. Each datapath gets one flow-mod per
+        real change followed by a single barrier.
+        """
+        for dpid, priority, match, actions in changes:
+            if actions is None:
+                self.programmer.unstage(dpid, priority, match)
+                continue
+            # A rerouted entry keeps its timeouts, so the change stays a modify
+            old = self.programmer.desired[dpid].get(flow_key(match, priority))
+            lifetime = {} if old is None else dict(idle_timeout=old.idle_timeout,
+                                                   hard_timeout=old.hard_timeout, cookie=old.cookie)
+            self.programmer.stage(dpid, priority, match, actions, **lifetime)
+        if not self._batch_depth:
+            return self.commit()
+        return {}
+
+    def aggregate_flow(self, flow_id, src, dst, priority, hops):
+        """Install the ``src`` -> ``dst`` host flow with ``hops`` (``{dpid:
+        actions}``) as wildcard rules shared with the flows on the same path"""
+        actions = {}
+        for dpid, hop_actions in hops.items():
+            key = tuple(str(a) for a in hop_actions)
+            self._rule_actions[key] = hop_actions
+            actions[dpid] = key
+        return self._apply_rules(self.rule_compiler.place(flow_id, src, dst, priority, actions))
+
+    def remove_aggregate_flow(self, flow_id):
+        return self._apply_rules(self.rule_compiler.remove(flow_id))
+
+    def _apply_rules(self, update):
+        for dpid, rules in update.deletes.items():
+            for rule in rules:
+                self.programmer.unstage(dpid, rule.priority, rule.match())
+        for changes in (update.adds, update.modifies):
+            for dpid, rules in changes.items():
+                for rule in rules:
+                    self.programmer.stage(dpid, rule.priority, rule.match(), self._rule_actions[rule.action])
+        if update.flow_mods and not self._batch_depth:
+            self.commit()
+        self.logger.debug("Rule update: %d flow-mods instead of %d, compression %.1fx",
+                          update.flow_mods, update.exact_flow_mods, update.compression_ratio)
+        return update
+
+    @property
+    def protection(self):
+        """Fast-failover protection over TopologyDiscovery's path engine, or
+        None until that app is running"""
+        if self._protection is None:
+            topology = app_manager.lookup_service_brick('TopologyDiscovery')
+            if topology is None:
+                return None
+            self._topology = topology
+            self._protection = ProtectionManager(self.programmer, topology.path_engine,
+                                                 ofproto_v1_3, ofproto_v1_3_parser)
+            topology.store.subscribe(self._links_changed)
+        return self._protection
+
+    def protect_flow(self, flow_id, match, priority, src, dst, path=None):
+        """Install a flow from switch ``src`` to ``dst`` with a fast-failover
+        backup at every hop; returns the ProtectionPlan or None"""
+        protection = self.protection
+        if protection is None:
+            raise RuntimeError("TopologyDiscovery is not running")
+        plan = protection.protect(flow_id, match, priority, src, dst, path)
+        if not self._batch_depth:
+            self.commit()
+        return plan
+
+    def _links_changed(self, events):
+        # The switches have already failed over; queue the affected flows
+        graph = self._topology.graph
+        for event in events:
+            if event.kind not in (LINK_DOWN, LINK_REMOVE):
+                continue
+            src, src_port = event.data['link'][:2]
+            link = graph.ports.get((graph.dpids.get(src), src_port))
+            if link is not None and self._protection.link_down(link):
+                self.logger.info("Link %s down: %d protected flows queued for re-planning",
+                                 graph.link_name(link), self._protection.pending)
+
+    def _reoptimise(self):
+        while True:
+            hub.sleep(REOPTIMISE_INTERVAL)
+            if self._protection is None or not self._protection.pending:
+                continue
+            with self.batch():
+                done = self._protection.reoptimise(REOPTIMISE_BATCH)
+            self.logger.info("Re-planned %d protected flows, %d still queued",
+                             len(done), self._protection.pending)
+
+    def _expire_flows(self):
+        """Forget, in one pass, the entries whose flow-removed message never came"""
+        expired = self.timeouts.expire()
+        count = sum(1 for (dpid, key), _ in expired if self.programmer.expired(dpid, key))
+        if count:
+            self.logger.info("Forgot %d timed-out flows without a flow-removed message", count)
+
+    def _poll_flow_stats(self):
+        """Send the flow stats requests that are due, unless FlowStatsCollector
+        is running and polling the switches already"""
+        self.scheduler.expire()
+        idle = not len(self.timeouts) or app_manager.lookup_service_brick('FlowStatsCollector') is not None
+        for dpid, kind in self.scheduler.due():
+            datapath = self.datapaths.get(dpid)
+            if datapath is None:
+                continue
+            # A reconciling switch is answering a flow stats request already
+            if idle or dpid in self._reconciling:
+                self.scheduler.skip(dpid, kind)
+                continue
+            request = datapath.ofproto_parser.OFPFlowStatsRequest(datapath)
+            datapath.send_msg(request)
+            self.scheduler.sent(dpid, kind, request.xid)
 
     def _monitor(self):
         while True:
-            # Implement monitoring logic here
-            hub.sleep(5)  # Adjust the sleep time as necessary
+            # A switch that never answered the flow stats request is
+            # programmed from scratch
+            now = time.time()
+            for dpid, (requested_at, stats) in list(self._reconciling.items()):
+                if now - requested_at > RECONCILE_TIMEOUT:
+                    self.logger.warning("Switch %s sent no flow stats; reinstalling its flows", dpid)
+                    self._reconcile(self.datapaths[dpid], stats)
+            self._poll_flow_stats()
+            self._expire_flows()
+            hub.sleep(MONITOR_TICK)
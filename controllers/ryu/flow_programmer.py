@@ -0,0 +1,370 @@
+"""
+Desired-state flow programming for OpenFlow 1.3 datapaths
+
+FlowProgrammer keeps a desired flow table per datapath and the state it last
+programmed. ``commit`` diffs the two and emits at most one flow-mod per real
+change (OFPFC_ADD for new entries, OFPFC_MODIFY_STRICT for changed actions,
+OFPFC_DELETE_STRICT for removed entries), followed by one barrier per
+datapath. Repeated changes to the same entry between commits are coalesced.
+Rerouting an installed flow rewrites its instructions in place, so there is
+no window where the entry is missing from the switch.
+
+After a controller restart ``reconcile`` adopts what a switch reports in its
+flow stats as already installed. The first commit then only sends the
+differences instead of reinstalling every entry.
+
+Groups (``stage_group``) are diffed the same way. A commit sends group adds
+and modifies before the flow-mods that may point at them, and group deletes
+after the flow-mods that stop using them.
+
+The module only talks to ``datapath.ofproto`` and ``datapath.ofproto_parser``
+so it can be driven by fake datapaths in tests.
+"""
+
+import logging
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+
+def match_fields(match):
+    """Normalise an OFPMatch or a dict of match fields to a plain dict"""
+    if isinstance(match, dict):
+        return dict(match)
+    return dict(match.items())
+
+
+def _freeze(value):
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class FlowEntry:
+    __slots__ = ('table_id', 'priority', 'match', 'actions', 'idle_timeout',
+                 'hard_timeout', 'cookie', 'meter_id', 'key', 'actions_key')
+
+    def __init__(self, priority, match, actions, table_id=0, idle_timeout=0,
+                 hard_timeout=0, cookie=0, meter_id=None):
+        self.table_id = table_id
+        self.priority = priority
+        self.match = match_fields(match)
+        self.actions = list(actions)
+        self.idle_timeout = idle_timeout
+        self.hard_timeout = hard_timeout
+        self.cookie = cookie
+        # Meter the entry's packets go through before its actions, if any
+        self.meter_id = meter_id
+        self.key = flow_key(self.match, priority, table_id)
+        self.actions_key = (meter_id,) + tuple(str(a) for a in self.actions)
+
+    def same_instructions(self, other):
+        return self.actions_key == other.actions_key
+
+    def same_lifetime(self, other):
+        return (self.idle_timeout, self.hard_timeout, self.cookie) == \
+            (other.idle_timeout, other.hard_timeout, other.cookie)
+
+
+def flow_key(match, priority, table_id=0):
+    """Identity of a flow entry as seen by strict OpenFlow matching"""
+    fields = match_fields(match)
+    return table_id, priority, tuple(sorted((k, _freeze(v)) for k, v in fields.items()))
+
+
+class GroupEntry:
+    __slots__ = ('group_id', 'type', 'buckets', 'buckets_key')
+
+    def __init__(self, group_id, type_, buckets):
+        """``type_`` is 'all', 'select', 'indirect' or 'ff'; ``buckets`` is a
+        list of ``(watch_port, actions)``, ``watch_port`` None for none"""
+        self.group_id = group_id
+        self.type = type_
+        self.buckets = [(watch_port, list(actions)) for watch_port, actions in buckets]
+        self.buckets_key = (type_, tuple((watch_port, tuple(str(a) for a in actions))
+                                         for watch_port, actions in self.buckets))
+
+    def same_buckets(self, other):
+        return self.buckets_key == other.buckets_key
+
+
+# Installed state of a group the switch already had when we tried to add it
+_EXISTING_GROUP = GroupEntry(None, None, [])
+
+
+def entry_from_stats(stat, ofproto):
+    """FlowEntry for one OFPFlowStats body, using its apply-actions and meter instructions"""
+    actions, meter_id = [], None
+    for inst in stat.instructions:
+        if inst.type == ofproto.OFPIT_APPLY_ACTIONS:
+            actions = inst.actions
+        elif inst.type == ofproto.OFPIT_METER:
+            meter_id = inst.meter_id
+    return FlowEntry(stat.priority, stat.match, actions, table_id=stat.table_id,
+                     idle_timeout=stat.idle_timeout, hard_timeout=stat.hard_timeout,
+                     cookie=stat.cookie, meter_id=meter_id)
+
+
+class FlowProgrammer:
+    def __init__(self):
+        self.desired = defaultdict(dict)
+        self.installed = defaultdict(dict)
+        self._dirty = defaultdict(set)
+        self.desired_groups = defaultdict(dict)
+        self.installed_groups = defaultdict(dict)
+        self._dirty_groups = defaultdict(set)
+        # dpid -> {xid: key} for flow-mods not yet covered by a barrier reply;
+        # group-mods are recorded as ('group', group_id, was_add)
+        self._in_flight = defaultdict(dict)
+        # dpid -> {xid: entry} for DELETE_STRICTs the switch has not confirmed
+        self.pending_deletes = defaultdict(dict)
+        self.pending_barriers = {}
+
+    # -- desired state ------------------------------------------------------
+
+    def stage(self, dpid, priority, match, actions, **kwargs):
+        """Declare that ``dpid`` should carry this entry after the next commit"""
+        entry = FlowEntry(priority, match, actions, **kwargs)
+        self.desired[dpid][entry.key] = entry
+        self._dirty[dpid].add(entry.key)
+        return entry
+
+    def unstage(self, dpid, priority, match, table_id=0):
+        """Declare that the entry should be removed from ``dpid``"""
+        key = flow_key(match, priority, table_id)
+        if self.desired[dpid].pop(key, None) is not None or key in self.installed[dpid]:
+            self._dirty[dpid].add(key)
+            return True
+        return False
+
+    def unstage_match(self, dpid, match, table_id=0):
+        """Remove every entry with exactly this match, whatever its priority"""
+        fields = flow_key(match, 0, table_id)[2]
+        keys = [k for k in set(self.desired[dpid]) | set(self.installed[dpid])
+                if k[0] == table_id and k[2] == fields]
+        for key in keys:
+            self.desired[dpid].pop(key, None)
+            self._dirty[dpid].add(key)
+        return len(keys)
+
+    def replace(self, dpid, entries):
+        """Make ``entries`` the complete desired table of ``dpid``"""
+        table = {entry.key: entry for entry in entries}
+        self._dirty[dpid].update(set(self.desired[dpid]) | set(table) | set(self.installed[dpid]))
+        self.desired[dpid] = table
+
+    def stage_group(self, dpid, group_id, type_, buckets):
+        """Declare that ``dpid`` should carry this group after the next commit"""
+        group = GroupEntry(group_id, type_, buckets)
+        self.desired_groups[dpid][group_id] = group
+        self._dirty_groups[dpid].add(group_id)
+        return group
+
+    def unstage_group(self, dpid, group_id):
+        if self.desired_groups[dpid].pop(group_id, None) is not None or \
+                group_id in self.installed_groups[dpid]:
+            self._dirty_groups[dpid].add(group_id)
+            return True
+        return False
+
+    def expired(self, dpid, key):
+        """The switch dropped the entry ``key`` on a timeout: stop wanting it,
+        unless it was staged again since, in which case the next commit
+        reinstalls it"""
+        self.installed[dpid].pop(key, None)
+        if key in self._dirty[dpid]:
+            return False
+        return self.desired[dpid].pop(key, None) is not None
+
+    def forget(self, dpid):
+        """The datapath disconnected: nothing is known to be installed on it"""
+        self.installed.pop(dpid, None)
+        self.installed_groups.pop(dpid, None)
+        self._in_flight.pop(dpid, None)
+        self.pending_deletes.pop(dpid, None)
+        self.pending_barriers.pop(dpid, None)
+        self._dirty[dpid].update(self.desired[dpid])
+        self._dirty_groups[dpid].update(self.desired_groups[dpid])
+
+    def reconcile(self, datapath, stats):
+        """Adopt the entries ``datapath`` reports (OFPFlowStats bodies) as installed.
+
+        Only entries this programmer wants are adopted; anything else on the
+        switch belongs to someone else and is left alone. Returns the number
+        of desired entries already present with the right instructions.
+        """
+        dpid = datapath.id
+        desired = self.desired[dpid]
+        installed = {}
+        for stat in stats:
+            entry = entry_from_stats(stat, datapath.ofproto)
+            if entry.key in desired:
+                installed[entry.key] = entry
+        self.installed[dpid] = installed
+        self.installed_groups.pop(dpid, None)
+        self._in_flight.pop(dpid, None)
+        self.pending_deletes.pop(dpid, None)
+        self._dirty[dpid].update(desired)
+        self._dirty_groups[dpid].update(self.desired_groups[dpid])
+        return sum(1 for key, entry in installed.items()
+                   if entry.same_instructions(desired[key]) and entry.same_lifetime(desired[key]))
+
+    # -- diff and emit ------------------------------------------------------
+
+    def diff(self, dpid):
+        """Return ``(adds, modifies, deletes)`` needed to reach the desired state"""
+        adds, modifies, deletes = [], [], []
+        desired, installed = self.desired[dpid], self.installed[dpid]
+        for key in self._dirty.get(dpid, ()):
+            want, have = desired.get(key), installed.get(key)
+            if want is None:
+                if have is not None:
+                    deletes.append(have)
+            elif have is None or not want.same_lifetime(have):
+                # OFPFC_ADD over an identical match replaces the entry atomically
+                adds.append(want)
+            elif not want.same_instructions(have):
+                modifies.append(want)
+        return adds, modifies, deletes
+
+    def group_diff(self, dpid):
+        """Return the ``(adds, modifies, deletes)`` group-mods for ``dpid``"""
+        adds, modifies, deletes = [], [], []
+        desired, installed = self.desired_groups[dpid], self.installed_groups[dpid]
+        for group_id in self._dirty_groups.get(dpid, ()):
+            want, have = desired.get(group_id), installed.get(group_id)
+            if want is None:
+                if have is not None:
+                    deletes.append(have if have is not _EXISTING_GROUP else GroupEntry(group_id, None, []))
+            elif have is None:
+                adds.append(want)
+            elif not want.same_buckets(have):
+                modifies.append(want)
+        return adds, modifies, deletes
+
+    def commit(self, datapaths):
+        """Program every dirty datapath in ``datapaths`` (a ``{dpid: datapath}``)
+
+        Returns the number of flow-mods and group-mods sent per datapath.
+        """
+        sent = {}
+        dirty = {d for d, keys in self._dirty.items() if keys} | \
+            {d for d, groups in self._dirty_groups.items() if groups}
+        for dpid in [d for d in dirty if d in datapaths]:
+            sent[dpid] = self._commit_one(datapaths[dpid])
+        return sent
+
+    def _commit_one(self, datapath):
+        dpid = datapath.id
+        ofproto, parser = datapath.ofproto, datapath.ofproto_parser
+        adds, modifies, deletes = self.diff(dpid)
+        group_adds, group_modifies, group_deletes = self.group_diff(dpid)
+        self._dirty[dpid].clear()
+        self._dirty_groups[dpid].clear()
+        # Groups must exist before flows point at them
+        count = self._send_groups(datapath, group_adds, group_modifies, ())
+        for command, entries in ((ofproto.OFPFC_ADD, adds), (ofproto.OFPFC_MODIFY_STRICT, modifies),
+                                 (ofproto.OFPFC_DELETE_STRICT, deletes)):
+            for entry in entries:
+                msg = self._flow_mod(datapath, command, entry)
+                datapath.send_msg(msg)
+                self._in_flight[dpid][msg.xid] = entry.key
+                if command == ofproto.OFPFC_DELETE_STRICT:
+                    self.installed[dpid].pop(entry.key, None)
+                    self.pending_deletes[dpid][msg.xid] = entry
+                else:
+                    self.installed[dpid][entry.key] = entry
+                count += 1
+        count += self._send_groups(datapath, (), (), group_deletes)
+        if count:
+            barrier = parser.OFPBarrierRequest(datapath)
+            datapath.send_msg(barrier)
+            self.pending_barriers[dpid] = barrier.xid
+            logger.debug("Programmed %d flow-mods on datapath %s (%d add, %d modify, %d delete)",
+                         count, dpid, len(adds), len(modifies), len(deletes))
+        return count
+
+    def _send_groups(self, datapath, adds, modifies, deletes):
+        dpid, ofproto = datapath.id, datapath.ofproto
+        count = 0
+        for command, groups in ((ofproto.OFPGC_ADD, adds), (ofproto.OFPGC_MODIFY, modifies),
+                                (ofproto.OFPGC_DELETE, deletes)):
+            for group in groups:
+                msg = self._group_mod(datapath, command, group)
+                datapath.send_msg(msg)
+                self._in_flight[dpid][msg.xid] = ('group', group.group_id, command == ofproto.OFPGC_ADD)
+                if command == ofproto.OFPGC_DELETE:
+                    self.installed_groups[dpid].pop(group.group_id, None)
+                else:
+                    self.installed_groups[dpid][group.group_id] = group
+                count += 1
+        return count
+
+    @staticmethod
+    def _group_mod(datapath, command, group):
+        ofproto, parser = datapath.ofproto, datapath.ofproto_parser
+        if command == ofproto.OFPGC_DELETE:
+            return parser.OFPGroupMod(datapath, command, ofproto.OFPGT_ALL, group.group_id, [])
+        buckets = [parser.OFPBucket(watch_port=ofproto.OFPP_ANY if watch_port is None else watch_port,
+                                    watch_group=ofproto.OFPG_ANY, actions=actions)
+                   for watch_port, actions in group.buckets]
+        return parser.OFPGroupMod(datapath, command, getattr(ofproto, 'OFPGT_' + group.type.upper()),
+                                  group.group_id, buckets)
+
+    @staticmethod
+    def _flow_mod(datapath, command, entry):
+        ofproto, parser = datapath.ofproto, datapath.ofproto_parser
+        kwargs = dict(datapath=datapath, table_id=entry.table_id, command=command,
+                      priority=entry.priority, match=parser.OFPMatch(**entry.match))
+        if command == ofproto.OFPFC_DELETE_STRICT:
+            kwargs.update(out_port=ofproto.OFPP_ANY, out_group=ofproto.OFPG_ANY)
+        else:
+            instructions = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, entry.actions)]
+            if entry.meter_id is not None:
+                instructions.insert(0, parser.OFPInstructionMeter(entry.meter_id, ofproto.OFPIT_METER))
+            kwargs.update(cookie=entry.cookie, idle_timeout=entry.idle_timeout,
+                          hard_timeout=entry.hard_timeout,
+                          # Entries that time out report it, so the controller forgets them
+                          flags=ofproto.OFPFF_SEND_FLOW_REM if entry.idle_timeout or entry.hard_timeout else 0,
+                          instructions=instructions)
+        return parser.OFPFlowMod(**kwargs)
+
+    # -- switch feedback ----------------------------------------------------
+
+    def barrier_reply(self, dpid, xid):
+        """Everything sent before the barrier has been processed by the switch"""
+        if self.pending_barriers.get(dpid) == xid:
+            del self.pending_barriers[dpid]
+            self._in_flight[dpid].clear()
+            self.pending_deletes.pop(dpid, None)
+
+    def error(self, dpid, xid):
+        """A flow-mod failed: the next commit retries it.
+
+        A failed add or modify is forgotten as installed, so it is added
+        again. A failed delete leaves the entry on the switch, so it is
+        marked installed again and deleted again.
+        """
+        key = self._in_flight[dpid].pop(xid, None)
+        if key is None:
+            return False
+        if key[0] == 'group':
+            _, group_id, was_add = key
+            # An add failing usually means the group is already there (it
+            # survived a reconnect), so modify it next; a modify failing means
+            # it is not, so add it
+            if was_add:
+                self.installed_groups[dpid][group_id] = _EXISTING_GROUP
+            else:
+                self.installed_groups[dpid].pop(group_id, None)
+            self._dirty_groups[dpid].add(group_id)
+            return True
+        deleted = self.pending_deletes[dpid].pop(xid, None)
+        if deleted is not None:
+            # The entry is still on the switch, so the next commit deletes it
+            # again; unless it was staged since, which replaced it anyway
+            self.installed[dpid].setdefault(key, deleted)
+        else:
+            self.installed[dpid].pop(key, None)
+        self._dirty[dpid].add(key)
+        return True
@@ -0,0 +1,105 @@
+from ryu.base import app_manager
+from ryu.controller import ofp_event
+from ryu.controller.handler import MAIN_DISPATCHER, set_ev_cls
+from ryu.lib import hub
+from ryu.ofproto import ofproto_v1_3, ofproto_v1_3_parser
+
+from controllers.forwarding import INSTALLED, Forwarder, controller_meter, table_miss
+from controllers.topology_compiler import load_topology
+
+# Packet-ins each switch may send per second, and the burst above that
+PACKET_IN_RATE = 1000
+PACKET_IN_BURST = 200
+LOG_INTERVAL = 10
+
+
+class Forwarding(app_manager.RyuApp):
+    """IPv4 forwarding over FlowManager's programmer and TopologyDiscovery's paths.
+
+    ``forwarding`` in the switch config picks the mode ("proactive" or
+    "reactive") and the packet-in meter's ``packet_in_rate`` and
+    ``packet_in_burst``.
+    """
+    OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
+
+    def __init__(self, *args, **kwargs):
+        super(Forwarding, self).__init__(*args, **kwargs)
+        config = load_topology().meta.get('forwarding', {})
+        self.mode = config.get('mode', 'reactive')
+        self.packet_in_rate = config.get('packet_in_rate', PACKET_IN_RATE)
+        self.packet_in_burst = config.get('packet_in_burst', PACKET_IN_BURST)
+        self.idle_timeout = config.get('idle_timeout', 30)
+        self._forwarder = None
+        self._flow_manager = None
+        self._topology_version = None
+        hub.spawn(self._monitor)
+
+    @property
+    def forwarder(self):
+        """The Forwarder, or None until FlowManager and TopologyDiscovery run"""
+        if self._forwarder is None:
+            flow_manager = app_manager.lookup_service_brick('FlowManager')
+            topology = app_manager.lookup_service_brick('TopologyDiscovery')
+            if flow_manager is None or topology is None:
+                return None
+            self._flow_manager = flow_manager
+            self._forwarder = Forwarder(flow_manager.programmer, topology.path_engine,
+                                        ofproto_v1_3, ofproto_v1_3_parser,
+                                        idle_timeout=self.idle_timeout)
+        return self._forwarder
+
+    @set_ev_cls(ofp_event.EventOFPStateChange, MAIN_DISPATCHER)
+    def _state_change_handler(self, ev):
+        datapath = ev.datapath
+        if self.forwarder is None or datapath.id is None:
+            return
+        for msg in controller_meter(datapath, self.packet_in_rate, self.packet_in_burst):
+            datapath.send_msg(msg)
+        with self._flow_manager.batch():
+            table_miss(self._flow_manager.programmer, datapath.id, datapath.ofproto,
+                       datapath.ofproto_parser)
+            if self.mode == 'proactive':
+                self.forwarder.proactive()
+
+    @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
+    def _packet_in_handler(self, ev):
+        msg = ev.msg
+        if self.forwarder is None:
+            return
+        datapath = msg.datapath
+        verdict, port = self._forwarder.packet_in(datapath.id, msg.data)
+        if verdict == INSTALLED:
+            self._flow_manager.commit()
+        if port is None:
+            return
+        ofproto, parser = datapath.ofproto, datapath.ofproto_parser
+        datapath.send_msg(parser.OFPPacketOut(datapath=datapath, buffer_id=ofproto.OFP_NO_BUFFER,
+                                              in_port=msg.match['in_port'],
+                                              actions=[parser.OFPActionOutput(port)], data=msg.data))
+
+    def _monitor(self):
+        ticks = 0
+        while True:
+            hub.sleep(1)
+            if self._forwarder is None:
+                continue
+            # Rules follow the topology: proactive ones are restaged, so only
+            # changed next hops are sent, and reactive pairs on a link that
+            # went down (or was removed) move to another path
+            engine = self._forwarder.path_engine
+            version = tuple(engine.link_up)
+            if version != self._topology_version:
+                previous, self._topology_version = self._topology_version, version
+                down = [link for link, up in enumerate(version)
+                        if not up and (previous is None or link >= len(previous) or previous[link])]
+                with self._flow_manager.batch():
+                    if self.mode == 'proactive':
+                        self._forwarder.proactive()
+                    elif down:
+                        moved = self._forwarder.reroute(down)
+                        self.logger.info("%d reactive pairs re-planned off links %s", moved, down)
+            ticks += 1
+            if ticks % LOG_INTERVAL == 0:
+                self._forwarder.prune()
+                self.logger.info("Packet-ins: %s, %d pairs being set up, %d routed",
+                                 self._forwarder.stats, self._forwarder.pending, self._forwarder.routes)
@@ -1,46 +1,134 @@
 from ryu.base import app_manager
 from ryu.controller import ofp_event
-from ryu.controller.handler import MAIN_DISPATCHER, set_ev_cls
+from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER, DEAD_DISPATCHER, set_ev_cls
 from ryu.lib import hub
-from ryu.lib.packet import packet
-from ryu.lib.packet import ethernet
 from ryu.ofproto import ofproto_v1_3
-import json
+
+from controllers.path_engine import DEFAULT_TOPOLOGY_FILE, PathEngine
+from controllers.topology_compiler import DEFAULT_SWITCH_CONFIG_FILE, load_topology
+from controllers.topology_reload import ConfigWatcher, TopologyReloader
+from controllers.topology_store import LINK_ADD, LINK_DOWN, LINK_REMOVE, LINK_UP, TopologyStore
+
+SUMMARY_INTERVAL = 10
+RELOAD_INTERVAL = 1
 
 class TopologyDiscovery(app_manager.RyuApp):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
 
     def __init__(self, *args, **kwargs):
         super(TopologyDiscovery, self).__init__(*args, **kwargs)
-        self.topology = {}
-        self.switches = set()
-        self.links = set()
+        self.store = TopologyStore()
+        # Cabling comes from the topology file; the store tracks what is live
+        self.graph = load_topology().graph()
+        self.path_engine = PathEngine(self.graph)
+        # Links only count for routing once both ends have been seen up
+        for link in range(self.graph.num_links):
+            self.path_engine.set_link_state(link, False)
+        self._node_dpid = {node: dpid for dpid, node in self.graph.dpids.items()}
+        self.store.subscribe(self._update_path_engine)
+        # Edits to the topology files are applied without a restart
+        self.reloader = TopologyReloader(self.path_engine, self.store)
+        self.watcher = ConfigWatcher([DEFAULT_TOPOLOGY_FILE, DEFAULT_SWITCH_CONFIG_FILE], self._reload)
         hub.spawn(self._monitor)
+        hub.spawn(self._watch_config)
+
+    @property
+    def topology(self):
+        return self.store.snapshot()
 
-    @set_ev_cls(ofp_event.EventOFPStateChange, [MAIN_DISPATCHER])
+    @set_ev_cls(ofp_event.EventOFPStateChange, [MAIN_DISPATCHER, DEAD_DISPATCHER])
     def state_change_handler(self, ev):
-        switch = ev.switch
-        if ev.state == 'up':
-            self.switches.add(switch.id)
-            self.topology[switch.id] = {'links': []}
-            self.logger.info("Switch %s is up", switch.id)
-        elif ev.state == 'down':
-            self.switches.discard(switch.id)
-            self.topology.pop(switch.id, None)
-            self.logger.info("Switch %s is down", switch.id)
-
-    @set_ev_cls(ofp_event.EventOFPPortStatus, [MAIN_DISPATCHER])
+        datapath = ev.datapath
+        if datapath.id is None:
+            return
+        if ev.state == MAIN_DISPATCHER:
+            self.store.add_switch(datapath.id)
+            self.logger.info("Switch %s is up", datapath.id)
+            parser = datapath.ofproto_parser
+            datapath.send_msg(parser.OFPPortDescStatsRequest(datapath, 0))
+        elif ev.state == DEAD_DISPATCHER:
+            self.store.remove_switch(datapath.id)
+            self.logger.info("Switch %s is down", datapath.id)
+
+    @set_ev_cls(ofp_event.EventOFPPortDescStatsReply, [CONFIG_DISPATCHER, MAIN_DISPATCHER])
+    def port_desc_handler(self, ev):
+        dpid = ev.msg.datapath.id
+        ofproto = ev.msg.datapath.ofproto
+        for port in ev.msg.body:
+            if port.port_no <= ofproto.OFPP_MAX:
+                self._set_port(dpid, port, ofproto)
+        self._connect_links(dpid)
+
+    @set_ev_cls(ofp_event.EventOFPPortStatus, MAIN_DISPATCHER)
     def port_status_handler(self, ev):
-        port = ev.port
-        switch_id = ev.switch.id
-        if port.state == 'up':
-            self.topology[switch_id]['links'].append(port.port_no)
-            self.logger.info("Port %s on switch %s is up", port.port_no, switch_id)
-        elif port.state == 'down':
-            self.topology[switch_id]['links'].remove(port.port_no)
-            self.logger.info("Port %s on switch %s is down", port.port_no, switch_id)
+        msg = ev.msg
+        dpid = msg.datapath.id
+        ofproto = msg.datapath.ofproto
+        port = msg.desc
+        if msg.reason == ofproto.OFPPR_DELETE:
+            self.store.remove_port(dpid, port.port_no)
+            self.logger.info("Port %s on switch %s was removed", port.port_no, dpid)
+            return
+        up = self._set_port(dpid, port, ofproto)
+        self.logger.info("Port %s on switch %s is %s", port.port_no, dpid, "up" if up else "down")
+        if up:
+            self._connect_links(dpid)
+
+    def _set_port(self, dpid, port, ofproto):
+        up = not (port.state & ofproto.OFPPS_LINK_DOWN or port.config & ofproto.OFPPC_PORT_DOWN)
+        if up:
+            self.store.port_up(dpid, port.port_no)
+        else:
+            self.store.port_down(dpid, port.port_no)
+        return up
+
+    def _connect_links(self, dpid):
+        """Add the configured links from ``dpid`` to neighbours that are connected"""
+        node = self.graph.dpids.get(dpid)
+        if node is None:
+            return
+        for peer, link in self.graph.adj[node]:
+            peer_dpid = self._node_dpid.get(peer)
+            port, peer_port = self.graph.port_of.get((node, link)), self.graph.port_of.get((peer, link))
+            if peer_dpid is not None and port is not None and peer_port is not None:
+                self.store.add_link(dpid, port, peer_dpid, peer_port)
+
+    def _update_path_engine(self, events):
+        for event in events:
+            if event.kind not in (LINK_ADD, LINK_REMOVE, LINK_UP, LINK_DOWN):
+                continue
+            src, src_port = event.data['link'][:2]
+            link = self.graph.ports.get((self.graph.dpids.get(src), src_port))
+            if link is None:
+                continue
+            up = event.kind == LINK_UP or (event.kind == LINK_ADD and event.data['up'])
+            self.path_engine.set_link_state(link, up)
+
+    def _reload(self, paths):
+        try:
+            compiled = load_topology()
+        except (OSError, KeyError, ValueError) as e:
+            self.logger.error("Topology reload failed, keeping the running topology: %s", e)
+            return
+        diff = self.reloader.apply(compiled.graph())
+        self._node_dpid = {node: dpid for dpid, node in self.graph.dpids.items()}
+        self.logger.info("Reloaded %s: %r", ", ".join(paths), diff)
+
+    def _watch_config(self):
+        while True:
+            hub.sleep(RELOAD_INTERVAL)
+            try:
+                self.watcher.poll()
+            except Exception:
+                self.logger.exception("Config reload failed")
 
     def _monitor(self):
+        version = -1
         while True:
-            self.logger.info("Current topology: %s", json.dumps(self.topology, indent=4))
-            hub.sleep(10)  # Monitor every 10 seconds
\ No newline at end of file
+            if self.store.version != version:
+                summary = self.store.summary()
+                version = summary['version']
+                self.logger.info("Topology version %d: %d switches, %d ports up, %d/%d links up",
+                                 version, summary['switches'], summary['ports_up'],
+                                 summary['links_up'], summary['links'])
+            hub.sleep(SUMMARY_INTERVAL)
@@ -2,35 +2,65 @@ from ryu.base import app_manager
 from ryu.controller import ofp_event
 from ryu.controller.handler import MAIN_DISPATCHER, set_ev_cls
 from ryu.lib import hub
-from ryu.lib.packet import packet
-from ryu.lib.packet import ethernet
+from ryu.ofproto import ofproto_v1_3
 import prometheus_client
 
+from controllers.counters import ShardedCounter, classify
+from monitoring.collectors.congestion_detector import START, StreamingDetector
+
+CHECK_INTERVAL = 1
+LOG_INTERVAL = 10
+
 class TrafficMonitor(app_manager.RyuApp):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
 
     def __init__(self, *args, **kwargs):
         super(TrafficMonitor, self).__init__(*args, **kwargs)
-        self.metrics = prometheus_client.Counter('traffic_monitor_packets', 'Number of packets monitored')
-        self.alert_threshold = 1000  # Example threshold for alerts
+        self.metrics = prometheus_client.Counter('traffic_monitor_packets', 'Number of packets monitored',
+                                                 ['protocol'])
+        # Per-packet work is one shard increment; totals are folded into
+        # Prometheus and the per-protocol rates checked on a timer
+        self.packets = ShardedCounter()
+        # Packet-in rates per protocol: a swing under 5 packets/s is noise
+        self.detector = StreamingDetector(capacity=64, min_std=5.0)
+        self._exported = {}
+        self._checked = 0
         self.monitor_thread = hub.spawn(self.monitor_traffic)
 
-    @set_ev_cls(ofp_event.EventPacketIn, MAIN_DISPATCHER)
+    @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def packet_in_handler(self, ev):
-        pkt = packet.Packet(ev.msg.data)
-        eth = pkt.get_protocol(ethernet.ethernet)
-        if eth:
-            self.metrics.inc()  # Increment the packet counter
-            self.check_alerts()
+        self.packets.inc(key=classify(ev.msg.data))
+
+    def packet_count(self):
+        return self.packets.total()
 
     def check_alerts(self):
-        if self.metrics._value.get() > self.alert_threshold:
-            self.send_alert()
+        """Export the packets counted since the last check and look for rate anomalies"""
+        totals = self.packets.values()
+        protocols, rates = [], []
+        for protocol, count in totals.items():
+            delta = count - self._exported.get(protocol, 0)
+            if delta > 0:
+                self.metrics.labels(protocol=protocol).inc(delta)
+            self._exported[protocol] = count
+            protocols.append(protocol)
+            rates.append(delta / CHECK_INTERVAL)
+        self._checked = sum(totals.values())
+        for event in self.detector.observe(protocols, rates):
+            self.send_alert(event)
 
-    def send_alert(self):
-        self.logger.warning("Traffic alert: Packet count exceeded threshold!")
+    def send_alert(self, event):
+        if event.kind == START:
+            self.logger.warning("Traffic alert: %s packet-in rate %.0f/s, z-score %.1f over mean %.0f/s",
+                                event.key, event.value, event.zscore, event.mean)
+        else:
+            self.logger.info("Traffic alert cleared: %s packet-in rate %.0f/s", event.key, event.value)
 
     def monitor_traffic(self):
+        ticks = 0
         while True:
-            hub.sleep(10)  # Monitor every 10 seconds
-            self.logger.info("Current packet count: %d", self.metrics._value.get())
\ No newline at end of file
+            hub.sleep(CHECK_INTERVAL)
+            self.check_alerts()
+            ticks += 1
+            if ticks % (LOG_INTERVAL // CHECK_INTERVAL) == 0:
+                self.logger.info("Current packet count: %d", self._checked)
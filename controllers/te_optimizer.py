@@ -0,0 +1,160 @@
+"""
+Multi-commodity traffic-engineering optimizer for flow placement
+
+Flows are grouped into commodities (ingress/egress switch pairs) and each
+commodity gets up to ``k`` candidate paths from the PathEngine. The optimizer
+then minimises the maximum link utilisation with a vectorized Frank-Wolfe
+iteration over the commodity split fractions (the max is approximated by the
+p-norm of the utilisation vector) and finally rounds the fractional split to a
+single path per flow. All per-flow and per-link work is done on NumPy arrays,
+so one pass over 100k flows and 1k links fits inside a control interval.
+
+Link updates arrive on other threads while a placement runs. The capacities,
+node ids and candidate paths are therefore read together with the path
+engine frozen, and the iteration then works on that snapshot alone.
+"""
+
+import logging
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class Placement:
+    """Result of an optimisation run"""
+
+    def __init__(self, flow_paths, paths, link_load, capacity, iterations, elapsed):
+        # flow index -> row in ``paths`` (-1 when the flow's egress is unreachable)
+        self.flow_paths = flow_paths
+        self.paths = paths
+        self.link_load = link_load
+        self.capacity = capacity
+        self.iterations = iterations
+        self.elapsed = elapsed
+
+    @property
+    def utilisation(self):
+        return self.link_load / self.capacity
+
+    @property
+    def max_utilisation(self):
+        return float(self.utilisation.max()) if len(self.capacity) else 0.0
+
+    def path_of(self, flow_index):
+        row = self.flow_paths[flow_index]
+        return self.paths[row] if row >= 0 else None
+
+
+class TrafficEngineeringOptimizer:
+    """Min-max link utilisation placement of flows onto candidate paths"""
+
+    def __init__(self, path_engine, k=4, iterations=40, norm=16):
+        self.path_engine = path_engine
+        self.k = k
+        self.iterations = iterations
+        self.norm = norm
+
+    def capacity_vector(self):
+        """Link capacities in Mbps, indexed by link id"""
+        return np.asarray(self.path_engine.graph.bandwidth, dtype=np.float64)
+
+    def optimise(self, src, dst, demand):
+        """Place flows given parallel arrays of ingress, egress and demand.
+
+        ``src`` and ``dst`` are switch ids or node indexes, ``demand`` is in
+        Mbps. Returns a Placement.
+        """
+        start = time.perf_counter()
+        demand = np.asarray(demand, dtype=np.float64)
+        with self.path_engine.frozen():
+            graph = self.path_engine.graph
+            src = np.asarray([graph.node_id(s) for s in src] if _needs_lookup(src) else src, dtype=np.int64)
+            dst = np.asarray([graph.node_id(d) for d in dst] if _needs_lookup(dst) else dst, dtype=np.int64)
+            capacity = self.capacity_vector()
+            num_nodes = graph.num_nodes
+            pairs, commodity = np.unique(src * num_nodes + dst, return_inverse=True)
+            paths, path_ptr, path_links, choices = self._candidate_paths(pairs, num_nodes)
+        num_paths = len(paths)
+        # Per path link incidence, flattened: path_of_entry[i] owns path_links[i]
+        path_of_entry = np.repeat(np.arange(num_paths), np.diff(path_ptr))
+        valid = choices >= 0
+        commodity_demand = np.bincount(commodity, weights=demand, minlength=len(pairs))
+
+        def link_load(fractions):
+            path_demand = np.zeros(num_paths)
+            np.add.at(path_demand, choices[valid], (fractions * commodity_demand[:, None])[valid])
+            return np.bincount(path_links, weights=path_demand[path_of_entry], minlength=len(capacity))
+
+        # Start everything on the first (shortest) candidate
+        fractions = np.zeros(choices.shape)
+        fractions[:, 0] = valid[:, 0]
+        iterations = 0
+        if num_paths and len(capacity):
+            for iterations in range(1, self.iterations + 1):
+                util = link_load(fractions) / capacity
+                peak = util.max()
+                if peak <= 0.0:
+                    break
+                # Gradient of sum((u / peak) ** p) with respect to the load on each link
+                link_grad = (util / peak) ** (self.norm - 1) / capacity
+                path_grad = np.bincount(path_of_entry, weights=link_grad[path_links], minlength=num_paths)
+                grad = np.where(valid, path_grad[np.maximum(choices, 0)], np.inf)
+                best = np.zeros(choices.shape)
+                best[np.arange(len(pairs)), grad.argmin(axis=1)] = 1.0
+                best[~valid[:, 0]] = 0.0
+                step = 2.0 / (iterations + 2.0)
+                fractions += step * (best - fractions)
+
+        flow_paths = self._round(fractions, choices, commodity, demand, commodity_demand)
+        path_demand = np.bincount(flow_paths[flow_paths >= 0], weights=demand[flow_paths >= 0],
+                                  minlength=num_paths)
+        load = np.bincount(path_links, weights=path_demand[path_of_entry], minlength=len(capacity))
+        elapsed = time.perf_counter() - start
+        placement = Placement(flow_paths, paths, load, capacity, iterations, elapsed)
+        logger.info(f"Placed {len(demand)} flows in {elapsed * 1000:.1f}ms, "
+                    f"max utilisation {placement.max_utilisation:.3f}")
+        return placement
+
+    def _candidate_paths(self, pairs, num_nodes):
+        paths, lengths, flat = [], [], []
+        choices = np.full((len(pairs), self.k), -1, dtype=np.int64)
+        for row, pair in enumerate(pairs.tolist()):
+            s, t = divmod(pair, num_nodes)
+            for j, path in enumerate(self.path_engine.k_shortest_paths(s, t, self.k)):
+                choices[row, j] = len(paths)
+                paths.append(path)
+                lengths.append(len(path.links))
+                flat.extend(path.links)
+        path_ptr = np.zeros(len(paths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=path_ptr[1:])
+        return paths, path_ptr, np.asarray(flat, dtype=np.int64), choices
+
+    @staticmethod
+    def _round(fractions, choices, commodity, demand, commodity_demand):
+        """Give each flow one path so per-commodity demand follows ``fractions``.
+
+        Flows are laid end to end within their commodity; a flow takes the path
+        whose share of the cumulative split contains the flow's midpoint.
+        """
+        order = np.lexsort((-demand, commodity))
+        sorted_comm = commodity[order]
+        cumulative = np.cumsum(demand[order])
+        starts = np.searchsorted(sorted_comm, sorted_comm, side='left')
+        offset = np.concatenate(([0.0], cumulative))[starts]
+        total = np.where(commodity_demand > 0, commodity_demand, 1.0)[sorted_comm]
+        midpoint = (cumulative - offset - demand[order] / 2.0) / total
+        bounds = np.cumsum(fractions, axis=1)[sorted_comm]
+        column = np.minimum((midpoint[:, None] >= bounds).sum(axis=1), choices.shape[1] - 1)
+        picked = choices[sorted_comm, column]
+        # Rounding error can land on an empty padding column; fall back to the last real path
+        fallback = choices[sorted_comm, np.maximum((choices[sorted_comm] >= 0).sum(axis=1) - 1, 0)]
+        picked = np.where(picked >= 0, picked, fallback)
+        flow_paths = np.empty(len(demand), dtype=np.int64)
+        flow_paths[order] = picked
+        return flow_paths
+
+
+def _needs_lookup(values):
+    return len(values) > 0 and isinstance(values[0], str)
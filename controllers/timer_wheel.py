@@ -0,0 +1,111 @@
+"""
+Hierarchical timer wheel
+
+Timers are kept in ``levels`` wheels of ``2**slot_bits`` slots. Level 0 has
+one slot per tick; a slot of level ``n`` spans ``2**(slot_bits * n)`` ticks.
+A timer goes into the lowest level whose span reaches its deadline, and when
+the lower level wraps around the next slot of the level above is cascaded
+down. Scheduling and cancelling cost O(1) and a tick touches one slot, so
+the cost does not depend on how many timers are pending.
+
+Slots hold keys only; the authoritative deadline of each key lives in one
+dict. Cancelling or rescheduling just changes that dict and leaves the old
+slot entry behind, to be skipped (or moved) when its slot comes up.
+"""
+
+import math
+import time
+
+
+class TimerWheel:
+    def __init__(self, tick=1.0, slot_bits=8, levels=4, now=None):
+        self.tick = tick
+        self.levels = levels
+        self._bits = slot_bits
+        self._mask = (1 << slot_bits) - 1
+        self._horizon = (1 << (slot_bits * levels)) - 1
+        self._wheels = [[set() for _ in range(1 << slot_bits)] for _ in range(levels)]
+        # key -> deadline in ticks
+        self._due = {}
+        self._now = int((time.time() if now is None else now) // tick)
+
+    def __len__(self):
+        return len(self._due)
+
+    def __contains__(self, key):
+        return key in self._due
+
+    def deadline(self, key):
+        """When ``key`` fires (rounded up to a tick), or None"""
+        due = self._due.get(key)
+        return None if due is None else due * self.tick
+
+    def schedule(self, key, deadline):
+        """Fire ``key`` at ``deadline`` (seconds), replacing any earlier schedule"""
+        due = max(math.ceil(deadline / self.tick), self._now + 1)
+        self._due[key] = due
+        self._place(key, due)
+
+    def cancel(self, key):
+        return self._due.pop(key, None) is not None
+
+    def _place(self, key, due):
+        delta = min(max(due - self._now, 0), self._horizon)
+        level = 0
+        while delta >> (self._bits * (level + 1)) and level + 1 < self.levels:
+            level += 1
+        if delta != due - self._now:
+            # Already due: the current slot. Beyond the top level: its
+            # furthest slot, to be placed again when that is cascaded
+            due = self._now + delta
+        self._wheels[level][(due >> (self._bits * level)) & self._mask].add(key)
+
+    def advance(self, now=None):
+        """Move time forward to ``now`` and return the keys that fell due"""
+        target = int((time.time() if now is None else now) // self.tick)
+        expired = []
+        if not self._due:
+            # Nothing pending: skip the empty ticks, dropping cancelled leftovers
+            if target > self._now:
+                for wheel in self._wheels:
+                    for slot in wheel:
+                        slot.clear()
+                self._now = target
+            return expired
+        while self._now < target:
+            self._now += 1
+            tick = self._now
+            level = 0
+            while level + 1 < self.levels and not (tick >> (self._bits * level)) & self._mask:
+                level += 1
+                self._cascade(level, (tick >> (self._bits * level)) & self._mask)
+            expired.extend(self._fire(tick & self._mask))
+            if not self._due:
+                self._now = target
+        return expired
+
+    def _cascade(self, level, index):
+        wheel = self._wheels[level]
+        slot, wheel[index] = wheel[index], set()
+        due = self._due
+        for key in slot:
+            when = due.get(key)
+            if when is not None:
+                self._place(key, when)
+
+    def _fire(self, index):
+        wheel = self._wheels[0]
+        slot, wheel[index] = wheel[index], set()
+        due, now = self._due, self._now
+        fired = []
+        for key in slot:
+            when = due.get(key)
+            if when is None:
+                continue
+            if when > now:
+                # Rescheduled since it was put in this slot
+                self._place(key, when)
+            else:
+                del due[key]
+                fired.append(key)
+        return fired
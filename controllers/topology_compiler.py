@@ -0,0 +1,272 @@
+"""
+Compiled binary topology: CSR graph columns in one memory-mapped file
+
+``compile_topology`` turns the topology JSON (and optionally the switch
+config) into a file of named, 64-byte aligned NumPy columns:
+
+- per switch: dpid, host subnet, management address, OpenFlow port and the
+  id/name/type/description strings (offsets plus a NUL separated blob)
+- adjacency in CSR form: ``adj_ptr[n] .. adj_ptr[n+1]`` index the
+  neighbour, link id and local port of each of switch ``n``'s links
+- per link: both end nodes, bandwidth (Mbps) and latency (ms), stored once
+
+``CompiledTopology.open`` maps the file read-only and exposes each column as
+a zero-copy ``np.frombuffer`` view, so opening costs the same at any size,
+and processes that open the same file share its pages through the page
+cache. The JSON served by the API and the PathEngine graph are both built
+from these columns.
+
+Link ids and adjacency order are those of ``TopologyGraph.from_dict``, so
+graphs built from the JSON and from the compiled file agree.
+"""
+
+import ipaddress
+import json
+import logging
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from controllers.path_engine import DEFAULT_TOPOLOGY_FILE, TopologyGraph
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SWITCH_CONFIG_FILE = os.path.normpath(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, 'network', 'switches', 'switch_config.json'))
+DEFAULT_COMPILED_FILE = os.path.normpath(os.path.splitext(DEFAULT_TOPOLOGY_FILE)[0] + '.bin')
+
+MAGIC = b'SDNTOPO1'
+_HEADER = struct.Struct('<8sII')
+_SECTION = struct.Struct('<24s8sQQ')
+_ALIGN = 64
+
+
+def _ip_to_int(address):
+    return int(ipaddress.IPv4Address(address)) if address else 0
+
+
+def _quantity(value, unit):
+    """``value`` in plain decimal notation, which parse_bandwidth and
+    parse_latency read back exactly (``:g`` would write 1 Tbps as 1e+06Mbps)"""
+    return np.format_float_positional(value, trim='-') + unit
+
+
+def _strings(values):
+    """``(offsets, blob)`` columns for a list of strings"""
+    encoded = [v.encode() for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype='<u4')
+    np.cumsum([len(e) + 1 for e in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b''.join(e + b'\0' for e in encoded), dtype=np.uint8)
+
+
+def compile_topology(topology, switch_config=None):
+    """Compiled file contents (bytes) for parsed topology and switch config dicts"""
+    graph = TopologyGraph.from_dict(topology)
+    switches = {s['id']: s for s in topology.get('topology', topology).get('switches', [])}
+    managed = {s['id']: s for s in (switch_config or {}).get('switches', [])}
+    n, m = graph.num_nodes, graph.num_links
+
+    columns = {}
+    info = [switches.get(name, {}) for name in graph.names]
+    config = [managed.get(name, {}) for name in graph.names]
+    columns['node_dpid'] = np.array([s.get('dpid', -1) for s in info], dtype='<i8')
+    subnets = [ipaddress.ip_network(s['subnet']) if s.get('subnet') else None for s in info]
+    columns['node_subnet'] = np.array([int(s.network_address) if s else 0 for s in subnets], dtype='<u4')
+    columns['node_prefix'] = np.array([s.prefixlen if s else -1 for s in subnets], dtype='<i1')
+    columns['node_mgmt_ip'] = np.array([_ip_to_int(c.get('ip_address')) for c in config], dtype='<u4')
+    columns['node_of_port'] = np.array([c.get('port', -1) for c in config], dtype='<i4')
+    for field, values in (('id', graph.names),
+                          ('name', [s.get('name') or c.get('name') or '' for s, c in zip(info, config)]),
+                          ('type', [s.get('type') or c.get('protocol') or '' for s, c in zip(info, config)]),
+                          ('description', [c.get('description', '') for c in config])):
+        columns[f'node_{field}_off'], columns[f'node_{field}_str'] = _strings(values)
+
+    degrees = [len(edges) for edges in graph.adj]
+    columns['adj_ptr'] = np.zeros(n + 1, dtype='<i8')
+    np.cumsum(degrees, out=columns['adj_ptr'][1:])
+    columns['adj_node'] = np.array([v for edges in graph.adj for v, _ in edges], dtype='<i4')
+    columns['adj_link'] = np.array([l for edges in graph.adj for _, l in edges], dtype='<i4')
+    columns['adj_port'] = np.array([graph.port_of.get((u, l), -1)
+                                    for u, edges in enumerate(graph.adj) for _, l in edges], dtype='<i4')
+    columns['link_ends'] = np.array(graph.link_ends, dtype='<i4').reshape(m * 2)
+    columns['link_bandwidth'] = np.array(graph.bandwidth, dtype='<f8')
+    columns['link_latency'] = np.array(graph.latency, dtype='<f8')
+    meta = {k: v for k, v in (switch_config or {}).items() if k != 'switches'}
+    columns['meta'] = np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8)
+    return _pack(columns)
+
+
+def _pack(columns):
+    directory_size = _HEADER.size + _SECTION.size * len(columns)
+    offset = -(-directory_size // _ALIGN) * _ALIGN
+    directory, chunks = [], []
+    for name, array in columns.items():
+        directory.append(_SECTION.pack(name.encode(), array.dtype.str.encode(), offset, array.size))
+        data = array.tobytes()
+        padded = -(-len(data) // _ALIGN) * _ALIGN
+        chunks.append(data + b'\0' * (padded - len(data)))
+        offset += padded
+    header = _HEADER.pack(MAGIC, 1, len(columns)) + b''.join(directory)
+    return header + b'\0' * (-len(header) % _ALIGN) + b''.join(chunks)
+
+
+def compile_file(topology_file=DEFAULT_TOPOLOGY_FILE, switch_config_file=DEFAULT_SWITCH_CONFIG_FILE,
+                 output_file=DEFAULT_COMPILED_FILE):
+    with open(topology_file) as f:
+        topology = json.load(f)
+    switch_config = None
+    if switch_config_file and os.path.exists(switch_config_file):
+        with open(switch_config_file) as f:
+            switch_config = json.load(f)
+    data = compile_topology(topology, switch_config)
+    # Replace atomically: other processes may have the old file mapped
+    tmp = f"{output_file}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, output_file)
+    return output_file
+
+
+class CompiledTopology:
+    def __init__(self, buffer, source=None):
+        self._buffer = buffer
+        self.source = source
+        magic, version, count = _HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != 1:
+            raise ValueError(f"not a compiled topology: {source or 'buffer'}")
+        self.columns = {}
+        for i in range(count):
+            name, dtype, offset, size = _SECTION.unpack_from(buffer, _HEADER.size + i * _SECTION.size)
+            self.columns[name.rstrip(b'\0').decode()] = np.frombuffer(
+                buffer, dtype=np.dtype(dtype.rstrip(b'\0').decode()), count=size, offset=offset)
+        self.num_nodes = len(self.columns['adj_ptr']) - 1
+        self.num_links = len(self.columns['link_bandwidth'])
+        self.link_ends = self.columns['link_ends'].reshape(self.num_links, 2)
+        self.meta = json.loads(self.columns['meta'].tobytes() or b'{}')
+
+    @classmethod
+    def open(cls, path):
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buffer, path)
+
+    def __getitem__(self, column):
+        return self.columns[column]
+
+    def strings(self, field):
+        """Every value of a node string column, decoded in one pass"""
+        blob = self.columns[f'node_{field}_str'].tobytes()
+        return blob.decode().split('\0')[:-1] if blob else []
+
+    def string(self, field, node):
+        offsets = self.columns[f'node_{field}_off']
+        return self.columns[f'node_{field}_str'][offsets[node]:offsets[node + 1] - 1].tobytes().decode()
+
+    def neighbours(self, node):
+        """``(nodes, links, ports)`` views of one switch's adjacency"""
+        start, end = self.columns['adj_ptr'][node:node + 2]
+        return (self.columns['adj_node'][start:end], self.columns['adj_link'][start:end],
+                self.columns['adj_port'][start:end])
+
+    def graph(self):
+        """TopologyGraph for PathEngine, built column-wise from the file"""
+        graph = TopologyGraph()
+        graph.names = self.strings('id')
+        graph.index = {name: i for i, name in enumerate(graph.names)}
+        graph.link_ends = list(map(tuple, self.link_ends.tolist()))
+        graph._link_index = dict(zip(graph.link_ends, range(self.num_links)))
+        graph.bandwidth = self.columns['link_bandwidth'].tolist()
+        graph.latency = self.columns['link_latency'].tolist()
+        ptr = self.columns['adj_ptr'].tolist()
+        nodes, links = self.columns['adj_node'].tolist(), self.columns['adj_link'].tolist()
+        pairs = list(zip(nodes, links))
+        graph.adj = [pairs[ptr[u]:ptr[u + 1]] for u in range(self.num_nodes)]
+        dpid = self.columns['node_dpid']
+        for node in np.flatnonzero(dpid >= 0).tolist():
+            graph.dpids[int(dpid[node])] = node
+        prefix, subnet = self.columns['node_prefix'], self.columns['node_subnet']
+        for node in np.flatnonzero(prefix >= 0).tolist():
+            graph.subnets.append((ipaddress.IPv4Network((int(subnet[node]), int(prefix[node]))), node))
+        owners = np.repeat(np.arange(self.num_nodes), np.diff(self.columns['adj_ptr']))
+        ports = self.columns['adj_port']
+        has_port = np.flatnonzero(ports >= 0)
+        for node, port, link in zip(owners[has_port].tolist(), ports[has_port].tolist(),
+                                    self.columns['adj_link'][has_port].tolist()):
+            graph.ports[(node, port)] = link
+            graph.port_of[(node, link)] = port
+        return graph
+
+    def to_dict(self):
+        """The topology in the layout of network_topology.json"""
+        ids = self.strings('id')
+        names, types = self.strings('name'), self.strings('type')
+        ptr = self.columns['adj_ptr'].tolist()
+        nodes, links = self.columns['adj_node'].tolist(), self.columns['adj_link'].tolist()
+        ports = self.columns['adj_port'].tolist()
+        bandwidth = [_quantity(b, "Mbps") for b in self.columns['link_bandwidth'].tolist()]
+        latency = [_quantity(l, "ms") for l in self.columns['link_latency'].tolist()]
+        dpids = self.columns['node_dpid'].tolist()
+        prefix, subnet = self.columns['node_prefix'].tolist(), self.columns['node_subnet'].tolist()
+        switches = []
+        for u in range(self.num_nodes):
+            switch = {"id": ids[u]}
+            if dpids[u] >= 0:
+                switch["dpid"] = dpids[u]
+            if names[u]:
+                switch["name"] = names[u]
+            if types[u]:
+                switch["type"] = types[u]
+            if prefix[u] >= 0:
+                switch["subnet"] = f"{ipaddress.IPv4Address(subnet[u])}/{prefix[u]}"
+            switch_links = []
+            for i in range(ptr[u], ptr[u + 1]):
+                link = {"target": ids[nodes[i]]}
+                if ports[i] >= 0:
+                    link["port"] = ports[i]
+                link["bandwidth"], link["latency"] = bandwidth[links[i]], latency[links[i]]
+                switch_links.append(link)
+            switch["links"] = switch_links
+            switches.append(switch)
+        return {"topology": {"switches": switches}}
+
+
+def load_topology(topology_file=DEFAULT_TOPOLOGY_FILE, switch_config_file=DEFAULT_SWITCH_CONFIG_FILE,
+                  compiled_file=DEFAULT_COMPILED_FILE):
+    """Open the compiled topology, recompiling it first if a source file is newer"""
+    sources = [p for p in (topology_file, switch_config_file) if p and os.path.exists(p)]
+    try:
+        stale = (not os.path.exists(compiled_file) or
+                 any(os.path.getmtime(p) > os.path.getmtime(compiled_file) for p in sources))
+        if stale:
+            compile_file(topology_file, switch_config_file, compiled_file)
+            logger.info(f"Compiled {topology_file} to {compiled_file}")
+        return CompiledTopology.open(compiled_file)
+    except OSError as e:
+        # Read-only checkout: compile into memory instead
+        logger.warning(f"Cannot write {compiled_file} ({e}); compiling in memory")
+        with open(topology_file) as f:
+            topology = json.load(f)
+        switch_config = None
+        if switch_config_file in sources:
+            with open(switch_config_file) as f:
+                switch_config = json.load(f)
+        return CompiledTopology(compile_topology(topology, switch_config), topology_file)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Compile the topology JSON into the binary format")
+    parser.add_argument('--topology', default=DEFAULT_TOPOLOGY_FILE)
+    parser.add_argument('--switches', default=DEFAULT_SWITCH_CONFIG_FILE)
+    parser.add_argument('-o', '--output', default=DEFAULT_COMPILED_FILE)
+    args = parser.parse_args(argv)
+    path = compile_file(args.topology, args.switches, args.output)
+    topology = CompiledTopology.open(path)
+    print(f"{path}: {topology.num_nodes} switches, {topology.num_links} links, "
+          f"{os.path.getsize(path)} bytes")
+
+
+if __name__ == '__main__':
+    main()
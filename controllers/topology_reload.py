@@ -0,0 +1,276 @@
+"""
+Hot reload of the topology and switch config while the controller runs
+
+``ConfigWatcher`` polls the size and mtime of the source files. inotify
+would need a Linux-only dependency, and stat-ing two files once a second is
+free. A change is only reported once the file has stopped changing for one
+poll, so an editor that writes in several steps triggers a single reload.
+
+``TopologyReloader`` compares a freshly compiled graph with the live one by
+switch name and applies the difference in place:
+
+- links that disappeared are kept as tombstones that stay down, so every
+  per-link array (utilisation, weights, meter columns) keeps its indexes
+- new links are appended and brought up through ``set_link_state``, which
+  drops only the cached paths they could improve
+- bandwidth and latency changes go through ``PathEngine.set_capacity``
+
+The returned ``TopologyDiff`` names the links whose flows must move (removed
+or degraded links). Flows elsewhere keep their paths and their flow entries.
+The whole apply runs with the PathEngine frozen, so a placement or path
+query on another thread never sees half-updated dpid and port maps.
+"""
+
+import logging
+import os
+import threading
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# A link between switches ``a`` < ``b`` and the port it uses on each end
+LinkSpec = namedtuple('LinkSpec', ['a', 'b', 'bandwidth', 'latency', 'port_a', 'port_b'])
+
+
+def link_specs(graph, exclude=()):
+    """``{(a, b): LinkSpec}`` for the links of ``graph`` not in ``exclude``"""
+    specs = {}
+    for link, (u, v) in enumerate(graph.link_ends):
+        if link in exclude:
+            continue
+        a, b = graph.names[u], graph.names[v]
+        port_a, port_b = graph.port_of.get((u, link)), graph.port_of.get((v, link))
+        if a > b:
+            a, b, port_a, port_b = b, a, port_b, port_a
+        specs[(a, b)] = LinkSpec(a, b, graph.bandwidth[link], graph.latency[link], port_a, port_b)
+    return specs
+
+
+def _node_attrs(graph, exclude=()):
+    """Switch name -> (dpid, subnets) for switches with at least one live link
+    or a dpid or subnet of their own"""
+    dpid_of = {node: dpid for dpid, node in graph.dpids.items()}
+    subnets = {}
+    for network, node in graph.subnets:
+        subnets.setdefault(node, []).append(str(network))
+    live = set(dpid_of) | set(subnets)
+    for link, ends in enumerate(graph.link_ends):
+        if link not in exclude:
+            live.update(ends)
+    return {graph.names[n]: (dpid_of.get(n), tuple(subnets.get(n, ()))) for n in live}
+
+
+class TopologyDiff:
+    """What changed between two versions of the topology, by switch name"""
+
+    def __init__(self, added_nodes=(), removed_nodes=(), changed_nodes=(),
+                 added_links=None, removed_links=None, changed_links=None):
+        self.added_nodes = list(added_nodes)
+        self.removed_nodes = list(removed_nodes)
+        # Switches whose dpid or host subnets changed
+        self.changed_nodes = list(changed_nodes)
+        self.added_links = added_links or {}
+        self.removed_links = removed_links or {}
+        # (a, b) -> (old LinkSpec, new LinkSpec)
+        self.changed_links = changed_links or {}
+
+    @property
+    def empty(self):
+        return not (self.added_nodes or self.removed_nodes or self.changed_nodes or
+                    self.added_links or self.removed_links or self.changed_links)
+
+    def degraded_links(self):
+        """Links whose flows need a new path: removed, or slower or narrower than before"""
+        links = list(self.removed_links)
+        for key, (old, new) in self.changed_links.items():
+            if new.bandwidth < old.bandwidth or new.latency > old.latency:
+                links.append(key)
+        return links
+
+    def to_dict(self):
+        return {
+            "added_switches": self.added_nodes,
+            "removed_switches": self.removed_nodes,
+            "changed_switches": self.changed_nodes,
+            "added_links": [f"{a}-{b}" for a, b in self.added_links],
+            "removed_links": [f"{a}-{b}" for a, b in self.removed_links],
+            "changed_links": {f"{a}-{b}": {"bandwidth_mbps": new.bandwidth, "latency_ms": new.latency}
+                              for (a, b), (_, new) in self.changed_links.items()},
+        }
+
+    def __repr__(self):
+        return (f"TopologyDiff(+{len(self.added_nodes)}/-{len(self.removed_nodes)} switches, "
+                f"+{len(self.added_links)}/-{len(self.removed_links)}/~{len(self.changed_links)} links)")
+
+
+def diff_graphs(old, new, removed=()):
+    """Structural diff from graph ``old`` (ignoring tombstoned ``removed``
+    link ids) to graph ``new``"""
+    old_links, new_links = link_specs(old, removed), link_specs(new)
+    old_nodes, new_nodes = _node_attrs(old, removed), _node_attrs(new)
+    return TopologyDiff(
+        added_nodes=[n for n in new_nodes if n not in old_nodes],
+        removed_nodes=[n for n in old_nodes if n not in new_nodes],
+        changed_nodes=[n for n, attrs in new_nodes.items() if n in old_nodes and old_nodes[n] != attrs],
+        added_links={k: s for k, s in new_links.items() if k not in old_links},
+        removed_links={k: s for k, s in old_links.items() if k not in new_links},
+        changed_links={k: (old_links[k], s) for k, s in new_links.items()
+                       if k in old_links and old_links[k] != s},
+    )
+
+
+class TopologyReloader:
+    """Applies a new version of the topology to a live graph, PathEngine and
+    TopologyStore without rebuilding them.
+
+    With ``assume_up`` the switches and ports of the new file are taken to be
+    connected, as in the simulator; otherwise new links come up only once the
+    store has seen both ports up, as under Ryu.
+    """
+
+    def __init__(self, path_engine, store=None, assume_up=False):
+        self.path_engine = path_engine
+        self.graph = path_engine.graph
+        self.store = store
+        self.assume_up = assume_up
+        # Tombstoned link ids: still in the graph, never routed over
+        self.removed = set()
+
+    def diff(self, new_graph):
+        return diff_graphs(self.graph, new_graph, self.removed)
+
+    def apply(self, new_graph):
+        """Bring the live topology in line with ``new_graph`` and return the diff"""
+        with self.path_engine.frozen():
+            diff = self.diff(new_graph)
+            if not diff.empty:
+                self._apply(diff, new_graph)
+        return diff
+
+    def _apply(self, diff, new_graph):
+        graph, engine = self.graph, self.path_engine
+        # Unplug first, while the old dpids still identify the store's links
+        for key in diff.removed_links:
+            link = graph.link_id(key)
+            self.removed.add(link)
+            self._unplug(link)
+            engine.set_link_state(link, False)
+        for key, (old, spec) in diff.changed_links.items():
+            if (old.port_a, old.port_b) != (spec.port_a, spec.port_b):
+                self._unplug(graph.link_id(key))
+
+        for name in diff.added_nodes:
+            engine.add_node(name)
+        old_dpids = set(graph.dpids)
+        index = graph.index
+        graph.dpids = {dpid: index[new_graph.names[n]] for dpid, n in new_graph.dpids.items()}
+        graph.subnets = [(network, index[new_graph.names[n]]) for network, n in new_graph.subnets]
+        if self.store is not None:
+            for dpid in old_dpids - set(graph.dpids):
+                self.store.remove_switch(dpid)
+            if self.assume_up:
+                for dpid in set(graph.dpids) - old_dpids:
+                    self.store.add_switch(dpid)
+
+        for key, (old, spec) in diff.changed_links.items():
+            link = graph.link_id(key)
+            if (old.bandwidth, old.latency) != (spec.bandwidth, spec.latency):
+                engine.set_capacity(link, spec.bandwidth, spec.latency)
+            if (old.port_a, old.port_b) != (spec.port_a, spec.port_b):
+                self._plug(link, spec)
+        for spec in diff.added_links.values():
+            # A link that comes back reuses its tombstone's id
+            link = engine.add_link(spec.a, spec.b, spec.bandwidth, spec.latency)
+            self.removed.discard(link)
+            engine.set_capacity(link, spec.bandwidth, spec.latency)
+            self._plug(link, spec)
+
+    def _ends(self, link):
+        """``(dpid, port)`` of both ends of ``link``, or None if either is unknown"""
+        dpid_of = {node: dpid for dpid, node in self.graph.dpids.items()}
+        ends = []
+        for node in self.graph.link_ends[link]:
+            dpid, port_no = dpid_of.get(node), self.graph.port_of.get((node, link))
+            if dpid is None or port_no is None:
+                return None
+            ends.append((dpid, port_no))
+        return ends
+
+    def _unplug(self, link):
+        ends = self._ends(link)
+        for node in self.graph.link_ends[link]:
+            port_no = self.graph.port_of.pop((node, link), None)
+            if port_no is not None and self.graph.ports.get((node, port_no)) == link:
+                del self.graph.ports[(node, port_no)]
+        if ends is not None and self.store is not None:
+            self.store.remove_link(*ends[0], *ends[1])
+
+    def _plug(self, link, spec):
+        for name, port_no in ((spec.a, spec.port_a), (spec.b, spec.port_b)):
+            if port_no is not None:
+                self.graph.set_port(name, port_no, link)
+        ends = self._ends(link)
+        if ends is None or self.store is None:
+            # Nothing on the switches to wait for
+            self.path_engine.set_link_state(link, self.assume_up)
+            return
+        if self.assume_up:
+            for dpid, port_no in ends:
+                self.store.port_up(dpid, port_no)
+        # The LINK_ADD event brings the link up in the PathEngine once both ports are
+        self.store.add_link(*ends[0], *ends[1])
+
+
+class ConfigWatcher:
+    """Calls ``callback(paths)`` from a background thread when any of
+    ``paths`` has changed and then stayed unchanged for one poll"""
+
+    def __init__(self, paths, callback, interval=1.0):
+        self.paths = list(paths)
+        self.callback = callback
+        self.interval = interval
+        self._stamps = {path: self._stamp(path) for path in self.paths}
+        self._pending = set()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _stamp(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def poll(self):
+        """Check the files once; returns the paths reported to the callback"""
+        settled = set(self._pending)
+        for path in self.paths:
+            stamp = self._stamp(path)
+            if stamp != self._stamps[path]:
+                self._stamps[path] = stamp
+                self._pending.add(path)
+                settled.discard(path)
+        if not settled:
+            return []
+        self._pending -= settled
+        changed = [path for path in self.paths if path in settled]
+        self.callback(changed)
+        return changed
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="ConfigWatcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Config reload failed")
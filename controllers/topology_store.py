@@ -0,0 +1,263 @@
+"""
+Incremental, versioned topology store
+
+Switches, ports and links live in dicts keyed by datapath id and port
+number, so every switch/port/link change is O(1) and a repeated or unknown
+change is a no-op rather than an error. Each change that actually alters the
+topology bumps ``version`` and appends a TopologyEvent to a bounded log.
+Consumers either subscribe to events as they happen or ask for
+``changes_since(version)`` and apply the deltas. When a consumer has fallen
+further behind than the log reaches, it gets None and re-reads the snapshot.
+
+``snapshot()`` and ``serialised()`` are rebuilt at most once per version and
+shared by every reader until the next change.
+"""
+
+import json
+import threading
+from collections import deque, namedtuple
+
+TopologyEvent = namedtuple('TopologyEvent', ['version', 'kind', 'data'])
+
+SWITCH_ADD = 'switch_add'
+SWITCH_REMOVE = 'switch_remove'
+PORT_UP = 'port_up'
+PORT_DOWN = 'port_down'
+LINK_ADD = 'link_add'
+LINK_REMOVE = 'link_remove'
+LINK_UP = 'link_up'
+LINK_DOWN = 'link_down'
+
+
+def link_key(dpid_a, port_a, dpid_b, port_b):
+    """Direction-independent key for the link between two switch ports"""
+    a, b = (dpid_a, port_a), (dpid_b, port_b)
+    return a + b if a <= b else b + a
+
+
+class TopologyStore:
+    def __init__(self, log_size=4096):
+        self.version = 0
+        self._lock = threading.Lock()
+        # dpid -> {port_no: up}
+        self._ports = {}
+        # dpid -> {port_no: link key}
+        self._adj = {}
+        # link key -> up
+        self._links = {}
+        self._log = deque(maxlen=log_size)
+        self._subscribers = []
+        self._snapshot = None
+        self._serialised = None
+        self._cached_version = -1
+
+    @classmethod
+    def from_graph(cls, graph, **kwargs):
+        """Store holding every switch, port and link of a TopologyGraph"""
+        store = cls(**kwargs)
+        node_dpid = {node: dpid for dpid, node in graph.dpids.items()}
+        for dpid in graph.dpids:
+            store.add_switch(dpid)
+        for (node, port_no) in graph.ports:
+            store.port_up(node_dpid[node], port_no)
+        for link in range(graph.num_links):
+            u, v = graph.link_ends[link]
+            port_u, port_v = graph.port_of.get((u, link)), graph.port_of.get((v, link))
+            if u in node_dpid and v in node_dpid and port_u is not None and port_v is not None:
+                store.add_link(node_dpid[u], port_u, node_dpid[v], port_v)
+        return store
+
+    def subscribe(self, callback):
+        """Call ``callback(events)`` with the events of every change"""
+        self._subscribers.append(callback)
+
+    def _emit(self, events):
+        for event in events:
+            self._log.append(event)
+        return events
+
+    def _publish(self, events):
+        # Outside the lock: subscribers may read the store
+        if events:
+            for callback in self._subscribers:
+                callback(events)
+        return events
+
+    def _event(self, kind, **data):
+        self.version += 1
+        return TopologyEvent(self.version, kind, data)
+
+    # -- changes ------------------------------------------------------------
+
+    def add_switch(self, dpid, ports=()):
+        with self._lock:
+            events = []
+            if dpid not in self._ports:
+                self._ports[dpid] = {}
+                self._adj[dpid] = {}
+                events.append(self._event(SWITCH_ADD, dpid=dpid))
+            for port_no in ports:
+                events += self._set_port(dpid, port_no, True)
+            self._emit(events)
+        return self._publish(events)
+
+    def remove_switch(self, dpid):
+        with self._lock:
+            if dpid not in self._ports:
+                return []
+            events = []
+            for key in set(self._adj[dpid].values()):
+                events += self._remove_link(key)
+            del self._ports[dpid]
+            del self._adj[dpid]
+            events.append(self._event(SWITCH_REMOVE, dpid=dpid))
+            self._emit(events)
+        return self._publish(events)
+
+    def port_up(self, dpid, port_no):
+        return self._port_change(dpid, port_no, True)
+
+    def port_down(self, dpid, port_no):
+        return self._port_change(dpid, port_no, False)
+
+    def remove_port(self, dpid, port_no):
+        with self._lock:
+            ports = self._ports.get(dpid)
+            if ports is None or port_no not in ports:
+                return []
+            events = []
+            key = self._adj[dpid].get(port_no)
+            if key is not None:
+                events += self._remove_link(key)
+            del ports[port_no]
+            events.append(self._event(PORT_DOWN, dpid=dpid, port_no=port_no, removed=True))
+            self._emit(events)
+        return self._publish(events)
+
+    def _port_change(self, dpid, port_no, up):
+        with self._lock:
+            if dpid not in self._ports:
+                return []
+            events = self._set_port(dpid, port_no, up)
+            self._emit(events)
+        return self._publish(events)
+
+    def _set_port(self, dpid, port_no, up):
+        ports = self._ports[dpid]
+        if ports.get(port_no) == up:
+            return []
+        ports[port_no] = up
+        events = [self._event(PORT_UP if up else PORT_DOWN, dpid=dpid, port_no=port_no)]
+        key = self._adj[dpid].get(port_no)
+        if key is not None:
+            events += self._refresh_link(key)
+        return events
+
+    def add_link(self, src_dpid, src_port, dst_dpid, dst_port):
+        with self._lock:
+            if src_dpid not in self._ports or dst_dpid not in self._ports:
+                return []
+            key = link_key(src_dpid, src_port, dst_dpid, dst_port)
+            if key in self._links:
+                return []
+            events = []
+            for dpid, port_no in ((src_dpid, src_port), (dst_dpid, dst_port)):
+                old = self._adj[dpid].get(port_no)
+                if old is not None:
+                    # The port was re-cabled: its previous link is gone
+                    events += self._remove_link(old)
+                self._adj[dpid][port_no] = key
+            self._links[key] = self._both_up(key)
+            events.append(self._event(LINK_ADD, link=key, up=self._links[key]))
+            self._emit(events)
+        return self._publish(events)
+
+    def remove_link(self, src_dpid, src_port, dst_dpid, dst_port):
+        with self._lock:
+            events = self._remove_link(link_key(src_dpid, src_port, dst_dpid, dst_port))
+            self._emit(events)
+        return self._publish(events)
+
+    def _remove_link(self, key):
+        if key not in self._links:
+            return []
+        del self._links[key]
+        for dpid, port_no in (key[:2], key[2:]):
+            adj = self._adj.get(dpid)
+            if adj is not None and adj.get(port_no) == key:
+                del adj[port_no]
+        return [self._event(LINK_REMOVE, link=key)]
+
+    def _both_up(self, key):
+        return (self._ports.get(key[0], {}).get(key[1], False) and
+                self._ports.get(key[2], {}).get(key[3], False))
+
+    def _refresh_link(self, key):
+        up = self._both_up(key)
+        if self._links[key] == up:
+            return []
+        self._links[key] = up
+        return [self._event(LINK_UP if up else LINK_DOWN, link=key)]
+
+    # -- reads --------------------------------------------------------------
+
+    def changes_since(self, version):
+        """Events after ``version`` in order, or None if the log no longer reaches back that far"""
+        with self._lock:
+            if version >= self.version:
+                return []
+            if not self._log or self._log[0].version > version + 1:
+                return None
+            # Versions in the log are consecutive, so the start is an offset
+            return list(self._log)[version + 1 - self._log[0].version:]
+
+    def switches(self):
+        with self._lock:
+            return list(self._ports)
+
+    def ports(self, dpid):
+        with self._lock:
+            return dict(self._ports.get(dpid, {}))
+
+    def link_for_port(self, dpid, port_no):
+        return self._adj.get(dpid, {}).get(port_no)
+
+    def links(self):
+        with self._lock:
+            return dict(self._links)
+
+    def snapshot(self):
+        """``{"version", "switches", "links"}`` view; do not mutate it"""
+        with self._lock:
+            self._refresh_cache()
+            return self._snapshot
+
+    def serialised(self):
+        """Compact JSON of ``snapshot()``, encoded once per version"""
+        with self._lock:
+            self._refresh_cache()
+            return self._serialised
+
+    def _refresh_cache(self):
+        if self._cached_version == self.version:
+            return
+        self._snapshot = {
+            "version": self.version,
+            "switches": [{"dpid": dpid,
+                          "ports": [{"port_no": port_no, "up": up} for port_no, up in sorted(ports.items())]}
+                         for dpid, ports in sorted(self._ports.items())],
+            "links": [{"src": key[0], "src_port": key[1], "dst": key[2], "dst_port": key[3], "up": up}
+                      for key, up in sorted(self._links.items())],
+        }
+        self._serialised = json.dumps(self._snapshot, separators=(',', ':'))
+        self._cached_version = self.version
+
+    def summary(self):
+        with self._lock:
+            return {
+                "version": self.version,
+                "switches": len(self._ports),
+                "ports_up": sum(up for ports in self._ports.values() for up in ports.values()),
+                "links": len(self._links),
+                "links_up": sum(self._links.values()),
+            }
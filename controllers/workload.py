@@ -0,0 +1,355 @@
+"""
+Seeded traffic workloads: generation, binary traces and timed replay
+
+``WorkloadGenerator`` draws flows between host subnets. Everything comes
+from one NumPy generator seeded once, so the same seed and parameters
+always give the same trace.
+
+- arrivals are a Poisson process whose rate follows an optional diurnal
+  cosine, sampled by thinning in vectorised windows so a run can produce
+  millions of flows
+- source and destination subnets follow a gravity traffic matrix with
+  lognormal subnet weights (``skew`` 0 makes it uniform)
+- flow sizes are Pareto (heavy tailed), lognormal or exponential; each flow
+  gets a lognormal rate and lasts ``size / rate``, capped at ``max_duration``
+- a ``FlashCrowd`` adds ``multiplier - 1`` times the base rate for its
+  window, all of it headed to one destination subnet
+
+A ``Trace`` is one packed record per flow (start, duration, addresses,
+size, rate, priority), 34 bytes each, after a header and the JSON
+parameters it was generated from. ``Trace.load`` maps the file read-only.
+Arrival and departure events are derived by sorting the start and end
+times, so they are never stored.
+
+``Replayer`` applies a trace to a FlowTable and a traffic monitor at N times
+real time, in batches of the events that are due: arrivals with ``add_many``
+(crediting their packets to the monitor) and departures with
+``remove_many``. Replayed flows carry zero idle and hard timeouts, so the
+trace's departures rather than the controller's default timeouts end them.
+Its report gives the speed actually achieved and how late events were
+applied, which shows whether the flow table and everything subscribed to it
+keep up.
+"""
+
+import ipaddress
+import json
+import mmap
+import socket
+import struct
+import time
+from collections import namedtuple
+
+import numpy as np
+
+MAGIC = b'SDNWKLD1'
+_HEADER = struct.Struct('<8sIIQ')
+FLOW_DTYPE = np.dtype([('start', '<f8'), ('duration', '<f4'), ('src', '<u4'), ('dst', '<u4'),
+                       ('size', '<u8'), ('demand', '<f4'), ('priority', '<u2')])
+PACKET_BYTES = 1500
+SIZE_DISTRIBUTIONS = ('pareto', 'lognormal', 'exponential')
+
+FlashCrowd = namedtuple('FlashCrowd', 'start duration multiplier dst')
+FlashCrowd.__new__.__defaults__ = (None,)
+
+ReplayReport = namedtuple('ReplayReport', 'events flows trace_seconds wall_seconds speed achieved_speed '
+                                          'lag_p50 lag_p99 lag_max peak_flows')
+
+
+def _ip_to_str(value):
+    return socket.inet_ntoa(value.to_bytes(4, 'big'))
+
+
+class Trace:
+    def __init__(self, flows, subnets, params=None):
+        self.flows = flows
+        self.subnets = [ipaddress.IPv4Network(s) for s in subnets]
+        self.params = params or {}
+
+    def __len__(self):
+        return len(self.flows)
+
+    @property
+    def duration(self):
+        """Seconds from time zero to the last departure"""
+        if not len(self.flows):
+            return 0.0
+        return float((self.flows['start'] + self.flows['duration']).max())
+
+    def packets(self):
+        """Packets per flow at ``PACKET_BYTES`` each"""
+        return -(-self.flows['size'].astype(np.int64) // PACKET_BYTES)
+
+    def events(self):
+        """``(times, order)``: every arrival and departure in time order. An
+        ``order`` below ``len(self)`` is that flow arriving, otherwise flow
+        ``order - len(self)`` leaving"""
+        flows = self.flows
+        times = np.concatenate([flows['start'], flows['start'] + flows['duration']])
+        order = np.argsort(times, kind='stable')
+        return times[order], order
+
+    def subnet_index(self, addresses):
+        """Index into ``subnets`` of each address, -1 for none"""
+        nets = np.array([int(s.network_address) for s in self.subnets], dtype=np.int64)
+        masks = np.array([int(s.netmask) for s in self.subnets], dtype=np.int64)
+        order = np.argsort(nets)
+        addresses = np.asarray(addresses, dtype=np.int64)
+        # Subnets do not overlap: only the nearest one starting below can hold an address
+        nearest = order[np.maximum(np.searchsorted(nets[order], addresses, side='right') - 1, 0)]
+        return np.where((addresses & masks[nearest]) == nets[nearest], nearest, -1)
+
+    def traffic_matrix(self):
+        """Bytes sent from subnet i to subnet j over the whole trace"""
+        n = len(self.subnets)
+        matrix = np.zeros((n, n))
+        src, dst = self.subnet_index(self.flows['src']), self.subnet_index(self.flows['dst'])
+        known = (src >= 0) & (dst >= 0)
+        np.add.at(matrix, (src[known], dst[known]), self.flows['size'][known].astype(np.float64))
+        return matrix
+
+    def save(self, path):
+        meta = json.dumps({"subnets": [str(s) for s in self.subnets], "params": self.params}).encode()
+        with open(path, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, 1, len(meta), len(self.flows)))
+            f.write(meta)
+            f.write(np.ascontiguousarray(self.flows, dtype=FLOW_DTYPE).tobytes())
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, meta_size, count = _HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != 1:
+            raise ValueError(f"not a workload trace: {path}")
+        meta = json.loads(buffer[_HEADER.size:_HEADER.size + meta_size])
+        flows = np.frombuffer(buffer, dtype=FLOW_DTYPE, count=count, offset=_HEADER.size + meta_size)
+        return cls(flows, meta['subnets'], meta['params'])
+
+
+class WorkloadGenerator:
+    def __init__(self, subnets, rate=100.0, seed=0, size='pareto', mean_size=1e6, pareto_alpha=1.2,
+                 lognormal_sigma=2.0, mean_demand_mbps=5.0, max_duration=3600.0, skew=1.0,
+                 diurnal_amplitude=0.0, diurnal_period=86400.0, diurnal_peak=14 * 3600.0,
+                 flash_crowds=(), priorities=(100, 200, 300)):
+        if len(subnets) < 2:
+            raise ValueError("a workload needs at least two subnets")
+        if size not in SIZE_DISTRIBUTIONS:
+            raise ValueError(f"size must be one of {', '.join(SIZE_DISTRIBUTIONS)}")
+        if size == 'pareto' and pareto_alpha <= 1:
+            raise ValueError("pareto_alpha must be above 1 for the mean size to exist")
+        if not 0 <= diurnal_amplitude < 1:
+            raise ValueError("diurnal_amplitude must be in [0, 1)")
+        self.subnets = [ipaddress.IPv4Network(s) for s in subnets]
+        self.params = dict(rate=rate, seed=seed, size=size, mean_size=mean_size, pareto_alpha=pareto_alpha,
+                           lognormal_sigma=lognormal_sigma, mean_demand_mbps=mean_demand_mbps,
+                           max_duration=max_duration, skew=skew, diurnal_amplitude=diurnal_amplitude,
+                           diurnal_period=diurnal_period, diurnal_peak=diurnal_peak,
+                           priorities=list(priorities))
+        self.rate = rate
+        self.rng = np.random.default_rng(seed)
+        n = len(self.subnets)
+        self._net = np.array([int(s.network_address) for s in self.subnets], dtype=np.uint32)
+        self._hosts = np.array([max(1, s.num_addresses - 2) for s in self.subnets], dtype=np.int64)
+        weights = self.rng.lognormal(0.0, skew, n) if skew > 0 else np.ones(n)
+        self.weights = weights / weights.sum()
+        matrix = np.outer(self.weights, self.weights)
+        np.fill_diagonal(matrix, 0.0)
+        # Probability of each (src, dst) subnet pair, flattened row-major
+        self.matrix = matrix / matrix.sum()
+        self._pair_cdf = np.cumsum(self.matrix.ravel())
+        self.flash_crowds = []
+        for crowd in flash_crowds:
+            crowd = FlashCrowd(*crowd)
+            dst = int(self.rng.integers(n)) if crowd.dst is None else crowd.dst
+            self.flash_crowds.append(crowd._replace(dst=dst))
+        self.params['flash_crowds'] = [list(c) for c in self.flash_crowds]
+
+    def base_rate(self, t):
+        """Background arrivals per second at times ``t``"""
+        p = self.params
+        if not p['diurnal_amplitude']:
+            return np.full(np.shape(t), float(self.rate))
+        phase = 2 * np.pi * (np.asarray(t) - p['diurnal_peak']) / p['diurnal_period']
+        return self.rate * (1 + p['diurnal_amplitude'] * np.cos(phase))
+
+    def _crowd_rates(self, t):
+        """``(len(flash_crowds), len(t))`` extra arrivals per second of each crowd"""
+        rates = np.zeros((len(self.flash_crowds), len(t)))
+        for i, crowd in enumerate(self.flash_crowds):
+            active = (t >= crowd.start) & (t < crowd.start + crowd.duration)
+            rates[i, active] = self.rate * (crowd.multiplier - 1)
+        return rates
+
+    def _sizes(self, k):
+        p, rng = self.params, self.rng
+        if p['size'] == 'pareto':
+            alpha = p['pareto_alpha']
+            sizes = p['mean_size'] * (alpha - 1) / alpha * (1 + rng.pareto(alpha, k))
+        elif p['size'] == 'lognormal':
+            sigma = p['lognormal_sigma']
+            sizes = rng.lognormal(np.log(p['mean_size']) - sigma ** 2 / 2, sigma, k)
+        else:
+            sizes = rng.exponential(p['mean_size'], k)
+        return np.clip(sizes, 64, 1e15).astype(np.uint64)
+
+    def _hosts_in(self, subnets):
+        offsets = 1 + (self.rng.random(len(subnets)) * self._hosts[subnets]).astype(np.int64)
+        return (self._net[subnets].astype(np.int64) + offsets).astype(np.uint32)
+
+    def generate(self, duration, start=0.0, chunk=1 << 18):
+        """Trace of the flows arriving in ``[start, start + duration)``"""
+        p, rng, n = self.params, self.rng, len(self.subnets)
+        peak = self.rate * (1 + p['diurnal_amplitude'])
+        peak += sum(self.rate * max(c.multiplier - 1, 0) for c in self.flash_crowds)
+        window = chunk / peak if peak > 0 else duration
+        parts = []
+        t0, end = start, start + duration
+        while t0 < end and peak > 0:
+            width = min(window, end - t0)
+            # Candidates at the peak rate, each kept with probability rate(t) / peak
+            t = np.sort(t0 + rng.random(rng.poisson(peak * width)) * width)
+            base = self.base_rate(t)
+            crowds = self._crowd_rates(t)
+            total = base + crowds.sum(axis=0)
+            u = rng.random(len(t)) * peak
+            keep = u < total
+            t, u, base, crowds = t[keep], u[keep], base[keep], crowds[:, keep]
+            k = len(t)
+            pairs = np.minimum(np.searchsorted(self._pair_cdf, rng.random(k), side='right'), n * n - 1)
+            src, dst = pairs // n, pairs % n
+            # Arrivals above the background rate belong to a flash crowd
+            level = base.copy()
+            for i, crowd in enumerate(self.flash_crowds):
+                mine = (u >= level) & (u < level + crowds[i])
+                if mine.any():
+                    dst[mine] = crowd.dst
+                    others = np.delete(self.weights, crowd.dst)
+                    picks = rng.choice(n - 1, mine.sum(), p=others / others.sum())
+                    src[mine] = picks + (picks >= crowd.dst)
+                level = level + crowds[i]
+            flows = np.empty(k, dtype=FLOW_DTYPE)
+            flows['start'] = t
+            flows['src'] = self._hosts_in(src)
+            flows['dst'] = self._hosts_in(dst)
+            flows['size'] = self._sizes(k)
+            demand = rng.lognormal(np.log(p['mean_demand_mbps']) - 0.5, 1.0, k)
+            flows['demand'] = demand
+            flows['duration'] = np.clip(flows['size'] * 8 / (demand * 1e6), 1e-3, p['max_duration'])
+            flows['priority'] = rng.choice(np.asarray(p['priorities'], dtype=np.uint16), k)
+            parts.append(flows)
+            t0 += width
+        flows = np.concatenate(parts) if parts else np.empty(0, dtype=FLOW_DTYPE)
+        return Trace(flows, self.subnets, dict(self.params, start=start, duration=duration))
+
+
+def flash_crowd(subnets, packets, seed=0, duration=10.0, mean_size=150000.0):
+    """A burst of about ``packets`` packets: flows arriving over ``duration``
+    seconds, three quarters of them converging on one destination subnet"""
+    flows = max(1.0, packets * PACKET_BYTES / mean_size)
+    # The crowd runs at three times the background rate for the whole burst
+    generator = WorkloadGenerator(subnets, rate=flows / duration / 4, seed=seed, mean_size=mean_size,
+                                  max_duration=duration, flash_crowds=[FlashCrowd(0.0, duration, 4.0)])
+    trace = generator.generate(duration)
+    # Heavy tails make the total swing widely: rescale the sizes to the target
+    flows = trace.flows
+    if len(flows):
+        flows['size'] = np.maximum(flows['size'] * (packets * PACKET_BYTES / flows['size'].sum()), 64)
+        flows['duration'] = np.clip(flows['size'] * 8 / (flows['demand'] * 1e6), 1e-3, duration)
+    return trace
+
+
+class Replayer:
+    def __init__(self, trace, flows, monitor=None, prefix='wl', batch=10000):
+        self.trace = trace
+        self.flows = flows
+        self.monitor = monitor
+        self.prefix = prefix
+        self.batch = batch
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+    def _apply(self, order, now):
+        n = len(self.trace)
+        arrivals, departures = order[order < n], order[order >= n] - n
+        records = self.trace.flows[arrivals]
+        if len(records):
+            items = [(f"{self.prefix}{i}", {"src": _ip_to_str(src), "dst": _ip_to_str(dst),
+                                            "priority": priority, "demand_mbps": round(demand, 3),
+                                            "size_bytes": size, "created_at": now,
+                                            "idle_timeout": 0, "hard_timeout": 0})
+                     for i, src, dst, priority, demand, size in zip(
+                         arrivals.tolist(), records['src'].tolist(), records['dst'].tolist(),
+                         records['priority'].tolist(), records['demand'].tolist(), records['size'].tolist())]
+            self.flows.add_many(items)
+            if self.monitor is not None:
+                self.monitor.count_packets(int(-(-records['size'].astype(np.int64) // PACKET_BYTES).sum()))
+        if len(departures):
+            self.flows.remove_many(f"{self.prefix}{i}" for i in departures.tolist())
+
+    def run(self, speed=1.0, clock=time.monotonic, sleep=time.sleep):
+        """Replay the whole trace at ``speed`` times real time (None: as fast
+        as possible); returns a ReplayReport"""
+        times, order = self.trace.events()
+        total = len(times)
+        if total:
+            # Start with the first arrival, whatever time of day the trace begins at
+            times = times - times[0]
+        lags = np.zeros(total)
+        peak = len(self.flows)
+        start = clock()
+        i = 0
+        while i < total and self.running:
+            elapsed = clock() - start
+            if speed is None:
+                j = min(i + self.batch, total)
+            else:
+                j = min(int(np.searchsorted(times, elapsed * speed, side='right')), i + self.batch)
+                if j == i:
+                    sleep(min((times[i] - elapsed * speed) / speed, 0.1))
+                    continue
+            self._apply(order[i:j], int(time.time()))
+            if speed is not None:
+                lags[i:j] = clock() - start - times[i:j] / speed
+            peak = max(peak, len(self.flows))
+            i = j
+        wall = clock() - start
+        trace_seconds = float(times[i - 1]) if i else 0.0
+        applied = lags[:i]
+        p50, p99 = np.percentile(applied, [50, 99]) if i else (0.0, 0.0)
+        return ReplayReport(i, int(np.count_nonzero(order[:i] < len(self.trace))), trace_seconds, wall,
+                            speed, trace_seconds / wall if wall > 0 else float('inf'),
+                            float(p50), float(p99), float(applied.max()) if i else 0.0, peak)
+
+
+def main(argv=None):
+    import argparse
+    from controllers.path_engine import DEFAULT_TOPOLOGY_FILE, TopologyGraph
+    parser = argparse.ArgumentParser(description="Generate a seeded workload trace")
+    parser.add_argument('output')
+    parser.add_argument('--topology', default=DEFAULT_TOPOLOGY_FILE)
+    parser.add_argument('--duration', type=float, default=3600.0, help="seconds of arrivals")
+    parser.add_argument('--rate', type=float, default=100.0, help="mean flow arrivals per second")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--size', choices=SIZE_DISTRIBUTIONS, default='pareto')
+    parser.add_argument('--mean-size', type=float, default=1e6, help="mean flow size in bytes")
+    parser.add_argument('--skew', type=float, default=1.0, help="lognormal sigma of the subnet weights")
+    parser.add_argument('--diurnal', type=float, default=0.0, help="amplitude of the daily rate swing")
+    parser.add_argument('--flash-crowd', action='append', default=[], metavar='START:DURATION:MULTIPLIER')
+    args = parser.parse_args(argv)
+    graph = TopologyGraph.from_file(args.topology)
+    crowds = [FlashCrowd(*map(float, spec.split(':'))) for spec in args.flash_crowd]
+    start = time.perf_counter()
+    trace = WorkloadGenerator([net for net, _ in graph.subnets], args.rate, args.seed, args.size,
+                              args.mean_size, skew=args.skew, diurnal_amplitude=args.diurnal,
+                              flash_crowds=crowds).generate(args.duration)
+    elapsed = time.perf_counter() - start
+    trace.save(args.output)
+    print(f"{args.output}: {len(trace)} flows over {trace.duration:.0f} s, "
+          f"{int(trace.flows['size'].sum())} bytes, generated in {elapsed:.2f} s")
+
+
+if __name__ == '__main__':
+    main()
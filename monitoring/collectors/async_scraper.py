@@ -0,0 +1,137 @@
+"""
+Concurrent HTTP scraper for controller and switch endpoints
+
+All targets share one asyncio event loop and one pooled aiohttp session, so
+a scrape reuses a keep-alive connection instead of opening a new one, and a
+thousand targets cost a thousand cheap coroutines rather than a thousand
+threads. Each target keeps its own interval and timeout. Start times are
+spread over the first interval, and a failing target backs off exponentially
+(with jitter) up to ``max_backoff`` before it is retried at its normal rate.
+
+Targets come from a JSON config::
+
+    {"defaults": {"interval": 1.0, "timeout": 0.5},
+     "targets": [{"name": "controller", "url": "http://localhost:8080/metrics",
+                  "kind": "metrics"}]}
+
+The scraper only fetches and decodes JSON. What a payload means is up to the
+``handler(target, payload)`` callback.
+"""
+
+import asyncio
+import json
+import logging
+import random
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+
+class ScrapeTarget:
+    def __init__(self, name, url, kind='metrics', interval=1.0, timeout=0.5, labels=None):
+        self.name = name
+        self.url = url
+        self.kind = kind
+        self.interval = float(interval)
+        self.timeout = float(timeout)
+        self.labels = labels or {}
+        self.failures = 0
+        self.scrapes = 0
+        self.errors = 0
+        self.last_error = None
+        self.last_duration = None
+
+    @property
+    def up(self):
+        return self.scrapes > 0 and self.failures == 0
+
+
+def load_targets(path):
+    with open(path, 'r') as f:
+        config = json.load(f)
+    defaults = config.get('defaults', {})
+    return [ScrapeTarget(**dict(defaults, **target)) for target in config.get('targets', [])]
+
+
+class AsyncScraper:
+    def __init__(self, targets, handler, max_connections=256, keepalive_timeout=30.0,
+                 max_backoff=30.0, rng=None):
+        self.targets = list(targets)
+        self.handler = handler
+        self.max_connections = max_connections
+        self.keepalive_timeout = keepalive_timeout
+        self.max_backoff = max_backoff
+        self.rng = rng or random.Random()
+
+    def _session(self):
+        connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=0,
+                                         keepalive_timeout=self.keepalive_timeout,
+                                         ttl_dns_cache=300)
+        return aiohttp.ClientSession(connector=connector)
+
+    async def run(self, stop=None):
+        """Scrape every target until ``stop`` (an asyncio.Event) is set"""
+        stop = stop or asyncio.Event()
+        async with self._session() as session:
+            tasks = [asyncio.create_task(self._loop(session, target)) for target in self.targets]
+            try:
+                await stop.wait()
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    def next_delay(self, target):
+        if not target.failures:
+            return target.interval
+        backoff = min(target.interval * 2 ** target.failures, self.max_backoff)
+        return backoff * self.rng.uniform(0.5, 1.0)
+
+    async def _loop(self, session, target):
+        loop = asyncio.get_running_loop()
+        due = loop.time() + self.rng.uniform(0, target.interval)
+        while True:
+            await asyncio.sleep(max(due - loop.time(), 0.0))
+            await self.scrape(session, target)
+            due += self.next_delay(target)
+            now = loop.time()
+            if due < now:
+                # Fell behind (slow scrape or busy loop): skip the missed ticks
+                due = now + self.next_delay(target)
+
+    async def scrape(self, session, target):
+        """Fetch one target and hand its payload over. Returns True on success."""
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        target.scrapes += 1
+        try:
+            timeout = aiohttp.ClientTimeout(total=target.timeout)
+            async with session.get(target.url, timeout=timeout) as response:
+                response.raise_for_status()
+                payload = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            target.failures += 1
+            target.errors += 1
+            target.last_error = str(e) or type(e).__name__
+            if target.failures == 1:
+                logger.warning(f"Scrape of {target.name} ({target.url}) failed: {target.last_error}")
+            return False
+        finally:
+            target.last_duration = loop.time() - start
+        if target.failures:
+            logger.info(f"Scrape of {target.name} recovered after {target.failures} failures")
+        target.failures = 0
+        try:
+            self.handler(target, payload)
+        except Exception:
+            logger.exception(f"Handler failed for {target.name}")
+        return True
+
+    def summary(self):
+        return {
+            "targets": len(self.targets),
+            "up": sum(1 for t in self.targets if t.up),
+            "scrapes": sum(t.scrapes for t in self.targets),
+            "errors": sum(t.errors for t in self.targets),
+        }
@@ -0,0 +1,184 @@
+"""
+Streaming congestion and anomaly detection over many rate series
+
+Every tracked series (a link's utilisation, a flow's byte rate, a switch's
+packet-in rate) owns one slot in a set of NumPy arrays holding its
+exponentially weighted mean and variance, a streaming quantile estimate and
+its alarm state. A batch of samples updates all of its series with a few
+vectorized operations, O(1) per sample and with no per-series history, so
+memory is fixed by ``capacity``. When every slot is taken the least recently
+updated series is dropped.
+
+A series raises an alarm when it crosses the absolute ``high`` level (if one
+is set) or when its z-score against its own recent behaviour reaches
+``z_on``. The alarm clears only once the value is back under ``low`` and the
+z-score is under ``z_off``, so a series hovering around a threshold produces
+one start and one end event instead of a stream of alerts. ``min_std`` is
+the smallest deviation worth scoring, in the units of the series: a series
+that has been flat scores a change against it rather than against its
+near-zero variance, so a trivial step does not raise an alarm.
+"""
+
+import time
+from collections import namedtuple
+
+import numpy as np
+
+START = 'start'
+END = 'end'
+
+DetectorEvent = namedtuple('DetectorEvent', ['kind', 'reason', 'key', 'value', 'mean', 'zscore',
+                                             'quantile', 'timestamp'])
+
+
+class StreamingDetector:
+    def __init__(self, capacity=131072, alpha=0.1, high=None, low=None, z_on=4.0, z_off=1.0,
+                 min_samples=10, quantile=0.95, quantile_rate=0.05, min_std=0.0):
+        self.capacity = capacity
+        self.alpha = alpha
+        self.high = high
+        self.low = high if low is None else low
+        self.z_on = z_on
+        self.z_off = z_off
+        self.min_samples = min_samples
+        self.min_std = max(min_std, 1e-9)
+        self.tau = quantile
+        self.quantile_rate = quantile_rate
+        self.mean = np.zeros(capacity)
+        self.var = np.zeros(capacity)
+        self.quantile = np.zeros(capacity)
+        self.count = np.zeros(capacity, dtype=np.int64)
+        self.alarm = np.zeros(capacity, dtype=bool)
+        self.last_seen = np.full(capacity, -np.inf)
+        self._slots = {}
+        self._keys = [None] * capacity
+        self._free = list(range(capacity - 1, -1, -1))
+        self._subscribers = []
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def subscribe(self, callback):
+        """Call ``callback(events)`` after every batch that produced events"""
+        self._subscribers.append(callback)
+
+    def observe(self, keys, values, timestamp=None):
+        """Feed one sample per key; returns the alarm transitions it caused"""
+        timestamp = time.time() if timestamp is None else timestamp
+        keys = list(keys)
+        if not keys:
+            return []
+        slots = self._lookup(keys, timestamp)
+        x = np.asarray(values, dtype=np.float64)
+        if len(slots) != len(np.unique(slots)):
+            # A key repeated within one batch: keep its last sample
+            _, last = np.unique(slots[::-1], return_index=True)
+            keep = np.sort(len(slots) - 1 - last)
+            slots, x = slots[keep], x[keep]
+            keys = [keys[i] for i in keep.tolist()]
+
+        mean, var, count = self.mean[slots], self.var[slots], self.count[slots]
+        first = count == 0
+        diff = x - mean
+        # Score against the statistics before this sample; the floors keep a
+        # perfectly flat series from turning tiny wiggles into huge z-scores
+        std = np.maximum(np.sqrt(var), np.maximum(np.abs(mean) * 0.01, self.min_std))
+        zscore = np.where(count >= self.min_samples, diff / std, 0.0)
+
+        increment = self.alpha * diff
+        self.mean[slots] = np.where(first, x, mean + increment)
+        self.var[slots] = np.where(first, 0.0, (1 - self.alpha) * (var + diff * increment))
+        q = self.quantile[slots]
+        step = self.quantile_rate * std * np.where(x < q, self.tau - 1.0, self.tau)
+        self.quantile[slots] = np.where(first, x, q + step)
+        self.count[slots] = count + 1
+        self.last_seen[slots] = timestamp
+
+        alarm = self.alarm[slots]
+        over = zscore >= self.z_on
+        if self.high is not None:
+            over_level = x >= self.high
+            under = (x <= self.low) & (zscore <= self.z_off)
+        else:
+            over_level = np.zeros(len(slots), dtype=bool)
+            under = zscore <= self.z_off
+        start = ~alarm & (over_level | over)
+        end = alarm & under
+        changed = np.flatnonzero(start | end)
+        if not len(changed):
+            return []
+        self.alarm[slots[start]] = True
+        self.alarm[slots[end]] = False
+
+        events = []
+        for i in changed.tolist():
+            slot = slots[i]
+            kind = START if start[i] else END
+            reason = 'level' if over_level[i] or (kind == END and self.high is not None) else 'zscore'
+            # The mean the sample was scored against, not the one it moved
+            prior = mean[i] if count[i] else x[i]
+            events.append(DetectorEvent(kind, reason, keys[i], float(x[i]), float(prior),
+                                        float(zscore[i]), float(self.quantile[slot]), timestamp))
+        for callback in self._subscribers:
+            callback(events)
+        return events
+
+    def _lookup(self, keys, timestamp):
+        get = self._slots.get
+        slots = np.fromiter((get(k, -1) for k in keys), np.int64, len(keys))
+        missing = np.flatnonzero(slots < 0)
+        if len(missing):
+            new_keys = dict.fromkeys(keys[i] for i in missing)
+            self._reserve(len(new_keys), slots[slots >= 0])
+            for key in new_keys:
+                slot = self._free.pop()
+                self._slots[key] = slot
+                self._keys[slot] = key
+                self.count[slot] = 0
+                self.alarm[slot] = False
+                self.last_seen[slot] = timestamp
+            slots[missing] = [self._slots[keys[i]] for i in missing]
+        return slots
+
+    def _reserve(self, needed, keep):
+        """Drop least recently updated series until ``needed`` slots are free"""
+        shortfall = needed - len(self._free)
+        if shortfall <= 0:
+            return
+        if needed + len(keep) > self.capacity:
+            raise ValueError(f"Batch with {needed + len(keep)} series exceeds detector capacity {self.capacity}")
+        age = np.where(self.count > 0, self.last_seen, np.inf)
+        age[keep] = np.inf
+        for slot in np.argpartition(age, shortfall - 1)[:shortfall].tolist():
+            self._release(slot)
+        self.evictions += shortfall
+
+    def _release(self, slot):
+        del self._slots[self._keys[slot]]
+        self._keys[slot] = None
+        self.count[slot] = 0
+        self.alarm[slot] = False
+        self.last_seen[slot] = -np.inf
+        self._free.append(slot)
+
+    def forget(self, key):
+        slot = self._slots.get(key)
+        if slot is not None:
+            self._release(slot)
+
+    def alarmed(self):
+        """Keys currently in alarm"""
+        return [self._keys[slot] for slot in np.flatnonzero(self.alarm).tolist()]
+
+    def stats(self, key):
+        slot = self._slots.get(key)
+        if slot is None:
+            return None
+        return {
+            "mean": float(self.mean[slot]),
+            "std": float(np.sqrt(self.var[slot])),
+            "quantile": float(self.quantile[slot]),
+            "samples": int(self.count[slot]),
+            "alarm": bool(self.alarm[slot]),
+        }
@@ -0,0 +1,62 @@
+"""
+Delta tracking for cumulative counters read from other processes
+
+Controllers, switch ports and flow entries all report running totals. Adding
+such a total to a Prometheus counter on every poll counts the same packets
+again and again; what has to be added is the increase since the previous
+poll. CounterTracker keeps the last value seen per source and turns each new
+reading into ``(delta, rate)``:
+
+- The first reading of a source only sets the baseline.
+- A reading lower than the previous one, or one with a new ``epoch``, means
+  the source restarted or was overwritten. The reading itself is then the
+  increase, since the counter started again from zero.
+"""
+
+import time
+
+
+class CounterTracker:
+    def __init__(self):
+        # source -> (value, timestamp, epoch)
+        self._last = {}
+        self._rates = {}
+        self.resets = {}
+
+    def __len__(self):
+        return len(self._last)
+
+    def update(self, source, value, timestamp=None, epoch=None):
+        """Record a cumulative reading; returns ``(delta, rate)``.
+
+        ``rate`` is per second, or None until two readings with increasing
+        timestamps have been seen.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        previous = self._last.get(source)
+        self._last[source] = (value, timestamp, epoch)
+        if previous is None:
+            return 0, None
+        last_value, last_timestamp, last_epoch = previous
+        if value < last_value or epoch != last_epoch:
+            self.resets[source] = self.resets.get(source, 0) + 1
+            delta = value
+        else:
+            delta = value - last_value
+        if timestamp <= last_timestamp:
+            return delta, self._rates.get(source)
+        rate = delta / (timestamp - last_timestamp)
+        self._rates[source] = rate
+        return delta, rate
+
+    def rate(self, source):
+        return self._rates.get(source)
+
+    def value(self, source):
+        last = self._last.get(source)
+        return last[0] if last is not None else None
+
+    def forget(self, source):
+        self._last.pop(source, None)
+        self._rates.pop(source, None)
+        self.resets.pop(source, None)
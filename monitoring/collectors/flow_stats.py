@@ -1,36 +1,199 @@
+import struct
+import time
+
 from ryu.base import app_manager
 from ryu.controller import ofp_event
 from ryu.lib import hub
-from ryu.controller.handler import MAIN_DISPATCHER, set_ev_cls
+from ryu.controller.handler import MAIN_DISPATCHER, DEAD_DISPATCHER, set_ev_cls
 from ryu.ofproto import ofproto_v1_3
 import prometheus_client
 
+from controllers.path_engine import DEFAULT_TOPOLOGY_FILE, TopologyGraph
+from monitoring.collectors.congestion_detector import START, StreamingDetector
+from monitoring.collectors.flow_stats_store import FlowStatsStore
+from monitoring.collectors.link_metrics import (PROBE_ETHERTYPE, LinkMeter, build_probe,
+                                                parse_probe)
+from monitoring.collectors.poll_scheduler import PollScheduler
+
+TOP_FLOWS = 20
+POLL_TICK = 0.5
+EXPORT_INTERVAL = 10
+PROBE_INTERVAL = 5
+
+
+def _flow_label(key):
+    table_id, priority, fields = key
+    match = ','.join(f"{name}={value}" for name, value in fields)
+    return f"table={table_id},priority={priority},{match}"
+
+
 class FlowStatsCollector(app_manager.RyuApp):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
 
     def __init__(self, *args, **kwargs):
         super(FlowStatsCollector, self).__init__(*args, **kwargs)
-        self.flow_stats = prometheus_client.Counter('flow_stats', 'Flow statistics', ['switch', 'table_id', 'flow_id'])
+        self.store = FlowStatsStore()
+        self.datapaths = {}
+        self.scheduler = PollScheduler()
+        self.link_meter = LinkMeter(TopologyGraph.from_file(DEFAULT_TOPOLOGY_FILE),
+                                    registry=prometheus_client.REGISTRY)
+        self.link_detector = StreamingDetector(capacity=max(self.link_meter.graph.num_links, 1),
+                                               high=0.8, low=0.6, min_samples=5, min_std=0.02)
+        # One series per flow the store tracks: byte-rate anomalies of at least
+        # a few hundred kbit/s
+        self.flow_detector = StreamingDetector(capacity=self.store.max_flows, min_std=50000.0)
+        self.link_congested = prometheus_client.Gauge(
+            'link_congested', 'Whether the congestion detector has a link in alarm', ['link'])
+        self.detector_events = prometheus_client.Counter(
+            'congestion_detector_events_total', 'Alarm transitions raised by the detectors',
+            ['series', 'kind'])
+        # Series are bounded: TOP_FLOWS flow series plus one per switch
+        self.top_flow_bytes = prometheus_client.Gauge(
+            'flow_top_bytes_per_second', 'Byte rate of the busiest flows', ['switch', 'flow'])
+        self.top_flow_packets = prometheus_client.Gauge(
+            'flow_top_packets_per_second', 'Packet rate of the busiest flows', ['switch', 'flow'])
+        self.switch_flows = prometheus_client.Gauge(
+            'switch_flows', 'Flows reported by each switch', ['switch'])
+        self.switch_bytes = prometheus_client.Gauge(
+            'switch_flow_bytes_per_second', 'Byte rate summed over all flows of a switch', ['switch'])
+        self.switch_packets = prometheus_client.Gauge(
+            'switch_flow_packets_per_second', 'Packet rate summed over all flows of a switch', ['switch'])
         hub.spawn(self._monitor)
 
-    @set_ev_cls(ofp_event.EventOFPStateChange, [MAIN_DISPATCHER])
+    @set_ev_cls(ofp_event.EventOFPStateChange, [MAIN_DISPATCHER, DEAD_DISPATCHER])
     def state_change_handler(self, ev):
-        if ev.state == 'up':
-            self._request_flow_stats(ev.datapath)
+        datapath = ev.datapath
+        if ev.state == MAIN_DISPATCHER:
+            self.datapaths[datapath.id] = datapath
+            self.scheduler.register(datapath.id)
+            self._install_probe_rule(datapath)
+        elif ev.state == DEAD_DISPATCHER and datapath.id is not None:
+            self.datapaths.pop(datapath.id, None)
+            self.scheduler.unregister(datapath.id)
+            self.store.forget_switch(ev.datapath.id)
+            for gauge in (self.switch_flows, self.switch_bytes, self.switch_packets):
+                try:
+                    gauge.remove(ev.datapath.id)
+                except KeyError:
+                    pass
 
-    def _request_flow_stats(self, datapath):
+    def _request_stats(self, datapath, kind):
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
-        req = parser.OFPFlowStatsRequest(datapath)
+        if kind == 'flow':
+            req = parser.OFPFlowStatsRequest(datapath)
+        else:
+            req = parser.OFPPortStatsRequest(datapath, 0, ofproto.OFPP_ANY)
         datapath.send_msg(req)
+        self.scheduler.sent(datapath.id, kind, req.xid)
+
+    @staticmethod
+    def _more(msg):
+        return bool(msg.flags & msg.datapath.ofproto.OFPMPF_REPLY_MORE)
 
     @set_ev_cls(ofp_event.EventOFPFlowStatsReply, [MAIN_DISPATCHER])
     def flow_stats_reply_handler(self, ev):
-        body = ev.msg.body
-        for stat in body:
-            self.flow_stats.labels(switch=ev.msg.datapath.id, table_id=stat.table_id, flow_id=stat.match).inc(stat.packet_count)
+        msg = ev.msg
+        try:
+            self.store.ingest_reply(msg.datapath.id, msg.body)
+        except ValueError as e:
+            # The store checks capacity before writing, so the reply is dropped whole
+            self.logger.warning("Dropping flow stats reply from switch %s: %s", msg.datapath.id, e)
+        self.scheduler.reply(msg.datapath.id, msg.xid, self._more(msg))
+
+    @set_ev_cls(ofp_event.EventOFPPortStatsReply, [MAIN_DISPATCHER])
+    def port_stats_reply_handler(self, ev):
+        msg = ev.msg
+        dpid = msg.datapath.id
+        changed = self.link_meter.update_ports(dpid, [(stat.port_no, stat.tx_bytes) for stat in msg.body])
+        if changed:
+            graph, utilisation = self.link_meter.graph, self.link_meter.utilisation
+            events = self.link_detector.observe([graph.link_name(link) for link in changed],
+                                                [utilisation[link] for link in changed])
+            for event in events:
+                self.link_congested.labels(link=event.key).set(1 if event.kind == START else 0)
+                self.detector_events.labels(series='link', kind=event.kind).inc()
+                self.logger.warning("Link %s congestion %s: utilisation %.2f (%s)",
+                                    event.key, event.kind, event.value, event.reason)
+        self.scheduler.set_load(dpid, self.link_meter.switch_utilisation(dpid))
+        self.scheduler.reply(dpid, msg.xid, self._more(msg))
+
+    def _install_probe_rule(self, datapath):
+        """Send latency probes arriving from a neighbour to the controller"""
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER, ofproto.OFPCML_NO_BUFFER)]
+        inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, actions)]
+        datapath.send_msg(parser.OFPFlowMod(datapath=datapath, priority=0xffff,
+                                            match=parser.OFPMatch(eth_type=PROBE_ETHERTYPE),
+                                            instructions=inst))
+
+    def _send_probes(self, datapath):
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        # Echo carries its send time so the reply gives the control-channel RTT
+        datapath.send_msg(parser.OFPEchoRequest(datapath, data=struct.pack('!d', time.time())))
+        graph = self.link_meter.graph
+        node = graph.dpids.get(datapath.id)
+        for _, link in graph.adj[node] if node is not None else ():
+            port_no = graph.port_of.get((node, link))
+            if port_no is None:
+                continue
+            actions = [parser.OFPActionOutput(port_no)]
+            datapath.send_msg(parser.OFPPacketOut(datapath=datapath, buffer_id=ofproto.OFP_NO_BUFFER,
+                                                  in_port=ofproto.OFPP_CONTROLLER, actions=actions,
+                                                  data=build_probe(datapath.id, port_no)))
+
+    @set_ev_cls(ofp_event.EventOFPEchoReply, [MAIN_DISPATCHER])
+    def echo_reply_handler(self, ev):
+        data = ev.msg.data
+        if data and len(data) == 8:
+            self.link_meter.record_echo(ev.msg.datapath.id, time.time() - struct.unpack('!d', data)[0])
+
+    @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
+    def probe_in_handler(self, ev):
+        probe = parse_probe(ev.msg.data)
+        if probe is not None:
+            src_dpid, src_port, sent_at = probe
+            self.link_meter.record_probe(src_dpid, src_port, sent_at)
+
+    def export(self, top=TOP_FLOWS):
+        """Publish top-K flow rates and per-switch totals"""
+        self.top_flow_bytes.clear()
+        self.top_flow_packets.clear()
+        for dpid, key, pkt_rate, byte_rate in self.store.top_flows(top):
+            label = _flow_label(key)
+            self.top_flow_bytes.labels(switch=dpid, flow=label).set(byte_rate)
+            self.top_flow_packets.labels(switch=dpid, flow=label).set(pkt_rate)
+        for dpid, (flows, pkt_rate, byte_rate) in self.store.switch_totals().items():
+            self.switch_flows.labels(switch=dpid).set(flows)
+            self.switch_bytes.labels(switch=dpid).set(byte_rate)
+            self.switch_packets.labels(switch=dpid).set(pkt_rate)
+        rows, owners = self.store.active()
+        if len(rows):
+            _, byte_rate = self.store.rates()
+            events = self.flow_detector.observe(owners, byte_rate[rows])
+            for event in events:
+                self.detector_events.labels(series='flow', kind=event.kind).inc()
+            started = sum(1 for event in events if event.kind == START)
+            if started:
+                self.logger.warning("%d flows with anomalous byte rates, %d flows in alarm",
+                                    started, len(self.flow_detector.alarmed()))
 
     def _monitor(self):
+        last_export = last_probe = time.monotonic()
         while True:
-            hub.sleep(10)  # Adjust the sleep time as needed
-            # Here you can add additional monitoring logic if required
\ No newline at end of file
+            hub.sleep(POLL_TICK)
+            for dpid, kind, xid in self.scheduler.expire():
+                self.logger.warning("%s stats request %s to switch %s timed out", kind, xid, dpid)
+            for dpid, kind in self.scheduler.due():
+                datapath = self.datapaths.get(dpid)
+                if datapath is not None:
+                    self._request_stats(datapath, kind)
+            if time.monotonic() - last_probe >= PROBE_INTERVAL:
+                last_probe = time.monotonic()
+                for datapath in list(self.datapaths.values()):
+                    self._send_probes(datapath)
+            if time.monotonic() - last_export >= EXPORT_INTERVAL:
+                last_export = time.monotonic()
+                self.export()
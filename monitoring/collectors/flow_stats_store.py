@@ -0,0 +1,161 @@
+"""
+Columnar ring-buffer store for OpenFlow flow statistics
+
+Each flow key owns one row of preallocated NumPy ring buffers holding the
+last ``depth`` samples of packet count, byte count and timestamp. A stats
+reply is ingested in bulk (one vectorized write per reply rather than one
+Python call per stat), and per-flow rates are computed from the two newest
+samples with array arithmetic. Memory is fixed at construction: when every
+row is taken, the least recently updated flows are evicted.
+
+Export is bounded by design: callers ask for the top-K flows plus per-switch
+totals instead of one Prometheus series per match.
+"""
+
+import time
+
+import numpy as np
+
+
+class FlowStatsStore:
+    def __init__(self, max_flows=65536, depth=8):
+        self.max_flows = max_flows
+        self.depth = depth
+        self.packets = np.zeros((max_flows, depth), dtype=np.float64)
+        self.bytes = np.zeros((max_flows, depth), dtype=np.float64)
+        self.timestamps = np.zeros((max_flows, depth), dtype=np.float64)
+        self.pos = np.zeros(max_flows, dtype=np.int64)
+        self.count = np.zeros(max_flows, dtype=np.int64)
+        self.in_use = np.zeros(max_flows, dtype=bool)
+        self.last_seen = np.full(max_flows, -np.inf)
+        # dpid -> {flow key -> row}, and row -> (dpid, key) for eviction and labels
+        self._rows = {}
+        self._owner = [None] * max_flows
+        self._free = list(range(max_flows - 1, -1, -1))
+        self.evictions = 0
+
+    def __len__(self):
+        return self.max_flows - len(self._free)
+
+    @staticmethod
+    def stat_key(stat):
+        """Key identifying an OFPFlowStats entry within its switch"""
+        return stat.table_id, stat.priority, tuple(stat.match.items())
+
+    def ingest_reply(self, dpid, body, timestamp=None):
+        """Ingest the body of an OFPFlowStatsReply"""
+        n = len(body)
+        return self.ingest(dpid, [self.stat_key(s) for s in body],
+                           np.fromiter((s.packet_count for s in body), np.float64, n),
+                           np.fromiter((s.byte_count for s in body), np.float64, n),
+                           timestamp)
+
+    def ingest(self, dpid, keys, packets, byte_counts, timestamp=None):
+        """Record one sample per key. Returns the rows written."""
+        timestamp = time.time() if timestamp is None else timestamp
+        rows = self._lookup(dpid, keys)
+        packets = np.asarray(packets, dtype=np.float64)
+        byte_counts = np.asarray(byte_counts, dtype=np.float64)
+        if len(rows) != len(np.unique(rows)):
+            # A key repeated within one reply: keep its last occurrence
+            _, last = np.unique(rows[::-1], return_index=True)
+            keep = len(rows) - 1 - last
+            rows, packets, byte_counts = rows[keep], packets[keep], byte_counts[keep]
+        slot = self.pos[rows]
+        self.packets[rows, slot] = packets
+        self.bytes[rows, slot] = byte_counts
+        self.timestamps[rows, slot] = timestamp
+        self.pos[rows] = (slot + 1) % self.depth
+        self.count[rows] = np.minimum(self.count[rows] + 1, self.depth)
+        self.last_seen[rows] = timestamp
+        return rows
+
+    def _lookup(self, dpid, keys):
+        index = self._rows.setdefault(dpid, {})
+        get = index.get
+        rows = np.fromiter((get(k, -1) for k in keys), np.int64, len(keys))
+        missing = np.flatnonzero(rows < 0)
+        if len(missing):
+            new_keys = dict.fromkeys(keys[i] for i in missing)
+            self._reserve(len(new_keys), rows[rows >= 0])
+            for key in new_keys:
+                row = self._free.pop()
+                index[key] = row
+                self._owner[row] = (dpid, key)
+                self.in_use[row] = True
+                self.pos[row] = self.count[row] = 0
+            rows[missing] = [index[keys[i]] for i in missing]
+        return rows
+
+    def _reserve(self, needed, keep):
+        """Evict least recently updated rows until ``needed`` rows are free"""
+        shortfall = needed - len(self._free)
+        if shortfall <= 0:
+            return
+        if needed + len(keep) > self.max_flows:
+            raise ValueError(f"Reply with {needed + len(keep)} flows exceeds store capacity {self.max_flows}")
+        age = np.where(self.in_use, self.last_seen, np.inf)
+        # Rows about to be written by the current ingest are not candidates
+        age[keep] = np.inf
+        victims = np.argpartition(age, shortfall - 1)[:shortfall]
+        for row in victims.tolist():
+            dpid, key = self._owner[row]
+            del self._rows[dpid][key]
+            self._release(row)
+        self.evictions += shortfall
+
+    def _release(self, row):
+        self._owner[row] = None
+        self.in_use[row] = False
+        self.count[row] = 0
+        self.last_seen[row] = -np.inf
+        self._free.append(row)
+
+    def forget_switch(self, dpid):
+        """Release every row held by a disconnected switch"""
+        for row in self._rows.pop(dpid, {}).values():
+            self._release(row)
+
+    def rates(self):
+        """Per-row ``(packets/s, bytes/s)`` from the two newest samples.
+
+        Rows with fewer than two samples, or whose counter went backwards
+        (the flow was reinstalled), report 0.
+        """
+        last = (self.pos - 1) % self.depth
+        prev = (self.pos - 2) % self.depth
+        rows = np.arange(self.max_flows)
+        dt = self.timestamps[rows, last] - self.timestamps[rows, prev]
+        valid = (self.count >= 2) & (dt > 0)
+        safe_dt = np.where(valid, dt, 1.0)
+        pkt_delta = self.packets[rows, last] - self.packets[rows, prev]
+        byte_delta = self.bytes[rows, last] - self.bytes[rows, prev]
+        valid &= (pkt_delta >= 0) & (byte_delta >= 0)
+        return (np.where(valid, pkt_delta / safe_dt, 0.0),
+                np.where(valid, byte_delta / safe_dt, 0.0))
+
+    def active(self):
+        """Rows currently holding a flow, with their ``(dpid, key)`` owners"""
+        rows = np.flatnonzero(self.in_use)
+        return rows, [self._owner[row] for row in rows.tolist()]
+
+    def top_flows(self, k=10, by='bytes'):
+        """``[(dpid, key, packets/s, bytes/s)]`` for the ``k`` busiest flows"""
+        pkt_rate, byte_rate = self.rates()
+        score = byte_rate if by == 'bytes' else pkt_rate
+        active = np.flatnonzero(self.count > 0)
+        if not len(active):
+            return []
+        k = min(k, len(active))
+        top = active[np.argpartition(-score[active], k - 1)[:k]]
+        top = top[np.argsort(-score[top], kind='stable')]
+        return [self._owner[row] + (float(pkt_rate[row]), float(byte_rate[row])) for row in top.tolist()]
+
+    def switch_totals(self):
+        """``{dpid: (flows, packets/s, bytes/s)}`` aggregated over every flow"""
+        pkt_rate, byte_rate = self.rates()
+        totals = {}
+        for dpid, index in self._rows.items():
+            rows = np.fromiter(index.values(), np.int64, len(index))
+            totals[dpid] = (len(rows), float(pkt_rate[rows].sum()), float(byte_rate[rows].sum()))
+        return totals
@@ -0,0 +1,198 @@
+"""
+Per-link utilisation and latency measurement
+
+LinkMeter turns switch port counters into link utilisation and probe
+timestamps into link latency, using the port-to-link mapping and the link
+capacities from the topology graph:
+
+- Utilisation: the tx byte delta of a port over the poll interval, divided by
+  the capacity of the link behind it. Each direction of a link is tracked
+  separately (tx on either end) and the busier one is reported. Only the
+  ports present in a stats reply are touched, so a poll costs O(changed
+  ports), not a full recompute.
+- Latency: a probe frame is sent out of a port with its send time and comes
+  back as a packet-in from the neighbouring switch. The controller-to-switch
+  legs are removed using the echo round-trip time of both switches. Each
+  link counts its probes, so a reader polling ``link_stats`` can tell a new
+  sample from the cached latency it saw last time.
+"""
+
+import struct
+import time
+
+from monitoring.collectors.counter_tracker import CounterTracker
+
+PROBE_ETHERTYPE = 0x88cc
+PROBE_DST_MAC = b'\x01\x80\xc2\x00\x00\x0e'
+PROBE_SRC_MAC = b'\x02\x00\x00\x00\x00\x01'
+_PROBE_MAGIC = b'WANP'
+_PROBE = struct.Struct('!4sQId')
+_ETH_HEADER = struct.Struct('!6s6sH')
+
+# Weight of a new sample in the smoothed echo round-trip time
+RTT_ALPHA = 0.2
+
+
+def build_probe(dpid, port_no, sent_at=None):
+    """Ethernet frame carrying the sending switch, port and timestamp"""
+    sent_at = time.time() if sent_at is None else sent_at
+    return (_ETH_HEADER.pack(PROBE_DST_MAC, PROBE_SRC_MAC, PROBE_ETHERTYPE) +
+            _PROBE.pack(_PROBE_MAGIC, dpid, port_no, sent_at))
+
+
+def parse_probe(data):
+    """``(dpid, port_no, sent_at)`` if ``data`` is a probe frame, else None"""
+    view = memoryview(data)
+    if len(view) < _ETH_HEADER.size + _PROBE.size:
+        return None
+    if view[12] != PROBE_ETHERTYPE >> 8 or view[13] != PROBE_ETHERTYPE & 0xff:
+        return None
+    magic, dpid, port_no, sent_at = _PROBE.unpack_from(view, _ETH_HEADER.size)
+    if magic != _PROBE_MAGIC:
+        return None
+    return dpid, port_no, sent_at
+
+
+class LinkMeter:
+    def __init__(self, graph, registry=None, on_update=None):
+        self.graph = graph
+        num_links = graph.num_links
+        # bits per second in each direction: [u -> v, v -> u] with u < v
+        self.throughput = [[0.0, 0.0] for _ in range(num_links)]
+        self.utilisation = [0.0] * num_links
+        self.latency = [None] * num_links
+        self.probes = [0] * num_links
+        self.rtt = {}
+        self.on_update = on_update
+        # Bumped on every measurement, so readers can tell when stats changed
+        self.version = 0
+        self.counters = CounterTracker()
+        self._node_dpid = {node: dpid for dpid, node in graph.dpids.items()}
+        self._metrics = None
+        if registry is not None:
+            self._metrics = self._create_metrics(registry)
+
+    @staticmethod
+    def _create_metrics(registry):
+        from prometheus_client import Gauge, Histogram
+        return (
+            Gauge('link_utilisation_ratio', 'Utilisation of the busier direction of a link',
+                  ['link'], registry=registry),
+            Gauge('link_throughput_bps', 'Measured throughput per link direction',
+                  ['link', 'direction'], registry=registry),
+            Histogram('link_latency_seconds', 'One-way link latency from probes', ['link'],
+                      buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0),
+                      registry=registry),
+        )
+
+    def topology_changed(self):
+        """Follow links and switches added to the graph since the last call"""
+        for _ in range(len(self.utilisation), self.graph.num_links):
+            self.throughput.append([0.0, 0.0])
+            self.utilisation.append(0.0)
+            self.latency.append(None)
+            self.probes.append(0)
+        self._node_dpid = {node: dpid for dpid, node in self.graph.dpids.items()}
+        self.version += 1
+
+    def link_for_port(self, dpid, port_no):
+        node = self.graph.dpids.get(dpid)
+        if node is None:
+            return None, None
+        return node, self.graph.ports.get((node, port_no))
+
+    # -- utilisation --------------------------------------------------------
+
+    def update_port(self, dpid, port_no, tx_bytes, timestamp=None):
+        """Feed one port's cumulative tx byte counter. Returns the link id it
+        updated, or None when the port is unknown or this is its first sample.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        node, link = self.link_for_port(dpid, port_no)
+        if link is None:
+            return None
+        # A counter reset (port flap or switch restart) counts from zero
+        _, byte_rate = self.counters.update((dpid, port_no), tx_bytes, timestamp)
+        if byte_rate is None:
+            return None
+        rate = byte_rate * 8.0
+        u, v = self.graph.link_ends[link]
+        direction = 0 if node == u else 1
+        self.throughput[link][direction] = rate
+        utilisation = max(self.throughput[link]) / (self.graph.bandwidth[link] * 1e6)
+        self.utilisation[link] = utilisation
+        self.version += 1
+        if self._metrics is not None:
+            name = self.graph.link_name(link)
+            self._metrics[0].labels(link=name).set(utilisation)
+            self._metrics[1].labels(link=name, direction=self.graph.names[node]).set(rate)
+        if self.on_update is not None:
+            self.on_update(link, utilisation)
+        return link
+
+    def update_ports(self, dpid, counters, timestamp=None):
+        """Feed ``(port_no, tx_bytes)`` pairs from one port stats reply"""
+        timestamp = time.time() if timestamp is None else timestamp
+        changed = []
+        for port_no, tx_bytes in counters:
+            link = self.update_port(dpid, port_no, tx_bytes, timestamp)
+            if link is not None:
+                changed.append(link)
+        return changed
+
+    def switch_utilisation(self, dpid):
+        """Utilisation of the busiest link attached to ``dpid``"""
+        node = self.graph.dpids.get(dpid)
+        if node is None:
+            return 0.0
+        return max((self.utilisation[link] for _, link in self.graph.adj[node]), default=0.0)
+
+    # -- latency ------------------------------------------------------------
+
+    def record_echo(self, dpid, rtt):
+        """Smoothed controller <-> switch round-trip time in seconds"""
+        previous = self.rtt.get(dpid)
+        self.rtt[dpid] = rtt if previous is None else previous + RTT_ALPHA * (rtt - previous)
+
+    def record_probe(self, src_dpid, src_port, sent_at, received_at=None):
+        """A probe sent out of ``src_port`` came back from the neighbour.
+
+        Returns the link id and its estimated one-way latency in seconds.
+        """
+        received_at = time.time() if received_at is None else received_at
+        node, link = self.link_for_port(src_dpid, src_port)
+        if link is None:
+            return None
+        u, v = self.graph.link_ends[link]
+        peer = v if node == u else u
+        peer_dpid = self._node_dpid.get(peer)
+        control_legs = (self.rtt.get(src_dpid, 0.0) + self.rtt.get(peer_dpid, 0.0)) / 2.0
+        latency = max(received_at - sent_at - control_legs, 0.0)
+        self.latency[link] = latency
+        self.probes[link] += 1
+        self.version += 1
+        if self._metrics is not None:
+            self._metrics[2].labels(link=self.graph.link_name(link)).observe(latency)
+        return link, latency
+
+    # -- reporting ----------------------------------------------------------
+
+    def link_stats(self):
+        stats = {}
+        for link in range(self.graph.num_links):
+            latency = self.latency[link]
+            stats[self.graph.link_name(link)] = {
+                "capacity_mbps": self.graph.bandwidth[link],
+                "throughput_mbps": max(self.throughput[link]) / 1e6,
+                "utilisation": self.utilisation[link],
+                "latency_ms": latency * 1000.0 if latency is not None else None,
+                "latency_samples": self.probes[link],
+            }
+        return stats
+
+    def summary(self):
+        measured = [l for l in self.latency if l is not None]
+        return {
+            "max_utilisation": max(self.utilisation, default=0.0),
+            "mean_latency_ms": sum(measured) / len(measured) * 1000.0 if measured else None,
+        }
@@ -0,0 +1,157 @@
+"""
+Stats polling scheduler for many datapaths
+
+Every (datapath, request kind) pair gets its own deadline on a heap. The
+first poll of each pair is placed at a random offset within one interval and
+every later one is jittered, so thousands of switches registered at the same
+moment do not all get polled together. Intervals adapt to load: a switch
+reporting congested links is polled close to ``min_interval`` and an idle one
+drifts out to ``max_interval``. A per-switch cap on outstanding requests,
+multipart reply tracking and request timeouts keep a slow switch from
+building up a backlog.
+
+The scheduler only decides *when* to poll. The caller sends the request,
+reports its xid through ``sent`` and feeds replies back through ``reply``.
+"""
+
+import heapq
+import random
+import time
+
+KINDS = ('flow', 'port')
+
+
+class PollScheduler:
+    def __init__(self, kinds=KINDS, base_interval=10.0, min_interval=1.0, max_interval=30.0,
+                 jitter=0.1, max_in_flight=2, timeout=5.0, max_per_tick=None,
+                 idle_utilisation=0.2, busy_utilisation=0.8, clock=time.monotonic, rng=None):
+        self.kinds = tuple(kinds)
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.max_per_tick = max_per_tick
+        self.idle_utilisation = idle_utilisation
+        self.busy_utilisation = busy_utilisation
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self._heap = []
+        self._seq = 0
+        # (dpid, kind) -> generation; heap entries from older generations are stale
+        self._generation = {}
+        self.intervals = {}
+        # dpid -> {xid: (kind, deadline)}
+        self.in_flight = {}
+        self.timeouts = 0
+
+    def register(self, dpid, now=None):
+        now = self.clock() if now is None else now
+        self.intervals.setdefault(dpid, self.base_interval)
+        self.in_flight.setdefault(dpid, {})
+        for kind in self.kinds:
+            self._schedule(dpid, kind, now + self.rng.uniform(0, self.intervals[dpid]))
+
+    def unregister(self, dpid):
+        self.intervals.pop(dpid, None)
+        self.in_flight.pop(dpid, None)
+        for kind in self.kinds:
+            # Bump rather than forget the generation: a re-registration must
+            # not start over at one and match entries still on the heap
+            key = (dpid, kind)
+            if key in self._generation:
+                self._generation[key] += 1
+
+    def _schedule(self, dpid, kind, when):
+        generation = self._generation.get((dpid, kind), 0) + 1
+        self._generation[(dpid, kind)] = generation
+        self._seq += 1
+        heapq.heappush(self._heap, (when, self._seq, dpid, kind, generation))
+
+    def _next_poll(self, dpid, kind, now):
+        interval = self.intervals[dpid]
+        self._schedule(dpid, kind, now + interval * self.rng.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def set_load(self, dpid, utilisation):
+        """Adapt the poll interval of ``dpid`` to its busiest link (0.0-1.0)"""
+        if dpid not in self.intervals:
+            return
+        span = self.busy_utilisation - self.idle_utilisation
+        busy = min(max((utilisation - self.idle_utilisation) / span, 0.0), 1.0)
+        interval = self.max_interval - busy * (self.max_interval - self.min_interval)
+        previous = self.intervals[dpid]
+        self.intervals[dpid] = interval
+        if interval < previous * 0.5:
+            # Congestion just started: don't wait out the old, long interval
+            now = self.clock()
+            for kind in self.kinds:
+                if not any(k == kind for k, _ in self.in_flight[dpid].values()):
+                    self._schedule(dpid, kind, now + self.rng.uniform(0, interval))
+
+    def due(self, now=None):
+        """Pop the ``(dpid, kind)`` polls to send now"""
+        now = self.clock() if now is None else now
+        ready, deferred = [], []
+        while self._heap and self._heap[0][0] <= now:
+            if self.max_per_tick is not None and len(ready) >= self.max_per_tick:
+                break
+            when, _, dpid, kind, generation = heapq.heappop(self._heap)
+            if self._generation.get((dpid, kind)) != generation:
+                continue
+            if len(self.in_flight[dpid]) >= self.max_in_flight:
+                deferred.append((dpid, kind))
+                continue
+            ready.append((dpid, kind))
+        for dpid, kind in deferred:
+            # Re-check shortly after the switch has had a chance to answer
+            self._schedule(dpid, kind, now + min(self.timeout, self.intervals[dpid]) / 2)
+        return ready
+
+    def skip(self, dpid, kind, now=None):
+        """Move a due poll that was not sent on to its next interval"""
+        now = self.clock() if now is None else now
+        self._next_poll(dpid, kind, now)
+
+    def sent(self, dpid, kind, xid, now=None):
+        now = self.clock() if now is None else now
+        self.in_flight.setdefault(dpid, {})[xid] = (kind, now + self.timeout)
+
+    def reply(self, dpid, xid, more=False, now=None):
+        """Record a reply part. Returns True once the request is complete."""
+        pending = self.in_flight.get(dpid)
+        if not pending or xid not in pending:
+            return False
+        now = self.clock() if now is None else now
+        kind, _ = pending[xid]
+        if more:
+            # Multipart reply in progress: the switch is alive, extend the deadline
+            pending[xid] = (kind, now + self.timeout)
+            return False
+        del pending[xid]
+        self._next_poll(dpid, kind, now)
+        return True
+
+    def expire(self, now=None):
+        """Drop requests past their deadline and reschedule them with backoff"""
+        now = self.clock() if now is None else now
+        expired = []
+        for dpid, pending in self.in_flight.items():
+            for xid, (kind, deadline) in list(pending.items()):
+                if deadline <= now:
+                    del pending[xid]
+                    expired.append((dpid, kind, xid))
+        for dpid, kind, _ in expired:
+            self.intervals[dpid] = min(self.intervals[dpid] * 2, self.max_interval)
+            self._next_poll(dpid, kind, now)
+        self.timeouts += len(expired)
+        return expired
+
+    def next_wakeup(self):
+        """Earliest time anything is due, or None"""
+        while self._heap:
+            when, _, dpid, kind, generation = self._heap[0]
+            if self._generation.get((dpid, kind)) == generation:
+                return when
+            heapq.heappop(self._heap)
+        return None
@@ -3,11 +3,13 @@
 Simple network metrics collector for the SDN WAN Optimization system
 """
 
-import time
-import json
+import asyncio
 import logging
+import os
 from prometheus_client import start_http_server, Counter, Gauge, Histogram
-import requests
+
+from monitoring.collectors.async_scraper import AsyncScraper, load_targets
+from monitoring.collectors.counter_tracker import CounterTracker
 
 # Set up logging to file (avoid printing metrics info to terminal)
 LOG_FILE = "metrics-collector.log"
@@ -24,52 +26,93 @@ root_logger.setLevel(logging.INFO)
 
 logger = logging.getLogger(__name__)
 
+# Scrape targets (controllers, switches); override with SCRAPE_TARGETS=/path/to/targets.json
+TARGETS_FILE = os.environ.get(
+    'SCRAPE_TARGETS',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'monitoring', 'scrape_targets.json'))
+
 # Prometheus metrics
-network_packets = Counter('network_packets_total', 'Total network packets processed')
-bandwidth_usage = Gauge('bandwidth_usage_percent', 'Current bandwidth usage percentage')
-link_latency = Histogram('link_latency_seconds', 'Link latency in seconds')
+network_packets = Counter('network_packets_total', 'Total network packets processed', ['target'])
+packet_rate = Gauge('network_packets_per_second', 'Packet rate reported by a target', ['target'])
+counter_resets = Counter('network_counter_resets_total', 'Counter resets seen on a target', ['target'])
+bandwidth_usage = Gauge('bandwidth_usage_percent', 'Current bandwidth usage percentage', ['link'])
+link_latency = Histogram('link_latency_seconds', 'Link latency in seconds', ['link'])
+scrape_up = Gauge('scrape_target_up', 'Whether the last scrape of a target succeeded', ['target'])
+scrape_duration = Gauge('scrape_duration_seconds', 'Duration of the last scrape of a target', ['target'])
 
 class NetworkMetricsCollector:
-    def __init__(self):
-        self.running = True
-        self.sdn_controller_url = "http://localhost:8080"
-        
+    def __init__(self, targets_file=TARGETS_FILE):
+        self.targets = load_targets(targets_file)
+        self.scraper = AsyncScraper(self.targets, self.handle)
+        self.counters = CounterTracker()
+        # Probe sample count last exported per link
+        self.latency_samples = {}
+        self.handlers = {
+            'metrics': self._handle_metrics,
+            'links': self._handle_links,
+        }
+
     def collect_metrics(self):
-        """Collect and expose network metrics"""
-        while self.running:
-            try:
-                # Simulate collecting metrics from SDN controller
-                response = requests.get(f"{self.sdn_controller_url}/metrics", timeout=5)
-                if response.status_code == 200:
-                    data = response.json()
-                    
-                    # Update Prometheus metrics
-                    network_packets.inc(data.get('packet_count', 0))
-                    bandwidth_usage.set(self._simulate_bandwidth_usage())
-                    link_latency.observe(self._simulate_latency())
-                    
-                    logger.info(f"Metrics updated: packets={data.get('packet_count', 0)}")
-                else:
-                    logger.warning(f"Failed to get metrics from SDN controller: {response.status_code}")
-                    
-            except requests.exceptions.RequestException as e:
-                logger.warning(f"Cannot connect to SDN controller: {e}")
-                # Continue running even if controller is not available
-                
-            except Exception as e:
-                logger.error(f"Error collecting metrics: {e}")
-                
-            time.sleep(30)  # Collect metrics every 30 seconds
-            
-    def _simulate_bandwidth_usage(self):
-        """Simulate bandwidth usage percentage"""
-        import random
-        return random.uniform(20, 80)  # Random bandwidth usage between 20-80%
-        
-    def _simulate_latency(self):
-        """Simulate link latency"""
-        import random
-        return random.uniform(0.001, 0.1)  # Random latency between 1ms and 100ms
+        """Scrape every configured target concurrently until interrupted"""
+        logger.info(f"Scraping {len(self.targets)} targets from {TARGETS_FILE}")
+        asyncio.run(self._run())
+
+    async def _run(self):
+        reporter = asyncio.create_task(self._report())
+        try:
+            await self.scraper.run()
+        finally:
+            reporter.cancel()
+
+    async def _report(self, interval=1.0):
+        while True:
+            await asyncio.sleep(interval)
+            for target in self.targets:
+                scrape_up.labels(target=target.name).set(1 if target.up else 0)
+                if target.last_duration is not None:
+                    scrape_duration.labels(target=target.name).set(target.last_duration)
+
+    def handle(self, target, payload):
+        handler = self.handlers.get(target.kind)
+        if handler is None:
+            logger.warning(f"No handler for target kind {target.kind!r} ({target.name})")
+            return
+        handler(target, payload)
+
+    def _count(self, target, name, metric, value, epoch=None):
+        """Add the increase of a cumulative counter since the last scrape"""
+        source = (target.name, name)
+        resets = self.counters.resets.get(source, 0)
+        delta, rate = self.counters.update(source, value, epoch=epoch)
+        if self.counters.resets.get(source, 0) != resets:
+            counter_resets.labels(target=target.name).inc()
+        metric.labels(target=target.name).inc(delta)
+        return rate
+
+    def _handle_metrics(self, target, data):
+        rate = self._count(target, 'packet_count', network_packets, data.get('packet_count', 0),
+                           data.get('packet_count_epoch'))
+        if rate is not None:
+            packet_rate.labels(target=target.name).set(rate)
+        logger.debug(f"Metrics updated from {target.name}: packets={data.get('packet_count', 0)}")
+
+    def _handle_links(self, target, data):
+        """Export the controller's measured per-link utilisation and latency.
+
+        The latency is the last probe sample, repeated on every scrape until
+        the next probe lands, so it is observed only when the link's sample
+        count moves.
+        """
+        for link, stats in data.items():
+            bandwidth_usage.labels(link=link).set(stats['utilisation'] * 100)
+            if stats.get('latency_ms') is None:
+                continue
+            samples = stats.get('latency_samples')
+            key = (target.name, link)
+            if samples is not None and self.latency_samples.get(key) == samples:
+                continue
+            self.latency_samples[key] = samples
+            link_latency.labels(link=link).observe(stats['latency_ms'] / 1000.0)
 
 def main():
     logger.info("Starting Network Metrics Collector")
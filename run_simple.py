@@ -4,11 +4,37 @@ Simple standalone version of the SDN WAN Optimization system
 This runs the monitoring and basic functionality without requiring complex Ryu setup
 """
 
+import argparse
+import gc
+import os
+import random
 import time
 import threading
 import logging
-from flask import Flask, jsonify, request
-import json
+from flask import Flask, Response, jsonify, request
+
+from controllers.counters import ShardedCounter
+from controllers.event_bus import EventBus
+from controllers.flow_query import FlowQuery
+from controllers.flow_store import FlowStore
+from controllers.flow_timeouts import IDLE, FlowTimeouts
+from controllers.flow_table import FlowTable
+from controllers.response_cache import ResponseCache
+from controllers.rule_compiler import RuleCompiler
+from controllers.path_engine import DEFAULT_TOPOLOGY_FILE, PathEngine, TopologyGraph
+from controllers.te_optimizer import TrafficEngineeringOptimizer
+from controllers.topology_compiler import DEFAULT_SWITCH_CONFIG_FILE, load_topology
+from controllers.topology_reload import ConfigWatcher, TopologyReloader
+from controllers.topology_store import LINK_ADD, LINK_DOWN, LINK_REMOVE, LINK_UP, TopologyStore
+from controllers.workload import Replayer, Trace, flash_crowd
+from monitoring.collectors.congestion_detector import START, StreamingDetector
+from monitoring.collectors.counter_tracker import CounterTracker
+from monitoring.collectors.link_metrics import LinkMeter
+
+try:
+    from waitress import serve as waitress_serve
+except ImportError:  # optional
+    waitress_serve = None
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -17,52 +43,318 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 
 class SimpleTrafficMonitor:
-    def __init__(self):
-        self.packet_count = 0
-        self.alert_threshold = 1000
+    def __init__(self, event_bus=None):
+        self.event_bus = event_bus
+        self._published = None
+        # Incremented from request and simulator threads; each gets its own shard
+        self.packets = ShardedCounter()
+        # Alert on packet rates that break from their recent behaviour rather
+        # than on a fixed cumulative count
+        self.detector = StreamingDetector(capacity=16, min_std=10.0)
+        self.counters = CounterTracker()
         self.running = True
+
+    @property
+    def packet_count(self):
+        return self.packets.total()
+
+    @packet_count.setter
+    def packet_count(self, value):
+        self.packets.set(value)
+
+    @property
+    def packet_count_epoch(self):
+        """Bumped whenever packet_count is overwritten rather than incremented,
+        so scrapers can tell a reset from growth"""
+        return self.packets.epoch
+
+    def count_packets(self, n=1):
+        self.packets.inc(n)
         
-    def start_monitoring(self):
+    def check(self, timestamp=None):
+        """Feed the current packet rate to the detector; returns its events"""
+        count, epoch = self.packet_count, self.packet_count_epoch
+        delta, rate = self.counters.update('packets', count, timestamp, epoch)
+        if self.event_bus is not None and (count, epoch) != self._published:
+            self._published = (count, epoch)
+            self.event_bus.publish('counters', {"packet_count": count, "packet_count_epoch": epoch,
+                                                "delta": delta, "rate": rate})
+        if rate is None:
+            return []
+        events = self.detector.observe(['packets'], [rate], timestamp)
+        for event in events:
+            if event.kind == START:
+                logger.warning(f"Traffic alert: packet rate {event.value:.0f}/s is {event.zscore:.1f} "
+                               f"standard deviations above its recent mean {event.mean:.0f}/s")
+            else:
+                logger.info(f"Traffic alert cleared: packet rate back to {event.value:.0f}/s")
+        return events
+
+    def start_monitoring(self, interval=1, log_every=10):
         """Start the monitoring thread"""
         def monitor():
+            ticks = 0
             while self.running:
-                time.sleep(10)
-                logger.info(f"Current packet count: {self.packet_count}")
-                if self.packet_count > self.alert_threshold:
-                    logger.warning("Traffic alert: Packet count exceeded threshold!")
+                time.sleep(interval)
+                self.check()
+                ticks += 1
+                if ticks % log_every == 0:
+                    logger.info(f"Current packet count: {self.packet_count}")
         
         thread = threading.Thread(target=monitor)
         thread.daemon = True
         thread.start()
         logger.info("Traffic monitoring started")
 
+def _rule_spec(record):
+    """RuleCompiler spec for a placed flow: the next hop at every switch on
+    its path, and local delivery at the last"""
+    hops = dict(zip(record.path, record.path[1:]))
+    hops[record.path[-1]] = 'local'
+    return record.src, record.dst, record.priority, hops
+
 class SimpleFlowManager:
-    def __init__(self):
-        self.flows = {}
+    def __init__(self, optimizer=None):
+        self.flows = FlowTable()
         self.running = True
         self._flow_idx = 1
+        self.optimizer = optimizer
+        self.placement = None
+        self._placement_lock = threading.Lock()
+        # One workload replay at a time, each with its own placement thread
+        self._replay_lock = threading.Lock()
+        self._replay = None
+        # default_flow from the switch config: priority and idle/hard timeouts
+        self.default_flow = {}
+        self.timeouts = FlowTimeouts()
+        # Ordered, so a stale add or update can't revive the timers of a removed flow
+        self.flows.subscribe(self._track_lifetime, ordered=True)
+        # Wildcard rules the switches would carry for the placed flows
+        self.rules = RuleCompiler()
+        # Ordered, so a stale update can't re-add rules after the flow's remove
+        self.flows.subscribe(self._compile_rules, ordered=True)
+
+    def set_default_flow(self, default_flow):
+        """Defaults for flows added from now on"""
+        self.default_flow = default_flow
+        self.timeouts.idle_timeout = default_flow.get('idle_timeout', 0)
+        self.timeouts.hard_timeout = default_flow.get('hard_timeout', 0)
         
     def add_flow(self, flow_id, flow_data):
-        self.flows[flow_id] = flow_data
+        if 'priority' not in flow_data and 'priority' in self.default_flow:
+            flow_data = dict(flow_data, priority=self.default_flow['priority'])
+        self.flows.add(flow_id, flow_data)
         logger.info(f"Added flow: {flow_id}")
         
+    def restore(self, store):
+        """Reload the flows persisted in ``store`` and log every later change to it"""
+        summary = store.restore(self.flows)
+        store.attach(self.flows)
+        numbers = [int(fid[4:]) for fid in self.flows.ids() if fid.startswith('flow') and fid[4:].isdigit()]
+        self._flow_idx = max(numbers, default=0) + 1
+        # Build the lookup indexes and timers off the startup path
+        threading.Thread(target=self._index_restored, name="FlowTableReindex", daemon=True).start()
+        return summary
+
+    def _index_restored(self):
+        self.flows.reindex()
+        snapshot = self.flows.snapshot()
+        for fid, record in snapshot.items():
+            # Hard timeouts count from created_at, so flows past theirs go at once
+            self._track_lifetime('add', fid, record)
+        self.rules.apply((fid, _rule_spec(record)) for fid, record in snapshot.items() if record.path)
+
+    def _track_lifetime(self, op, flow_id, record):
+        if op == 'remove':
+            self.timeouts.remove(flow_id)
+        elif op == 'add':
+            extra = record.extra or {}
+            self.timeouts.add(flow_id, idle_timeout=extra.get('idle_timeout'),
+                              hard_timeout=extra.get('hard_timeout'), started_at=record.created_at)
+        elif record.last_seen_packets is not None:
+            # Counter updates stand in for flow stats: a change is activity
+            self.timeouts.observe_packets(flow_id, record.last_seen_packets)
+
+    def _compile_rules(self, op, flow_id, record):
+        update = self.rules.apply([(flow_id, None if op == 'remove' or not record.path
+                                    else _rule_spec(record))])
+        if update.exact_flow_mods:
+            logger.debug(f"Rules for {flow_id}: {update.flow_mods} flow-mods instead of "
+                         f"{update.exact_flow_mods}, compression {update.compression_ratio:.1f}x")
+
+    def expire_flows(self, now=None):
+        """Remove every flow past its idle or hard timeout in one batch"""
+        expired = self.timeouts.expire(now)
+        if expired:
+            removed = self.flows.remove_many(fid for fid, _ in expired)
+            idle = sum(1 for _, reason in expired if reason == IDLE)
+            logger.info(f"Expired {removed} flows ({idle} idle, {len(expired) - idle} hard timeout)")
+        return expired
+
+    def start_expiry(self, interval=1.0):
+        def expire():
+            while self.running:
+                time.sleep(interval)
+                try:
+                    self.expire_flows()
+                except Exception:
+                    logger.exception("Flow expiry failed")
+
+        thread = threading.Thread(target=expire, name="FlowExpiry", daemon=True)
+        thread.start()
+
+    def replay_workload(self, trace, monitor, speed=1.0, prefix='wl', place_interval=6):
+        """Replay a workload trace into the flow table in the background,
+        placing the flows every ``place_interval`` seconds while it runs.
+
+        Returns the Replayer, or None while an earlier replay is still running.
+        """
+        with self._replay_lock:
+            if self.replaying:
+                return None
+            replayer = Replayer(trace, self.flows, monitor, prefix)
+            self._replay = self._start_replay(replayer, speed, place_interval)
+        return replayer
+
+    @property
+    def replaying(self):
+        """Whether a workload replay is still running"""
+        return self._replay is not None and self._replay.is_alive()
+
+    def _start_replay(self, replayer, speed, place_interval):
+        def replay():
+            report = replayer.run(speed)
+            logger.info(f"Workload replay of {report.flows} flows finished: {report.achieved_speed:.1f}x "
+                        f"real time, events applied {report.lag_p99 * 1000:.0f} ms late at p99 "
+                        f"({report.lag_max * 1000:.0f} ms at worst)")
+
+        def place():
+            while thread.is_alive():
+                time.sleep(place_interval)
+                try:
+                    self.place_flows()
+                except Exception:
+                    logger.exception("Flow placement failed")
+
+        thread = threading.Thread(target=replay, name="WorkloadReplay", daemon=True)
+        thread.start()
+        threading.Thread(target=place, name="WorkloadPlacement", daemon=True).start()
+        return thread
+
     def get_flows(self):
-        return self.flows
+        return self.flows.to_dict()
+
+    def query_flows(self, query):
+        """One page of a FlowQuery: ``(records, next_cursor)``"""
+        return query.run(self.flows)
 
     def remove_flow(self, flow_id):
-        if flow_id in self.flows:
-            del self.flows[flow_id]
+        if self.flows.remove(flow_id) is not None:
             logger.info(f"Removed flow: {flow_id}")
 
-    def simulate_flow_management(self, monitor: SimpleTrafficMonitor, interval=6):
+    def flows_on_link(self, a, b):
+        """Flows whose current path traverses the link between switches a and b"""
+        return self.flows.by_link(a, b)
+
+    def on_congestion(self, events):
+        """Re-optimise placement as soon as a link becomes congested"""
+        for event in events:
+            if event.kind == START:
+                logger.warning(f"Link {event.key} congested: utilisation {event.value:.0%} "
+                               f"(mean {event.mean:.0%}, {event.reason})")
+            else:
+                logger.info(f"Link {event.key} congestion cleared: utilisation {event.value:.0%}")
+        if any(event.kind == START for event in events):
+            self.place_flows()
+
+    def place_flows(self):
+        """Assign every flow a path that minimises the peak link utilisation"""
+        if self.optimizer is None:
+            return None
+        with self._placement_lock:
+            return self._place_flows()
+
+    def _place_flows(self):
+        graph = self.optimizer.path_engine.graph
+        ids, src, dst, demand = [], [], [], []
+        for fid, flow in self.flows.snapshot().items():
+            ingress, egress = graph.node_for_host(flow.src), graph.node_for_host(flow.dst)
+            if ingress is None or egress is None:
+                continue
+            ids.append(fid)
+            src.append(ingress)
+            dst.append(egress)
+            demand.append(flow.demand_mbps or 1.0)
+        result = self.optimizer.optimise(src, dst, demand)
+        assignments = {}
+        current = self.flows.snapshot()
+        for i, fid in enumerate(ids):
+            path = result.path_of(i)
+            assignments[fid] = path.nodes if path else None
+            flow = current.get(fid)
+            if flow is not None and flow.path != (tuple(assignments[fid]) if assignments[fid] else None):
+                self.flows.update(fid, path=assignments[fid])
+        self.placement = {
+            "computed_at": int(time.time()),
+            "elapsed_ms": round(result.elapsed * 1000, 3),
+            "iterations": result.iterations,
+            "max_utilisation": result.max_utilisation,
+            "links": {
+                graph.link_name(link): {
+                    "load_mbps": float(result.link_load[link]),
+                    "capacity_mbps": float(result.capacity[link]),
+                    "utilisation": float(result.utilisation[link]),
+                } for link in range(len(result.capacity))
+            },
+            "flows": assignments,
+        }
+        return self.placement
+
+    def on_topology_change(self, diff):
+        """Re-route only the flows a topology reload affects: those crossing a
+        removed or degraded link, and those whose hosts moved to another switch.
+        Returns the number of flows given a new path.
+        """
+        affected = {}
+        for a, b in diff.degraded_links():
+            for flow in self.flows_on_link(a, b):
+                affected[flow.flow_id] = flow
+        if diff.changed_nodes or diff.removed_nodes:
+            graph = self.optimizer.path_engine.graph
+            for fid, flow in self.flows.snapshot().items():
+                ends = (graph.node_for_host(flow.src), graph.node_for_host(flow.dst))
+                if flow.path and ends != (graph.index.get(flow.path[0]), graph.index.get(flow.path[-1])):
+                    affected[fid] = flow
+        return self.reroute(affected.values())
+
+    def reroute(self, flows):
+        """Move ``flows`` onto the current lowest-cost paths; other flows keep theirs"""
+        if self.optimizer is None:
+            return 0
+        engine = self.optimizer.path_engine
+        moved = 0
+        with self._placement_lock:
+            for flow in flows:
+                ingress, egress = engine.graph.node_for_host(flow.src), engine.graph.node_for_host(flow.dst)
+                path = None
+                if ingress is not None and egress is not None:
+                    path = engine.shortest_path(ingress, egress)
+                nodes = tuple(path.nodes) if path else None
+                if (flow.path != nodes and
+                        self.flows.update(flow.flow_id, path=list(nodes) if nodes else None) is not None):
+                    moved += 1
+        return moved
+
+    def simulate_flow_management(self, monitor: SimpleTrafficMonitor, interval=6, seed=0):
         """Background simulator that creates/removes flows based on packet load.
 
         - If packet_count is high, create flows (up to a cap).
         - If packet_count is low, remove some flows to simulate teardown.
         This demonstrates the flow manager reacting to traffic and produces
-        visible entries under `/flows` for demo purposes.
+        visible entries under `/flows` for demo purposes. Its choices are
+        drawn from ``seed``, so the same load gives the same flows.
         """
-        import random
+        rng = random.Random(seed)
 
         def manager():
             while self.running:
@@ -72,13 +364,14 @@ class SimpleFlowManager:
                 # If traffic is high, create new flows
                 if pkt > 200 and active < 20:
                     # create 1-3 new flows
-                    for _ in range(random.randint(1, 3)):
+                    for _ in range(rng.randint(1, 3)):
                         fid = f"flow{self._flow_idx}"
                         self._flow_idx += 1
                         flow_data = {
-                            "src": f"10.0.0.{random.randint(1,254)}",
-                            "dst": f"10.0.1.{random.randint(1,254)}",
-                            "priority": random.choice([100,200,300]),
+                            "src": f"10.0.0.{rng.randint(1,254)}",
+                            "dst": f"10.0.1.{rng.randint(1,254)}",
+                            "priority": rng.choice([100,200,300]),
+                            "demand_mbps": round(rng.uniform(1, 10), 2),
                             "created_at": int(time.time()),
                         }
                         self.add_flow(fid, flow_data)
@@ -86,21 +379,26 @@ class SimpleFlowManager:
                 # If traffic low, remove some flows
                 if pkt < 150 and active > 0:
                     # remove 1-2 random flows
-                    remove_n = min(active, random.randint(1, 2))
-                    keys = list(self.flows.keys())
-                    for fid in random.sample(keys, remove_n):
+                    remove_n = min(active, rng.randint(1, 2))
+                    keys = self.flows.ids()
+                    for fid in rng.sample(keys, min(remove_n, len(keys))):
                         self.remove_flow(fid)
 
                 # Occasionally update existing flows' metrics.
                 # Recompute the current keys before sampling so we don't try
                 # to sample more items than exist (which caused a ValueError
                 # and terminated the thread previously).
-                if random.random() < 0.3:
-                    keys = list(self.flows.keys())
+                if rng.random() < 0.3:
+                    keys = self.flows.ids()
                     if keys:
                         k = min(3, len(keys))
-                        for fid in random.sample(keys, k):
-                            self.flows[fid]["last_seen_packets"] = random.randint(0, 1000)
+                        for fid in rng.sample(keys, k):
+                            self.flows.update(fid, last_seen_packets=rng.randint(0, 1000))
+
+                try:
+                    self.place_flows()
+                except Exception:
+                    logger.exception("Flow placement failed")
 
                 time.sleep(interval)
 
@@ -110,22 +408,198 @@ class SimpleFlowManager:
         logger.info("Flow manager simulation started")
 
 class SimpleTopologyDiscovery:
-    def __init__(self):
-        # Load topology from config file
+    def __init__(self, event_bus=None):
+        self.event_bus = event_bus
+        # The topology and switch config are compiled to a memory-mapped
+        # binary file; the JSON view and the routing graph come from it
         try:
-            with open('network/topology/network_topology.json', 'r') as f:
-                self.topology = json.load(f)
+            self.compiled = load_topology()
+            self.topology = self.compiled.to_dict()
+            self.graph = self.compiled.graph()
         except FileNotFoundError:
+            self.compiled = None
             self.topology = {"switches": [], "links": []}
+            self.graph = TopologyGraph.from_dict(self.topology)
             logger.warning("No topology file found, using empty topology")
+        self.default_flow = self.compiled.meta.get('default_flow', {}) if self.compiled else {}
+        # Bumped whenever self.topology changes
+        self.version = 0
+        self.store = TopologyStore.from_graph(self.graph)
+        self.path_engine = PathEngine(self.graph)
+        # Applies edited topology files in place; there are no real switches
+        # to wait for, so new switches and ports count as connected
+        self.reloader = TopologyReloader(self.path_engine, self.store, assume_up=True)
+        # Measured utilisation feeds straight into path costs
+        self.link_meter = LinkMeter(self.graph, on_update=self.path_engine.set_utilisation)
+        # Headroom for links added by later reloads
+        self.link_detector = StreamingDetector(capacity=max(2 * self.graph.num_links, 64),
+                                               high=0.8, low=0.6, min_samples=5, min_std=0.02)
+        self.store.subscribe(self._apply_link_state)
+        self.running = True
+
+    def _apply_link_state(self, events):
+        """Keep path computation in step with links going down and up"""
+        for event in events:
+            if event.kind in (LINK_ADD, LINK_UP, LINK_DOWN, LINK_REMOVE):
+                dpid, port_no = event.data['link'][:2]
+                link = self.graph.ports.get((self.graph.dpids.get(dpid), port_no))
+                if link is not None:
+                    up = event.kind == LINK_UP or (event.kind == LINK_ADD and event.data['up'])
+                    self.path_engine.set_link_state(link, up)
+
+    def reload(self):
+        """Re-read the topology and switch config and apply what changed.
+
+        Returns the TopologyDiff, or None when the files cannot be loaded, in
+        which case the running topology is kept.
+        """
+        try:
+            compiled = load_topology()
+        except (OSError, KeyError, ValueError) as e:
+            logger.error(f"Topology reload failed, keeping the running topology: {e}")
+            return None
+        # The link meter is resized under the same lock its readers take, so
+        # nothing sees the new links before their utilisation slots exist
+        with self.path_engine.frozen():
+            diff = self.reloader.apply(compiled.graph())
+            self.link_meter.topology_changed()
+        for a, b in diff.removed_links:
+            self.link_detector.forget(f"{a}-{b}")
+            self.link_detector.forget(f"{b}-{a}")
+        self.compiled = compiled
+        self.default_flow = compiled.meta.get('default_flow', {})
+        topology = compiled.to_dict()
+        if topology != self.topology:
+            # Names and descriptions can change without a structural diff
+            self.topology = topology
+            self.version += 1
+        logger.info(f"Topology reloaded: {diff!r}")
+        if self.event_bus is not None and not diff.empty:
+            self.event_bus.publish('topology_reload', dict(diff.to_dict(), version=self.version))
+        return diff
+
+    def live_links(self):
+        """Link ids that are part of the current topology"""
+        return [link for link in range(self.graph.num_links) if link not in self.reloader.removed]
     
     def get_topology(self):
         return self.topology
 
+    def get_links(self):
+        with self.path_engine.frozen():
+            stats = self.link_meter.link_stats()
+            for link in self.reloader.removed:
+                stats.pop(self.graph.link_name(link), None)
+        return stats
+
+    def simulate_link_measurements(self, flow_manager, interval=2, seed=0):
+        """Drive the link meter the way port stats and probes would.
+
+        Each tick advances a tx byte counter per switch port by the load the
+        current flow placement puts on that link, then reports probe
+        timestamps whose delay grows with the link's queueing.
+        """
+        rng = random.Random(seed)
+        graph = self.graph
+        tx_bytes = {}
+
+        def tick(now, elapsed):
+            # Recomputed each tick: a reload may have changed the topology
+            node_dpid = {node: dpid for dpid, node in graph.dpids.items()}
+            link_ids = {graph.link_name(link): link for link in self.live_links()}
+            port_of = list(graph.port_of.items())
+            placement = flow_manager.placement or {}
+            loads = {link_ids[name]: info["load_mbps"]
+                     for name, info in placement.get("links", {}).items() if name in link_ids}
+            for (node, link), port_no in port_of:
+                dpid = node_dpid.get(node)
+                if dpid is None:
+                    continue
+                mbps = loads.get(link, 0.0) * rng.uniform(0.9, 1.1)
+                key = (dpid, port_no)
+                tx_bytes[key] = tx_bytes.get(key, 0) + int(mbps * 1e6 / 8 * elapsed)
+                self.link_meter.update_port(dpid, port_no, tx_bytes[key], now)
+            for (node, link), port_no in port_of:
+                u, _ = graph.link_ends[link]
+                if node != u or node not in node_dpid:
+                    continue
+                utilisation = min(self.link_meter.utilisation[link], 0.95)
+                delay = graph.latency[link] / 1000.0 * (1 + utilisation / (1 - utilisation))
+                self.link_meter.record_probe(node_dpid[node], port_no, now - delay, now)
+            self.link_detector.observe(list(link_ids), [self.link_meter.utilisation[link]
+                                                        for link in link_ids.values()], now)
+            return self.link_meter.link_stats()
+
+        def measure():
+            last = time.time()
+            while self.running:
+                time.sleep(interval)
+                now = time.time()
+                elapsed, last = now - last, now
+                try:
+                    with self.path_engine.frozen():
+                        links = tick(now, elapsed)
+                except Exception:
+                    logger.exception("Link measurement failed")
+                    continue
+                if self.event_bus is not None:
+                    self.event_bus.publish('links', {"summary": self.link_meter.summary(), "links": links})
+
+        thread = threading.Thread(target=measure, name="LinkMeasurementSim")
+        thread.daemon = True
+        thread.start()
+        logger.info("Link measurement simulation started")
+
+    def get_paths(self, src, dst, k=1, mode="shortest"):
+        """Compute paths between two switches using live link utilisation"""
+        if mode == "widest":
+            path = self.path_engine.widest_path(src, dst)
+            paths = [path] if path else []
+        else:
+            paths = self.path_engine.k_shortest_paths(src, dst, k)
+        return [{
+            "nodes": p.nodes,
+            "cost_ms": p.cost,
+            "bottleneck_mbps": p.width,
+        } for p in paths]
+
 # Initialize components
-traffic_monitor = SimpleTrafficMonitor()
-flow_manager = SimpleFlowManager()
-topology_discovery = SimpleTopologyDiscovery()
+event_bus = EventBus()
+traffic_monitor = SimpleTrafficMonitor(event_bus)
+topology_discovery = SimpleTopologyDiscovery(event_bus)
+flow_manager = SimpleFlowManager(TrafficEngineeringOptimizer(topology_discovery.path_engine))
+topology_discovery.link_detector.subscribe(flow_manager.on_congestion)
+
+# Push every change to /events subscribers as it happens
+def _publish_flow(op, flow_id, record):
+    event_bus.publish(f"flow_{op}", {"id": flow_id} if op == 'remove' else {"id": flow_id, "flow": record.to_dict()})
+
+def _publish_topology(events):
+    for event in events:
+        event_bus.publish('topology', dict(event.data, kind=event.kind, version=event.version))
+
+def _publish_congestion(events):
+    for event in events:
+        event_bus.publish('congestion', {"link": event.key, "state": event.kind, "reason": event.reason,
+                                         "utilisation": event.value})
+
+def reload_config(paths=()):
+    """Apply edits to the topology or switch config without a restart"""
+    diff = topology_discovery.reload()
+    if diff is None:
+        return None
+    flow_manager.set_default_flow(topology_discovery.default_flow)
+    if not diff.empty:
+        moved = flow_manager.on_topology_change(diff)
+        logger.info(f"{moved} flows re-routed after the topology change")
+    return diff
+
+flow_manager.set_default_flow(topology_discovery.default_flow)
+flow_manager.flows.subscribe(_publish_flow)
+topology_discovery.store.subscribe(_publish_topology)
+topology_discovery.link_detector.subscribe(_publish_congestion)
+# Serialised API responses, rebuilt only when the state behind them changes
+response_cache = ResponseCache()
 
 # Flask routes
 @app.route('/')
@@ -253,7 +727,7 @@ def home():
             <div class="card">
                 <h3><span class="status-indicator running"></span>Traffic Monitor</h3>
                 <p><strong>Packets Processed:</strong> <span id="packet-count">0</span></p>
-                <p><strong>Alert Threshold:</strong> 1,000</p>
+                <p><strong>Alerting:</strong> Adaptive (rate z-score)</p>
                 <p><strong>Status:</strong> Active</p>
             </div>
             
@@ -275,8 +749,8 @@ def home():
         <div class="metrics-grid">
             <div class="card">
                 <h3>📊 Live Metrics</h3>
-                <p><strong>Bandwidth Usage:</strong> <span id="bandwidth">Loading...</span>%</p>
-                <p><strong>Link Latency:</strong> <span id="latency">Loading...</span> ms</p>
+                <p><strong>Peak Link Utilisation:</strong> <span id="bandwidth">Loading...</span>%</p>
+                <p><strong>Mean Link Latency:</strong> <span id="latency">Loading...</span> ms</p>
                 <p><strong>Prometheus Metrics:</strong> <a href="/api/prometheus" target="_blank">View</a></p>
                 <button class="refresh-btn" onclick="refreshMetrics()">Refresh Data</button>
                 <label style="margin-left:10px;color:#fff;">Burst:</label>
@@ -310,7 +784,12 @@ def home():
             <div class="endpoint">GET <a href="/metrics">/metrics</a> - System metrics and stats</div>
             <div class="endpoint">GET <a href="/health">/health</a> - Health check</div>
             <div class="endpoint">GET <a href="/flows">/flows</a> - Current flow information</div>
+            <div class="endpoint">GET <a href="/flows?sort=traffic&limit=10&fields=src,dst,last_seen_packets">/flows?sort=traffic&amp;limit=10</a> - Filtered, paginated flow query</div>
+            <div class="endpoint">GET <a href="/flows/placement">/flows/placement</a> - Min-max utilisation flow placement</div>
             <div class="endpoint">GET <a href="/topology">/topology</a> - Network topology</div>
+            <div class="endpoint">GET <a href="/links">/links</a> - Measured link utilisation and latency</div>
+            <div class="endpoint">GET <a href="/events">/events</a> - Live change stream (Server-Sent Events)</div>
+            <div class="endpoint">GET <a href="/paths?src=switch1&dst=switch4&k=2">/paths</a> - Congestion-aware path computation</div>
         </div>
     </div>
     
@@ -327,28 +806,47 @@ def home():
         }
         
         function refreshMetrics() {
-            fetch('/metrics')
+            fetch('/metrics?slim=1')
                 .then(response => response.json())
                 .then(data => {
                     document.getElementById('packet-count').textContent = data.packet_count.toLocaleString();
                     document.getElementById('flow-count').textContent = data.flows;
-                    document.getElementById('switch-count').textContent = data.topology.topology.switches.length;
+                    document.getElementById('switch-count').textContent = data.switch_count;
+                    showLinks(data.links);
                 })
                 .catch(error => console.error('Error:', error));
-                
-            // Simulate bandwidth and latency data
-            document.getElementById('bandwidth').textContent = (Math.random() * 60 + 20).toFixed(1);
-            document.getElementById('latency').textContent = (Math.random() * 50 + 10).toFixed(1);
         }
         
+        function showLinks(summary) {
+            document.getElementById('bandwidth').textContent = (summary.max_utilisation * 100).toFixed(1);
+            document.getElementById('latency').textContent = summary.mean_latency_ms === null
+                ? 'n/a' : summary.mean_latency_ms.toFixed(1);
+        }
+
+        function adjustFlows(by) {
+            const el = document.getElementById('flow-count');
+            el.textContent = Math.max(0, (parseInt(el.textContent) || 0) + by);
+        }
+
         // Update uptime every second
         setInterval(updateUptime, 1000);
         
-        // Refresh metrics every 10 seconds
-        setInterval(refreshMetrics, 10000);
-        
-        // Initial load
+        // Initial load, then apply changes as the server pushes them
         refreshMetrics();
+        if (window.EventSource) {
+            const events = new EventSource('/events');
+            events.addEventListener('counters', e => {
+                document.getElementById('packet-count').textContent = JSON.parse(e.data).packet_count.toLocaleString();
+            });
+            events.addEventListener('flow_add', () => adjustFlows(1));
+            events.addEventListener('flow_remove', () => adjustFlows(-1));
+            events.addEventListener('links', e => showLinks(JSON.parse(e.data).summary));
+            events.addEventListener('topology', refreshMetrics);
+            // Missed events we can't replay: re-read the full state
+            events.addEventListener('resync', refreshMetrics);
+        } else {
+            setInterval(refreshMetrics, 10000);
+        }
 
         function simulateBurst() {
             const amountEl = document.getElementById('burst-amount');
@@ -376,21 +874,93 @@ def simple_dashboard():
     with open('simple_dashboard.html', 'r') as f:
         return f.read()
 
-@app.route('/metrics')
-def metrics():
-    return jsonify({
+def _metrics_payload(slim):
+    payload = {
         "packet_count": traffic_monitor.packet_count,
+        "packet_count_epoch": traffic_monitor.packet_count_epoch,
         "flows": len(flow_manager.flows),
-        "topology": topology_discovery.get_topology()
-    })
+        "topology_version": topology_discovery.version,
+        "switch_count": topology_discovery.graph.num_nodes,
+        "links": topology_discovery.link_meter.summary()
+    }
+    if not slim:
+        payload["topology"] = topology_discovery.get_topology()
+    return payload
+
+@app.route('/metrics')
+def metrics():
+    """System metrics; ?slim=1 leaves out the embedded topology"""
+    slim = bool(request.args.get('slim'))
+    key = (traffic_monitor.packet_count, traffic_monitor.packet_count_epoch, flow_manager.flows.version,
+           topology_discovery.version, topology_discovery.link_meter.version)
+    return response_cache.respond('metrics-slim' if slim else 'metrics', key,
+                                  lambda: _metrics_payload(slim), request)
 
 @app.route('/flows')
 def flows():
-    return jsonify(flow_manager.get_flows())
+    """Every flow, or with query arguments one filtered, projected page.
+
+    Filters: src/dst (CIDR), priority, min_age/max_age (seconds),
+    min_packets/max_packets. Also fields=a,b, sort=id|traffic, limit and the
+    cursor returned as next_cursor by the previous page.
+    """
+    if not request.args:
+        return response_cache.respond('flows', flow_manager.flows.version, flow_manager.get_flows, request)
+    try:
+        query = FlowQuery.from_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    page, next_cursor = flow_manager.query_flows(query)
+    return Response(query.iter_json(page, next_cursor), mimetype='application/json',
+                    headers={'Cache-Control': 'no-cache'})
+
+@app.route('/flows/placement')
+def flow_placement():
+    """Latest traffic-engineering placement; ?refresh=1 recomputes it now"""
+    if flow_manager.placement is None or request.args.get('refresh'):
+        flow_manager.place_flows()
+    return jsonify(flow_manager.placement)
+
+@app.route('/flows/rules')
+def flow_rules():
+    """Aggregated wildcard rules per switch, compression and flow-mods saved"""
+    return jsonify(flow_manager.rules.summary())
 
 @app.route('/topology')
 def topology():
-    return jsonify(topology_discovery.get_topology())
+    return response_cache.respond('topology', topology_discovery.version,
+                                  topology_discovery.get_topology, request)
+
+@app.route('/events')
+def events():
+    """Server-Sent Events stream of flow, counter, link and topology changes.
+
+    Reconnecting clients send Last-Event-ID (or ?last_event_id=) to resume.
+    Each stream holds a server thread: beyond --max-event-streams the answer
+    is 503, and a stream ends after a few minutes for the client to reconnect.
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    stream = event_bus.open_stream(last_event_id)
+    if stream is None:
+        return jsonify({"error": "too many open event streams"}), 503, {'Retry-After': '5'}
+    return Response(stream, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/links')
+def links():
+    return response_cache.respond('links', topology_discovery.link_meter.version,
+                                  topology_discovery.get_links, request)
+
+@app.route('/paths')
+def paths():
+    src, dst = request.args.get('src'), request.args.get('dst')
+    mode = request.args.get('mode', 'shortest')
+    try:
+        k = max(1, min(int(request.args.get('k', 1)), 16))
+        result = topology_discovery.get_paths(src, dst, k, mode)
+    except (KeyError, ValueError):
+        return jsonify({"error": "src and dst must be known switch ids"}), 400
+    return jsonify({"src": src, "dst": dst, "mode": mode, "paths": result})
 
 @app.route('/health')
 def health():
@@ -407,44 +977,120 @@ def prometheus_proxy():
         return "Prometheus metrics unavailable", 503
 
 
+# Seeds for successive bursts, drawn from --seed so a run's bursts repeat
+burst_seeds = random.Random(0)
+# Packets one burst may carry; its flows all go through the flow table
+MAX_BURST_PACKETS = 10 ** 6
+
 @app.route('/simulate_burst', methods=['GET', 'POST'])
 def simulate_burst():
-    """Trigger a simulated traffic burst.
+    """Replay a simulated flash crowd against the flow table and monitor.
 
     Query params:
-      - amount: integer, how many packets to add (default 2000)
+      - amount: integer, about how many packets the burst carries (default 2000, at most 1000000)
+      - duration: seconds the burst lasts (default 10)
+      - seed: integer, repeat an earlier burst (default: the next seed of this run)
 
-    Returns the new packet_count.
+    Returns the burst's seed, flows and packets, and the current packet_count.
+    Only one burst or workload replays at a time; 409 while one is running.
     """
-    try:
-        amount = int(request.args.get('amount', request.form.get('amount', 2000)))
-    except Exception:
-        amount = 2000
+    def param(name, default, kind):
+        try:
+            return kind(request.args.get(name, request.form.get(name, default)))
+        except (TypeError, ValueError):
+            return default
 
-    # Reset packet count then set to the burst amount so bursts don't accumulate
-    old = traffic_monitor.packet_count
-    traffic_monitor.packet_count = amount
-    logger.info(f"Simulated burst: reset {old} -> {amount}, new packet_count={traffic_monitor.packet_count}")
-    return jsonify({"packet_count": traffic_monitor.packet_count, "added": amount})
+    if flow_manager.replaying:
+        return jsonify({"error": "a burst or workload replay is already running"}), 409
+    amount = max(1, min(param('amount', 2000, int), MAX_BURST_PACKETS))
+    duration = max(0.1, min(param('duration', 10.0, float), 3600.0))
+    seed = param('seed', None, int)
+    if seed is None:
+        seed = burst_seeds.randrange(2 ** 32)
+    subnets = [network for network, _ in topology_discovery.graph.subnets]
+    trace = flash_crowd(subnets, amount, seed, duration)
+    if flow_manager.replay_workload(trace, traffic_monitor, prefix=f"burst{seed}-") is None:
+        return jsonify({"error": "a burst or workload replay is already running"}), 409
+    packets = int(trace.packets().sum())
+    logger.info(f"Simulated burst {seed}: {len(trace)} flows carrying {packets} packets over {duration:g} s")
+    return jsonify({"seed": seed, "flows": len(trace), "packets": packets, "duration": duration,
+                    "packet_count": traffic_monitor.packet_count, "added": packets})
 
-def main():
+DEFAULT_STATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'state')
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="SDN WAN Optimization System (Simple Mode)")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--server', choices=('auto', 'waitress', 'dev'), default='auto',
+                        help="WSGI server; auto uses waitress when it is installed")
+    parser.add_argument('--threads', type=int, default=32,
+                        help="request threads for waitress; each open /events stream holds one")
+    parser.add_argument('--max-event-streams', type=int,
+                        help="open /events streams allowed at once (default: half of --threads)")
+    parser.add_argument('--state-dir', default=DEFAULT_STATE_DIR,
+                        help="where flows are persisted across restarts; empty to keep them in memory only")
+    parser.add_argument('--reload-interval', type=float, default=1.0,
+                        help="seconds between checks of the topology and switch config for edits; 0 disables")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="seed of the simulators and bursts, so runs can be repeated")
+    parser.add_argument('--workload', help="replay this trace (python -m controllers.workload) "
+                                           "instead of running the flow simulator")
+    parser.add_argument('--replay-speed', type=float, default=1.0,
+                        help="times real time to replay --workload at; 0 replays as fast as possible")
+    args = parser.parse_args(argv)
+    if args.max_event_streams is None:
+        args.max_event_streams = max(1, args.threads // 2)
+    if args.server == 'auto':
+        args.server = 'waitress' if waitress_serve is not None else 'dev'
+    elif args.server == 'waitress' and waitress_serve is None:
+        parser.error("--server waitress needs the waitress package (pip install waitress)")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
     logger.info("Starting SDN WAN Optimization System (Simple Mode)")
+    event_bus.max_streams = args.max_event_streams
+    if args.state_dir:
+        summary = flow_manager.restore(FlowStore(args.state_dir))
+        logger.info(f"Persisting flows to {args.state_dir} ({summary['flows']} restored)")
+        # The restored records live as long as the process: keep the cyclic
+        # collector from rescanning them
+        gc.freeze()
     
+    if args.reload_interval > 0:
+        ConfigWatcher([DEFAULT_TOPOLOGY_FILE, DEFAULT_SWITCH_CONFIG_FILE], reload_config,
+                      args.reload_interval).start()
+
     # Start monitoring
     traffic_monitor.start_monitoring()
+    flow_manager.start_expiry()
 
-    # Start flow manager simulation so flows are created/removed based on load
-    try:
-        flow_manager.simulate_flow_management(traffic_monitor)
-    except Exception:
-        logger.exception("Failed to start flow manager simulation")
+    burst_seeds.seed(args.seed)
+    if args.workload:
+        trace = Trace.load(args.workload)
+        logger.info(f"Replaying {len(trace)} flows from {args.workload}")
+        flow_manager.replay_workload(trace, traffic_monitor, args.replay_speed or None)
+    else:
+        # Start flow manager simulation so flows are created/removed based on load
+        try:
+            flow_manager.simulate_flow_management(traffic_monitor, seed=args.seed)
+        except Exception:
+            logger.exception("Failed to start flow manager simulation")
+    topology_discovery.simulate_link_measurements(flow_manager, seed=args.seed)
     
-    # Start Flask app
-    logger.info("Starting web interface on http://localhost:8080")
-    # Run without the Flask reloader to avoid multiple processes and reloader-related
-    # issues when launching from background or in containers. Use a single process
-    # so monitoring and HTTP clients receive responses reliably.
-    app.run(host='0.0.0.0', port=8080, debug=False)
+    logger.info(f"Starting web interface on http://localhost:{args.port} ({args.server} server)")
+    # All state lives in this process and is shared by the request threads:
+    # the flow table, caches and event bus are thread-safe, so one process
+    # with a thread pool serves a single consistent view. Separate worker
+    # processes would each run their own simulator.
+    if args.server == 'waitress':
+        waitress_serve(app, host=args.host, port=args.port, threads=args.threads,
+                       channel_timeout=60, ident='sdn-wan')
+    else:
+        # Werkzeug development server, without the reloader so the simulator
+        # threads are only started once
+        app.run(host=args.host, port=args.port, debug=False, threaded=True)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -1,9 +1,14 @@
 #!/bin/bash
 
-# Start the Ryu controller for WAN optimization
+# Start the Ryu controller for WAN optimization.
+# The apps import shared modules as ``controllers.*``, so run from the project root.
+cd "$(dirname "${BASH_SOURCE[0]}")/.."
+export PYTHONPATH="$(pwd)${PYTHONPATH:+:$PYTHONPATH}"
+
 ryu-manager --verbose \
     --ofp-tcp-listen-port 6633 \
     --set-logger=debug \
-    sdn-wan-optimization/controllers/ryu/traffic_monitor.py \
-    sdn-wan-optimization/controllers/ryu/flow_manager.py \
-    sdn-wan-optimization/controllers/ryu/topology_discovery.py
\ No newline at end of file
+    controllers/ryu/traffic_monitor.py \
+    controllers/ryu/flow_manager.py \
+    controllers/ryu/forwarding.py \
+    controllers/ryu/topology_discovery.py
@@ -0,0 +1,297 @@
+"""
+Fake OpenFlow 1.3 datapath for exercising controller code without switches
+
+FakeDatapath mimics the parts of ``ryu.controller.controller.Datapath`` the
+controller apps use: ``id``, ``ofproto``, ``ofproto_parser`` and ``send_msg``.
+Every message is recorded, and flow-mods and group-mods are applied to an
+in-memory flow and group table so tests can check what the switch ends up
+carrying and whether an entry ever went missing while it was being changed.
+``forward`` looks a packet up the way the switch would, including
+fast-failover groups skipping buckets whose watched port is down.
+"""
+
+import socket
+import struct
+from collections import Counter
+
+
+class FakeOFProto:
+    OFP_VERSION = 0x04
+    OFPFC_ADD = 0
+    OFPFC_MODIFY = 1
+    OFPFC_MODIFY_STRICT = 2
+    OFPFC_DELETE = 3
+    OFPFC_DELETE_STRICT = 4
+    OFPFF_SEND_FLOW_REM = 1
+    OFPRR_IDLE_TIMEOUT = 0
+    OFPRR_HARD_TIMEOUT = 1
+    OFPIT_APPLY_ACTIONS = 4
+    OFPIT_METER = 6
+    OFPP_ANY = 0xffffffff
+    OFPP_NORMAL = 0xfffffffa
+    OFPP_CONTROLLER = 0xfffffffd
+    OFPG_ANY = 0xffffffff
+    OFPCML_NO_BUFFER = 0xffff
+    OFPGC_ADD = 0
+    OFPGC_MODIFY = 1
+    OFPGC_DELETE = 2
+    OFPGT_ALL = 0
+    OFPGT_SELECT = 1
+    OFPGT_INDIRECT = 2
+    OFPGT_FF = 3
+    OFP_NO_BUFFER = 0xffffffff
+    OFPMC_ADD = 0
+    OFPMC_MODIFY = 1
+    OFPMC_DELETE = 2
+    OFPMF_KBPS = 1
+    OFPMF_PKTPS = 2
+    OFPMF_BURST = 4
+    OFPMPF_REPLY_MORE = 1
+    OFPP_MAX = 0xffffff00
+    OFPPC_PORT_DOWN = 1
+    OFPPS_LINK_DOWN = 1
+    OFPPR_ADD = 0
+    OFPPR_DELETE = 1
+    OFPPR_MODIFY = 2
+
+
+class _Message:
+    def __init__(self, **kwargs):
+        self.xid = None
+        self.__dict__.update(kwargs)
+
+    def __repr__(self):
+        fields = ','.join(f"{k}={v!r}" for k, v in sorted(self.__dict__.items())
+                          if k not in ('datapath', 'xid'))
+        return f"{type(self).__name__}({fields})"
+
+
+class OFPMatch(dict):
+    def __init__(self, **fields):
+        super(OFPMatch, self).__init__(fields)
+
+
+class OFPActionOutput(_Message):
+    def __init__(self, port, max_len=0xffe5):
+        super(OFPActionOutput, self).__init__(port=port, max_len=max_len)
+
+
+class OFPActionGroup(_Message):
+    def __init__(self, group_id):
+        super(OFPActionGroup, self).__init__(group_id=group_id)
+
+
+class OFPBucket(_Message):
+    def __init__(self, weight=0, watch_port=0xffffffff, watch_group=0xffffffff, actions=None):
+        super(OFPBucket, self).__init__(weight=weight, watch_port=watch_port,
+                                        watch_group=watch_group, actions=actions or [])
+
+
+class OFPGroupMod(_Message):
+    def __init__(self, datapath, command=0, type_=0, group_id=0, buckets=None):
+        super(OFPGroupMod, self).__init__(datapath=datapath, command=command, type=type_,
+                                          group_id=group_id, buckets=buckets or [])
+
+
+class OFPInstructionActions(_Message):
+    def __init__(self, type_, actions):
+        super(OFPInstructionActions, self).__init__(type=type_, actions=actions)
+
+
+class OFPInstructionMeter(_Message):
+    def __init__(self, meter_id=1, type_=6):
+        super(OFPInstructionMeter, self).__init__(type=type_, meter_id=meter_id)
+
+
+class OFPMeterBandDrop(_Message):
+    def __init__(self, rate=0, burst_size=0):
+        super(OFPMeterBandDrop, self).__init__(rate=rate, burst_size=burst_size)
+
+
+class OFPMeterMod(_Message):
+    def __init__(self, datapath, command=0, flags=1, meter_id=1, bands=None):
+        super(OFPMeterMod, self).__init__(datapath=datapath, command=command, flags=flags,
+                                          meter_id=meter_id, bands=bands or [])
+
+
+class OFPPacketOut(_Message):
+    def __init__(self, datapath, buffer_id=None, in_port=None, actions=None, data=None):
+        super(OFPPacketOut, self).__init__(datapath=datapath, buffer_id=buffer_id, in_port=in_port,
+                                           actions=actions or [], data=data)
+
+
+class OFPFlowMod(_Message):
+    def __init__(self, datapath, cookie=0, table_id=0, command=0, idle_timeout=0,
+                 hard_timeout=0, priority=0x8000, out_port=0, out_group=0, flags=0,
+                 match=None, instructions=None):
+        super(OFPFlowMod, self).__init__(
+            datapath=datapath, cookie=cookie, table_id=table_id, command=command,
+            idle_timeout=idle_timeout, hard_timeout=hard_timeout, priority=priority,
+            out_port=out_port, out_group=out_group, flags=flags, match=match or OFPMatch(),
+            instructions=instructions or [])
+
+
+class OFPBarrierRequest(_Message):
+    def __init__(self, datapath):
+        super(OFPBarrierRequest, self).__init__(datapath=datapath)
+
+
+class OFPFlowStatsRequest(_Message):
+    def __init__(self, datapath, flags=0, table_id=0xff, out_port=0xffffffff,
+                 out_group=0xffffffff, cookie=0, cookie_mask=0, match=None):
+        super(OFPFlowStatsRequest, self).__init__(datapath=datapath, table_id=table_id,
+                                                  match=match or OFPMatch())
+
+
+class OFPPortStatsRequest(_Message):
+    def __init__(self, datapath, flags=0, port_no=0xffffffff):
+        super(OFPPortStatsRequest, self).__init__(datapath=datapath, port_no=port_no)
+
+
+class OFPPortDescStatsRequest(_Message):
+    def __init__(self, datapath, flags=0):
+        super(OFPPortDescStatsRequest, self).__init__(datapath=datapath)
+
+
+class OFPFlowStats(_Message):
+    def __init__(self, table_id, priority, match, instructions, cookie=0, idle_timeout=0,
+                 hard_timeout=0, packet_count=0, byte_count=0, duration_sec=0, flags=0):
+        super(OFPFlowStats, self).__init__(table_id=table_id, priority=priority, match=match,
+                                           instructions=instructions, cookie=cookie,
+                                           idle_timeout=idle_timeout, hard_timeout=hard_timeout,
+                                           packet_count=packet_count, byte_count=byte_count,
+                                           duration_sec=duration_sec, flags=flags)
+
+
+class FakeParser:
+    OFPMatch = OFPMatch
+    OFPActionOutput = OFPActionOutput
+    OFPActionGroup = OFPActionGroup
+    OFPBucket = OFPBucket
+    OFPGroupMod = OFPGroupMod
+    OFPInstructionActions = OFPInstructionActions
+    OFPInstructionMeter = OFPInstructionMeter
+    OFPMeterBandDrop = OFPMeterBandDrop
+    OFPMeterMod = OFPMeterMod
+    OFPPacketOut = OFPPacketOut
+    OFPFlowMod = OFPFlowMod
+    OFPBarrierRequest = OFPBarrierRequest
+    OFPFlowStatsRequest = OFPFlowStatsRequest
+    OFPPortStatsRequest = OFPPortStatsRequest
+    OFPPortDescStatsRequest = OFPPortDescStatsRequest
+
+
+def _field_matches(value, want):
+    """Match field ``want``, which may be a masked ``(address, mask)`` pair"""
+    if isinstance(want, tuple) and value is not None:
+        address, mask = (struct.unpack('!I', socket.inet_aton(v))[0] for v in want)
+        return struct.unpack('!I', socket.inet_aton(value))[0] & mask == address & mask
+    return value == want
+
+
+def _table_key(msg):
+    return msg.table_id, msg.priority, tuple(sorted(msg.match.items()))
+
+
+class FakeDatapath:
+    def __init__(self, dpid):
+        self.id = dpid
+        self.ofproto = FakeOFProto
+        self.ofproto_parser = FakeParser
+        self.sent = []
+        self.flow_table = {}
+        self.group_table = {}
+        self.meter_table = {}
+        self.ports_down = set()
+        self._lifetimes = {}
+        # Entries that were deleted and then installed again: traffic hitting
+        # them in between would have been black-holed
+        self.blackholed = set()
+        self._removed = set()
+        self._xid = 0
+
+    def send_msg(self, msg):
+        if msg.xid is None:
+            self._xid += 1
+            msg.xid = self._xid
+        self.sent.append(msg)
+        if isinstance(msg, OFPFlowMod):
+            self._apply(msg)
+        elif isinstance(msg, OFPGroupMod):
+            if msg.command == self.ofproto.OFPGC_DELETE:
+                self.group_table.pop(msg.group_id, None)
+            else:
+                self.group_table[msg.group_id] = (msg.type, msg.buckets)
+        elif isinstance(msg, OFPMeterMod):
+            if msg.command == self.ofproto.OFPMC_DELETE:
+                self.meter_table.pop(msg.meter_id, None)
+            else:
+                self.meter_table[msg.meter_id] = (msg.flags, msg.bands)
+
+    def _apply(self, msg):
+        ofp = self.ofproto
+        key = _table_key(msg)
+        if msg.command == ofp.OFPFC_ADD:
+            if key in self._removed:
+                self.blackholed.add(key)
+                self._removed.discard(key)
+            self.flow_table[key] = msg.instructions
+            self._lifetimes[key] = dict(cookie=msg.cookie, idle_timeout=msg.idle_timeout,
+                                        hard_timeout=msg.hard_timeout)
+        elif msg.command in (ofp.OFPFC_MODIFY, ofp.OFPFC_MODIFY_STRICT):
+            if key in self.flow_table:
+                self.flow_table[key] = msg.instructions
+        elif msg.command == ofp.OFPFC_DELETE_STRICT:
+            if self.flow_table.pop(key, None) is not None:
+                self._removed.add(key)
+        elif msg.command == ofp.OFPFC_DELETE:
+            for existing in [k for k in self.flow_table
+                             if k[0] == msg.table_id and set(msg.match.items()) <= set(k[2])]:
+                del self.flow_table[existing]
+                self._removed.add(existing)
+
+    def message_counts(self):
+        counts = Counter(type(m).__name__ for m in self.sent)
+        for msg in self.sent:
+            if isinstance(msg, OFPFlowMod):
+                counts[f"command_{msg.command}"] += 1
+        return counts
+
+    def flow_stats(self):
+        """OFPFlowStats bodies for every installed entry, as a flow stats reply carries"""
+        return [OFPFlowStats(key[0], key[1], OFPMatch(**dict(key[2])), instructions,
+                             **self._lifetimes.get(key, {}))
+                for key, instructions in self.flow_table.items()]
+
+    def forward(self, fields, table_id=0):
+        """Output port for a packet with header ``fields`` (including
+        ``in_port``), or None if it is dropped"""
+        best = None
+        for (table, priority, match), instructions in self.flow_table.items():
+            if table == table_id and (best is None or priority > best[0]) and \
+                    all(_field_matches(fields.get(k), v) for k, v in match):
+                best = (priority, instructions)
+        actions = [a for inst in best[1] for a in getattr(inst, 'actions', ())] if best else []
+        return self._output(actions)
+
+    def _output(self, actions):
+        for action in actions:
+            if isinstance(action, OFPActionOutput):
+                return action.port
+            if isinstance(action, OFPActionGroup) and action.group_id in self.group_table:
+                type_, buckets = self.group_table[action.group_id]
+                if type_ == self.ofproto.OFPGT_FF:
+                    # The first bucket whose watched port is live
+                    buckets = [b for b in buckets if b.watch_port not in self.ports_down][:1]
+                for bucket in buckets:
+                    return self._output(bucket.actions)
+        return None
+
+    def output_port(self, match, priority, table_id=0):
+        """Output port the installed entry sends matching packets to, or None"""
+        instructions = self.flow_table.get((table_id, priority, tuple(sorted(match.items()))))
+        for inst in instructions or ():
+            for action in getattr(inst, 'actions', ()):
+                if isinstance(action, OFPActionOutput):
+                    return action.port
+        return None
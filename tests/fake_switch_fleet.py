@@ -0,0 +1,547 @@
+#!/usr/bin/env python3
+"""
+Fleet of fake OpenFlow 1.3 switches that connect to a controller over TCP
+
+Every switch of a topology (``network_topology.json`` or a generated ring
+with random chords) is an asyncio protocol on one event loop, so thousands
+of them fit in one process. Each one dials the controller, says hello and
+answers what Ryu's handshake and the controller apps ask for:
+
+- features, config, role and echo requests, and barriers
+- port description (one port per configured link plus a host port), port
+  stats and flow stats multipart requests. Long replies are split with
+  OFPMPF_REPLY_MORE.
+- flow-mods, applied to an in-memory flow table with OpenFlow 1.3 add,
+  modify and delete semantics and recorded in ``flow_mods``. Group-mods
+  and meter-mods are kept in their own tables. Anything else gets an
+  OFPBRC_BAD_TYPE error back.
+
+There is no data plane. Counters are synthetic but consistent: every flow
+entry gets a packet rate and packet size when it is added, every port a
+share of its link's bandwidth, and stats report rate times age, so
+consecutive polls give steady rates. Entries never time out on their own.
+``send_packet_in`` and ``set_port_state`` (or ``SwitchFleet.set_link``) make
+a switch raise the matching asynchronous messages.
+
+Run against a controller from the project root, for example:
+python -m tests.fake_switch_fleet --switches 2000 --controller 127.0.0.1:6633
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import struct
+import time
+from collections import Counter, defaultdict, namedtuple
+
+from controllers.path_engine import DEFAULT_TOPOLOGY_FILE, TopologyGraph
+from tests.fake_datapath import FakeOFProto, OFPActionGroup
+from tests.ofp_wire import (DESC, FEATURES_REPLY, FLOW_MOD, FLOW_REMOVED, FLOW_STATS,
+                            FLOW_STATS_REQUEST, GROUP_MOD, MAX_MESSAGE, METER_MOD, MULTIPART,
+                            OFPBRC_BAD_MULTIPART, OFPBRC_BAD_TYPE, OFPET_BAD_REQUEST, OFPMP_DESC,
+                            OFPMP_FLOW, OFPMP_PORT_DESC, OFPMP_PORT_STATS, OFPT_BARRIER_REPLY,
+                            OFPT_BARRIER_REQUEST, OFPT_ECHO_REPLY, OFPT_ECHO_REQUEST, OFPT_ERROR,
+                            OFPT_FEATURES_REPLY, OFPT_FEATURES_REQUEST, OFPT_FLOW_MOD,
+                            OFPT_FLOW_REMOVED, OFPT_GET_CONFIG_REPLY, OFPT_GET_CONFIG_REQUEST,
+                            OFPT_GROUP_MOD, OFPT_HELLO, OFPT_METER_MOD, OFPT_MULTIPART_REPLY,
+                            OFPT_MULTIPART_REQUEST, OFPT_PACKET_IN, OFPT_PACKET_OUT,
+                            OFPT_PORT_STATUS, OFPT_ROLE_REPLY, OFPT_ROLE_REQUEST, OFPT_SET_CONFIG,
+                            PACKET_IN, PORT, PORT_STATS, decode_instructions, decode_match,
+                            encode_match, message, split_messages)
+
+logger = logging.getLogger(__name__)
+
+OFPP_ANY = FakeOFProto.OFPP_ANY
+OFPG_ANY = FakeOFProto.OFPG_ANY
+OFPG_ALL = 0xfffffffc
+OFPM_ALL = 0xffffffff
+OFPTT_ALL = 0xff
+OFPRR_DELETE = 2
+OFPPS_LIVE = 4
+# Flow, table, port and group stats
+CAPABILITIES = 0x0f
+
+FlowMod = namedtuple('FlowMod', ['time', 'xid', 'command', 'table_id', 'priority', 'match',
+                                 'instructions', 'idle_timeout', 'hard_timeout', 'cookie', 'flags'])
+
+
+class _Flow:
+    __slots__ = ('table_id', 'priority', 'match', 'match_bytes', 'instructions', 'cookie',
+                 'idle_timeout', 'hard_timeout', 'flags', 'added', 'rate', 'size')
+
+    def counters(self, now):
+        """``(duration, packets, bytes)`` at ``now``"""
+        duration = now - self.added
+        packets = int(self.rate * duration)
+        return duration, packets, packets * self.size
+
+    def targets(self):
+        """``(output ports, group ids)`` the entry's actions send packets to"""
+        ports, groups = set(), set()
+        for inst in decode_instructions(self.instructions):
+            for action in getattr(inst, 'actions', ()):
+                if isinstance(action, OFPActionGroup):
+                    groups.add(action.group_id)
+                else:
+                    ports.add(action.port)
+        return ports, groups
+
+
+class _Port:
+    __slots__ = ('port_no', 'up', 'speed', 'rate', 'tx_bytes', 'since')
+
+    def __init__(self, port_no, speed, rate, now):
+        self.port_no = port_no
+        self.up = True
+        # kbps, as ofp_port reports it, and the synthetic transmit rate in bytes/s
+        self.speed = speed
+        self.rate = rate
+        self.tx_bytes = 0.0
+        self.since = now
+
+    def transmitted(self, now):
+        return self.tx_bytes + (self.rate * (now - self.since) if self.up else 0.0)
+
+    def set_up(self, up, now):
+        self.tx_bytes = self.transmitted(now)
+        self.since = now
+        self.up = up
+
+
+class FakeSwitch(asyncio.Protocol):
+    def __init__(self, dpid, ports, rng, host_port=None, record=True, flow_rate=(10, 1000)):
+        self.dpid = dpid
+        now = time.monotonic()
+        # ``ports`` is {port_no: (speed in kbps, transmit rate in bytes/s)}
+        self.ports = {port_no: _Port(port_no, speed, rate, now)
+                      for port_no, (speed, rate) in sorted(ports.items())}
+        self.host_port = host_port
+        self.flow_table = {}
+        self.group_table = {}
+        self.meter_table = {}
+        self.record = record
+        self.flow_mods = []
+        self.received = Counter()
+        self.listeners = []
+        self.transport = None
+        self.connected_at = None
+        # Set once the features and port description requests are answered,
+        # which is when Ryu moves a switch to MAIN_DISPATCHER
+        self.ready_at = None
+        self._answered = set()
+        self._rng = rng
+        self._flow_rate = flow_rate
+        self._buffer = bytearray()
+        self._xid = 0
+
+    @property
+    def ready(self):
+        return self.ready_at is not None
+
+    # -- connection ---------------------------------------------------------
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.connected_at = time.monotonic()
+        self._send(OFPT_HELLO, self._next_xid())
+
+    def connection_lost(self, exc):
+        self.transport = None
+        self.ready_at = None
+        self._answered.clear()
+
+    def data_received(self, data):
+        self._buffer += data
+        for type_, xid, body in split_messages(self._buffer):
+            self.received[type_] += 1
+            handler = self._HANDLERS.get(type_)
+            if handler is None:
+                self._error(type_, xid, body, OFPBRC_BAD_TYPE)
+            else:
+                handler(self, xid, body)
+            for listener in self.listeners:
+                listener(self, type_, xid, body)
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+    def _next_xid(self):
+        self._xid = self._xid + 1 & 0xffffffff
+        return self._xid
+
+    def _send(self, type_, xid, body=b''):
+        if self.transport is not None:
+            self.transport.write(message(type_, xid, body))
+
+    def _error(self, type_, xid, body, code):
+        offending = message(type_, xid, body)[:64]
+        self._send(OFPT_ERROR, xid, struct.pack('!HH', OFPET_BAD_REQUEST, code) + offending)
+
+    def _answer(self, what):
+        self._answered.add(what)
+        if self.ready_at is None and self._answered >= {'features', 'port_desc'}:
+            self.ready_at = time.monotonic()
+
+    # -- asynchronous messages ----------------------------------------------
+
+    def send_packet_in(self, data, in_port=None, reason=0, table_id=0, cookie=0):
+        """Send ``data`` to the controller as a table-miss packet-in"""
+        in_port = self.host_port if in_port is None else in_port
+        body = PACKET_IN.pack(FakeOFProto.OFP_NO_BUFFER, len(data), reason, table_id, cookie)
+        self._send(OFPT_PACKET_IN, self._next_xid(),
+                   body + encode_match({'in_port': in_port}) + b'\0\0' + data)
+
+    def set_port_state(self, port_no, up):
+        """Bring a port up or down and report it with a port status message"""
+        port = self.ports[port_no]
+        if port.up == up:
+            return
+        port.set_up(up, time.monotonic())
+        self._send(OFPT_PORT_STATUS, self._next_xid(),
+                   struct.pack('!B7x', FakeOFProto.OFPPR_MODIFY) + self._port_desc(port))
+
+    # -- requests -----------------------------------------------------------
+
+    def _hello(self, xid, body):
+        pass
+
+    def _echo_request(self, xid, body):
+        self._send(OFPT_ECHO_REPLY, xid, body)
+
+    def _features_request(self, xid, body):
+        self._send(OFPT_FEATURES_REPLY, xid, FEATURES_REPLY.pack(self.dpid, 0, 254, 0, CAPABILITIES, 0))
+        self._answer('features')
+
+    def _get_config_request(self, xid, body):
+        self._send(OFPT_GET_CONFIG_REPLY, xid, struct.pack('!HH', 0, 0xffff))
+
+    def _role_request(self, xid, body):
+        self._send(OFPT_ROLE_REPLY, xid, body)
+
+    def _barrier_request(self, xid, body):
+        # Messages are applied in order as they arrive, so everything before
+        # the barrier is already done
+        self._send(OFPT_BARRIER_REPLY, xid)
+
+    def _ignore(self, xid, body):
+        pass
+
+    def _group_mod(self, xid, body):
+        command, _, group_id = GROUP_MOD.unpack_from(body)
+        if command == FakeOFProto.OFPGC_DELETE:
+            if group_id == OFPG_ALL:
+                self.group_table.clear()
+            self.group_table.pop(group_id, None)
+        else:
+            self.group_table[group_id] = body
+
+    def _meter_mod(self, xid, body):
+        command, _, meter_id = METER_MOD.unpack_from(body)
+        if command == FakeOFProto.OFPMC_DELETE:
+            if meter_id == OFPM_ALL:
+                self.meter_table.clear()
+            self.meter_table.pop(meter_id, None)
+        else:
+            self.meter_table[meter_id] = body
+
+    def _flow_mod(self, xid, body):
+        (cookie, _, table_id, command, idle_timeout, hard_timeout, priority, _, out_port,
+         out_group, flags) = FLOW_MOD.unpack_from(body)
+        match, offset = decode_match(body, FLOW_MOD.size)
+        instructions = body[offset:]
+        now = time.monotonic()
+        if self.record:
+            self.flow_mods.append(FlowMod(now, xid, command, table_id, priority, match, instructions,
+                                          idle_timeout, hard_timeout, cookie, flags))
+        ofp = FakeOFProto
+        key = (table_id, priority, tuple(sorted(match.items())))
+        if command == ofp.OFPFC_ADD:
+            flow = _Flow()
+            flow.table_id, flow.priority, flow.match = table_id, priority, match
+            flow.match_bytes = body[FLOW_MOD.size:offset]
+            flow.instructions, flow.cookie, flow.flags = instructions, cookie, flags
+            flow.idle_timeout, flow.hard_timeout = idle_timeout, hard_timeout
+            flow.added = now
+            flow.rate = self._rng.uniform(*self._flow_rate)
+            flow.size = self._rng.randint(64, 1500)
+            self.flow_table[key] = flow
+        elif command == ofp.OFPFC_MODIFY_STRICT:
+            if key in self.flow_table:
+                self.flow_table[key].instructions = instructions
+        elif command == ofp.OFPFC_MODIFY:
+            for flow in self._select(table_id, match, OFPP_ANY, OFPG_ANY):
+                flow.instructions = instructions
+        elif command == ofp.OFPFC_DELETE_STRICT:
+            flow = self.flow_table.get(key)
+            if flow is not None and self._selected(flow, table_id, flow.match, out_port, out_group):
+                self._remove(key, now)
+        elif command == ofp.OFPFC_DELETE:
+            for flow in self._select(table_id, match, out_port, out_group):
+                self._remove((flow.table_id, flow.priority, tuple(sorted(flow.match.items()))), now)
+
+    @staticmethod
+    def _selected(flow, table_id, match, out_port, out_group):
+        if table_id != OFPTT_ALL and flow.table_id != table_id:
+            return False
+        if any(flow.match.get(name) != value for name, value in match.items()):
+            return False
+        # Port and group 0 are not real ones; treat them as "any", as Open vSwitch does
+        any_port, any_group = out_port in (0, OFPP_ANY), out_group in (0, OFPG_ANY)
+        if any_port and any_group:
+            return True
+        ports, groups = flow.targets()
+        return (any_port or out_port in ports) and (any_group or out_group in groups)
+
+    def _select(self, table_id, match, out_port, out_group):
+        return [flow for flow in list(self.flow_table.values())
+                if self._selected(flow, table_id, match, out_port, out_group)]
+
+    def _remove(self, key, now):
+        flow = self.flow_table.pop(key)
+        if flow.flags & FakeOFProto.OFPFF_SEND_FLOW_REM:
+            duration, packets, byte_count = flow.counters(now)
+            self._send(OFPT_FLOW_REMOVED, self._next_xid(),
+                       FLOW_REMOVED.pack(flow.cookie, flow.priority, OFPRR_DELETE, flow.table_id,
+                                          int(duration), int(duration % 1 * 1e9), flow.idle_timeout,
+                                          flow.hard_timeout, packets, byte_count) + flow.match_bytes)
+
+    # -- multipart ----------------------------------------------------------
+
+    def _multipart_request(self, xid, body):
+        mp_type, _ = MULTIPART.unpack_from(body)
+        request = body[MULTIPART.size:]
+        if mp_type == OFPMP_DESC:
+            entries = [DESC.pack(b'SDN-WAN-optimization', b'fake OpenFlow 1.3 switch',
+                                  b'tests.fake_switch_fleet', str(self.dpid).encode(),
+                                  f"switch dpid {self.dpid}".encode())]
+        elif mp_type == OFPMP_PORT_DESC:
+            entries = [self._port_desc(port) for port in self.ports.values()]
+            self._answer('port_desc')
+        elif mp_type == OFPMP_PORT_STATS:
+            entries = self._port_stats(struct.unpack_from('!I', request)[0])
+        elif mp_type == OFPMP_FLOW:
+            entries = self._flow_stats(request)
+        else:
+            self._error(OFPT_MULTIPART_REQUEST, xid, body, OFPBRC_BAD_MULTIPART)
+            return
+        self._multipart_reply(mp_type, xid, entries)
+
+    def _multipart_reply(self, mp_type, xid, entries):
+        # Room for the OpenFlow and multipart headers in every part
+        limit = MAX_MESSAGE - 8 - MULTIPART.size
+        parts, part, size = [], [], 0
+        for entry in entries:
+            if part and size + len(entry) > limit:
+                parts.append(part)
+                part, size = [], 0
+            part.append(entry)
+            size += len(entry)
+        parts.append(part)
+        for i, part in enumerate(parts):
+            flags = FakeOFProto.OFPMPF_REPLY_MORE if i < len(parts) - 1 else 0
+            self._send(OFPT_MULTIPART_REPLY, xid, MULTIPART.pack(mp_type, flags) + b''.join(part))
+
+    def _port_desc(self, port):
+        hw_addr = struct.pack('!HI', self.dpid & 0xffff, port.port_no)
+        name = f"s{self.dpid}-eth{port.port_no}".encode()[:15]
+        state = OFPPS_LIVE if port.up else FakeOFProto.OFPPS_LINK_DOWN
+        return PORT.pack(port.port_no, hw_addr, name, 0, state, 0, 0, 0, 0,
+                          port.speed, port.speed)
+
+    def _port_stats(self, port_no):
+        now = time.monotonic()
+        entries = []
+        for port in self.ports.values():
+            if port_no not in (OFPP_ANY, port.port_no):
+                continue
+            tx_bytes = int(port.transmitted(now))
+            # Receive as much as is sent, in 800-byte packets on average
+            rx_bytes = tx_bytes
+            duration = now - (self.connected_at or now)
+            entries.append(PORT_STATS.pack(port.port_no, rx_bytes // 800, tx_bytes // 800, rx_bytes,
+                                            tx_bytes, 0, 0, 0, 0, 0, 0, 0, 0,
+                                            int(duration), int(duration % 1 * 1e9)))
+        return entries
+
+    def _flow_stats(self, request):
+        table_id, out_port, out_group, cookie, cookie_mask = FLOW_STATS_REQUEST.unpack_from(request)
+        match, _ = decode_match(request, FLOW_STATS_REQUEST.size)
+        now = time.monotonic()
+        entries = []
+        for flow in self._select(table_id, match, out_port, out_group):
+            if (flow.cookie ^ cookie) & cookie_mask:
+                continue
+            duration, packets, byte_count = flow.counters(now)
+            length = FLOW_STATS.size + len(flow.match_bytes) + len(flow.instructions)
+            entries.append(FLOW_STATS.pack(length, flow.table_id, int(duration),
+                                            int(duration % 1 * 1e9), flow.priority, flow.idle_timeout,
+                                            flow.hard_timeout, flow.flags, flow.cookie, packets,
+                                            byte_count) + flow.match_bytes + flow.instructions)
+        return entries
+
+    _HANDLERS = {
+        OFPT_HELLO: _hello,
+        OFPT_ERROR: _ignore,
+        OFPT_ECHO_REQUEST: _echo_request,
+        OFPT_ECHO_REPLY: _ignore,
+        OFPT_FEATURES_REQUEST: _features_request,
+        OFPT_GET_CONFIG_REQUEST: _get_config_request,
+        OFPT_SET_CONFIG: _ignore,
+        OFPT_PACKET_OUT: _ignore,
+        OFPT_FLOW_MOD: _flow_mod,
+        OFPT_GROUP_MOD: _group_mod,
+        OFPT_MULTIPART_REQUEST: _multipart_request,
+        OFPT_BARRIER_REQUEST: _barrier_request,
+        OFPT_ROLE_REQUEST: _role_request,
+        OFPT_METER_MOD: _meter_mod,
+    }
+
+
+def synthetic_graph(num_switches, degree=3, seed=0):
+    """A ring with random chords, cabled and addressed like network_topology.json:
+    dpid = index + 1, a /24 host subnet per switch and a port on both ends of
+    every link"""
+    rng = random.Random(seed)
+    edges = set()
+    for u in range(num_switches):
+        targets = [(u + 1) % num_switches] + [rng.randrange(num_switches) for _ in range(degree - 2)]
+        for v in targets:
+            if u != v:
+                edges.add((min(u, v), max(u, v)))
+    switches = [{"id": f"switch{u}", "dpid": u + 1, "subnet": f"10.{u >> 8 & 255}.{u & 255}.0/24",
+                 "links": []} for u in range(num_switches)]
+    for u, v in sorted(edges):
+        bandwidth, latency = f"{rng.choice([1, 10, 100])}Gbps", f"{rng.randint(1, 50)}ms"
+        for a, b in ((u, v), (v, u)):
+            links = switches[a]["links"]
+            links.append({"target": f"switch{b}", "port": len(links) + 1,
+                          "bandwidth": bandwidth, "latency": latency})
+    return TopologyGraph.from_dict({"topology": {"switches": switches}})
+
+
+class SwitchFleet:
+    """One FakeSwitch per dpid of ``graph``, cabled as the graph says"""
+
+    def __init__(self, graph, seed=0, record=True, utilisation=(0.05, 0.6), flow_rate=(10, 1000)):
+        self.graph = graph
+        rng = random.Random(seed)
+        ports = defaultdict(dict)
+        for (node, link), port_no in graph.port_of.items():
+            # bandwidth is in Mbps; ports report kbps and count bytes
+            bandwidth = graph.bandwidth[link]
+            ports[node][port_no] = (int(bandwidth * 1000), bandwidth * 1e6 / 8 * rng.uniform(*utilisation))
+        self.switches = {}
+        self._dpid_of = {}
+        for dpid, node in sorted(graph.dpids.items()):
+            node_ports = ports[node]
+            host_port = max(node_ports, default=0) + 1
+            node_ports[host_port] = (10_000_000, 0.0)
+            self.switches[dpid] = FakeSwitch(dpid, node_ports, rng, host_port, record, flow_rate)
+            self._dpid_of[node] = dpid
+
+    @classmethod
+    def from_file(cls, path=DEFAULT_TOPOLOGY_FILE, **kwargs):
+        return cls(TopologyGraph.from_file(path), **kwargs)
+
+    def __len__(self):
+        return len(self.switches)
+
+    def __getitem__(self, dpid):
+        return self.switches[dpid]
+
+    async def start(self, host='127.0.0.1', port=6633, concurrency=256):
+        """Connect every switch to the controller at ``host:port``"""
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def connect(switch):
+            async with semaphore:
+                await loop.create_connection(lambda: switch, host, port)
+        await asyncio.gather(*(connect(s) for s in self.switches.values()))
+
+    async def wait_ready(self, timeout=60.0):
+        """Wait for every switch to finish the handshake; returns how many did"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if all(s.ready for s in self.switches.values()):
+                break
+            await asyncio.sleep(0.01)
+        return sum(1 for s in self.switches.values() if s.ready)
+
+    def stop(self):
+        for switch in self.switches.values():
+            switch.close()
+
+    def set_link(self, link, up):
+        """Bring both ends of ``link`` (an id or endpoint pair) up or down"""
+        link = self.graph.link_id(link)
+        for node in self.graph.link_ends[link]:
+            dpid = self._dpid_of.get(node)
+            port_no = self.graph.port_of.get((node, link))
+            if dpid is not None and port_no is not None:
+                self.switches[dpid].set_port_state(port_no, up)
+
+    def summary(self):
+        received = Counter()
+        for switch in self.switches.values():
+            received.update(switch.received)
+        return {
+            'switches': len(self.switches),
+            'connected': sum(1 for s in self.switches.values() if s.transport is not None),
+            'ready': sum(1 for s in self.switches.values() if s.ready),
+            'flow_entries': sum(len(s.flow_table) for s in self.switches.values()),
+            'flow_mods': received[OFPT_FLOW_MOD],
+            'packet_outs': received[OFPT_PACKET_OUT],
+            'stats_requests': received[OFPT_MULTIPART_REQUEST],
+            'barriers': received[OFPT_BARRIER_REQUEST],
+        }
+
+
+def add_topology_arguments(parser):
+    parser.add_argument('--topology', default=DEFAULT_TOPOLOGY_FILE, help="topology JSON file")
+    parser.add_argument('--switches', type=int, help="generate a ring topology of this many switches")
+    parser.add_argument('--degree', type=int, default=3, help="links per generated switch")
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def graph_from_args(args):
+    if args.switches:
+        return synthetic_graph(args.switches, args.degree, args.seed)
+    return TopologyGraph.from_file(args.topology)
+
+
+async def run(fleet, host, port, interval, duration):
+    await fleet.start(host, port)
+    ready = await fleet.wait_ready()
+    logger.info(f"{ready}/{len(fleet)} switches connected to {host}:{port}")
+    started = time.monotonic()
+    try:
+        while not duration or time.monotonic() - started < duration:
+            await asyncio.sleep(interval)
+            logger.info(f"Fleet: {fleet.summary()}")
+    finally:
+        fleet.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Connect a fleet of fake OpenFlow 1.3 switches "
+                                                 "to a controller")
+    add_topology_arguments(parser)
+    parser.add_argument('--controller', default='127.0.0.1:6633', help="host:port to connect to")
+    parser.add_argument('--interval', type=float, default=10.0, help="seconds between summaries")
+    parser.add_argument('--duration', type=float, default=0, help="seconds to run; 0 runs forever")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    host, _, port = args.controller.rpartition(':')
+    # Flow-mods are applied but not kept: a long run would hold every one
+    fleet = SwitchFleet(graph_from_args(args), seed=args.seed, record=False)
+    try:
+        asyncio.run(run(fleet, host or '127.0.0.1', int(port), args.interval, args.duration))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
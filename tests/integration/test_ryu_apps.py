@@ -0,0 +1,95 @@
+import asyncio
+import importlib.util
+import os
+import socket
+import subprocess
+import sys
+import unittest
+
+from tests.fake_datapath import FakeOFProto
+from tests.fake_switch_fleet import SwitchFleet
+from tests.integration.test_traffic_routing import frame, until
+from tests.ofp_wire import OFPT_MULTIPART_REQUEST, OFPT_PACKET_OUT
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# The apps of scripts/start_ryu.sh that program and poll switches, plus the collector
+APPS = ['controllers/ryu/flow_manager.py', 'controllers/ryu/forwarding.py',
+        'controllers/ryu/topology_discovery.py', 'monitoring/collectors/flow_stats.py']
+PAIR = (('eth_type', 0x0800), ('ipv4_dst', '10.0.3.7'), ('ipv4_src', '10.0.0.1'))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def wait_listening(port, timeout=30.0):
+    for _ in range(int(timeout / 0.2)):
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise AssertionError(f"ryu-manager never listened on port {port}")
+
+
+@unittest.skipUnless(importlib.util.find_spec('ryu'), "ryu is not installed")
+class TestRyuApps(unittest.TestCase):
+    """The Ryu apps themselves, under ryu-manager, driving a fleet of switches over TCP"""
+
+    def setUp(self):
+        self.port = free_port()
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+        self.controller = subprocess.Popen(
+            [sys.executable, '-m', 'ryu.cmd.manager', '--ofp-tcp-listen-port', str(self.port)] + APPS,
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.addCleanup(self.controller.wait)
+        self.addCleanup(self.controller.terminate)
+
+    def run_network(self, body):
+        async def main():
+            await wait_listening(self.port)
+            fleet = SwitchFleet.from_file()
+            try:
+                await fleet.start(port=self.port)
+                self.assertEqual(await fleet.wait_ready(10), len(fleet))
+                # Every switch has its table-miss entry once Forwarding has seen it
+                await until(lambda: all(switch.flow_table for switch in fleet.switches.values()))
+                return await body(fleet)
+            finally:
+                fleet.stop()
+        return asyncio.run(main())
+
+    @staticmethod
+    def output_port(switch, priority, match):
+        flow = switch.flow_table.get((0, priority, match))
+        return None if flow is None else flow.targets()[0]
+
+    def test_reactive_path_setup_and_rerouting(self):
+        async def body(fleet):
+            fleet[1].send_packet_in(frame("10.0.0.1", "10.0.3.7"))
+            await until(lambda: fleet[1].received[OFPT_PACKET_OUT] == 1)
+            # Shortest path switch1 -> switch2 -> switch4, delivered locally at the end
+            await until(lambda: self.output_port(fleet[4], 11, PAIR) == {FakeOFProto.OFPP_NORMAL})
+            self.assertEqual(self.output_port(fleet[1], 11, PAIR), {1})
+            self.assertEqual(self.output_port(fleet[2], 11, PAIR), {2})
+            fleet.set_link(("switch1", "switch2"), False)
+            # TopologyDiscovery hears the port status and the rules move to switch1 -> switch3 -> switch4
+            await until(lambda: self.output_port(fleet[3], 11, PAIR) == {2})
+            await until(lambda: self.output_port(fleet[1], 11, PAIR) == {2})
+            await until(lambda: self.output_port(fleet[2], 11, PAIR) is None)
+        self.run_network(body)
+
+    def test_switches_are_polled_for_stats(self):
+        async def body(fleet):
+            asked = {dpid: switch.received[OFPT_MULTIPART_REQUEST] for dpid, switch in fleet.switches.items()}
+            # The collector's first polls are jittered over its base interval
+            await until(lambda: all(switch.received[OFPT_MULTIPART_REQUEST] > asked[dpid]
+                                    for dpid, switch in fleet.switches.items()), timeout=30.0)
+        self.run_network(body)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,37 +1,121 @@
+import asyncio
+import socket
+import struct
 import unittest
-from controllers.ryu.flow_manager import FlowManager
-from controllers.ryu.traffic_monitor import TrafficMonitor
+
+from controllers.path_engine import DEFAULT_TOPOLOGY_FILE, TopologyGraph
+from tests.fake_datapath import FakeOFProto
+from tests.fake_switch_fleet import SwitchFleet
+from tests.loopback_controller import ForwardingController
+from tests.ofp_wire import OFPT_PACKET_OUT
+
+SUBNET_RULE = (('eth_type', 0x0800), ('ipv4_dst', ('10.0.3.0', '255.255.255.0')))
+
+
+def frame(src, dst):
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20, 0, 0, 64, 17, 0,
+                     socket.inet_aton(src), socket.inet_aton(dst))
+    return b'\x00\x00\x00\x00\x00\x02\x00\x00\x00\x00\x00\x01\x08\x00' + ip
+
+
+async def until(predicate, timeout=10.0):
+    for _ in range(int(timeout / 0.01)):
+        if predicate():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition never held")
+
 
 class TestTrafficRouting(unittest.TestCase):
+    """The forwarding and stats modules driving a fleet of switches over TCP"""
 
-    def setUp(self):
-        self.flow_manager = FlowManager()
-        self.traffic_monitor = TrafficMonitor()
+    def run_network(self, body, mode):
+        async def main():
+            graph = TopologyGraph.from_file(DEFAULT_TOPOLOGY_FILE)
+            controller = ForwardingController(graph, mode=mode)
+            port = await controller.start()
+            fleet = SwitchFleet(graph)
+            try:
+                await fleet.start(port=port)
+                await fleet.wait_ready(10)
+                self.assertTrue(await controller.settle())
+                return await body(controller, fleet)
+            finally:
+                fleet.stop()
+                controller.stop()
+        return asyncio.run(main())
 
-    def test_dynamic_rerouting(self):
-        # Simulate traffic conditions
-        initial_flow = {'src': '10.0.0.1', 'dst': '10.0.0.2', 'bandwidth': 100}
-        self.flow_manager.add_flow(initial_flow)
+    @staticmethod
+    def output_port(switch, priority, match):
+        flow = switch.flow_table.get((0, priority, match))
+        return None if flow is None else flow.targets()[0]
 
-        # Simulate congestion
-        self.traffic_monitor.detect_congestion(initial_flow)
+    def test_reactive_path_setup(self):
+        async def body(controller, fleet):
+            ingress = fleet[1]
+            ingress.send_packet_in(frame("10.0.0.1", "10.0.3.7"))
+            await until(lambda: ingress.received[OFPT_PACKET_OUT] == 1)
+            self.assertTrue(await controller.settle())
+            pair = (('eth_type', 0x0800), ('ipv4_dst', '10.0.3.7'), ('ipv4_src', '10.0.0.1'))
+            # Shortest path switch1 -> switch2 -> switch4, delivered locally at the end
+            self.assertEqual(self.output_port(fleet[1], 11, pair), {1})
+            self.assertEqual(self.output_port(fleet[2], 11, pair), {2})
+            self.assertEqual(self.output_port(fleet[4], 11, pair), {FakeOFProto.OFPP_NORMAL})
+            self.assertIsNone(self.output_port(fleet[3], 11, pair))
+            # A duplicate while the rules are on their way only gets a packet-out
+            flow_mods = fleet.summary()['flow_mods']
+            ingress.send_packet_in(frame("10.0.0.1", "10.0.3.7"))
+            await until(lambda: ingress.received[OFPT_PACKET_OUT] == 2)
+            self.assertEqual(fleet.summary()['flow_mods'], flow_mods)
+        self.run_network(body, 'reactive')
+
+    def test_dynamic_rerouting(self):
+        async def body(controller, fleet):
+            switch1 = fleet[1]
+            self.assertEqual(self.output_port(switch1, 10, SUBNET_RULE), {1})
+            sent = len(switch1.flow_mods)
+            fleet.set_link(("switch1", "switch2"), False)
+            await until(lambda: self.output_port(switch1, 10, SUBNET_RULE) == {2})
+            self.assertTrue(await controller.settle())
+            # The entry was rewritten in place, never deleted
+            changes = [m for m in switch1.flow_mods[sent:] if tuple(sorted(m.match.items())) == SUBNET_RULE]
+            self.assertEqual([m.command for m in changes], [FakeOFProto.OFPFC_MODIFY_STRICT])
+            fleet.set_link(("switch1", "switch2"), True)
+            await until(lambda: self.output_port(switch1, 10, SUBNET_RULE) == {1})
 
-        # Reroute traffic
-        new_flow = {'src': '10.0.0.1', 'dst': '10.0.0.3', 'bandwidth': 100}
-        self.flow_manager.reroute_flow(initial_flow, new_flow)
+        async def reactive(controller, fleet):
+            pair = (('eth_type', 0x0800), ('ipv4_dst', '10.0.3.7'), ('ipv4_src', '10.0.0.1'))
+            fleet[1].send_packet_in(frame("10.0.0.1", "10.0.3.7"))
+            await until(lambda: self.output_port(fleet[2], 11, pair) == {2})
+            self.assertTrue(await controller.settle())
+            fleet.set_link(("switch1", "switch2"), False)
+            # The exact rules leave the dead link for switch1 -> switch3 -> switch4
+            await until(lambda: self.output_port(fleet[3], 11, pair) == {2})
+            self.assertTrue(await controller.settle())
+            self.assertEqual(self.output_port(fleet[1], 11, pair), {2})
+            self.assertEqual(self.output_port(fleet[4], 11, pair), {FakeOFProto.OFPP_NORMAL})
+            self.assertIsNone(self.output_port(fleet[2], 11, pair))
 
-        # Verify that the flow has been updated
-        self.assertIn(new_flow, self.flow_manager.get_flows())
-        self.assertNotIn(initial_flow, self.flow_manager.get_flows())
+        with self.subTest(mode='proactive'):
+            self.run_network(body, 'proactive')
+        with self.subTest(mode='reactive'):
+            self.run_network(reactive, 'reactive')
 
     def test_traffic_monitoring(self):
-        # Simulate traffic monitoring
-        flow = {'src': '10.0.0.1', 'dst': '10.0.0.2', 'bandwidth': 100}
-        self.flow_manager.add_flow(flow)
+        async def body(controller, fleet):
+            store, meter = controller.flow_stats, controller.link_meter
+            # Four subnet rules and a table-miss entry on each switch
+            controller.poll()
+            await until(lambda: (store.count >= 1).sum() == 20)
+            await asyncio.sleep(0.2)
+            controller.poll()
+            await until(lambda: (store.count >= 2).sum() == 20 and all(meter.utilisation))
+            flows = store.top_flows(100)
+            self.assertEqual(len(flows), 20)
+            self.assertTrue(all(byte_rate > 0 for _, _, _, byte_rate in flows))
+            self.assertTrue(all(0 < u < 1 for u in meter.utilisation), meter.utilisation)
+        self.run_network(body, 'proactive')
 
-        # Check if traffic is being monitored
-        metrics = self.traffic_monitor.collect_metrics()
-        self.assertIn(flow, metrics)
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+"""
+Minimal OpenFlow 1.3 controller that drives the controller modules over TCP
+
+LoopbackController accepts switch connections and runs Ryu's handshake
+(hello, features request, port description request). Each connection is a
+WireDatapath, which has the ``id``, ``ofproto``, ``ofproto_parser`` and
+``send_msg`` of a Ryu datapath. It is built on the message classes of
+``tests.fake_datapath`` and encodes whatever it is sent onto the wire. So
+FlowProgrammer, Forwarder and the rest run unchanged against real
+connections without Ryu. Messages from the switches are decoded into the
+same classes, or into namespaces with Ryu's attribute names. They reach the
+``on_*`` hooks, with multipart replies joined across OFPMPF_REPLY_MORE.
+
+ForwardingController fills in the hooks the way the Forwarding, FlowManager
+and FlowStatsCollector apps do:
+
+- a packet-in meter and table-miss entry on every switch that connects
+- proactive or reactive IPv4 forwarding, with packet-outs for packet-ins
+- link state from port status messages, restaging proactive rules
+- flow and port stats fed into FlowStatsStore and LinkMeter by ``poll``
+
+Run from the project root: python -m tests.loopback_controller --switches 2000
+"""
+
+import argparse
+import asyncio
+import logging
+import struct
+import time
+from types import SimpleNamespace
+
+from controllers.forwarding import INSTALLED, Forwarder, controller_meter, table_miss
+from controllers.path_engine import PathEngine
+from controllers.ryu.flow_programmer import FlowProgrammer
+from monitoring.collectors.flow_stats_store import FlowStatsStore
+from monitoring.collectors.link_metrics import LinkMeter
+from tests.fake_datapath import FakeOFProto, FakeParser, OFPFlowStats
+from tests.fake_switch_fleet import add_topology_arguments, graph_from_args
+from tests.ofp_wire import (BUCKET, DESC, FEATURES_REPLY, FLOW_MOD, FLOW_REMOVED, FLOW_STATS,
+                            FLOW_STATS_REQUEST, GROUP_MOD, METER_BAND_DROP, METER_MOD, MULTIPART,
+                            OFPMP_DESC, OFPMP_FLOW, OFPMP_PORT_DESC, OFPMP_PORT_STATS,
+                            OFPT_BARRIER_REPLY, OFPT_BARRIER_REQUEST, OFPT_ECHO_REPLY,
+                            OFPT_ECHO_REQUEST, OFPT_ERROR, OFPT_FEATURES_REPLY,
+                            OFPT_FEATURES_REQUEST, OFPT_FLOW_MOD, OFPT_FLOW_REMOVED, OFPT_GROUP_MOD,
+                            OFPT_HELLO, OFPT_METER_MOD, OFPT_MULTIPART_REPLY,
+                            OFPT_MULTIPART_REQUEST, OFPT_PACKET_IN, OFPT_PACKET_OUT,
+                            OFPT_PORT_STATUS, PACKET_IN, PACKET_OUT, PORT, PORT_STATS,
+                            decode_instructions, decode_match, encode_actions, encode_instructions,
+                            encode_match, message, split_messages)
+
+logger = logging.getLogger(__name__)
+
+PACKET_IN_RATE = 1000
+PACKET_IN_BURST = 200
+
+_PORT_STATS_FIELDS = ('port_no', 'rx_packets', 'tx_packets', 'rx_bytes', 'tx_bytes', 'rx_dropped',
+                      'tx_dropped', 'rx_errors', 'tx_errors', 'rx_frame_err', 'rx_over_err',
+                      'rx_crc_err', 'collisions', 'duration_sec', 'duration_nsec')
+
+
+# -- controller -> switch ----------------------------------------------------
+
+def _flow_mod(msg):
+    return OFPT_FLOW_MOD, FLOW_MOD.pack(
+        msg.cookie, 0, msg.table_id, msg.command, msg.idle_timeout, msg.hard_timeout, msg.priority,
+        FakeOFProto.OFP_NO_BUFFER, msg.out_port, msg.out_group, msg.flags) + \
+        encode_match(msg.match) + encode_instructions(msg.instructions)
+
+
+def _packet_out(msg):
+    actions = encode_actions(msg.actions)
+    return OFPT_PACKET_OUT, PACKET_OUT.pack(msg.buffer_id, msg.in_port, len(actions)) + \
+        actions + (msg.data or b'')
+
+
+def _group_mod(msg):
+    buckets = []
+    for bucket in msg.buckets:
+        actions = encode_actions(bucket.actions)
+        buckets.append(BUCKET.pack(BUCKET.size + len(actions), bucket.weight, bucket.watch_port,
+                                   bucket.watch_group) + actions)
+    return OFPT_GROUP_MOD, GROUP_MOD.pack(msg.command, msg.type, msg.group_id) + b''.join(buckets)
+
+
+def _meter_mod(msg):
+    bands = b''.join(METER_BAND_DROP.pack(1, METER_BAND_DROP.size, band.rate, band.burst_size)
+                     for band in msg.bands)
+    return OFPT_METER_MOD, METER_MOD.pack(msg.command, msg.flags, msg.meter_id) + bands
+
+
+def _flow_stats_request(msg):
+    return OFPT_MULTIPART_REQUEST, MULTIPART.pack(OFPMP_FLOW, 0) + FLOW_STATS_REQUEST.pack(
+        msg.table_id, FakeOFProto.OFPP_ANY, FakeOFProto.OFPG_ANY, 0, 0) + encode_match(msg.match)
+
+
+def _port_stats_request(msg):
+    return OFPT_MULTIPART_REQUEST, MULTIPART.pack(OFPMP_PORT_STATS, 0) + struct.pack('!I4x', msg.port_no)
+
+
+def _port_desc_request(msg):
+    return OFPT_MULTIPART_REQUEST, MULTIPART.pack(OFPMP_PORT_DESC, 0)
+
+
+_ENCODERS = {
+    FakeParser.OFPFlowMod: _flow_mod,
+    FakeParser.OFPPacketOut: _packet_out,
+    FakeParser.OFPGroupMod: _group_mod,
+    FakeParser.OFPMeterMod: _meter_mod,
+    FakeParser.OFPBarrierRequest: lambda msg: (OFPT_BARRIER_REQUEST, b''),
+    FakeParser.OFPFlowStatsRequest: _flow_stats_request,
+    FakeParser.OFPPortStatsRequest: _port_stats_request,
+    FakeParser.OFPPortDescStatsRequest: _port_desc_request,
+}
+
+
+def encode_message(msg):
+    type_, body = _ENCODERS[type(msg)](msg)
+    return message(type_, msg.xid, body)
+
+
+# -- switch -> controller ----------------------------------------------------
+
+def _port(data, offset=0):
+    (port_no, hw_addr, name, config, state, curr, advertised, supported, peer, curr_speed,
+     max_speed) = PORT.unpack_from(data, offset)
+    return SimpleNamespace(port_no=port_no, hw_addr=':'.join(f"{b:02x}" for b in hw_addr),
+                           name=name.rstrip(b'\0').decode(), config=config, state=state,
+                           curr_speed=curr_speed, max_speed=max_speed)
+
+
+def _flow_stats(data):
+    body, offset = [], 0
+    while offset < len(data):
+        (length, table_id, duration_sec, _, priority, idle_timeout, hard_timeout, flags, cookie,
+         packet_count, byte_count) = FLOW_STATS.unpack_from(data, offset)
+        match, instructions_at = decode_match(data, offset + FLOW_STATS.size)
+        body.append(OFPFlowStats(table_id, priority, match,
+                                 decode_instructions(data, instructions_at, offset + length),
+                                 cookie=cookie, idle_timeout=idle_timeout, hard_timeout=hard_timeout,
+                                 packet_count=packet_count, byte_count=byte_count,
+                                 duration_sec=duration_sec, flags=flags))
+        offset += length
+    return body
+
+
+def _port_stats(data):
+    return [SimpleNamespace(**dict(zip(_PORT_STATS_FIELDS, PORT_STATS.unpack_from(data, offset))))
+            for offset in range(0, len(data), PORT_STATS.size)]
+
+
+def _port_desc(data):
+    return [_port(data, offset) for offset in range(0, len(data), PORT.size)]
+
+
+def _desc(data):
+    fields = ('mfr_desc', 'hw_desc', 'sw_desc', 'serial_num', 'dp_desc')
+    return SimpleNamespace(**{name: value.rstrip(b'\0').decode()
+                              for name, value in zip(fields, DESC.unpack_from(data))})
+
+
+_MULTIPART_DECODERS = {OFPMP_FLOW: _flow_stats, OFPMP_PORT_STATS: _port_stats,
+                       OFPMP_PORT_DESC: _port_desc}
+
+
+class WireDatapath(asyncio.Protocol):
+    ofproto = FakeOFProto
+    ofproto_parser = FakeParser
+
+    def __init__(self, controller):
+        self.id = None
+        self.controller = controller
+        self.transport = None
+        self.ports = {}
+        self._buffer = bytearray()
+        self._xid = 0
+        # xid -> (multipart type, bodies so far) while OFPMPF_REPLY_MORE is set
+        self._multipart = {}
+
+    def send_msg(self, msg):
+        if msg.xid is None:
+            self._xid = self._xid + 1 & 0xffffffff
+            msg.xid = self._xid
+        if self.transport is not None:
+            self.transport.write(encode_message(msg))
+
+    def _send(self, type_, body=b''):
+        self._xid = self._xid + 1 & 0xffffffff
+        self.transport.write(message(type_, self._xid, body))
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self._send(OFPT_HELLO)
+        self._send(OFPT_FEATURES_REQUEST)
+
+    def connection_lost(self, exc):
+        self.transport = None
+        if self.id is not None and self.controller.datapaths.get(self.id) is self:
+            del self.controller.datapaths[self.id]
+            self.controller.on_switch_down(self)
+
+    def data_received(self, data):
+        self._buffer += data
+        for type_, xid, body in split_messages(self._buffer):
+            self.controller.events += 1
+            handler = self._HANDLERS.get(type_)
+            if handler is not None:
+                handler(self, xid, body)
+
+    def _echo_request(self, xid, body):
+        self.transport.write(message(OFPT_ECHO_REPLY, xid, body))
+
+    def _features_reply(self, xid, body):
+        self.id = FEATURES_REPLY.unpack_from(body)[0]
+        self.send_msg(FakeParser.OFPPortDescStatsRequest(self))
+
+    def _packet_in(self, xid, body):
+        buffer_id, total_len, reason, table_id, cookie = PACKET_IN.unpack_from(body)
+        match, offset = decode_match(body, PACKET_IN.size)
+        self.controller.on_packet_in(SimpleNamespace(
+            datapath=self, xid=xid, buffer_id=buffer_id, total_len=total_len, reason=reason,
+            table_id=table_id, cookie=cookie, match=match, data=body[offset + 2:]))
+
+    def _port_status(self, xid, body):
+        desc = _port(body, 8)
+        self.ports[desc.port_no] = desc
+        self.controller.on_port_status(SimpleNamespace(datapath=self, xid=xid, reason=body[0], desc=desc))
+
+    def _flow_removed(self, xid, body):
+        (cookie, priority, reason, table_id, duration_sec, _, idle_timeout, hard_timeout,
+         packet_count, byte_count) = FLOW_REMOVED.unpack_from(body)
+        match, _ = decode_match(body, FLOW_REMOVED.size)
+        self.controller.on_flow_removed(SimpleNamespace(
+            datapath=self, xid=xid, cookie=cookie, priority=priority, reason=reason, table_id=table_id,
+            duration_sec=duration_sec, idle_timeout=idle_timeout, hard_timeout=hard_timeout,
+            packet_count=packet_count, byte_count=byte_count, match=match))
+
+    def _barrier_reply(self, xid, body):
+        self.controller.on_barrier_reply(SimpleNamespace(datapath=self, xid=xid))
+
+    def _error(self, xid, body):
+        type_, code = struct.unpack_from('!HH', body)
+        self.controller.on_error(SimpleNamespace(datapath=self, xid=xid, type=type_, code=code,
+                                                 data=body[4:]))
+
+    def _multipart_reply(self, xid, body):
+        mp_type, flags = MULTIPART.unpack_from(body)
+        data = body[MULTIPART.size:]
+        if mp_type == OFPMP_DESC:
+            self.controller.on_desc(SimpleNamespace(datapath=self, xid=xid, body=_desc(data)))
+            return
+        decode = _MULTIPART_DECODERS.get(mp_type)
+        if decode is None:
+            return
+        _, parts = self._multipart.setdefault(xid, (mp_type, []))
+        parts.extend(decode(data))
+        if flags & FakeOFProto.OFPMPF_REPLY_MORE:
+            return
+        del self._multipart[xid]
+        msg = SimpleNamespace(datapath=self, xid=xid, type=mp_type, flags=flags, body=parts)
+        if mp_type == OFPMP_PORT_DESC:
+            self.ports = {port.port_no: port for port in parts}
+            if self.id not in self.controller.datapaths:
+                self.controller.datapaths[self.id] = self
+                self.controller.on_switch_ready(self)
+        elif mp_type == OFPMP_FLOW:
+            self.controller.on_flow_stats(msg)
+        else:
+            self.controller.on_port_stats(msg)
+
+    _HANDLERS = {
+        OFPT_ECHO_REQUEST: _echo_request,
+        OFPT_FEATURES_REPLY: _features_reply,
+        OFPT_PACKET_IN: _packet_in,
+        OFPT_PORT_STATUS: _port_status,
+        OFPT_FLOW_REMOVED: _flow_removed,
+        OFPT_BARRIER_REPLY: _barrier_reply,
+        OFPT_ERROR: _error,
+        OFPT_MULTIPART_REPLY: _multipart_reply,
+    }
+
+
+class LoopbackController:
+    def __init__(self):
+        # dpid -> WireDatapath, for switches that finished the handshake
+        self.datapaths = {}
+        # Messages received from all switches
+        self.events = 0
+        self._server = None
+
+    async def start(self, host='127.0.0.1', port=0):
+        """Listen for switches; returns the port listened on"""
+        loop = asyncio.get_running_loop()
+        self._server = await loop.create_server(lambda: WireDatapath(self), host, port, backlog=4096)
+        return self._server.sockets[0].getsockname()[1]
+
+    def stop(self):
+        if self._server is not None:
+            self._server.close()
+        for datapath in list(self.datapaths.values()):
+            if datapath.transport is not None:
+                datapath.transport.close()
+
+    # -- hooks ----------------------------------------------------------------
+
+    def on_switch_ready(self, datapath):
+        pass
+
+    def on_switch_down(self, datapath):
+        pass
+
+    def on_packet_in(self, msg):
+        pass
+
+    def on_port_status(self, msg):
+        pass
+
+    def on_flow_removed(self, msg):
+        pass
+
+    def on_barrier_reply(self, msg):
+        pass
+
+    def on_error(self, msg):
+        logger.warning(f"Switch {msg.datapath.id} rejected xid {msg.xid}: type={msg.type} code={msg.code}")
+
+    def on_desc(self, msg):
+        pass
+
+    def on_flow_stats(self, msg):
+        pass
+
+    def on_port_stats(self, msg):
+        pass
+
+
+class ForwardingController(LoopbackController):
+    def __init__(self, graph, mode='reactive', idle_timeout=30, packet_in_rate=PACKET_IN_RATE,
+                 packet_in_burst=PACKET_IN_BURST):
+        super(ForwardingController, self).__init__()
+        self.graph = graph
+        self.mode = mode
+        self.packet_in_rate = packet_in_rate
+        self.packet_in_burst = packet_in_burst
+        self.path_engine = PathEngine(graph)
+        self.programmer = FlowProgrammer()
+        self.forwarder = Forwarder(self.programmer, self.path_engine, FakeOFProto, FakeParser,
+                                   idle_timeout=idle_timeout)
+        self.flow_stats = FlowStatsStore()
+        self.link_meter = LinkMeter(graph)
+
+    def commit(self):
+        return self.programmer.commit(self.datapaths)
+
+    async def settle(self, timeout=10.0):
+        """Wait until every switch has answered the barrier of its last commit"""
+        deadline = time.monotonic() + timeout
+        while self.programmer.pending_barriers and time.monotonic() < deadline:
+            await asyncio.sleep(0.005)
+        return not self.programmer.pending_barriers
+
+    def poll(self):
+        """Ask every switch for flow and port stats"""
+        for datapath in self.datapaths.values():
+            datapath.send_msg(FakeParser.OFPFlowStatsRequest(datapath))
+            datapath.send_msg(FakeParser.OFPPortStatsRequest(datapath))
+
+    def on_switch_ready(self, datapath):
+        for msg in controller_meter(datapath, self.packet_in_rate, self.packet_in_burst):
+            datapath.send_msg(msg)
+        table_miss(self.programmer, datapath.id, FakeOFProto, FakeParser)
+        if self.mode == 'proactive':
+            self.forwarder.proactive()
+            self.commit()
+        else:
+            self.programmer.commit({datapath.id: datapath})
+
+    def on_switch_down(self, datapath):
+        self.programmer.forget(datapath.id)
+
+    def on_packet_in(self, msg):
+        datapath = msg.datapath
+        verdict, port = self.forwarder.packet_in(datapath.id, msg.data)
+        if verdict == INSTALLED:
+            self.commit()
+        if port is not None:
+            datapath.send_msg(FakeParser.OFPPacketOut(datapath, FakeOFProto.OFP_NO_BUFFER,
+                                                      msg.match['in_port'],
+                                                      [FakeParser.OFPActionOutput(port)], msg.data))
+
+    def on_port_status(self, msg):
+        graph, port = self.graph, msg.desc
+        link = graph.ports.get((graph.dpids.get(msg.datapath.id), port.port_no))
+        if link is None:
+            return
+        up = not (port.state & FakeOFProto.OFPPS_LINK_DOWN or port.config & FakeOFProto.OFPPC_PORT_DOWN)
+        if self.path_engine.link_up[link] == up:
+            return
+        self.path_engine.set_link_state(link, up)
+        if self.mode == 'proactive':
+            self.forwarder.proactive()
+            self.commit()
+        elif not up:
+            self.forwarder.reroute([link])
+            self.commit()
+
+    def on_barrier_reply(self, msg):
+        self.programmer.barrier_reply(msg.datapath.id, msg.xid)
+
+    def on_error(self, msg):
+        if self.programmer.error(msg.datapath.id, msg.xid):
+            super(ForwardingController, self).on_error(msg)
+
+    def on_flow_stats(self, msg):
+        self.flow_stats.ingest_reply(msg.datapath.id, msg.body)
+
+    def on_port_stats(self, msg):
+        self.link_meter.update_ports(msg.datapath.id, [(s.port_no, s.tx_bytes) for s in msg.body])
+
+
+async def run(controller, host, port, poll_interval, interval=10.0):
+    port = await controller.start(host, port)
+    logger.info(f"Listening on {host}:{port} ({controller.mode} forwarding)")
+    polled_at = logged_at = time.monotonic()
+    while True:
+        await asyncio.sleep(min(poll_interval or interval, interval))
+        now = time.monotonic()
+        if poll_interval and now - polled_at >= poll_interval:
+            polled_at = now
+            controller.poll()
+        if now - logged_at >= interval:
+            logged_at = now
+            logger.info(f"{len(controller.datapaths)} switches, {controller.events} messages, "
+                        f"packet-ins {controller.forwarder.stats}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Minimal OpenFlow 1.3 controller running the "
+                                                 "forwarding and stats modules")
+    add_topology_arguments(parser)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6633)
+    parser.add_argument('--mode', choices=('reactive', 'proactive'), default='reactive')
+    parser.add_argument('--poll-interval', type=float, default=0,
+                        help="seconds between flow and port stats polls; 0 disables polling")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    controller = ForwardingController(graph_from_args(args), mode=args.mode)
+    try:
+        asyncio.run(run(controller, args.host, args.port, args.poll_interval))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+"""
+OpenFlow 1.3 wire format shared by the fake switch fleet and the loopback
+controller
+
+Only what the two ends exchange is covered: the message header, OXM
+matches for the fields the controller apps use, and apply-actions/meter
+instructions with output and group actions. Matches decode to plain dicts
+in Ryu's value conventions (dotted IPv4 strings, colon separated MACs,
+``(value, mask)`` for masked fields), so decoded and staged entries compare
+equal. Actions and instructions decode to the classes in
+``tests.fake_datapath``, which FlowProgrammer already understands.
+"""
+
+import socket
+import struct
+
+from tests.fake_datapath import (FakeOFProto, OFPActionGroup, OFPActionOutput,
+                                 OFPInstructionActions, OFPInstructionMeter, OFPMatch)
+
+OFP_VERSION = 0x04
+
+OFPT_HELLO = 0
+OFPT_ERROR = 1
+OFPT_ECHO_REQUEST = 2
+OFPT_ECHO_REPLY = 3
+OFPT_FEATURES_REQUEST = 5
+OFPT_FEATURES_REPLY = 6
+OFPT_GET_CONFIG_REQUEST = 7
+OFPT_GET_CONFIG_REPLY = 8
+OFPT_SET_CONFIG = 9
+OFPT_PACKET_IN = 10
+OFPT_FLOW_REMOVED = 11
+OFPT_PORT_STATUS = 12
+OFPT_PACKET_OUT = 13
+OFPT_FLOW_MOD = 14
+OFPT_GROUP_MOD = 15
+OFPT_MULTIPART_REQUEST = 18
+OFPT_MULTIPART_REPLY = 19
+OFPT_BARRIER_REQUEST = 20
+OFPT_BARRIER_REPLY = 21
+OFPT_ROLE_REQUEST = 24
+OFPT_ROLE_REPLY = 25
+OFPT_METER_MOD = 29
+
+OFPMP_DESC = 0
+OFPMP_FLOW = 1
+OFPMP_PORT_STATS = 4
+OFPMP_PORT_DESC = 13
+
+OFPET_BAD_REQUEST = 1
+OFPBRC_BAD_TYPE = 1
+OFPBRC_BAD_MULTIPART = 2
+
+OFPIT_WRITE_ACTIONS = 3
+
+OFPAT_OUTPUT = 0
+OFPAT_GROUP = 22
+
+HEADER = struct.Struct('!BBHI')
+MULTIPART = struct.Struct('!HH4x')
+# Fixed parts of the message bodies; a match and instructions or data follow
+FEATURES_REPLY = struct.Struct('!QIBB2xII')
+FLOW_MOD = struct.Struct('!QQBBHHHIIIH2x')
+FLOW_REMOVED = struct.Struct('!QHBBIIHHQQ')
+PACKET_IN = struct.Struct('!IHBBQ')
+PACKET_OUT = struct.Struct('!IIH6x')
+GROUP_MOD = struct.Struct('!HBxI')
+BUCKET = struct.Struct('!HHII4x')
+METER_MOD = struct.Struct('!HHI')
+METER_BAND_DROP = struct.Struct('!HHII4x')
+FLOW_STATS_REQUEST = struct.Struct('!B3xII4xQQ')
+FLOW_STATS = struct.Struct('!HBxIIHHHH4xQQQ')
+PORT = struct.Struct('!I4x6s2x16sIIIIIIII')
+PORT_STATS = struct.Struct('!I4x12QII')
+DESC = struct.Struct('!256s256s256s32s256s')
+# Multipart messages carry a 16-bit length, so big replies are split
+MAX_MESSAGE = 0xffff
+
+_OXM_HEADER = struct.Struct('!HBB')
+_OXM_CLASS = 0x8000
+_ACTION_OUTPUT = struct.Struct('!HHIH6x')
+_ACTION_GROUP = struct.Struct('!HHI')
+_INSTRUCTION_ACTIONS = struct.Struct('!HH4x')
+_INSTRUCTION_METER = struct.Struct('!HHI')
+
+
+def message(type_, xid, body=b''):
+    return HEADER.pack(OFP_VERSION, type_, HEADER.size + len(body), xid) + body
+
+
+def split_messages(buffer):
+    """Complete ``(type, xid, body)`` messages at the front of ``buffer`` (a
+    bytearray), which keeps whatever partial message follows them"""
+    messages = []
+    offset = 0
+    end = len(buffer)
+    while end - offset >= HEADER.size:
+        _, type_, length, xid = HEADER.unpack_from(buffer, offset)
+        if length < HEADER.size:
+            raise ValueError(f"bad OpenFlow message length {length}")
+        if end - offset < length:
+            break
+        messages.append((type_, xid, bytes(buffer[offset + HEADER.size:offset + length])))
+        offset += length
+    del buffer[:offset]
+    return messages
+
+
+def _pad8(length):
+    return -length % 8
+
+
+def _mac_bytes(value):
+    return bytes.fromhex(value.replace(':', ''))
+
+
+def _mac_str(data):
+    return ':'.join(f"{b:02x}" for b in data)
+
+
+# kind -> (encode, decode, length)
+_CODECS = {
+    'B': (struct.Struct('!B').pack, lambda d: d[0], 1),
+    'H': (struct.Struct('!H').pack, lambda d: struct.unpack('!H', d)[0], 2),
+    'I': (struct.Struct('!I').pack, lambda d: struct.unpack('!I', d)[0], 4),
+    'Q': (struct.Struct('!Q').pack, lambda d: struct.unpack('!Q', d)[0], 8),
+    'mac': (_mac_bytes, _mac_str, 6),
+    'ipv4': (socket.inet_aton, socket.inet_ntoa, 4),
+}
+
+# name -> (OXM field number, value kind) for the OpenFlow basic class
+OXM_FIELDS = {
+    'in_port': (0, 'I'), 'in_phy_port': (1, 'I'), 'metadata': (2, 'Q'),
+    'eth_dst': (3, 'mac'), 'eth_src': (4, 'mac'), 'eth_type': (5, 'H'),
+    'vlan_vid': (6, 'H'), 'vlan_pcp': (7, 'B'), 'ip_dscp': (8, 'B'), 'ip_ecn': (9, 'B'),
+    'ip_proto': (10, 'B'), 'ipv4_src': (11, 'ipv4'), 'ipv4_dst': (12, 'ipv4'),
+    'tcp_src': (13, 'H'), 'tcp_dst': (14, 'H'), 'udp_src': (15, 'H'), 'udp_dst': (16, 'H'),
+}
+_OXM_BY_NUMBER = {number: (name, kind) for name, (number, kind) in OXM_FIELDS.items()}
+
+
+def encode_match(fields):
+    """An OXM ofp_match for ``fields``, padded to 8 bytes, in field order"""
+    oxms = []
+    for name, value in sorted(fields.items(), key=lambda item: OXM_FIELDS[item[0]][0]):
+        number, kind = OXM_FIELDS[name]
+        encode, _, length = _CODECS[kind]
+        if isinstance(value, tuple):
+            oxms.append(_OXM_HEADER.pack(_OXM_CLASS, number << 1 | 1, 2 * length) +
+                        encode(value[0]) + encode(value[1]))
+        else:
+            oxms.append(_OXM_HEADER.pack(_OXM_CLASS, number << 1, length) + encode(value))
+    body = b''.join(oxms)
+    length = 4 + len(body)
+    return struct.pack('!HH', 1, length) + body + b'\0' * _pad8(length)
+
+
+def decode_match(data, offset=0):
+    """``(OFPMatch, offset past the padding)`` for the ofp_match at ``offset``"""
+    _, length = struct.unpack_from('!HH', data, offset)
+    fields = OFPMatch()
+    pos, end = offset + 4, offset + length
+    while pos < end:
+        class_, field, size = _OXM_HEADER.unpack_from(data, pos)
+        pos += _OXM_HEADER.size
+        value = data[pos:pos + size]
+        pos += size
+        known = _OXM_BY_NUMBER.get(field >> 1) if class_ == _OXM_CLASS else None
+        if known is None:
+            continue
+        name, kind = known
+        decode = _CODECS[kind][1]
+        if field & 1:
+            half = size // 2
+            fields[name] = (decode(value[:half]), decode(value[half:]))
+        else:
+            fields[name] = decode(value)
+    return fields, end + _pad8(length)
+
+
+def encode_actions(actions):
+    out = []
+    for action in actions:
+        if isinstance(action, OFPActionOutput):
+            out.append(_ACTION_OUTPUT.pack(OFPAT_OUTPUT, _ACTION_OUTPUT.size, action.port, action.max_len))
+        elif isinstance(action, OFPActionGroup):
+            out.append(_ACTION_GROUP.pack(OFPAT_GROUP, _ACTION_GROUP.size, action.group_id))
+        else:
+            raise ValueError(f"cannot encode {action!r}")
+    return b''.join(out)
+
+
+def decode_actions(data, offset=0, end=None):
+    """Output and group actions in ``data[offset:end]``; others are skipped"""
+    end = len(data) if end is None else end
+    actions = []
+    while offset < end:
+        type_, length = struct.unpack_from('!HH', data, offset)
+        if type_ == OFPAT_OUTPUT:
+            _, _, port, max_len = _ACTION_OUTPUT.unpack_from(data, offset)
+            actions.append(OFPActionOutput(port, max_len))
+        elif type_ == OFPAT_GROUP:
+            actions.append(OFPActionGroup(_ACTION_GROUP.unpack_from(data, offset)[2]))
+        offset += max(length, 4)
+    return actions
+
+
+def encode_instructions(instructions):
+    out = []
+    for inst in instructions:
+        if isinstance(inst, OFPInstructionMeter):
+            out.append(_INSTRUCTION_METER.pack(FakeOFProto.OFPIT_METER, _INSTRUCTION_METER.size,
+                                               inst.meter_id))
+        else:
+            actions = encode_actions(inst.actions)
+            out.append(_INSTRUCTION_ACTIONS.pack(inst.type, _INSTRUCTION_ACTIONS.size + len(actions)) +
+                       actions)
+    return b''.join(out)
+
+
+def decode_instructions(data, offset=0, end=None):
+    end = len(data) if end is None else end
+    instructions = []
+    while offset < end:
+        type_, length = struct.unpack_from('!HH', data, offset)
+        if type_ == FakeOFProto.OFPIT_METER:
+            instructions.append(OFPInstructionMeter(_INSTRUCTION_METER.unpack_from(data, offset)[2], type_))
+        elif type_ in (OFPIT_WRITE_ACTIONS, FakeOFProto.OFPIT_APPLY_ACTIONS):
+            instructions.append(OFPInstructionActions(
+                type_, decode_actions(data, offset + _INSTRUCTION_ACTIONS.size, offset + length)))
+        offset += max(length, 4)
+    return instructions
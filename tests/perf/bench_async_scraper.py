@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Benchmark scraping many endpoints from one asyncio process
+
+Serves ``num_targets`` JSON endpoints from a local aiohttp server in a child
+process and scrapes each of them every ``interval`` seconds.
+
+Run from the project root: python -m tests.perf.bench_async_scraper
+"""
+
+import asyncio
+import multiprocessing
+import resource
+import time
+
+from aiohttp import web
+
+from monitoring.collectors.async_scraper import AsyncScraper, ScrapeTarget
+
+PORT = 18081
+
+
+def serve():
+    async def metrics(request):
+        return web.json_response({"packet_count": 1234, "target": request.match_info['n']})
+
+    app = web.Application()
+    app.router.add_get('/metrics/{n}', metrics)
+    web.run_app(app, host='127.0.0.1', port=PORT, access_log=None, print=None)
+
+
+async def scrape(num_targets, interval, duration):
+    targets = [ScrapeTarget(f"controller{i}", f"http://127.0.0.1:{PORT}/metrics/{i}",
+                            interval=interval, timeout=2.0) for i in range(num_targets)]
+    scraper = AsyncScraper(targets, lambda target, payload: None, max_connections=256)
+    stop = asyncio.Event()
+    asyncio.get_running_loop().call_later(duration, stop.set)
+    start = time.perf_counter()
+    cpu = time.process_time()
+    await scraper.run(stop)
+    elapsed = time.perf_counter() - start
+    summary = scraper.summary()
+    late = sum(1 for t in targets if t.last_duration and t.last_duration > interval)
+    print(f"{num_targets} targets every {interval}s for {elapsed:.1f}s: "
+          f"{summary['scrapes'] / elapsed:,.0f} scrapes/s, {summary['errors']} errors, "
+          f"{late} targets slower than their interval")
+    print(f"scraper CPU: {(time.process_time() - cpu) / elapsed * 100:.0f}% of one core, "
+          f"max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+
+
+def main(num_targets=1000, interval=1.0, duration=10.0):
+    server = multiprocessing.Process(target=serve, daemon=True)
+    server.start()
+    time.sleep(1.0)
+    try:
+        asyncio.run(scrape(num_targets, interval, duration))
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Benchmark the streaming detector over 100k series updated in batches
+
+Run from the project root: python -m tests.perf.bench_congestion_detector
+"""
+
+import time
+
+import numpy as np
+
+from monitoring.collectors.congestion_detector import StreamingDetector
+
+
+def main(num_series=100000, rounds=50):
+    detector = StreamingDetector(capacity=num_series)
+    keys = [("switch", i) for i in range(num_series)]
+    rng = np.random.default_rng(0)
+    base = rng.uniform(1e3, 1e6, num_series)
+    events = 0
+    start = time.perf_counter()
+    for r in range(rounds):
+        values = base * rng.normal(1.0, 0.05, num_series)
+        if r == rounds - 5:
+            values[:100] *= 10
+        events += len(detector.observe(keys, values, timestamp=float(r)))
+    elapsed = time.perf_counter() - start
+    samples = num_series * rounds
+    print(f"{samples:,} samples over {num_series:,} series in {elapsed:.2f}s: "
+          f"{samples / elapsed:,.0f} samples/s, {elapsed / rounds * 1000:.0f}ms per batch, {events} events")
+    nbytes = sum(a.nbytes for a in (detector.mean, detector.var, detector.quantile, detector.count,
+                                    detector.alarm, detector.last_seen))
+    print(f"state: {nbytes / num_series:.0f} bytes per series (fixed)")
+
+
+if __name__ == '__main__':
+    main()
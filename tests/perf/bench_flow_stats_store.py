@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Benchmark bulk flow-stats ingestion into the ring-buffer store
+
+Run from the project root: python -m tests.perf.bench_flow_stats_store
+"""
+
+import time
+
+import numpy as np
+
+from monitoring.collectors.flow_stats_store import FlowStatsStore
+
+
+def main(num_switches=50, flows_per_switch=10000, rounds=5):
+    store = FlowStatsStore(max_flows=num_switches * flows_per_switch, depth=8)
+    keys = [(0, 100, (("ipv4_dst", f"10.{i >> 8 & 255}.{i & 255}.1"),)) for i in range(flows_per_switch)]
+    rng = np.random.default_rng(0)
+    packets = np.zeros((num_switches, flows_per_switch))
+    total, elapsed = 0, 0.0
+    for r in range(rounds):
+        packets += rng.integers(0, 1000, packets.shape)
+        for dpid in range(num_switches):
+            start = time.perf_counter()
+            store.ingest(dpid, keys, packets[dpid], packets[dpid] * 1000, timestamp=float(r))
+            elapsed += time.perf_counter() - start
+            total += flows_per_switch
+    print(f"ingested {total} flow stats in {elapsed:.2f}s: {total / elapsed:,.0f} stats/s")
+    start = time.perf_counter()
+    store.top_flows(20)
+    store.switch_totals()
+    print(f"top-20 + per-switch totals over {len(store)} flows: {(time.perf_counter() - start) * 1000:.1f}ms")
+    nbytes = sum(a.nbytes for a in (store.packets, store.bytes, store.timestamps))
+    print(f"ring buffer memory: {nbytes / 2 ** 20:.0f} MiB (fixed)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Benchmark the indexed flow table at 1M flows
+
+Run from the project root: python -m tests.perf.bench_flow_table
+"""
+
+import random
+import time
+
+from controllers.flow_table import FlowTable
+
+PATHS = [["switch1", "switch2", "switch4"], ["switch1", "switch3", "switch4"],
+         ["switch2", "switch1", "switch3"], ["switch3", "switch4"]]
+
+
+def timed(label, fn, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{label:<45} {elapsed * 1000:10.3f} ms")
+    return result
+
+
+def main(num_flows=1000000):
+    rng = random.Random(0)
+    table = FlowTable()
+
+    def batch(start, size):
+        return [(f"flow{i}", {
+            "src": f"10.{i % 200}.{(i >> 8) % 256}.{i % 250 + 1}",
+            "dst": f"10.{200 + i % 50}.{rng.randrange(256)}.{rng.randrange(1, 255)}",
+            "priority": rng.choice([100, 200, 300]),
+            "created_at": 0,
+            "path": PATHS[i % len(PATHS)] if i % 1000 else ["switch9", "switch10"],
+        }) for i in range(start, start + size)]
+
+    elapsed, chunk = 0.0, 100000
+    for start in range(0, num_flows, chunk):
+        items = batch(start, chunk)
+        begin = time.perf_counter()
+        table.add_many(items)
+        elapsed += time.perf_counter() - begin
+    print(f"{f'insert {num_flows} flows (add_many)':<45} {elapsed * 1000:10.3f} ms")
+    timed("add one flow", lambda: table.add("extra", {"src": "10.0.0.1", "dst": "10.0.1.1"}), 10000)
+    matches = timed("by_link (1k matches)", lambda: table.by_link("switch9", "switch10"), 100)
+    print(f"  -> {len(matches)} flows")
+    matches = timed("by_dst_prefix /24", lambda: table.by_dst_prefix("10.201.7.0/24"), 100)
+    print(f"  -> {len(matches)} flows")
+    matches = timed("by_src_prefix /16", lambda: table.by_src_prefix("10.7.0.0/16"), 10)
+    print(f"  -> {len(matches)} flows")
+    timed("update one flow (reroute)", lambda: table.update("flow5", path=PATHS[3]), 10000)
+    timed("snapshot after a write", lambda: (table.update("flow5", last_seen_packets=1), table.snapshot()), 10)
+    timed("snapshot, unchanged table", table.snapshot, 1000)
+    timed("remove + re-add one flow",
+          lambda: table.add("flow6", table.remove("flow6")), 10000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Load test for the run_simple.py REST API
+
+Starts run_simple.py in a child process (or targets a running server given
+with --url), then drives each endpoint in turn with ``concurrency`` clients
+that send requests back to back for ``duration`` seconds. Reports requests/s
+and p50/p99 latency per endpoint.
+
+Run from the project root: python -m tests.perf.bench_http_load [--server dev]
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import aiohttp
+import numpy as np
+
+PORT = 18080
+ENDPOINTS = (
+    '/health',
+    '/metrics?slim=1',
+    '/flows',
+    '/flows?sort=traffic&limit=20&fields=src,dst,last_seen_packets',
+    '/topology',
+    '/links',
+    '/paths?src=switch1&dst=switch4&k=2',
+)
+
+
+async def wait_ready(session, url, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(url + '/health') as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not become ready")
+
+
+async def load(session, url, concurrency, duration):
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                async with session.get(url) as response:
+                    await response.read()
+                    ok = response.status == 200
+            except aiohttp.ClientError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return np.array(latencies), errors, time.perf_counter() - start
+
+
+async def run(url, endpoints, concurrency, duration):
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await wait_ready(session, url)
+        # Let the simulator create some flows and measurements first
+        await asyncio.sleep(3.0)
+        print(f"{'endpoint':<64} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for endpoint in endpoints:
+            latencies, errors, elapsed = await load(session, url + endpoint, concurrency, duration)
+            if len(latencies):
+                p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+            else:
+                p50 = p99 = float('nan')
+            print(f"{endpoint:<64} {len(latencies) / elapsed:>9,.0f} {p50:>8.2f} {p99:>8.2f} {errors:>7}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help="test a running server instead of starting one")
+    parser.add_argument('--server', default='auto', help="server for the child run_simple.py")
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds per endpoint")
+    parser.add_argument('--endpoint', action='append', help="endpoint path; repeatable")
+    args = parser.parse_args(argv)
+
+    child = None
+    url = args.url
+    if url is None:
+        url = f"http://127.0.0.1:{PORT}"
+        child = subprocess.Popen(
+            [sys.executable, 'run_simple.py', '--host', '127.0.0.1', '--port', str(PORT),
+             '--server', args.server, '--threads', str(args.threads)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=os.getcwd())
+    try:
+        asyncio.run(run(url.rstrip('/'), args.endpoint or ENDPOINTS, args.concurrency, args.duration))
+    finally:
+        if child is not None:
+            child.terminate()
+            child.wait()
+
+
+if __name__ == '__main__':
+    main()
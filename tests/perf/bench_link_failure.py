@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Benchmark link failures on a grid of fake switches carrying protected flows:
+how many affected flows the fast-failover groups deliver with no controller
+involvement, and what the background re-planning costs in time and
+flow-mods per failure
+
+Run from the project root: python -m tests.perf.bench_link_failure
+"""
+
+import random
+import time
+from collections import Counter
+
+from controllers.path_engine import PathEngine, TopologyGraph
+from controllers.protection import ProtectionManager
+from controllers.ryu.flow_programmer import FlowProgrammer
+from tests.fake_datapath import FakeDatapath, FakeOFProto, FakeParser
+
+
+def grid(size, seed=1):
+    """size x size grid with a port on both ends of every link; dpid = node + 1"""
+    rng = random.Random(seed)
+    graph = TopologyGraph()
+    next_port = Counter()
+    for r in range(size):
+        for c in range(size):
+            for a, b in (((r, c), (r, c + 1)), ((r, c), (r + 1, c))):
+                if b[0] >= size or b[1] >= size:
+                    continue
+                link = graph.add_link(f"s{a[0]}_{a[1]}", f"s{b[0]}_{b[1]}", 100, rng.uniform(1, 20))
+                for name in (f"s{a[0]}_{a[1]}", f"s{b[0]}_{b[1]}"):
+                    next_port[name] += 1
+                    graph.set_port(name, next_port[name], link)
+    for node in range(graph.num_nodes):
+        graph.dpids[node + 1] = node
+    return graph
+
+
+def trace(graph, datapaths, src, fields, limit=64):
+    """True if a packet from ``src`` reaches a switch that delivers it"""
+    node, in_port = src, None
+    for _ in range(limit):
+        dp = datapaths[node + 1]
+        out = dp.forward(dict(fields, in_port=in_port))
+        if out == FakeOFProto.OFPP_NORMAL:
+            return True
+        if out is None or out in dp.ports_down:
+            return False
+        link = graph.ports[(node, out)]
+        a, b = graph.link_ends[link]
+        node = b if a == node else a
+        in_port = graph.port_of[(node, link)]
+    return False
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<45} {elapsed * 1000:10.1f} ms")
+    return result, elapsed
+
+
+def main(size=8, num_flows=2000, failures=5, batch_size=500, seed=7):
+    rng = random.Random(seed)
+    graph = grid(size)
+    engine = PathEngine(graph)
+    programmer = FlowProgrammer()
+    datapaths = {dpid: FakeDatapath(dpid) for dpid in graph.dpids}
+    manager = ProtectionManager(programmer, engine, FakeOFProto, FakeParser)
+
+    flows = {}
+    for i in range(num_flows):
+        src, dst = rng.sample(range(graph.num_nodes), 2)
+        flows[i] = (src, dst, {"eth_type": 0x0800, "ipv4_dst": f"10.{i // 256}.{i % 256}.1"})
+
+    def protect():
+        for i, (src, dst, match) in flows.items():
+            manager.protect(i, match, 100, graph.names[src], graph.names[dst])
+
+    def install():
+        return sum(programmer.commit(datapaths).values())
+
+    timed(f"plan {num_flows} protected flows", protect)
+    sent, _ = timed(f"install {num_flows} protected flows", install)
+    unprotected = sum(f.plan.unprotected for f in manager.flows.values())
+    print(f"  -> {sent} flow/group-mods, {unprotected} primary hops without a backup")
+
+    links = [l for l in range(graph.num_links) if manager.flows_on_link(l)]
+    for failure, link in enumerate(rng.sample(links, failures), 1):
+        for dp in datapaths.values():
+            dp.sent.clear()
+        for node in graph.link_ends[link]:
+            datapaths[node + 1].ports_down.add(graph.port_of[(node, link)])
+        engine.set_link_state(link, False)
+        affected = manager.flows_on_link(link)
+        delivered = sum(trace(graph, datapaths, flows[f][0], flows[f][2]) for f in affected)
+        print(f"failure {failure}: {graph.link_name(link)}, {len(affected)} flows affected, "
+              f"{delivered} delivered by failover")
+
+        _, queue_time = timed("  queue affected flows", lambda: manager.link_down(link))
+        _, plan_time = timed("  re-plan", lambda: [manager.reoptimise(batch_size)
+                                                  for _ in range(-(-len(affected) // batch_size))])
+        _, commit_time = timed("  commit", install)
+        counts = Counter()
+        for dp in datapaths.values():
+            counts.update(dp.message_counts())
+        flow_mods = counts["OFPFlowMod"]
+        print(f"  -> {flow_mods} flow-mods, {counts['OFPGroupMod']} group-mods, "
+              f"{(queue_time + plan_time + commit_time) * 1000:.1f} ms to re-optimise")
+        delivered = sum(trace(graph, datapaths, flows[f][0], flows[f][2]) for f in affected)
+        print(f"  -> {delivered}/{len(affected)} delivered after re-planning")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Benchmark packet-in handling as new-flow load grows: a replay of flow
+arrivals at the ingress switches of the default topology through each
+forwarding set-up, timing the controller's share of the work
+
+A packet misses the switch table until its pair's rules land, rule_delay
+after the controller commits them. Misses go through the per-switch
+packet-in meter (a token bucket, when enabled) and reach the controller.
+
+Run from the project root: python -m tests.perf.bench_packet_in_replay
+"""
+
+import random
+import socket
+import struct
+import time
+from collections import Counter
+
+from controllers.forwarding import INSTALLED, Forwarder
+from controllers.path_engine import DEFAULT_TOPOLOGY_FILE, INF, PathEngine, TopologyGraph
+from controllers.ryu.flow_programmer import FlowProgrammer
+from tests.fake_datapath import FakeDatapath, FakeOFProto, FakeParser
+
+
+def frame(src, dst):
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20, 0, 0, 64, 17, 0,
+                     socket.inet_aton(src), socket.inet_aton(dst))
+    return b'\x00\x00\x00\x00\x00\x02\x00\x00\x00\x00\x00\x01\x08\x00' + ip
+
+
+class Meter:
+    """Packet-per-second token bucket, as the switch's OFPMF_PKTPS meter"""
+
+    def __init__(self, rate, burst):
+        self.rate, self.burst = rate, burst
+        self.tokens, self.last = burst, 0.0
+
+    def allow(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+def workload(graph, flows_per_second, packets_per_flow, seed, unknown=0.05, spacing=0.002):
+    """``(time, dpid, pair, frame)`` for one second of new flows, time ordered"""
+    rng = random.Random(seed)
+    node_dpid = {node: dpid for dpid, node in graph.dpids.items()}
+    subnets = graph.subnets
+    packets = []
+    for _ in range(flows_per_second):
+        (src_net, src_node), (dst_net, _) = rng.sample(subnets, 2)
+        src = str(src_net.network_address + rng.randint(1, 254))
+        dst = (f"192.0.2.{rng.randint(1, 254)}" if rng.random() < unknown
+               else str(dst_net.network_address + rng.randint(1, 254)))
+        data, start = frame(src, dst), rng.random()
+        for k in range(packets_per_flow):
+            packets.append((start + k * spacing, node_dpid[src_node], (src, dst), data))
+    packets.sort(key=lambda p: p[0])
+    return packets
+
+
+def replay(graph, packets, mode, suppress, meter, rule_delay=0.01):
+    engine = PathEngine(graph)
+    programmer = FlowProgrammer()
+    datapaths = {dpid: FakeDatapath(dpid) for dpid in graph.dpids}
+    forwarder = Forwarder(programmer, engine, FakeOFProto, FakeParser,
+                          setup_hold=1.0 if suppress else 0.0)
+    meters = {dpid: Meter(*meter) for dpid in datapaths} if meter else None
+    # Pairs whose rules are on the ingress switch from this time on
+    active = {}
+    if mode == 'proactive':
+        forwarder.proactive()
+        programmer.commit(datapaths)
+    counts = Counter()
+    cpu = 0.0
+    for now, dpid, pair, data in packets:
+        if active.get(pair, INF) <= now:
+            continue
+        if mode == 'proactive' and graph.node_for_host(pair[1]) is not None:
+            # Covered by the destination subnet rules
+            continue
+        if meters is not None and not meters[dpid].allow(now):
+            counts['metered'] += 1
+            continue
+        counts['packet_in'] += 1
+        start = time.perf_counter()
+        verdict, port = forwarder.packet_in(dpid, data, now=now)
+        if verdict == INSTALLED:
+            counts['flow_mods'] += sum(programmer.commit(datapaths).values())
+            active.setdefault(pair, now + rule_delay)
+        if port is not None:
+            dp = datapaths[dpid]
+            dp.send_msg(FakeParser.OFPPacketOut(dp, FakeOFProto.OFP_NO_BUFFER, 1,
+                                                [FakeParser.OFPActionOutput(port)], data))
+        cpu += time.perf_counter() - start
+        counts[verdict] += 1
+    return cpu, counts
+
+
+def main(loads=(500, 2000, 8000), packets_per_flow=10, meter=(1000, 200), seed=1):
+    graph = TopologyGraph.from_file(DEFAULT_TOPOLOGY_FILE)
+    setups = (("reactive, every miss set up", 'reactive', False, None),
+              ("reactive, duplicates suppressed", 'reactive', True, None),
+              ("reactive, suppressed + meter", 'reactive', True, meter),
+              ("proactive + meter", 'proactive', True, meter))
+    for load in loads:
+        packets = workload(graph, load, packets_per_flow, seed)
+        print(f"{load} new flows/s, {len(packets)} packets")
+        for label, mode, suppress, with_meter in setups:
+            cpu, counts = replay(graph, packets, mode, suppress, with_meter)
+            print(f"  {label:<43} {cpu * 1000:10.1f} ms controller CPU per second "
+                  f"({counts['packet_in']} packet-ins, {counts['metered']} metered, "
+                  f"{counts['flow_mods']} flow-mods)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Benchmark /flows with a large flow table: re-serialising per request versus
+the versioned response cache (full body, gzip and 304 revalidation)
+
+Run from the project root: python -m tests.perf.bench_response_cache
+"""
+
+import time
+
+from flask import Flask, jsonify, request
+
+from controllers.flow_table import FlowTable
+from controllers.response_cache import ResponseCache
+
+
+def main(num_flows=100000, requests=50):
+    flows = FlowTable()
+    flows.add_many((f"flow{i}", {"src": f"10.0.{i >> 8 & 255}.{i & 255}", "dst": "10.0.1.1",
+                                 "priority": 100, "path": ["switch1", "switch2", "switch4"]})
+                   for i in range(num_flows))
+    cache = ResponseCache()
+    app = Flask(__name__)
+
+    @app.route('/plain')
+    def plain():
+        return jsonify(flows.to_dict())
+
+    @app.route('/cached')
+    def cached():
+        return cache.respond('flows', flows.version, flows.to_dict, request)
+
+    client = app.test_client()
+    etag = client.get('/cached').headers['ETag']
+    cases = (
+        ("jsonify per request", '/plain', {}),
+        ("cached", '/cached', {}),
+        ("cached, gzip", '/cached', {'Accept-Encoding': 'gzip'}),
+        ("cached, If-None-Match", '/cached', {'If-None-Match': etag}),
+    )
+    for name, url, headers in cases:
+        start = time.perf_counter()
+        for _ in range(requests):
+            response = client.get(url, headers=headers)
+        elapsed = (time.perf_counter() - start) / requests
+        print(f"{name:22s} {elapsed * 1000:8.2f}ms/request, {len(response.data) / 1024:8.0f} KiB on the wire")
+
+
+if __name__ == '__main__':
+    main()
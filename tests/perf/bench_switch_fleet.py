@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Benchmark a controller against thousands of fake switches over loopback TCP:
+handshake rate, memory per switch, packet-in to flow-mod latency and
+packet-in (controller event) throughput
+
+By default the controller is tests.loopback_controller, which runs the
+Forwarder and FlowProgrammer behind a minimal OpenFlow endpoint, in a child
+process on a generated topology the fleet shares. --ryu runs the real Ryu
+apps (FlowManager, Forwarding, TopologyDiscovery and FlowStatsCollector)
+under ryu-manager in the child instead; they load the project's topology
+file, so the fleet uses that too. --controller targets a running controller
+instead, such as ryu-manager with the apps of scripts/start_ryu.sh. Give it
+the topology that controller was started with (--topology), and
+--controller-pid to measure its memory.
+
+Latency is measured one packet-in at a time, each for a new host pair:
+the time until the ingress switch gets its flow-mod and its packet-out.
+Throughput keeps ``window`` packet-ins outstanding on every switch, drawn
+from a pool of pairs per switch. Each packet-out answering one releases the
+next; a switch that hears nothing for a second (its packet-ins were dropped
+by the controller's packet-in meter) gets a fresh window.
+
+Run from the project root: python -m tests.perf.bench_switch_fleet [--switches 2000]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import struct
+import subprocess
+import sys
+import time
+
+import numpy as np
+import psutil
+
+from controllers.path_engine import DEFAULT_TOPOLOGY_FILE, TopologyGraph
+from tests.fake_switch_fleet import SwitchFleet, add_topology_arguments, graph_from_args
+from tests.ofp_wire import OFPT_FLOW_MOD, OFPT_PACKET_OUT
+
+PORT = 16633
+RYU_APPS = ['controllers/ryu/flow_manager.py', 'controllers/ryu/forwarding.py',
+            'controllers/ryu/topology_discovery.py', 'monitoring/collectors/flow_stats.py']
+
+
+def frame(src, dst):
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20, 0, 0, 64, 17, 0,
+                     socket.inet_aton(src), socket.inet_aton(dst))
+    return b'\x00\x00\x00\x00\x00\x02\x00\x00\x00\x00\x00\x01\x08\x00' + ip
+
+
+def host(network, index):
+    return str(network.network_address + 1 + index % (network.num_addresses - 2))
+
+
+def rss(process):
+    return process.memory_info().rss if process is not None else 0
+
+
+async def wait_listening(host_, port, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection(host_, port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"no controller listening on {host_}:{port}")
+
+
+async def handshake(fleet, host_, port, controller):
+    fleet_before, controller_before = rss(psutil.Process()), rss(controller)
+    start = time.perf_counter()
+    await fleet.start(host_, port)
+    ready = await fleet.wait_ready(timeout=300)
+    elapsed = time.perf_counter() - start
+    # Let the controller finish programming the switches it just saw
+    await asyncio.sleep(1.0)
+    n = len(fleet)
+    print(f"{'handshake ' + str(ready) + '/' + str(n) + ' switches':<45} {elapsed * 1000:10.1f} ms"
+          f"   ({ready / elapsed:,.0f} switches/s)")
+    print(f"{'fleet memory per switch':<45} {(rss(psutil.Process()) - fleet_before) / n / 1024:10.1f} KB")
+    if controller is not None:
+        print(f"{'controller memory per switch':<45} {(rss(controller) - controller_before) / n / 1024:10.1f} KB")
+
+
+async def latency(fleet, samples, rng):
+    """Sequential packet-ins for new pairs; ``(flow-mod, packet-out)`` latencies"""
+    loop = asyncio.get_running_loop()
+    subnets = {node: network for network, node in fleet.graph.subnets}
+    dpids = [dpid for dpid, node in fleet.graph.dpids.items() if node in subnets]
+    current = {}
+
+    def listener(switch, type_, xid, body):
+        waiting = current.get(switch.dpid)
+        if waiting is None or type_ not in (OFPT_FLOW_MOD, OFPT_PACKET_OUT):
+            return
+        sent_at, seen, done = waiting
+        seen.setdefault(type_, time.perf_counter() - sent_at)
+        if len(seen) == 2 and not done.done():
+            done.set_result(seen)
+
+    for switch in fleet.switches.values():
+        switch.listeners.append(listener)
+    flow_mod, packet_out, lost = [], [], 0
+    for i in range(samples):
+        dpid = rng.choice(dpids)
+        src_net = subnets[fleet.graph.dpids[dpid]]
+        dst_net, _ = rng.choice([s for s in fleet.graph.subnets if s[0] != src_net])
+        done = loop.create_future()
+        current[dpid] = (time.perf_counter(), {}, done)
+        fleet[dpid].send_packet_in(frame(host(src_net, i), host(dst_net, i)))
+        try:
+            seen = await asyncio.wait_for(done, 1.0)
+            flow_mod.append(seen[OFPT_FLOW_MOD])
+            packet_out.append(seen[OFPT_PACKET_OUT])
+        except asyncio.TimeoutError:
+            lost += 1
+        del current[dpid]
+    for switch in fleet.switches.values():
+        switch.listeners.remove(listener)
+    for label, values in (("packet-in -> ingress flow-mod", flow_mod), ("packet-in -> packet-out", packet_out)):
+        if values:
+            p50, p99 = np.percentile(values, [50, 99]) * 1000
+            print(f"{label:<45} {p50:10.2f} ms p50 {p99:8.2f} ms p99")
+    if lost:
+        print(f"  -> {lost}/{samples} packet-ins got no flow-mod and packet-out within 1 s")
+
+
+async def throughput(fleet, duration, window, pairs, rng):
+    subnets = {node: network for network, node in fleet.graph.subnets}
+    frames = {}
+    for dpid, node in fleet.graph.dpids.items():
+        if node in subnets:
+            others = [network for network, other in fleet.graph.subnets if other != node]
+            frames[dpid] = [frame(host(subnets[node], rng.randrange(254)),
+                                  host(rng.choice(others), rng.randrange(254))) for _ in range(pairs)]
+    answered = 0
+    running = True
+    flow_mods = sum(s.received[OFPT_FLOW_MOD] for s in fleet.switches.values())
+    sent = {dpid: 0 for dpid in frames}
+    heard = dict.fromkeys(frames, time.monotonic())
+    refills = 0
+
+    def send(switch):
+        pool = frames[switch.dpid]
+        switch.send_packet_in(pool[sent[switch.dpid] % len(pool)])
+        sent[switch.dpid] += 1
+
+    def listener(switch, type_, xid, body):
+        nonlocal answered
+        if type_ == OFPT_PACKET_OUT and switch.dpid in frames:
+            answered += 1
+            heard[switch.dpid] = time.monotonic()
+            if running:
+                send(switch)
+
+    for switch in fleet.switches.values():
+        switch.listeners.append(listener)
+    start = time.perf_counter()
+    for dpid in frames:
+        for _ in range(window):
+            send(fleet[dpid])
+    deadline = start + duration
+    while time.perf_counter() < deadline:
+        await asyncio.sleep(min(0.5, max(0.0, deadline - time.perf_counter())))
+        now = time.monotonic()
+        for dpid, last in heard.items():
+            if now - last > 1.0:
+                heard[dpid] = now
+                refills += 1
+                for _ in range(window):
+                    send(fleet[dpid])
+    running = False
+    elapsed = time.perf_counter() - start
+    done = answered
+    await asyncio.sleep(1.0)
+    for switch in fleet.switches.values():
+        switch.listeners.remove(listener)
+    flow_mods = sum(s.received[OFPT_FLOW_MOD] for s in fleet.switches.values()) - flow_mods
+    print(f"{'packet-ins answered':<45} {done / elapsed:10,.0f} /s"
+          f"   ({len(frames) * window} outstanding, {flow_mods / elapsed:,.0f} flow-mods/s)")
+    unanswered = sum(sent.values()) - answered
+    if unanswered:
+        print(f"  -> {unanswered} packet-ins never answered, {refills} windows refilled")
+
+
+async def run(args, graph, controller):
+    host_, _, port = args.controller.rpartition(':') if args.controller else ('127.0.0.1', '', PORT)
+    port = int(port)
+    await wait_listening(host_, port)
+    fleet = SwitchFleet(graph, seed=args.seed, record=False)
+    rng = random.Random(args.seed)
+    print(f"{len(fleet)} switches, {graph.num_links} links")
+    try:
+        await handshake(fleet, host_, port, controller)
+        await latency(fleet, args.samples, rng)
+        await throughput(fleet, args.duration, args.window, args.pairs, rng)
+    finally:
+        fleet.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_topology_arguments(parser)
+    parser.set_defaults(switches=2000)
+    parser.add_argument('--controller', help="host:port of a running controller instead of a child one")
+    parser.add_argument('--ryu', action='store_true',
+                        help="run the Ryu apps under ryu-manager as the child controller")
+    parser.add_argument('--controller-pid', type=int, help="pid of that controller, for its memory")
+    parser.add_argument('--mode', choices=('reactive', 'proactive'), default='reactive',
+                        help="forwarding mode of the child controller")
+    parser.add_argument('--samples', type=int, default=500, help="packet-ins timed for latency")
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds of the throughput run")
+    parser.add_argument('--window', type=int, default=2, help="outstanding packet-ins per switch")
+    parser.add_argument('--pairs', type=int, default=64, help="host pairs per switch in the throughput run")
+    args = parser.parse_args(argv)
+
+    graph = TopologyGraph.from_file(DEFAULT_TOPOLOGY_FILE) if args.ryu else graph_from_args(args)
+    child = controller = None
+    if args.controller is None and args.ryu:
+        child = subprocess.Popen(
+            [sys.executable, '-m', 'ryu.cmd.manager', '--ofp-tcp-listen-port', str(PORT)] + RYU_APPS,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=os.getcwd(),
+            env=dict(os.environ, PYTHONPATH=os.getcwd()))
+        controller = psutil.Process(child.pid)
+    elif args.controller is None:
+        child = subprocess.Popen(
+            [sys.executable, '-m', 'tests.loopback_controller', '--port', str(PORT), '--mode', args.mode,
+             '--topology', args.topology, '--degree', str(args.degree), '--seed', str(args.seed)] +
+            (['--switches', str(args.switches)] if args.switches else []),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=os.getcwd())
+        controller = psutil.Process(child.pid)
+    elif args.controller_pid:
+        controller = psutil.Process(args.controller_pid)
+    try:
+        asyncio.run(run(args, graph, controller))
+    finally:
+        if child is not None:
+            child.terminate()
+            child.wait()
+
+
+if __name__ == '__main__':
+    main()
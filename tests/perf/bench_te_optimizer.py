@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Benchmark the traffic-engineering optimizer at 100k flows over 1k links
+
+Run from the project root: python -m tests.perf.bench_te_optimizer
+"""
+
+import random
+import time
+
+import numpy as np
+
+from controllers.path_engine import PathEngine, TopologyGraph
+from controllers.te_optimizer import TrafficEngineeringOptimizer
+
+
+def random_wan(num_switches=400, num_links=1000, seed=0):
+    rng = random.Random(seed)
+    graph = TopologyGraph()
+    for i in range(1, num_switches):
+        graph.add_link(f"s{i}", f"s{rng.randrange(i)}", rng.choice([1000, 10000]), rng.uniform(1, 20))
+    while graph.num_links < num_links:
+        a, b = rng.randrange(num_switches), rng.randrange(num_switches)
+        if a != b:
+            graph.add_link(f"s{a}", f"s{b}", rng.choice([1000, 10000]), rng.uniform(1, 20))
+    return graph
+
+
+def main(num_flows=100000, edge_sites=60):
+    graph = random_wan()
+    optimizer = TrafficEngineeringOptimizer(PathEngine(graph))
+    rng = np.random.default_rng(0)
+    edges = rng.choice(graph.num_nodes, edge_sites, replace=False)
+    src, dst = rng.choice(edges, num_flows), rng.choice(edges, num_flows)
+    demand = rng.exponential(0.05, num_flows)
+
+    start = time.perf_counter()
+    optimizer.optimise(src, dst, demand)
+    print(f"cold (candidate paths computed): {time.perf_counter() - start:.2f}s")
+
+    runs = []
+    for _ in range(5):
+        placement = optimizer.optimise(src, dst, demand)
+        runs.append(placement.elapsed)
+    baseline = TrafficEngineeringOptimizer(optimizer.path_engine, iterations=0).optimise(src, dst, demand)
+    print(f"{num_flows} flows, {graph.num_links} links: "
+          f"median {sorted(runs)[len(runs) // 2] * 1000:.1f}ms per placement")
+    print(f"max utilisation {placement.max_utilisation:.3f} "
+          f"(shortest path only: {baseline.max_utilisation:.3f})")
+
+
+if __name__ == '__main__':
+    main()
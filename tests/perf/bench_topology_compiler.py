@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Benchmark loading a 100k-switch topology: JSON versus the compiled binary
+
+Run from the project root: python -m tests.perf.bench_topology_compiler
+"""
+
+import json
+import os
+import random
+import tempfile
+import time
+
+from controllers.path_engine import TopologyGraph
+from controllers.topology_compiler import CompiledTopology, compile_topology
+
+
+def synthetic_topology(num_switches, degree=3, seed=0):
+    """A ring with random chords, listed under both ends like network_topology.json"""
+    rng = random.Random(seed)
+    links = {}
+    for u in range(num_switches):
+        links.setdefault(u, []).append((u + 1) % num_switches)
+        for _ in range(degree - 2):
+            links[u].append(rng.randrange(num_switches))
+    switches = [{"id": f"switch{u}", "dpid": u + 1, "name": f"Switch {u}", "type": "OpenFlow",
+                 "subnet": f"10.{u >> 16}.{(u >> 8) & 255}.{u & 255}/32", "links": []}
+                for u in range(num_switches)]
+    for u, targets in links.items():
+        for port, v in enumerate(targets, 1):
+            if u == v:
+                continue
+            for a, b in ((u, v), (v, u)):
+                switches[a]["links"].append({"target": f"switch{b}", "bandwidth": f"{rng.choice([1, 10, 100])}Gbps",
+                                             "latency": f"{rng.randint(1, 50)}ms"})
+    return {"topology": {"switches": switches}}
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    print(f"{label:<45} {(time.perf_counter() - start) * 1000:10.1f} ms")
+    return result
+
+
+def main(num_switches=100000):
+    topology = synthetic_topology(num_switches)
+    with tempfile.TemporaryDirectory() as directory:
+        json_file = os.path.join(directory, 'topology.json')
+        bin_file = os.path.join(directory, 'topology.bin')
+        with open(json_file, 'w') as f:
+            json.dump(topology, f)
+        data = timed("compile", lambda: compile_topology(topology))
+        with open(bin_file, 'wb') as f:
+            f.write(data)
+        print(f"JSON {os.path.getsize(json_file) / 1e6:.1f} MB, binary {len(data) / 1e6:.1f} MB")
+
+        timed("JSON: json.load + TopologyGraph.from_dict", lambda: TopologyGraph.from_file(json_file))
+        compiled = timed("binary: open (mmap + column views)", lambda: CompiledTopology.open(bin_file))
+        print(f"  -> {compiled.num_nodes} switches, {compiled.num_links} links")
+        timed("binary: neighbours of one switch", lambda: compiled.neighbours(num_switches // 2))
+        timed("binary: TopologyGraph for PathEngine", compiled.graph)
+        timed("binary: JSON view (to_dict)", compiled.to_dict)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Benchmark seeded workloads: generating 1M flows, the binary trace round
+trip, and replaying traces into the simple controller's flow manager and
+traffic monitor as fast as possible and at N times real time
+
+Run from the project root: python -m tests.perf.bench_workload_replay
+"""
+
+import os
+import tempfile
+import time
+
+from controllers.flow_table import FlowTable
+from controllers.path_engine import DEFAULT_TOPOLOGY_FILE, TopologyGraph
+from controllers.workload import FlashCrowd, Replayer, Trace, WorkloadGenerator
+from run_simple import SimpleFlowManager, SimpleTrafficMonitor
+
+
+def timed(label, fn, count=None):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    per = f" ({elapsed / count * 1e6:.2f} us each)" if count else ""
+    print(f"{label:<45} {elapsed * 1000:10.1f} ms{per}")
+    return result
+
+
+def replay(label, trace, flows, monitor=None, speed=None):
+    report = Replayer(trace, flows, monitor).run(speed)
+    print(f"{label:<45} {report.wall_seconds * 1000:10.1f} ms "
+          f"({report.events / report.wall_seconds:,.0f} events/s, {report.achieved_speed:,.1f}x real time)")
+    if speed is not None:
+        print(f"  -> events applied {report.lag_p50 * 1000:.1f} ms late at p50, "
+              f"{report.lag_p99 * 1000:.1f} ms at p99, {report.lag_max * 1000:.1f} ms at worst")
+    return report
+
+
+def main(num_flows=1000000, speeds=(10, 100)):
+    subnets = [network for network, _ in TopologyGraph.from_file(DEFAULT_TOPOLOGY_FILE).subnets]
+    duration = 100.0
+    generator = WorkloadGenerator(subnets, rate=num_flows / duration, seed=1, max_duration=30,
+                                  diurnal_amplitude=0.5, diurnal_period=duration,
+                                  flash_crowds=[FlashCrowd(40, 10, 3)])
+    trace = timed(f"generate {num_flows} flows", lambda: generator.generate(duration), num_flows)
+    print(f"  -> {len(trace)} flows, {trace.packets().sum():,} packets")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "trace.bin")
+        timed("save trace", lambda: trace.save(path))
+        print(f"  -> {os.path.getsize(path) / len(trace):.1f} bytes per flow")
+        loaded = timed("load trace", lambda: Trace.load(path))
+        timed("derive arrival and departure events", loaded.events)
+        replay("replay into a bare FlowTable", loaded, FlowTable())
+
+    # The simple controller's table carries timeout and rule compiler subscribers
+    small = WorkloadGenerator(subnets, rate=2000, seed=2, max_duration=10).generate(10)
+    replay(f"replay {len(small)} flows into the flow manager", small,
+           SimpleFlowManager().flows, SimpleTrafficMonitor())
+    for speed in speeds:
+        replay(f"replay {len(small)} flows at {speed}x", small, SimpleFlowManager().flows,
+               SimpleTrafficMonitor(), speed)
+
+
+if __name__ == '__main__':
+    main()
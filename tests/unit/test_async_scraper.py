@@ -0,0 +1,95 @@
+import asyncio
+import json
+import os
+import random
+import tempfile
+import unittest
+
+from aiohttp import web
+
+from monitoring.collectors.async_scraper import AsyncScraper, ScrapeTarget, load_targets
+
+
+class TestAsyncScraper(unittest.TestCase):
+
+    def run_scraper(self, targets, seconds, **kwargs):
+        seen = []
+
+        async def main():
+            async def ok(request):
+                return web.json_response({"n": int(request.match_info['n'])})
+
+            async def fail(request):
+                return web.Response(status=500)
+
+            async def slow(request):
+                await asyncio.sleep(1.0)
+                return web.json_response({})
+            app = web.Application()
+            app.router.add_get('/ok/{n}', ok)
+            app.router.add_get('/fail', fail)
+            app.router.add_get('/slow', slow)
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            for target in targets:
+                target.url = target.url.format(port=port)
+            scraper = AsyncScraper(targets, lambda t, p: seen.append((t.name, p)),
+                                   rng=random.Random(0), **kwargs)
+            stop = asyncio.Event()
+            asyncio.get_running_loop().call_later(seconds, stop.set)
+            await scraper.run(stop)
+            await runner.cleanup()
+            return scraper
+
+        return asyncio.run(main()), seen
+
+    def test_concurrent_targets_at_sub_second_interval(self):
+        targets = [ScrapeTarget(f"t{i}", f"http://127.0.0.1:{{port}}/ok/{i}", interval=0.1)
+                   for i in range(200)]
+        scraper, seen = self.run_scraper(targets, 0.55)
+        per_target = {}
+        for name, payload in seen:
+            per_target[name] = per_target.get(name, 0) + 1
+        self.assertEqual(len(per_target), 200)
+        # Ticks are anchored to the first one, so 0.55 s of 0.1 s interval
+        # holds at most six scrapes; three leaves slack for a loaded machine
+        self.assertTrue(all(3 <= n <= 6 for n in per_target.values()), per_target)
+        self.assertIn(("t7", {"n": 7}), seen)
+        self.assertEqual(scraper.summary()["up"], 200)
+
+    def test_failures_back_off_and_time_out(self):
+        failing = ScrapeTarget("bad", "http://127.0.0.1:{port}/fail", interval=0.05)
+        slow = ScrapeTarget("slow", "http://127.0.0.1:{port}/slow", interval=0.05, timeout=0.1)
+        scraper, seen = self.run_scraper([failing, slow], 0.8, max_backoff=0.4)
+        self.assertEqual(seen, [])
+        # Without backoff each would have been tried ~16 times
+        self.assertLess(failing.scrapes, 8)
+        self.assertLess(slow.scrapes, 6)
+        self.assertFalse(failing.up)
+        self.assertEqual(failing.errors, failing.scrapes)
+
+    def test_next_delay_caps_backoff(self):
+        scraper = AsyncScraper([], None, max_backoff=10.0, rng=random.Random(0))
+        target = ScrapeTarget("t", "http://x", interval=1.0)
+        self.assertEqual(scraper.next_delay(target), 1.0)
+        target.failures = 20
+        self.assertLessEqual(scraper.next_delay(target), 10.0)
+        self.assertGreaterEqual(scraper.next_delay(target), 5.0)
+
+    def test_load_targets_applies_defaults(self):
+        config = {"defaults": {"interval": 0.25, "timeout": 0.1},
+                  "targets": [{"name": "a", "url": "http://a/metrics"},
+                              {"name": "b", "url": "http://b/links", "kind": "links", "interval": 2}]}
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump(config, f)
+        self.addCleanup(os.unlink, f.name)
+        a, b = load_targets(f.name)
+        self.assertEqual((a.interval, a.timeout, a.kind), (0.25, 0.1, 'metrics'))
+        self.assertEqual((b.interval, b.kind), (2.0, 'links'))
+
+
+if __name__ == '__main__':
+    unittest.main()
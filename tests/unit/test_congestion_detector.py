@@ -0,0 +1,80 @@
+import unittest
+
+import numpy as np
+
+from monitoring.collectors.congestion_detector import END, START, StreamingDetector
+
+
+class TestStreamingDetector(unittest.TestCase):
+
+    def test_level_hysteresis_gives_one_start_and_one_end(self):
+        detector = StreamingDetector(capacity=4, high=0.8, low=0.6, z_on=100.0)
+        samples = [0.5, 0.85, 0.79, 0.82, 0.7, 0.81, 0.55, 0.5]
+        events = []
+        for t, value in enumerate(samples):
+            events += detector.observe(['s1-s2'], [value], timestamp=float(t))
+        self.assertEqual([(e.kind, e.timestamp) for e in events], [(START, 1.0), (END, 6.0)])
+        self.assertEqual(events[0].reason, 'level')
+        self.assertEqual(detector.alarmed(), [])
+
+    def test_zscore_spike_on_noisy_series(self):
+        rng = np.random.default_rng(1)
+        detector = StreamingDetector(capacity=8, z_on=4.0, z_off=1.0)
+        events = []
+        for t in range(200):
+            events += detector.observe(['flow'], [100 + rng.normal(0, 5)], timestamp=float(t))
+        self.assertEqual(events, [])
+        events = detector.observe(['flow'], [400.0], timestamp=200.0)
+        self.assertEqual([(e.kind, e.reason) for e in events], [(START, 'zscore')])
+        self.assertGreater(events[0].zscore, 4.0)
+        self.assertAlmostEqual(events[0].mean, 100, delta=35)
+        # Back to normal: the alarm clears
+        for t in range(201, 210):
+            events += detector.observe(['flow'], [100.0], timestamp=float(t))
+        self.assertEqual(events[-1].kind, END)
+
+    def test_small_step_after_a_flat_series_stays_quiet(self):
+        detector = StreamingDetector(capacity=4, min_std=10.0)
+        events = []
+        for t in range(50):
+            events += detector.observe(['zero', 'hundred'], [0.0, 100.0], timestamp=float(t))
+        for t in range(50, 60):
+            events += detector.observe(['zero', 'hundred'], [1.0, 105.0], timestamp=float(t))
+        self.assertEqual(events, [])
+        # A step well past the floor still alarms
+        events = detector.observe(['zero', 'hundred'], [80.0, 105.0], timestamp=60.0)
+        self.assertEqual([(e.kind, e.key) for e in events], [(START, 'zero')])
+
+    def test_streaming_quantile_tracks_distribution(self):
+        rng = np.random.default_rng(2)
+        detector = StreamingDetector(capacity=2, quantile=0.95, z_on=1e9)
+        for t, value in enumerate(rng.normal(50, 10, 5000)):
+            detector.observe(['x'], [value], timestamp=float(t))
+        stats = detector.stats('x')
+        self.assertAlmostEqual(stats['quantile'], 50 + 1.645 * 10, delta=3)
+        self.assertAlmostEqual(stats['mean'], 50, delta=3)
+
+    def test_vectorised_batch_and_bounded_memory(self):
+        detector = StreamingDetector(capacity=1000, high=0.9, z_on=1e9)
+        keys = [f"l{i}" for i in range(1000)]
+        values = np.zeros(1000)
+        values[[3, 500]] = 0.95
+        events = detector.observe(keys, values, timestamp=0.0)
+        self.assertEqual(sorted(e.key for e in events), ['l3', 'l500'])
+        # New series push out the least recently updated ones
+        detector.observe(keys[1:], np.zeros(999), timestamp=1.0)
+        detector.observe(['new'], [0.0], timestamp=2.0)
+        self.assertEqual(len(detector), 1000)
+        self.assertIsNone(detector.stats('l0'))
+        self.assertEqual(detector.evictions, 1)
+
+    def test_subscribers_receive_events(self):
+        detector = StreamingDetector(capacity=2, high=0.5)
+        received = []
+        detector.subscribe(received.extend)
+        detector.observe(['a', 'b'], [0.1, 0.7], timestamp=0.0)
+        self.assertEqual([e.key for e in received], ['b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
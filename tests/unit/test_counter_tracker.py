@@ -0,0 +1,44 @@
+import unittest
+
+from monitoring.collectors.counter_tracker import CounterTracker
+
+
+class TestCounterTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.tracker = CounterTracker()
+
+    def test_first_reading_is_baseline(self):
+        self.assertEqual(self.tracker.update('c', 5000, timestamp=0.0), (0, None))
+        self.assertEqual(self.tracker.update('c', 5300, timestamp=10.0), (300, 30.0))
+        self.assertEqual(self.tracker.rate('c'), 30.0)
+
+    def test_repeated_totals_are_not_counted_twice(self):
+        total = 0
+        for t in range(10):
+            delta, _ = self.tracker.update('c', 1000, timestamp=float(t))
+            total += delta
+        self.assertEqual(total, 0)
+
+    def test_reset_counts_from_zero(self):
+        self.tracker.update('c', 900, timestamp=0.0)
+        self.assertEqual(self.tracker.update('c', 40, timestamp=1.0), (40, 40.0))
+        self.assertEqual(self.tracker.resets['c'], 1)
+
+    def test_epoch_change_is_a_reset(self):
+        # An overwrite to a higher value would otherwise look like growth
+        self.tracker.update('c', 100, timestamp=0.0, epoch=0)
+        self.assertEqual(self.tracker.update('c', 2000, timestamp=1.0, epoch=1), (2000, 2000.0))
+        self.assertEqual(self.tracker.update('c', 2100, timestamp=2.0, epoch=1), (100, 100.0))
+        self.assertEqual(self.tracker.resets['c'], 1)
+
+    def test_sources_are_independent(self):
+        self.tracker.update(('ctl1', 'packets'), 10, timestamp=0.0)
+        self.tracker.update(('ctl2', 'packets'), 500, timestamp=0.0)
+        self.assertEqual(self.tracker.update(('ctl1', 'packets'), 20, timestamp=1.0)[0], 10)
+        self.tracker.forget(('ctl2', 'packets'))
+        self.assertEqual(self.tracker.update(('ctl2', 'packets'), 600, timestamp=1.0), (0, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import struct
+import threading
+import unittest
+
+from controllers.counters import ShardedCounter, classify, ethertype
+
+
+def frame(*ethertypes):
+    header = b'\xff' * 6 + b'\x02' * 6
+    for value in ethertypes[:-1]:
+        header += struct.pack('!HH', value, 100)
+    return header + struct.pack('!H', ethertypes[-1]) + b'\x00' * 20
+
+
+class TestClassify(unittest.TestCase):
+
+    def test_ethertype_from_raw_frame(self):
+        self.assertEqual(classify(frame(0x0800)), 'ipv4')
+        self.assertEqual(classify(frame(0x0806)), 'arp')
+        self.assertEqual(classify(frame(0x1234)), 'other')
+        self.assertEqual(classify(bytearray(frame(0x86dd))), 'ipv6')
+
+    def test_vlan_tags_are_skipped(self):
+        self.assertEqual(ethertype(frame(0x8100, 0x0800)), 0x0800)
+        self.assertEqual(classify(frame(0x88a8, 0x8100, 0x88cc)), 'lldp')
+
+    def test_truncated_frame(self):
+        self.assertEqual(classify(b'\x00' * 13), 'truncated')
+        self.assertEqual(classify(frame(0x8100, 0x0800)[:15]), 'truncated')
+
+
+class TestShardedCounter(unittest.TestCase):
+
+    def test_threads_increment_without_losing_counts(self):
+        counter = ShardedCounter()
+
+        def work():
+            for _ in range(20000):
+                counter.inc()
+                counter.inc(key='ipv4')
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(counter.value(), 160000)
+        self.assertEqual(counter.value('ipv4'), 160000)
+        self.assertEqual(counter.total(), 320000)
+
+    def test_shards_of_finished_threads_fold_into_the_total(self):
+        counter = ShardedCounter()
+        counter.inc(3)
+        for _ in range(50):
+            thread = threading.Thread(target=counter.inc, kwargs={'key': 'ipv4'})
+            thread.start()
+            thread.join()
+        self.assertEqual(counter.values(), {None: 3, 'ipv4': 50})
+        # Only this thread's shard is left
+        self.assertEqual(len(counter._shards), 1)
+        counter.set(10, key='ipv4')
+        counter.inc(key='ipv4')
+        self.assertEqual(counter.values(), {None: 3, 'ipv4': 11})
+
+    def test_set_overwrites_total_and_bumps_epoch(self):
+        counter = ShardedCounter()
+        counter.inc(500)
+        counter.set(2000)
+        self.assertEqual((counter.value(), counter.epoch), (2000, 1))
+        counter.inc(5)
+        self.assertEqual(counter.value(), 2005)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import threading
+import time
+import unittest
+
+from controllers.event_bus import EventBus
+
+
+def take(stream, n):
+    return [next(stream) for _ in range(n)]
+
+
+class TestEventBus(unittest.TestCase):
+
+    def setUp(self):
+        self.bus = EventBus(log_size=4)
+
+    def test_event_is_encoded_once_as_sse(self):
+        seq = self.bus.publish('flow_add', {"id": "flow1"})
+        [encoded] = self.bus.since(seq - 1)
+        self.assertEqual(encoded, f'id: {self.bus.instance}-1\nevent: flow_add\ndata: {{"id":"flow1"}}\n\n'.encode())
+
+    def test_new_client_starts_from_now(self):
+        self.bus.publish('counters', {"packet_count": 1})
+        stream = self.bus.stream(heartbeat=0.01)
+        hello, retry = take(stream, 2)
+        self.assertIn(b'event: hello', hello)
+        self.assertEqual(retry, b'retry: 2000\n\n')
+        self.bus.publish('counters', {"packet_count": 2})
+        self.assertIn(b'"packet_count":2', next(stream))
+
+    def test_resume_from_last_event_id(self):
+        self.bus.publish('a', {})
+        self.bus.publish('b', {})
+        self.bus.publish('c', {})
+        stream = self.bus.stream(f"{self.bus.instance}-1", heartbeat=0.01)
+        self.assertEqual(next(stream), b'retry: 2000\n\n')
+        chunk = next(stream)
+        self.assertNotIn(b'event: a', chunk)
+        self.assertIn(b'event: b', chunk)
+        self.assertIn(b'event: c', chunk)
+
+    def test_unknown_or_expired_id_resyncs(self):
+        self.assertIn(b'event: resync', next(self.bus.stream("otherproc-5")))
+        for i in range(10):
+            self.bus.publish('x', {"i": i})
+        self.assertIsNone(self.bus.since(1))
+        self.assertIn(b'event: resync', next(self.bus.stream(f"{self.bus.instance}-1")))
+
+    def test_heartbeat_when_idle(self):
+        stream = self.bus.stream(heartbeat=0.01)
+        take(stream, 2)
+        self.assertTrue(next(stream).startswith(b': keepalive'))
+
+    def test_fan_out_to_many_clients(self):
+        clients = [self.bus.stream(heartbeat=1.0) for _ in range(50)]
+        for stream in clients:
+            take(stream, 2)
+        received = []
+
+        def read(stream):
+            received.append(next(stream))
+
+        threads = [threading.Thread(target=read, args=(stream,)) for stream in clients]
+        for t in threads:
+            t.start()
+        self.bus.publish('topology', {"version": 7})
+        for t in threads:
+            t.join(2.0)
+        self.assertEqual(len(received), 50)
+        self.assertEqual(len(set(received)), 1)
+        self.assertEqual(self.bus.published, 1)
+
+    def test_streams_are_capped_and_free_their_slot_when_closed(self):
+        self.bus.max_streams = 2
+        first, second = self.bus.open_stream(), self.bus.open_stream()
+        self.assertIsNone(self.bus.open_stream())
+        self.assertEqual((self.bus.streams, self.bus.rejected), (2, 1))
+        take(first, 2)
+        first.close()
+        first.close()
+        # A stream closed before it was read gives its slot back too
+        second.close()
+        self.assertEqual(self.bus.streams, 0)
+        self.assertIsNotNone(self.bus.open_stream())
+
+    def test_stream_ends_after_its_lifetime_and_resumes(self):
+        stream = self.bus.open_stream(heartbeat=10.0, lifetime=0.05)
+        hello, retry = take(stream, 2)
+        self.assertEqual(retry, b'retry: 2000\n\n')
+        self.bus.publish('links', {"n": 1})
+        chunk = next(stream)
+        start = time.monotonic()
+        # Quiet from here: the stream stops at its deadline, not the heartbeat
+        rest = list(stream)
+        self.assertTrue(all(c.startswith(b': keepalive') for c in rest), rest)
+        self.assertLess(time.monotonic() - start, 1.0)
+        stream.close()
+        last_id = chunk.split(b'\n', 1)[0][len(b'id: '):].decode()
+        self.bus.publish('links', {"n": 2})
+        resumed = self.bus.open_stream(last_id, heartbeat=0.01)
+        self.assertEqual(next(resumed), b'retry: 2000\n\n')
+        self.assertIn(b'"n":2', next(resumed))
+        resumed.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
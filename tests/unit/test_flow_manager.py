@@ -1,35 +1,89 @@
+import time
 import unittest
+from types import SimpleNamespace
+
+try:
+    from ryu.controller.handler import DEAD_DISPATCHER, MAIN_DISPATCHER
+except ImportError:
+    raise unittest.SkipTest("ryu is not installed")
+
 from controllers.ryu.flow_manager import FlowManager
+from tests.fake_datapath import FakeDatapath, FakeOFProto, FakeParser
+
 
 class TestFlowManager(unittest.TestCase):
 
     def setUp(self):
         self.flow_manager = FlowManager()
+        self.datapath = FakeDatapath(1)
+        self.connect(self.datapath)
+
+    def connect(self, datapath):
+        """Bring ``datapath`` up and answer the reconciliation flow stats request"""
+        self.flow_manager._state_change_handler(SimpleNamespace(datapath=datapath, state=MAIN_DISPATCHER))
+        reply = SimpleNamespace(datapath=datapath, body=datapath.flow_stats(), flags=0, xid=None)
+        self.flow_manager._flow_stats_reply_handler(SimpleNamespace(msg=reply))
+
+    def add(self, port):
+        self.flow_manager.add_flow(self.datapath, 10, FakeParser.OFPMatch(in_port=1),
+                                   [FakeParser.OFPActionOutput(port)])
+
+    def last_command(self):
+        return [m for m in self.datapath.sent if isinstance(m, FakeParser.OFPFlowMod)][-1].command
 
     def test_add_flow(self):
-        flow = {'id': '1', 'match': {'in_port': 1}, 'actions': [{'type': 'OUTPUT', 'port': 2}]}
-        result = self.flow_manager.add_flow(flow)
-        self.assertTrue(result)
-        self.assertIn(flow['id'], self.flow_manager.flows)
+        self.add(2)
+        self.assertEqual(self.datapath.output_port({'in_port': 1}, 10), 2)
+        self.assertEqual(self.last_command(), FakeOFProto.OFPFC_ADD)
 
     def test_modify_flow(self):
-        flow = {'id': '2', 'match': {'in_port': 1}, 'actions': [{'type': 'OUTPUT', 'port': 2}]}
-        self.flow_manager.add_flow(flow)
-        modified_flow = {'id': '2', 'match': {'in_port': 1}, 'actions': [{'type': 'OUTPUT', 'port': 3}]}
-        result = self.flow_manager.modify_flow(modified_flow)
-        self.assertTrue(result)
-        self.assertEqual(self.flow_manager.flows['2']['actions'][0]['port'], 3)
+        self.add(2)
+        self.flow_manager.modify_flow(self.datapath, 10, FakeParser.OFPMatch(in_port=1),
+                                      [FakeParser.OFPActionOutput(3)])
+        self.assertEqual(self.datapath.output_port({'in_port': 1}, 10), 3)
+        self.assertEqual(self.last_command(), FakeOFProto.OFPFC_MODIFY_STRICT)
+        self.assertEqual(self.datapath.blackholed, set())
 
     def test_delete_flow(self):
-        flow = {'id': '3', 'match': {'in_port': 1}, 'actions': [{'type': 'OUTPUT', 'port': 2}]}
-        self.flow_manager.add_flow(flow)
-        result = self.flow_manager.delete_flow(flow['id'])
-        self.assertTrue(result)
-        self.assertNotIn(flow['id'], self.flow_manager.flows)
+        self.add(2)
+        self.flow_manager.delete_flow(self.datapath, FakeParser.OFPMatch(in_port=1))
+        self.assertIsNone(self.datapath.output_port({'in_port': 1}, 10))
+        self.assertEqual(self.last_command(), FakeOFProto.OFPFC_DELETE_STRICT)
+
+    def test_delete_unknown_flow_falls_back_to_a_wildcard_delete(self):
+        self.flow_manager.delete_flow(self.datapath, FakeParser.OFPMatch(in_port=9))
+        self.assertEqual(self.last_command(), FakeOFProto.OFPFC_DELETE)
+
+    def test_flow_stats_are_polled_on_the_scheduler_not_all_at_once(self):
+        self.add(2)
+        datapaths = [self.datapath] + [FakeDatapath(dpid) for dpid in range(2, 7)]
+        for datapath in datapaths[1:]:
+            self.connect(datapath)
+        sent = {dp.id: len(dp.sent) for dp in datapaths}
+        start = time.monotonic()
+        polled = {}
+        for second in range(1, 17):
+            self.flow_manager.scheduler.clock = lambda: start + second
+            self.flow_manager._poll_flow_stats()
+            for dp in datapaths:
+                for msg in dp.sent[sent[dp.id]:]:
+                    if isinstance(msg, FakeParser.OFPFlowStatsRequest):
+                        polled.setdefault(dp.id, []).append(second)
+                sent[dp.id] = len(dp.sent)
+        # One request per switch within the first interval, at spread-out times
+        self.assertEqual(sorted(polled), [dp.id for dp in datapaths])
+        self.assertTrue(all(len(seconds) == 1 for seconds in polled.values()), polled)
+        self.assertGreater(len({seconds[0] for seconds in polled.values()}), 1)
+
+    def test_reconnect_keeps_flows_already_on_the_switch(self):
+        self.add(2)
+        self.flow_manager._state_change_handler(SimpleNamespace(datapath=self.datapath,
+                                                                state=DEAD_DISPATCHER))
+        sent = len(self.datapath.sent)
+        self.connect(self.datapath)
+        flow_mods = [m for m in self.datapath.sent[sent:] if isinstance(m, FakeParser.OFPFlowMod)]
+        self.assertEqual(flow_mods, [])
 
-    def test_flow_not_found(self):
-        result = self.flow_manager.delete_flow('non_existent_flow')
-        self.assertFalse(result)
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
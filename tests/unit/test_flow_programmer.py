@@ -0,0 +1,186 @@
+import unittest
+
+from controllers.ryu.flow_programmer import FlowProgrammer, flow_key
+from tests.fake_datapath import FakeDatapath, FakeOFProto, FakeParser
+
+
+def output(port):
+    return [FakeParser.OFPActionOutput(port)]
+
+
+def host_match(i):
+    return {"eth_type": 0x0800, "ipv4_src": "10.0.0.1", "ipv4_dst": f"10.0.1.{i}"}
+
+
+class TestFlowProgrammer(unittest.TestCase):
+
+    def setUp(self):
+        self.programmer = FlowProgrammer()
+        self.datapaths = {1: FakeDatapath(1), 2: FakeDatapath(2)}
+
+    def install(self, count, port=2):
+        for i in range(count):
+            for dpid in self.datapaths:
+                self.programmer.stage(dpid, 100, host_match(i), output(port))
+        return self.programmer.commit(self.datapaths)
+
+    def test_initial_install_adds_then_barrier(self):
+        sent = self.install(3)
+        self.assertEqual(sent, {1: 3, 2: 3})
+        counts = self.datapaths[1].message_counts()
+        self.assertEqual(counts[f"command_{FakeOFProto.OFPFC_ADD}"], 3)
+        self.assertEqual(counts["OFPBarrierRequest"], 1)
+        self.assertIsInstance(self.datapaths[1].sent[-1], FakeParser.OFPBarrierRequest)
+
+    def test_reroute_is_one_modify_per_change_and_hitless(self):
+        self.install(200)
+        for dp in self.datapaths.values():
+            dp.sent.clear()
+        for i in range(200):
+            self.programmer.stage(1, 100, host_match(i), output(3))
+        sent = self.programmer.commit(self.datapaths)
+        self.assertEqual(sent, {1: 200})
+        dp = self.datapaths[1]
+        counts = dp.message_counts()
+        self.assertEqual(counts[f"command_{FakeOFProto.OFPFC_MODIFY_STRICT}"], 200)
+        self.assertEqual(counts["OFPBarrierRequest"], 1)
+        self.assertEqual(len(dp.sent), 201)
+        self.assertEqual(dp.blackholed, set())
+        self.assertEqual(dp.output_port(host_match(7), 100), 3)
+        self.assertEqual(self.datapaths[2].sent, [])
+
+    def test_unchanged_and_coalesced_changes(self):
+        self.install(5)
+        self.datapaths[1].sent.clear()
+        # Restaging the same actions is a no-op; flapping twice collapses to the last value
+        self.programmer.stage(1, 100, host_match(0), output(2))
+        self.programmer.stage(1, 100, host_match(1), output(4))
+        self.programmer.stage(1, 100, host_match(1), output(5))
+        self.assertEqual(self.programmer.commit(self.datapaths), {1: 1})
+        self.assertEqual(self.datapaths[1].output_port(host_match(1), 100), 5)
+
+    def test_delete(self):
+        self.install(2)
+        self.assertTrue(self.programmer.unstage(1, 100, host_match(0)))
+        self.programmer.commit(self.datapaths)
+        dp = self.datapaths[1]
+        self.assertEqual(dp.sent[-2].command, FakeOFProto.OFPFC_DELETE_STRICT)
+        self.assertEqual(dp.sent[-2].out_port, FakeOFProto.OFPP_ANY)
+        self.assertIsNone(dp.output_port(host_match(0), 100))
+        self.assertEqual(len(dp.flow_table), 1)
+
+    def test_replace_diffs_whole_table(self):
+        self.install(4)
+        entries = [self.programmer.stage(1, 100, host_match(i), output(2 if i else 9)) for i in range(1, 4)]
+        entries.append(self.programmer.stage(1, 100, host_match(10), output(2)))
+        self.programmer.replace(1, entries)
+        self.datapaths[1].sent.clear()
+        adds, modifies, deletes = self.programmer.diff(1)
+        self.assertEqual((len(adds), len(modifies), len(deletes)), (1, 0, 1))
+        self.programmer.commit(self.datapaths)
+        self.assertEqual(len(self.datapaths[1].flow_table), 4)
+
+    def test_barrier_and_error_feedback(self):
+        self.install(1)
+        dp = self.datapaths[1]
+        flow_mod, barrier = dp.sent[-2], dp.sent[-1]
+        self.assertTrue(self.programmer.error(1, flow_mod.xid))
+        # The failed entry is retried on the next commit
+        self.assertEqual(self.programmer.commit(self.datapaths), {1: 1})
+        self.programmer.barrier_reply(1, dp.sent[-1].xid)
+        self.assertNotIn(1, self.programmer.pending_barriers)
+        self.assertFalse(self.programmer.error(1, barrier.xid))
+
+    def test_failed_delete_is_retried(self):
+        self.install(2)
+        dp = self.datapaths[1]
+        self.programmer.barrier_reply(1, dp.sent[-1].xid)
+        self.programmer.unstage(1, 100, host_match(0))
+        self.programmer.commit(self.datapaths)
+        delete = dp.sent[-2]
+        self.assertIn(delete.xid, self.programmer.pending_deletes[1])
+        self.assertTrue(self.programmer.error(1, delete.xid))
+        self.assertEqual(self.programmer.commit(self.datapaths), {1: 1})
+        self.assertEqual(dp.sent[-2].command, FakeOFProto.OFPFC_DELETE_STRICT)
+        # Once a barrier covers the retry, the delete is done
+        self.programmer.barrier_reply(1, dp.sent[-1].xid)
+        self.assertEqual(self.programmer.pending_deletes[1], {})
+        self.assertEqual(self.programmer.commit(self.datapaths), {})
+
+    def test_failed_delete_does_not_undo_a_later_add(self):
+        self.install(1)
+        dp = self.datapaths[1]
+        self.programmer.unstage(1, 100, host_match(0))
+        self.programmer.commit(self.datapaths)
+        delete = dp.sent[-2]
+        self.programmer.stage(1, 100, host_match(0), output(4))
+        self.programmer.commit(self.datapaths)
+        self.programmer.error(1, delete.xid)
+        # The add replaced the entry on the switch, so there is nothing to delete
+        self.assertEqual(self.programmer.commit(self.datapaths), {1: 0})
+        self.assertEqual(dp.output_port(host_match(0), 100), 4)
+
+    def test_reconnect_reinstalls_desired_state(self):
+        self.install(3)
+        self.programmer.forget(1)
+        fresh = FakeDatapath(1)
+        self.assertEqual(self.programmer.commit({1: fresh}), {1: 3})
+        self.assertEqual(len(fresh.flow_table), 3)
+
+    def test_reconcile_after_restart_sends_only_differences(self):
+        self.install(5)
+        dp = self.datapaths[1]
+        dp.send_msg(FakeParser.OFPFlowMod(dp, priority=0, match=FakeParser.OFPMatch()))
+        # A restarted controller re-derives the same desired state, except one changed path
+        restarted = FlowProgrammer()
+        for i in range(5):
+            restarted.stage(1, 100, host_match(i), output(3 if i == 4 else 2))
+        restarted.stage(1, 100, host_match(5), output(2))
+        self.assertEqual(restarted.reconcile(dp, dp.flow_stats()), 4)
+        dp.sent.clear()
+        self.assertEqual(restarted.commit({1: dp}), {1: 2})
+        counts = dp.message_counts()
+        self.assertEqual(counts[f"command_{FakeOFProto.OFPFC_ADD}"], 1)
+        self.assertEqual(counts[f"command_{FakeOFProto.OFPFC_MODIFY_STRICT}"], 1)
+        # The entry it does not manage is left in place
+        self.assertEqual(len(dp.flow_table), 7)
+
+    def test_timed_entries_report_removal_and_are_not_reinstalled(self):
+        self.programmer.stage(1, 100, host_match(0), output(2), idle_timeout=30, hard_timeout=60)
+        self.programmer.stage(1, 100, host_match(1), output(2))
+        self.programmer.commit(self.datapaths)
+        flags = [m.flags for m in self.datapaths[1].sent if isinstance(m, FakeParser.OFPFlowMod)]
+        self.assertEqual(sorted(flags), [0, FakeOFProto.OFPFF_SEND_FLOW_REM])
+
+        # The switch timed the entry out: forgetting it must not send a delete or a re-add
+        key = flow_key(host_match(0), 100)
+        self.assertTrue(self.programmer.expired(1, key))
+        self.assertFalse(self.programmer.expired(1, key))
+        self.programmer.forget(1)
+        fresh = FakeDatapath(1)
+        self.assertEqual(self.programmer.commit({1: fresh}), {1: 1})
+
+
+    def test_group_errors_switch_between_add_and_modify(self):
+        buckets = [(2, output(2)), (3, output(3))]
+        self.programmer.stage_group(1, 7, 'ff', buckets)
+        self.programmer.commit(self.datapaths)
+        add = self.datapaths[1].sent[0]
+        self.assertEqual(add.command, FakeOFProto.OFPGC_ADD)
+
+        # The group survived a reconnect, so the add fails: retry as a modify
+        self.assertTrue(self.programmer.error(1, add.xid))
+        self.datapaths[1].sent.clear()
+        self.programmer.commit(self.datapaths)
+        modify = self.datapaths[1].sent[0]
+        self.assertEqual(modify.command, FakeOFProto.OFPGC_MODIFY)
+
+        # It was gone after all: the modify fails, so add it again
+        self.assertTrue(self.programmer.error(1, modify.xid))
+        self.datapaths[1].sent.clear()
+        self.programmer.commit(self.datapaths)
+        self.assertEqual(self.datapaths[1].sent[0].command, FakeOFProto.OFPGC_ADD)
+
+
+if __name__ == '__main__':
+    unittest.main()
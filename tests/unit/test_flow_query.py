@@ -0,0 +1,85 @@
+import base64
+import json
+import unittest
+
+from controllers.flow_query import FlowQuery
+from controllers.flow_table import FlowTable
+
+
+class TestFlowQuery(unittest.TestCase):
+
+    def setUp(self):
+        self.table = FlowTable()
+        self.table.add_many(
+            (f"flow{i:03d}", {"src": f"10.0.{i % 4}.{i % 250 + 1}", "dst": f"10.1.0.{i % 250 + 1}",
+                              "priority": i % 3, "created_at": 1000.0 + i,
+                              "last_seen_packets": (i * 37) % 101, "path": ["switch1", "switch2"]})
+            for i in range(200))
+
+    def _all_pages(self, **kwargs):
+        ids, cursor = [], None
+        while True:
+            page, cursor = FlowQuery(cursor=cursor, **kwargs).run(self.table, now=1200.0)
+            ids.extend(r.flow_id for r in page)
+            if cursor is None:
+                return ids
+
+    def test_cursor_pages_cover_every_flow_once(self):
+        ids = self._all_pages(limit=7)
+        self.assertEqual(ids, sorted(self.table.ids()))
+
+    def test_filters_combine(self):
+        page, _ = FlowQuery(src="10.0.1.0/24", priority=2, min_packets=50, max_age=150,
+                            limit=1000).run(self.table, now=1200.0)
+        expected = [r for r in self.table.snapshot().values()
+                    if r.src.startswith("10.0.1.") and r.priority == 2
+                    and r.last_seen_packets >= 50 and 1200.0 - r.created_at <= 150]
+        self.assertTrue(expected)
+        self.assertEqual(sorted(r.flow_id for r in page), sorted(r.flow_id for r in expected))
+
+    def test_traffic_sort_pages_in_descending_order(self):
+        ids = self._all_pages(sort="traffic", limit=9)
+        packets = [self.table.get(fid).last_seen_packets for fid in ids]
+        self.assertEqual(len(ids), 200)
+        self.assertEqual(packets, sorted(packets, reverse=True))
+
+    def test_cursor_survives_writes_between_pages(self):
+        first, cursor = FlowQuery(limit=10).run(self.table)
+        self.table.remove(first[-1].flow_id)
+        self.table.add("flow000a", {"src": "10.0.0.1", "dst": "10.1.0.1"})
+        second, _ = FlowQuery(limit=10, cursor=cursor).run(self.table)
+        self.assertEqual(second[0].flow_id, "flow010")
+
+    def test_projection_and_json_output(self):
+        query = FlowQuery(fields=["src", "path"], limit=3)
+        page, cursor = query.run(self.table)
+        body = json.loads(''.join(query.iter_json(page, cursor)))
+        self.assertEqual(body["count"], 3)
+        self.assertEqual(body["flows"][0], {"id": "flow000", "src": "10.0.0.1", "path": ["switch1", "switch2"]})
+        self.assertEqual(body["next_cursor"], cursor)
+
+    def test_bad_arguments_raise_value_error(self):
+        for args in ({"limit": "0"}, {"sort": "size"}, {"fields": "src,bogus"},
+                     {"src": "10.0.0.300/24"}, {"cursor": "!!"}, {"min_age": "old"}):
+            with self.assertRaises(ValueError):
+                FlowQuery.from_args(args)
+
+    def test_cursor_from_another_sort_or_of_the_wrong_shape_is_rejected(self):
+        _, by_id = FlowQuery(limit=5).run(self.table)
+        _, by_traffic = FlowQuery(sort="traffic", limit=5).run(self.table)
+        with self.assertRaises(ValueError):
+            FlowQuery.from_args({"sort": "traffic", "cursor": by_id})
+        with self.assertRaises(ValueError):
+            FlowQuery.from_args({"cursor": by_traffic})
+        for key in (["traffic", "flow001", 3], ["id", 7], ["id"], ["traffic", True, "a"], {"id": 1}, "id"):
+            cursor = base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+            with self.assertRaises(ValueError):
+                FlowQuery.from_args({"sort": "traffic", "cursor": cursor})
+            with self.assertRaises(ValueError):
+                FlowQuery.from_args({"cursor": cursor})
+        page, _ = FlowQuery.from_args({"sort": "traffic", "cursor": by_traffic}).run(self.table)
+        self.assertEqual(len(page), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
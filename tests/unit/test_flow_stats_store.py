@@ -0,0 +1,70 @@
+import unittest
+from collections import namedtuple
+
+import numpy as np
+
+from monitoring.collectors.flow_stats_store import FlowStatsStore
+
+FlowStats = namedtuple('FlowStats', 'table_id priority match packet_count byte_count')
+
+
+class Match(dict):
+    def items(self):
+        return sorted(super(Match, self).items())
+
+
+class TestFlowStatsStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = FlowStatsStore(max_flows=4, depth=3)
+
+    def test_rates_from_reply(self):
+        body = [FlowStats(0, 100, Match(ipv4_dst="10.0.1.1"), 10, 1000),
+                FlowStats(0, 100, Match(ipv4_dst="10.0.1.2"), 0, 0)]
+        self.store.ingest_reply(1, body, timestamp=100.0)
+        body = [FlowStats(0, 100, Match(ipv4_dst="10.0.1.1"), 30, 5000),
+                FlowStats(0, 100, Match(ipv4_dst="10.0.1.2"), 5, 500)]
+        self.store.ingest_reply(1, body, timestamp=110.0)
+        top = self.store.top_flows(1)
+        self.assertEqual(len(top), 1)
+        dpid, key, pkt_rate, byte_rate = top[0]
+        self.assertEqual((dpid, key), (1, (0, 100, (("ipv4_dst", "10.0.1.1"),))))
+        self.assertAlmostEqual(pkt_rate, 2.0)
+        self.assertAlmostEqual(byte_rate, 400.0)
+        self.assertEqual(self.store.switch_totals(), {1: (2, 2.5, 450.0)})
+
+    def test_ring_wraps_and_counter_reset(self):
+        for i, packets in enumerate([10, 20, 30, 40, 5]):
+            self.store.ingest(1, ["a"], [packets], [packets * 100], timestamp=float(i))
+        self.assertEqual(self.store.count[self.store._rows[1]["a"]], 3)
+        # 40 -> 5 means the flow was reinstalled; no negative rate
+        self.assertEqual(self.store.top_flows(1)[0][2:], (0.0, 0.0))
+        self.store.ingest(1, ["a"], [15], [1500], timestamp=5.0)
+        self.assertEqual(self.store.top_flows(1)[0][2:], (10.0, 1000.0))
+
+    def test_duplicate_keys_keep_last(self):
+        self.store.ingest(1, ["a", "a"], [1, 2], [10, 20], timestamp=0.0)
+        row = self.store._rows[1]["a"]
+        self.assertEqual(self.store.packets[row, 0], 2)
+        self.assertEqual(len(self.store), 1)
+
+    def test_fixed_capacity_evicts_oldest(self):
+        self.store.ingest(1, ["a", "b"], [1, 1], [1, 1], timestamp=1.0)
+        self.store.ingest(2, ["c", "d"], [1, 1], [1, 1], timestamp=2.0)
+        self.store.ingest(1, ["a", "e"], [2, 1], [2, 1], timestamp=3.0)
+        self.assertEqual(len(self.store), 4)
+        self.assertEqual(self.store.evictions, 1)
+        self.assertNotIn("b", self.store._rows[1])
+        self.assertIn("a", self.store._rows[1])
+        with self.assertRaises(ValueError):
+            self.store.ingest(3, list("vwxyz"), np.ones(5), np.ones(5), timestamp=4.0)
+
+    def test_forget_switch(self):
+        self.store.ingest(1, ["a", "b"], [1, 1], [1, 1], timestamp=1.0)
+        self.store.forget_switch(1)
+        self.assertEqual(len(self.store), 0)
+        self.assertEqual(self.store.top_flows(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+import threading
+import unittest
+
+from controllers.flow_table import FlowTable
+from controllers.flow_timeouts import FlowTimeouts
+from controllers.rule_compiler import RuleCompiler
+
+
+def flow(src, dst, priority=100, path=None, **extra):
+    data = {"src": src, "dst": dst, "priority": priority, "created_at": 1}
+    if path:
+        data["path"] = path
+    data.update(extra)
+    return data
+
+
+class TestFlowTable(unittest.TestCase):
+
+    def setUp(self):
+        self.table = FlowTable()
+        self.table.add("f1", flow("10.0.0.1", "10.0.1.1", 100, ["switch1", "switch2"]))
+        self.table.add("f2", flow("10.0.0.2", "10.0.1.130", 200, ["switch1", "switch3", "switch4"]))
+        self.table.add("f3", flow("10.0.2.3", "10.0.3.3", 100))
+
+    def ids(self, records):
+        return sorted(r.flow_id for r in records)
+
+    def test_round_trip(self):
+        data = self.table.get("f1").to_dict()
+        self.assertEqual(data, {"src": "10.0.0.1", "dst": "10.0.1.1", "priority": 100,
+                                "created_at": 1, "path": ["switch1", "switch2"]})
+        self.table.add("f4", flow("10.0.0.4", "10.0.1.4", owner="ops"))
+        self.assertEqual(self.table.get("f4").to_dict()["owner"], "ops")
+
+    def test_secondary_indexes(self):
+        self.assertEqual(self.ids(self.table.by_priority(100)), ["f1", "f3"])
+        self.assertEqual(self.ids(self.table.by_link("switch2", "switch1")), ["f1"])
+        self.assertEqual(self.ids(self.table.by_link("switch3", "switch4")), ["f2"])
+        self.assertEqual(self.ids(self.table.by_src_prefix("10.0.0.0/24")), ["f1", "f2"])
+        self.assertEqual(self.ids(self.table.by_dst_prefix("10.0.1.128/25")), ["f2"])
+        self.assertEqual(self.ids(self.table.by_dst_prefix("10.0.0.0/16")), ["f1", "f2", "f3"])
+        self.assertEqual(self.table.by_dst_prefix("192.168.0.0/16"), [])
+
+    def test_update_reindexes(self):
+        self.table.update("f1", path=["switch1", "switch3", "switch4"], priority=300)
+        self.assertEqual(self.table.by_link("switch1", "switch2"), [])
+        self.assertEqual(self.ids(self.table.by_link("switch1", "switch3")), ["f1", "f2"])
+        self.assertEqual(self.ids(self.table.by_priority(300)), ["f1"])
+        self.assertIsNone(self.table.update("missing", priority=1))
+
+    def test_remove(self):
+        self.assertIsNotNone(self.table.remove("f2"))
+        self.assertIsNone(self.table.remove("f2"))
+        self.assertEqual(len(self.table), 2)
+        self.assertEqual(self.table.by_priority(200), [])
+        self.assertEqual(self.ids(self.table.by_src_prefix("10.0.0.0/24")), ["f1"])
+
+    def test_remove_many(self):
+        removed = []
+        self.table.subscribe(lambda op, fid, record: removed.append((op, fid)))
+        version = self.table.version
+        self.assertEqual(self.table.remove_many(["f1", "missing", "f3"]), 2)
+        self.assertEqual(removed, [("remove", "f1"), ("remove", "f3")])
+        self.assertEqual(self.table.version, version + 1)
+        self.assertEqual(self.table.ids(), ["f2"])
+        self.assertEqual(self.table.by_priority(100), [])
+
+    def test_snapshot_is_stable(self):
+        version = self.table.version
+        snap = self.table.snapshot()
+        self.assertIs(snap, self.table.snapshot())
+        self.table.update("f1", last_seen_packets=5)
+        self.table.remove("f3")
+        self.assertGreater(self.table.version, version)
+        self.assertIn("f3", snap)
+        self.assertIsNone(snap["f1"].last_seen_packets)
+        self.assertEqual(self.table.snapshot()["f1"].last_seen_packets, 5)
+
+    def test_load_defers_indexes_until_used(self):
+        restored = FlowTable()
+        restored.load(dict(self.table.snapshot()))
+        self.assertEqual(len(restored), 3)
+        restored.remove("f2")
+        restored.add("f5", flow("10.0.0.5", "10.0.1.5", 200, ["switch1", "switch2"]))
+        self.assertEqual(self.ids(restored.by_link("switch2", "switch1")), ["f1", "f5"])
+        self.assertEqual(self.ids(restored.by_priority(200)), ["f5"])
+        self.assertEqual(self.ids(restored.by_src_prefix("10.0.0.0/24")), ["f1", "f5"])
+
+    def test_concurrent_readers_and_writers(self):
+        errors = []
+
+        def writer(base):
+            for i in range(2000):
+                fid = f"w{base}-{i}"
+                self.table.add(fid, flow(f"10.0.{base}.{i % 250}", "10.0.9.1", i % 3, ["a", "b"]))
+                self.table.update(fid, last_seen_packets=i)
+                if i % 2:
+                    self.table.remove(fid)
+
+        def reader():
+            try:
+                for _ in range(200):
+                    snap = self.table.snapshot()
+                    for record in snap.values():
+                        record.to_dict()
+                    self.table.by_link("a", "b")
+                    self.table.by_src_prefix("10.0.0.0/16")
+            except Exception as e:  # pragma: no cover - surfaced below
+                errors.append(e)
+
+        threads = [threading.Thread(target=writer, args=(b,)) for b in range(4)]
+        threads += [threading.Thread(target=reader) for _ in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self.table.by_link("a", "b")), 4000)
+
+    def test_ordered_subscribers_see_a_late_update_before_the_remove(self):
+        rules, timeouts = RuleCompiler(), FlowTimeouts(idle_timeout=30)
+        blocked, release = threading.Event(), threading.Event()
+
+        def hold_updates(seq, op, flow_id, record):
+            if op == 'update':
+                blocked.set()
+                release.wait(5)
+
+        def follow(op, flow_id, record):
+            # What run_simple's flow manager does with every change
+            hops = dict(zip(record.path, record.path[1:] + ('local',)))
+            rules.apply([(flow_id, None if op == 'remove' else
+                          (record.src, record.dst, record.priority, hops))])
+            if op == 'remove':
+                timeouts.remove(flow_id)
+            else:
+                timeouts.add(flow_id, started_at=0.0)
+
+        # Runs before the ordered subscriber and stalls the update's notification
+        self.table.subscribe(hold_updates, sequenced=True)
+        self.table.subscribe(follow, ordered=True)
+        self.table.add("f4", flow("10.0.0.4", "10.0.1.4", 100, ["switch1", "switch2"]))
+        writer = threading.Thread(target=self.table.update, args=("f4",),
+                                  kwargs={"path": ["switch1", "switch3"]})
+        writer.start()
+        self.assertTrue(blocked.wait(5))
+        # Applied after the update, but notified first: held until the update is in
+        self.table.remove("f4")
+        self.assertEqual(rules.num_entries, 2)
+        release.set()
+        writer.join()
+        self.assertEqual(rules.num_entries, 0)
+        self.assertEqual(rules.num_rules, 0)
+        self.assertNotIn("f4", timeouts)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import random
+import unittest
+
+from controllers.flow_timeouts import HARD, IDLE, FlowTimeouts
+from controllers.timer_wheel import TimerWheel
+
+
+class TestTimerWheel(unittest.TestCase):
+
+    def test_matches_a_sorted_list_across_levels(self):
+        rng = random.Random(7)
+        # Small wheels so that cascades and the horizon clamp are exercised
+        wheel = TimerWheel(tick=1.0, slot_bits=3, levels=3, now=0)
+        due, now = {}, 0
+        for _ in range(500):
+            for _ in range(rng.randint(0, 4)):
+                key = rng.randrange(100)
+                deadline = now + rng.choice([rng.uniform(0, 8), rng.uniform(0, 80), rng.uniform(0, 2000)])
+                wheel.schedule(key, deadline)
+                due[key] = max(-(-deadline // 1), now + 1)
+            if due and rng.random() < 0.2:
+                key = rng.choice(list(due))
+                self.assertTrue(wheel.cancel(key))
+                del due[key]
+            now += rng.choice([1, 1, 2, 13])
+            expected = {key for key, when in due.items() if when <= now}
+            self.assertEqual(set(wheel.advance(now)), expected)
+            for key in expected:
+                del due[key]
+        self.assertEqual(len(wheel), len(due))
+
+    def test_reschedule_moves_the_deadline(self):
+        wheel = TimerWheel(now=100)
+        wheel.schedule("a", 110)
+        wheel.schedule("a", 400)
+        self.assertEqual(wheel.advance(399), [])
+        self.assertEqual(wheel.deadline("a"), 400)
+        self.assertEqual(wheel.advance(400), ["a"])
+        self.assertNotIn("a", wheel)
+
+
+class TestFlowTimeouts(unittest.TestCase):
+
+    def setUp(self):
+        self.timeouts = FlowTimeouts(idle_timeout=30, hard_timeout=60, now=0)
+
+    def test_idle_timeout_refreshed_by_activity(self):
+        self.timeouts.add("f1", now=0)
+        self.timeouts.add("f2", now=0)
+        self.timeouts.observe_packets("f1", 0, now=5)
+        self.timeouts.observe_packets("f1", 12, now=20)
+        self.assertEqual(self.timeouts.expire(now=30), [("f2", IDLE)])
+        self.assertEqual(self.timeouts.deadline("f1"), 50)
+        self.timeouts.touch("f1", now=45)
+        self.assertEqual(self.timeouts.expire(now=59), [])
+        # Still busy, but the hard timeout is absolute
+        self.timeouts.touch("f1", now=59)
+        self.assertEqual(self.timeouts.expire(now=60), [("f1", HARD)])
+        self.assertEqual(self.timeouts.expired, {IDLE: 1, HARD: 1})
+        self.assertEqual(len(self.timeouts), 0)
+
+    def test_per_flow_timeouts_and_start_time(self):
+        self.timeouts.add("restored", now=100, started_at=45)
+        self.timeouts.add("forever", now=100, idle_timeout=0, hard_timeout=0)
+        self.timeouts.add("short", now=100, idle_timeout=5, hard_timeout=0)
+        self.assertNotIn("forever", self.timeouts)
+        self.assertEqual(self.timeouts.expire(now=104), [])
+        self.assertEqual(sorted(self.timeouts.expire(now=105)), [("restored", HARD), ("short", IDLE)])
+        self.timeouts.add("gone", now=105)
+        self.assertTrue(self.timeouts.remove("gone"))
+        self.assertEqual(self.timeouts.expire(now=1000), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import socket
+import struct
+import unittest
+
+from controllers.forwarding import (IGNORED, INSTALLED, SUPPRESSED, UNROUTABLE, Forwarder,
+                                    controller_meter, ipv4_pair, table_miss)
+from controllers.path_engine import DEFAULT_TOPOLOGY_FILE, PathEngine, TopologyGraph
+from controllers.ryu.flow_programmer import FlowProgrammer
+from tests.fake_datapath import FakeDatapath, FakeOFProto, FakeParser
+
+
+def frame(src, dst, vlan=False):
+    eth = b'\x00\x00\x00\x00\x00\x02\x00\x00\x00\x00\x00\x01'
+    if vlan:
+        eth += b'\x81\x00\x00\x0a'
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20, 0, 0, 64, 17, 0,
+                     socket.inet_aton(src), socket.inet_aton(dst))
+    return eth + b'\x08\x00' + ip
+
+
+class TestForwarding(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = TopologyGraph.from_file(DEFAULT_TOPOLOGY_FILE)
+        self.engine = PathEngine(self.graph)
+        self.programmer = FlowProgrammer()
+        self.datapaths = {dpid: FakeDatapath(dpid) for dpid in self.graph.dpids}
+        self.forwarder = Forwarder(self.programmer, self.engine, FakeOFProto, FakeParser)
+
+    def commit(self):
+        return sum(self.programmer.commit(self.datapaths).values())
+
+    def deliver(self, dpid, src, dst):
+        """dpid of the switch that delivers the packet locally, or None"""
+        fields = {'eth_type': 0x0800, 'ipv4_src': src, 'ipv4_dst': dst}
+        for _ in range(len(self.datapaths)):
+            port = self.datapaths[dpid].forward(fields)
+            if port == FakeOFProto.OFPP_NORMAL:
+                return dpid
+            if port is None:
+                return None
+            node = self.graph.dpids[dpid]
+            link = self.graph.ports[(node, port)]
+            a, b = self.graph.link_ends[link]
+            peer = b if a == node else a
+            dpid = next(d for d, n in self.graph.dpids.items() if n == peer)
+        return None
+
+    def test_ipv4_pair_reads_only_the_addresses(self):
+        self.assertEqual(ipv4_pair(frame("10.0.0.1", "10.0.3.7")), ("10.0.0.1", "10.0.3.7"))
+        self.assertEqual(ipv4_pair(frame("10.0.0.1", "10.0.3.7", vlan=True)), ("10.0.0.1", "10.0.3.7"))
+        arp = b'\x00' * 12 + b'\x08\x06' + b'\x00' * 28
+        self.assertIsNone(ipv4_pair(arp))
+        self.assertIsNone(ipv4_pair(frame("10.0.0.1", "10.0.3.7")[:20]))
+
+    def test_first_packet_installs_the_path_and_duplicates_are_suppressed(self):
+        verdict, port = self.forwarder.packet_in(1, frame("10.0.0.1", "10.0.3.7"), now=0)
+        self.assertEqual(verdict, INSTALLED)
+        sent = self.commit()
+        self.assertGreaterEqual(sent, 2)
+        self.assertEqual(self.deliver(1, "10.0.0.1", "10.0.3.7"), 4)
+        self.assertEqual(self.datapaths[1].output_port(
+            {'eth_type': 0x0800, 'ipv4_src': "10.0.0.1", 'ipv4_dst': "10.0.3.7"}, 11), port)
+
+        # Packets that raced the flow-mods, at the ingress or further along
+        for dpid in (1, 1, 4):
+            verdict, port = self.forwarder.packet_in(dpid, frame("10.0.0.1", "10.0.3.7"), now=0.5)
+            self.assertEqual(verdict, SUPPRESSED)
+            self.assertIsNotNone(port)
+        self.assertEqual(self.commit(), 0)
+        self.assertEqual(self.forwarder.stats[SUPPRESSED], 3)
+
+        # Once the hold is over a packet-in means the rules are gone: set up again
+        self.assertEqual(self.forwarder.packet_in(1, frame("10.0.0.1", "10.0.3.7"), now=5)[0], INSTALLED)
+        self.assertEqual(self.forwarder.pending, 1)
+
+    def test_unknown_destinations_and_other_protocols(self):
+        for _ in range(3):
+            self.assertEqual(self.forwarder.packet_in(1, frame("10.0.0.1", "192.0.2.1"), now=0),
+                             (UNROUTABLE, None))
+        self.assertEqual(self.forwarder.packet_in(1, b'\x00' * 12 + b'\x08\x06' + b'\x00' * 28),
+                         (IGNORED, None))
+        self.assertEqual(self.commit(), 0)
+
+    def test_proactive_rules_reach_every_subnet(self):
+        staged = self.forwarder.proactive()
+        self.assertEqual(staged, len(self.graph.subnets) * len(self.datapaths))
+        self.commit()
+        for network, owner in self.graph.subnets:
+            host = str(network.network_address + 9)
+            owner_dpid = next(d for d, n in self.graph.dpids.items() if n == owner)
+            for dpid in self.datapaths:
+                self.assertEqual(self.deliver(dpid, "10.9.9.9", host), owner_dpid)
+
+        # A link failure only touches the switches whose next hop changed
+        self.engine.set_link_state(("switch1", "switch2"), False)
+        self.forwarder.proactive()
+        self.assertLess(self.commit(), staged)
+
+    def test_reroute_moves_reactive_pairs_off_a_failed_link(self):
+        self.forwarder.packet_in(1, frame("10.0.0.1", "10.0.3.7"), now=0)
+        self.forwarder.packet_in(3, frame("10.0.2.1", "10.0.0.5"), now=0)
+        self.commit()
+        link = self.graph.link_id(("switch1", "switch2"))
+        self.engine.set_link_state(link, False)
+        self.assertEqual(self.forwarder.reroute([link]), 1)
+        self.assertGreater(self.commit(), 0)
+        self.assertEqual(self.deliver(1, "10.0.0.1", "10.0.3.7"), 4)
+        self.assertIsNone(self.datapaths[2].output_port(
+            {'eth_type': 0x0800, 'ipv4_src': "10.0.0.1", 'ipv4_dst': "10.0.3.7"}, 11))
+        # The pair on switch3 -> switch1 did not cross the link
+        self.assertEqual(self.deliver(3, "10.0.2.1", "10.0.0.5"), 1)
+
+        # With no path left the rules are withdrawn
+        self.engine.set_link_state(("switch1", "switch3"), False)
+        self.forwarder.reroute([self.graph.link_id(("switch1", "switch3"))])
+        self.commit()
+        self.assertIsNone(self.deliver(1, "10.0.0.1", "10.0.3.7"))
+        self.assertIsNone(self.deliver(3, "10.0.2.1", "10.0.0.5"))
+
+    def test_prune_drops_routes_whose_rules_expired(self):
+        self.forwarder.packet_in(1, frame("10.0.0.1", "10.0.3.7"), now=0)
+        self.commit()
+        self.assertEqual((self.forwarder.prune(), self.forwarder.routes), (0, 1))
+        for key in list(self.programmer.desired[1]):
+            self.programmer.expired(1, key)
+        self.assertEqual((self.forwarder.prune(), self.forwarder.routes), (1, 0))
+
+    def test_table_miss_goes_through_the_packet_in_meter(self):
+        dp = self.datapaths[1]
+        for msg in controller_meter(dp, rate=500, burst=50):
+            dp.send_msg(msg)
+        flags, bands = dp.meter_table[1]
+        self.assertTrue(flags & FakeOFProto.OFPMF_PKTPS)
+        self.assertEqual((bands[0].rate, bands[0].burst_size), (500, 50))
+
+        table_miss(self.programmer, 1, FakeOFProto, FakeParser)
+        self.commit()
+        flow_mod = [m for m in dp.sent if isinstance(m, FakeParser.OFPFlowMod)][0]
+        self.assertEqual(flow_mod.priority, 0)
+        self.assertIsInstance(flow_mod.instructions[0], FakeParser.OFPInstructionMeter)
+        self.assertEqual(dp.forward({'eth_type': 0x0800}), FakeOFProto.OFPP_CONTROLLER)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+
+from prometheus_client import CollectorRegistry
+
+from controllers.path_engine import DEFAULT_TOPOLOGY_FILE, TopologyGraph
+from monitoring.collectors.link_metrics import LinkMeter, build_probe, parse_probe
+
+
+class TestLinkMeter(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = TopologyGraph.from_file(DEFAULT_TOPOLOGY_FILE)
+        self.updates = []
+        self.registry = CollectorRegistry()
+        self.meter = LinkMeter(self.graph, registry=self.registry,
+                               on_update=lambda link, u: self.updates.append((link, u)))
+        # switch1 port 1 -> switch2 (100Mbps)
+        self.link = self.graph.link_id(('switch1', 'switch2'))
+
+    def test_utilisation_from_counter_delta(self):
+        self.assertIsNone(self.meter.update_port(1, 1, 0, timestamp=0.0))
+        # 25 Mbit/s over 2 seconds on a 100Mbps link
+        link = self.meter.update_port(1, 1, 25e6 / 8 * 2, timestamp=2.0)
+        self.assertEqual(link, self.link)
+        self.assertAlmostEqual(self.meter.utilisation[link], 0.25)
+        self.assertEqual(self.updates, [(link, self.meter.utilisation[link])])
+        value = self.registry.get_sample_value('link_utilisation_ratio', {'link': 'switch1-switch2'})
+        self.assertAlmostEqual(value, 0.25)
+
+    def test_busier_direction_wins_and_only_changed_ports_update(self):
+        self.meter.update_ports(1, [(1, 0), (2, 0)], timestamp=0.0)
+        self.meter.update_ports(2, [(1, 0)], timestamp=0.0)
+        self.meter.update_ports(2, [(1, 50e6 / 8)], timestamp=1.0)
+        self.meter.update_ports(1, [(1, 10e6 / 8)], timestamp=1.0)
+        self.assertAlmostEqual(self.meter.utilisation[self.link], 0.5)
+        self.assertEqual([link for link, _ in self.updates], [self.link, self.link])
+        self.assertAlmostEqual(self.meter.switch_utilisation(1), 0.5)
+
+    def test_counter_reset_and_unknown_port(self):
+        self.meter.update_port(1, 1, 10 ** 9, timestamp=0.0)
+        self.meter.update_port(1, 1, 100e6 / 8 / 10, timestamp=1.0)
+        self.assertAlmostEqual(self.meter.utilisation[self.link], 0.1)
+        self.assertIsNone(self.meter.update_port(1, 99, 5, timestamp=1.0))
+        self.assertIsNone(self.meter.update_port(42, 1, 5, timestamp=1.0))
+
+    def test_probe_latency_removes_control_legs(self):
+        frame = build_probe(1, 1, sent_at=100.0)
+        self.assertEqual(parse_probe(frame), (1, 1, 100.0))
+        self.assertIsNone(parse_probe(b'\x00' * 64))
+        self.meter.record_echo(1, 0.004)
+        self.meter.record_echo(2, 0.006)
+        link, latency = self.meter.record_probe(1, 1, 100.0, received_at=100.015)
+        self.assertEqual(link, self.link)
+        self.assertAlmostEqual(latency, 0.010)
+        stats = self.meter.link_stats()['switch1-switch2']
+        self.assertAlmostEqual(stats['latency_ms'], 10.0)
+        self.assertEqual(stats['latency_samples'], 1)
+        count = self.registry.get_sample_value('link_latency_seconds_count', {'link': 'switch1-switch2'})
+        self.assertEqual(count, 1.0)
+
+    def test_collector_observes_each_probe_sample_once(self):
+        from prometheus_client import REGISTRY
+        from monitoring.collectors.async_scraper import ScrapeTarget
+        from run_monitoring import NetworkMetricsCollector
+
+        collector = NetworkMetricsCollector()
+        target = ScrapeTarget("controller", "http://x/links", kind='links')
+        link = 'test-switch1-switch2'
+
+        def scrape():
+            stats = self.meter.link_stats()['switch1-switch2']
+            collector.handle(target, {link: stats})
+            return REGISTRY.get_sample_value('link_latency_seconds_count', {'link': link}) or 0
+
+        self.assertEqual(scrape(), 0)
+        self.meter.record_probe(1, 1, 100.0, received_at=100.01)
+        # The cached latency comes back on every scrape until the next probe
+        self.assertEqual([scrape() for _ in range(3)], [1, 1, 1])
+        self.meter.record_probe(1, 1, 101.0, received_at=101.01)
+        self.assertEqual(scrape(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+import random
+import threading
+import unittest
+
+from controllers.path_engine import (PathEngine, TopologyGraph, parse_bandwidth,
+                                     parse_latency)
+
+TOPOLOGY = {
+    "topology": {
+        "switches": [
+            {"id": "switch1", "links": [
+                {"target": "switch2", "bandwidth": "100Mbps", "latency": "10ms"},
+                {"target": "switch3", "bandwidth": "100Mbps", "latency": "15ms"}]},
+            {"id": "switch2", "links": [
+                {"target": "switch1", "bandwidth": "100Mbps", "latency": "10ms"},
+                {"target": "switch4", "bandwidth": "50Mbps", "latency": "20ms"}]},
+            {"id": "switch3", "links": [
+                {"target": "switch1", "bandwidth": "100Mbps", "latency": "15ms"},
+                {"target": "switch4", "bandwidth": "75Mbps", "latency": "25ms"}]},
+            {"id": "switch4", "links": [
+                {"target": "switch2", "bandwidth": "50Mbps", "latency": "20ms"},
+                {"target": "switch3", "bandwidth": "75Mbps", "latency": "25ms"}]},
+        ]
+    }
+}
+
+
+def grid_graph(size, seed=1):
+    rng = random.Random(seed)
+    graph = TopologyGraph()
+    for r in range(size):
+        for c in range(size):
+            if c + 1 < size:
+                graph.add_link(f"s{r}_{c}", f"s{r}_{c + 1}", rng.choice([50, 100]), rng.uniform(1, 20))
+            if r + 1 < size:
+                graph.add_link(f"s{r}_{c}", f"s{r + 1}_{c}", rng.choice([50, 100]), rng.uniform(1, 20))
+    return graph
+
+
+class TestTopologyGraph(unittest.TestCase):
+
+    def test_parse_units(self):
+        self.assertEqual(parse_bandwidth("100Mbps"), 100.0)
+        self.assertEqual(parse_bandwidth("1Gbps"), 1000.0)
+        self.assertEqual(parse_latency("10ms"), 10.0)
+        self.assertEqual(parse_latency("0.5s"), 500.0)
+        with self.assertRaises(ValueError):
+            parse_bandwidth("fast")
+
+    def test_links_stored_once(self):
+        graph = TopologyGraph.from_dict(TOPOLOGY)
+        self.assertEqual(graph.num_nodes, 4)
+        self.assertEqual(graph.num_links, 4)
+        link = graph.link_id(("switch4", "switch2"))
+        self.assertEqual(graph.bandwidth[link], 50.0)
+        self.assertEqual(graph.latency[link], 20.0)
+
+
+class TestPathEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = PathEngine(TopologyGraph.from_dict(TOPOLOGY))
+
+    def test_shortest_path(self):
+        path = self.engine.shortest_path("switch1", "switch4")
+        self.assertEqual(path.nodes, ["switch1", "switch2", "switch4"])
+        self.assertAlmostEqual(path.cost, 30.0)
+
+    def test_k_shortest_paths(self):
+        paths = self.engine.k_shortest_paths("switch1", "switch4", k=3)
+        self.assertEqual([p.nodes for p in paths],
+                         [["switch1", "switch2", "switch4"], ["switch1", "switch3", "switch4"]])
+
+    def test_widest_path(self):
+        path = self.engine.widest_path("switch1", "switch4")
+        self.assertEqual(path.nodes, ["switch1", "switch3", "switch4"])
+        self.assertEqual(path.width, 75.0)
+
+    def test_congestion_reroutes(self):
+        self.engine.shortest_path("switch1", "switch4")
+        self.engine.set_utilisation(("switch1", "switch2"), 0.8)
+        path = self.engine.shortest_path("switch1", "switch4")
+        self.assertEqual(path.nodes, ["switch1", "switch3", "switch4"])
+        self.engine.set_utilisation(("switch1", "switch2"), 0.0)
+        path = self.engine.shortest_path("switch1", "switch4")
+        self.assertEqual(path.nodes, ["switch1", "switch2", "switch4"])
+
+    def test_link_down(self):
+        self.engine.set_link_state(("switch2", "switch4"), False)
+        self.assertEqual(self.engine.shortest_path("switch1", "switch4").nodes,
+                         ["switch1", "switch3", "switch4"])
+        self.assertEqual(len(self.engine.k_shortest_paths("switch1", "switch4", k=3)), 1)
+        self.engine.set_link_state(("switch1", "switch3"), False)
+        self.assertIsNone(self.engine.shortest_path("switch1", "switch4"))
+        self.assertIsNone(self.engine.widest_path("switch1", "switch4"))
+
+    def test_unrelated_update_keeps_cache(self):
+        engine = PathEngine(grid_graph(10))
+        engine.shortest_path("s0_0", "s0_3")
+        engine.k_shortest_paths("s0_0", "s0_3", k=2)
+        # A far-away link getting busier cannot change these answers
+        engine.set_utilisation(("s9_8", "s9_9"), 0.9)
+        src, dst = engine.graph.index["s0_0"], engine.graph.index["s0_3"]
+        self.assertIn(("k", src, dst, 1), engine._paths)
+        self.assertIn(("k", src, dst, 2), engine._paths)
+
+    def test_incremental_matches_fresh(self):
+        rng = random.Random(7)
+        graph = grid_graph(8)
+        engine = PathEngine(graph)
+        pairs = [(f"s{rng.randrange(8)}_{rng.randrange(8)}", f"s{rng.randrange(8)}_{rng.randrange(8)}")
+                 for _ in range(10)]
+        for _ in range(200):
+            for src, dst in pairs:
+                engine.shortest_path(src, dst)
+                engine.widest_path(src, dst)
+                engine.k_shortest_paths(src, dst, k=3)
+            link = rng.randrange(graph.num_links)
+            if rng.random() < 0.1:
+                engine.set_link_state(link, not engine.link_up[link])
+            else:
+                engine.set_utilisation(link, rng.random())
+            fresh = PathEngine(graph)
+            fresh.utilisation = list(engine.utilisation)
+            fresh.link_up = list(engine.link_up)
+            fresh.weight = list(engine.weight)
+            fresh.residual = list(engine.residual)
+            for src, dst in pairs:
+                a, b = engine.shortest_path(src, dst), fresh.shortest_path(src, dst)
+                self.assertEqual(a and round(a.cost, 9), b and round(b.cost, 9))
+                a, b = engine.widest_path(src, dst), fresh.widest_path(src, dst)
+                self.assertEqual(a and a.width, b and b.width)
+                costs = [round(p.cost, 9) for p in engine.k_shortest_paths(src, dst, k=3)]
+                self.assertEqual(costs, [round(p.cost, 9) for p in fresh.k_shortest_paths(src, dst, k=3)])
+
+    def test_frozen_holds_off_updates_from_other_threads(self):
+        engine = PathEngine(TopologyGraph.from_dict(TOPOLOGY))
+        update = threading.Thread(target=engine.set_utilisation, args=(("switch2", "switch4"), 0.9))
+        with engine.frozen():
+            before = engine.k_shortest_paths("switch1", "switch4", k=2)
+            update.start()
+            update.join(0.1)
+            self.assertTrue(update.is_alive())
+            self.assertEqual(engine.k_shortest_paths("switch1", "switch4", k=2), before)
+        update.join(1.0)
+        self.assertFalse(update.is_alive())
+        self.assertEqual(engine.shortest_path("switch1", "switch4").nodes, ["switch1", "switch3", "switch4"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import random
+import unittest
+from collections import Counter
+
+from monitoring.collectors.poll_scheduler import PollScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestPollScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.scheduler = PollScheduler(base_interval=10.0, min_interval=1.0, max_interval=30.0,
+                                       timeout=5.0, max_in_flight=1, clock=self.clock,
+                                       rng=random.Random(1))
+
+    def drain(self, until, step=0.1, answer=True):
+        sent = []
+        xid = len(sent)
+        while self.clock.now < until:
+            self.clock.now = round(self.clock.now + step, 6)
+            for dpid, kind in self.scheduler.due():
+                xid += 1
+                self.scheduler.sent(dpid, kind, xid)
+                sent.append((self.clock.now, dpid, kind, xid))
+                if answer:
+                    self.scheduler.reply(dpid, xid)
+        return sent
+
+    def test_initial_polls_are_spread(self):
+        for dpid in range(10000):
+            self.scheduler.register(dpid)
+        sent = self.drain(10.0, step=1.0)
+        self.assertEqual(len(sent), 20000)
+        per_second = Counter(int(t) for t, _, _, _ in sent)
+        # Uniformly spread over ten one-second ticks, nowhere near everything at once
+        self.assertLess(max(per_second.values()), 2600)
+
+    def test_in_flight_cap_and_multipart(self):
+        self.scheduler.register(1)
+        sent = self.drain(10.0, answer=False)
+        # One outstanding request per switch: the second kind waits
+        self.assertEqual(len(sent), 1)
+        _, dpid, kind, xid = sent[0]
+        self.assertFalse(self.scheduler.reply(dpid, xid, more=True))
+        self.assertTrue(self.scheduler.reply(dpid, xid))
+        self.assertFalse(self.scheduler.reply(dpid, xid))
+        more = self.drain(15.0, answer=False)
+        self.assertEqual(len(more), 1)
+        self.assertNotEqual(more[0][2], kind)
+
+    def test_timeout_backs_off(self):
+        self.scheduler.register(1)
+        self.drain(10.0, answer=False)
+        self.clock.now += 5.0
+        expired = self.scheduler.expire()
+        self.assertEqual(len(expired), 1)
+        self.assertEqual(self.scheduler.timeouts, 1)
+        self.assertEqual(self.scheduler.intervals[1], 20.0)
+        self.assertEqual(self.scheduler.in_flight[1], {})
+
+    def test_skipped_poll_comes_back_next_interval(self):
+        self.scheduler = PollScheduler(kinds=('flow',), base_interval=10.0, jitter=0.0,
+                                       clock=self.clock, rng=random.Random(1))
+        self.scheduler.register(1)
+        self.clock.now = 10.0
+        self.assertEqual(self.scheduler.due(), [(1, 'flow')])
+        self.scheduler.skip(1, 'flow')
+        self.assertEqual(self.scheduler.in_flight[1], {})
+        self.assertEqual(self.scheduler.next_wakeup(), 20.0)
+
+    def test_adaptive_interval(self):
+        self.scheduler.register(1)
+        self.scheduler.register(2)
+        self.scheduler.set_load(1, 0.95)
+        self.scheduler.set_load(2, 0.0)
+        self.assertEqual(self.scheduler.intervals[1], 1.0)
+        self.assertEqual(self.scheduler.intervals[2], 30.0)
+        sent = self.drain(60.0)
+        polls = Counter(dpid for _, dpid, _, _ in sent)
+        self.assertGreater(polls[1], 10 * polls[2])
+
+    def test_unregister(self):
+        self.scheduler.register(1)
+        self.scheduler.unregister(1)
+        self.assertEqual(self.drain(30.0), [])
+        self.assertIsNone(self.scheduler.next_wakeup())
+
+    def test_reregister_does_not_revive_stale_polls(self):
+        self.scheduler.register(1)
+        self.scheduler.unregister(1)
+        self.clock.now = 5.0
+        self.scheduler.register(1)
+        # Polls must follow the new registration alone, as for a switch the
+        # scheduler never saw (the same random draws, spent on another dpid)
+        expected = PollScheduler(base_interval=10.0, min_interval=1.0, max_interval=30.0,
+                                 timeout=5.0, max_in_flight=1, clock=self.clock, rng=random.Random(1))
+        expected.register(2, now=0.0)
+        expected.unregister(2)
+        expected.register(1)
+        sent = self.drain(40.0)
+        self.clock.now = 5.0
+        self.scheduler = expected
+        self.assertEqual(sent, self.drain(40.0))
+
+if __name__ == '__main__':
+    unittest.main()
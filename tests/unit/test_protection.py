@@ -0,0 +1,141 @@
+import unittest
+
+from controllers.path_engine import PathEngine, TopologyGraph
+from controllers.protection import ProtectionManager, plan_protection
+from controllers.ryu.flow_programmer import FlowProgrammer
+from tests.fake_datapath import FakeDatapath, FakeOFProto, FakeParser
+
+
+def link(target, port, latency):
+    return {"target": target, "port": port, "bandwidth": "100Mbps", "latency": f"{latency}ms"}
+
+
+# s1 - s2 - s4 is the primary; s3 and s5 offer the detours
+TOPOLOGY = {
+    "topology": {
+        "switches": [
+            {"id": "s1", "dpid": 1, "links": [link("s2", 1, 1), link("s3", 2, 5)]},
+            {"id": "s2", "dpid": 2, "links": [link("s1", 1, 1), link("s4", 2, 1), link("s3", 3, 1)]},
+            {"id": "s3", "dpid": 3, "links": [link("s1", 1, 5), link("s2", 2, 1), link("s5", 3, 1)]},
+            {"id": "s4", "dpid": 4, "links": [link("s2", 1, 1), link("s5", 2, 1)]},
+            {"id": "s5", "dpid": 5, "links": [link("s3", 1, 1), link("s4", 2, 1)]},
+        ]
+    }
+}
+
+MATCH = {"eth_type": 0x0800, "ipv4_dst": "10.0.4.1"}
+
+
+def trace(graph, datapaths, src, fields, limit=16):
+    """Follow a packet hop by hop; returns the nodes it visits, ending at
+    the delivering switch, or None if it is dropped or loops"""
+    node, in_port, visited = graph.node_id(src), None, []
+    for _ in range(limit):
+        visited.append(graph.names[node])
+        dp = datapaths[node + 1]
+        out = dp.forward(dict(fields, in_port=in_port))
+        if out == FakeOFProto.OFPP_NORMAL:
+            return visited
+        if out is None or out in dp.ports_down:
+            return None
+        link_id = graph.ports[(node, out)]
+        a, b = graph.link_ends[link_id]
+        node = b if a == node else a
+        in_port = graph.port_of[(node, link_id)]
+    return None
+
+
+def fail(graph, datapaths, engine, a, b):
+    link_id = graph.link_id((a, b))
+    for node in graph.link_ends[link_id]:
+        datapaths[node + 1].ports_down.add(graph.port_of[(node, link_id)])
+    engine.set_link_state(link_id, False)
+
+
+class TestProtection(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = TopologyGraph.from_dict(TOPOLOGY)
+        self.engine = PathEngine(self.graph)
+        self.programmer = FlowProgrammer()
+        self.datapaths = {dpid: FakeDatapath(dpid) for dpid in self.graph.dpids}
+        self.manager = ProtectionManager(self.programmer, self.engine, FakeOFProto, FakeParser)
+
+    def protect(self):
+        plan = self.manager.protect("f1", MATCH, 100, "s1", "s4")
+        self.programmer.commit(self.datapaths)
+        for dp in self.datapaths.values():
+            dp.sent.clear()
+        return plan
+
+    def test_plan_protects_every_primary_hop(self):
+        nodes = [self.graph.node_id(n) for n in ("s1", "s2", "s4")]
+        plan = plan_protection(self.engine, nodes)
+        self.assertEqual(plan.unprotected, 0)
+        backups = {self.graph.names[h.node]: h.backup_port for h in plan.hops if h.in_port is None}
+        # s1 detours via s3; s2 via s3 too, since s2-s4 and s1-s2 are banned
+        self.assertEqual(backups, {"s1": 2, "s2": 3, "s4": None, "s3": None, "s5": None})
+
+    def test_groups_go_out_before_the_flows_that_use_them(self):
+        self.manager.protect("f1", MATCH, 100, "s1", "s4")
+        self.programmer.commit(self.datapaths)
+        sent = self.datapaths[1].sent
+        self.assertIsInstance(sent[0], FakeParser.OFPGroupMod)
+        self.assertEqual(sent[0].type, FakeOFProto.OFPGT_FF)
+        self.assertEqual(trace(self.graph, self.datapaths, "s1", MATCH), ["s1", "s2", "s4"])
+
+    def test_failover_is_local_and_sends_nothing(self):
+        for a, b, expected in (("s2", "s4", ["s1", "s2", "s3", "s5", "s4"]),
+                               ("s1", "s2", ["s1", "s3", "s5", "s4"])):
+            with self.subTest(failed=(a, b)):
+                self.setUp()
+                self.protect()
+                fail(self.graph, self.datapaths, self.engine, a, b)
+                self.assertEqual(trace(self.graph, self.datapaths, "s1", MATCH), expected)
+                self.assertEqual(self.manager.link_down((a, b)), 1)
+                self.assertFalse(any(dp.sent for dp in self.datapaths.values()))
+
+    def test_detour_through_a_primary_switch_is_not_sent_back(self):
+        # s2's detour runs s2 - x - s1 - y - s3 and crosses s1, which would
+        # otherwise send it straight back to s2
+        graph = TopologyGraph.from_dict({"switches": [
+            {"id": "s1", "dpid": 1, "links": [link("s2", 1, 1), link("x", 2, 1), link("y", 3, 5)]},
+            {"id": "s2", "dpid": 2, "links": [link("s1", 1, 1), link("s3", 2, 1), link("x", 3, 1)]},
+            {"id": "s3", "dpid": 3, "links": [link("s2", 1, 1), link("y", 2, 5)]},
+            {"id": "x", "dpid": 4, "links": [link("s1", 1, 1), link("s2", 2, 1)]},
+            {"id": "y", "dpid": 5, "links": [link("s1", 1, 5), link("s3", 2, 5)]},
+        ]})
+        engine = PathEngine(graph)
+        datapaths = {dpid: FakeDatapath(dpid) for dpid in graph.dpids}
+        manager = ProtectionManager(self.programmer, engine, FakeOFProto, FakeParser)
+        manager.protect("f1", MATCH, 100, "s1", "s3")
+        self.programmer.commit(datapaths)
+        self.assertEqual(trace(graph, datapaths, "s1", MATCH), ["s1", "s2", "s3"])
+        fail(graph, datapaths, engine, "s2", "s3")
+        self.assertEqual(trace(graph, datapaths, "s1", MATCH), ["s1", "s2", "x", "s1", "y", "s3"])
+
+    def test_reoptimise_modifies_in_place(self):
+        self.protect()
+        fail(self.graph, self.datapaths, self.engine, "s2", "s4")
+        self.manager.link_down(("s2", "s4"))
+        self.assertEqual(self.manager.reoptimise(batch_size=10), ["f1"])
+        self.assertEqual(self.manager.pending, 0)
+        self.programmer.commit(self.datapaths)
+        self.assertEqual(trace(self.graph, self.datapaths, "s1", MATCH), ["s1", "s2", "s3", "s5", "s4"])
+        self.assertNotIn(self.graph.link_id(("s2", "s4")), self.manager.flows["f1"].plan.links)
+        self.assertEqual(self.manager.flows_on_link(("s2", "s4")), set())
+        dp1 = self.datapaths[1].message_counts()
+        self.assertNotIn(f"command_{FakeOFProto.OFPFC_ADD}", dp1)
+
+    def test_unprotect_removes_entries_and_groups(self):
+        self.protect()
+        self.assertTrue(self.manager.unprotect("f1"))
+        self.programmer.commit(self.datapaths)
+        for dp in self.datapaths.values():
+            self.assertEqual(dp.flow_table, {})
+            self.assertEqual(dp.group_table, {})
+        self.assertFalse(self.manager.unprotect("f1"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import gzip
+import json
+import unittest
+
+from flask import Flask, request
+
+from controllers.response_cache import ResponseCache, accepts
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = ResponseCache(min_compress_size=100)
+        self.state = {"version": 1, "items": list(range(200))}
+        self.built = 0
+        app = Flask(__name__)
+
+        def build():
+            self.built += 1
+            return dict(self.state)
+
+        @app.route('/items')
+        def items():
+            return self.cache.respond('items', self.state['version'], build, request)
+
+        self.client = app.test_client()
+
+    def test_body_is_built_once_per_version(self):
+        first = self.client.get('/items')
+        second = self.client.get('/items')
+        self.assertEqual(first.get_json()['items'][:3], [0, 1, 2])
+        self.assertEqual(first.headers['ETag'], second.headers['ETag'])
+        self.assertEqual(self.built, 1)
+        self.state['version'] = 2
+        third = self.client.get('/items')
+        self.assertNotEqual(third.headers['ETag'], first.headers['ETag'])
+        self.assertEqual(self.built, 2)
+
+    def test_if_none_match_gives_304(self):
+        etag = self.client.get('/items').headers['ETag']
+        response = self.client.get('/items', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        self.state['version'] = 2
+        self.assertEqual(self.client.get('/items', headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_gzip_when_accepted(self):
+        response = self.client.get('/items', headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.data))['version'], 1)
+        self.assertNotIn('Content-Encoding', self.client.get('/items').headers)
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+
+    def test_accept_encoding_parsing(self):
+        self.assertTrue(accepts('gzip, br', 'gzip'))
+        self.assertTrue(accepts('deflate, *;q=0.5', 'gzip'))
+        self.assertFalse(accepts('gzip;q=0, br', 'gzip'))
+        self.assertFalse(accepts('', 'gzip'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import random
+import unittest
+
+from controllers.flow_table import ip_to_int
+from controllers.rule_compiler import RuleCompiler
+
+
+def contains(prefix, address):
+    base, length = prefix
+    return (address ^ base) >> (32 - length) == 0
+
+
+def resolve(rules, src, dst):
+    """Actions of the highest-priority rules matching a packet"""
+    src, dst = ip_to_int(src), ip_to_int(dst)
+    best, actions = None, set()
+    for rule in rules:
+        if not (contains(rule.src, src) and contains(rule.dst, dst)):
+            continue
+        if best is None or rule.priority > best:
+            best, actions = rule.priority, {rule.action}
+        elif rule.priority == best:
+            actions.add(rule.action)
+    return actions
+
+
+class TestRuleCompiler(unittest.TestCase):
+
+    def setUp(self):
+        self.compiler = RuleCompiler()
+
+    def test_flows_sharing_a_path_collapse_to_one_rule(self):
+        changes = [(f"f{i}", (f"10.0.0.{i}", f"10.0.1.{255 - i}", 100, {"s1": 2, "s2": 3}))
+                   for i in range(1, 101)]
+        update = self.compiler.apply(changes)
+        self.assertEqual(self.compiler.num_rules, 2)
+        self.assertEqual(update.flow_mods, 2)
+        self.assertEqual(update.exact_flow_mods, 200)
+        self.assertEqual(update.saved, 198)
+        self.assertEqual(update.compression_ratio, 100)
+        rule, = self.compiler.rules("s1")
+        self.assertEqual(rule.match()["ipv4_dst"], ("10.0.1.0", "255.255.255.0"))
+
+        # Another host on the same path changes nothing on the switches
+        update = self.compiler.place("f200", "10.0.0.200", "10.0.1.7", 100, {"s1": 2, "s2": 3})
+        self.assertEqual((update.flow_mods, update.saved), (0, 2))
+
+    def test_lower_priority_flows_with_other_actions_are_not_captured(self):
+        self.compiler.place("low", "10.0.0.5", "10.0.1.9", 50, {"s1": 4})
+        for i in (1, 2, 3, 200):
+            self.compiler.place(f"f{i}", "10.0.0.5", f"10.0.1.{i}", 100, {"s1": 2})
+        rules = self.compiler.rules("s1")
+        self.assertEqual(resolve(rules, "10.0.0.5", "10.0.1.9"), {4})
+        for i in (1, 2, 3, 200):
+            self.assertEqual(resolve(rules, "10.0.0.5", f"10.0.1.{i}"), {2})
+        self.assertLess(len(rules), 5)
+
+    def test_higher_priority_flows_do_not_block_aggregation(self):
+        self.compiler.place("high", "10.0.0.5", "10.0.1.9", 300, {"s1": 4})
+        for i in (1, 2, 3, 200):
+            self.compiler.place(f"f{i}", "10.0.0.5", f"10.0.1.{i}", 100, {"s1": 2})
+        self.assertEqual(self.compiler.num_rules, 2)
+        self.assertEqual(resolve(self.compiler.rules("s1"), "10.0.0.5", "10.0.1.9"), {4})
+
+    def test_incremental_updates_track_the_flows(self):
+        self.compiler.place("a", "10.0.0.1", "10.0.1.1", 100, {"s1": 2, "s2": 3})
+        self.compiler.place("b", "10.0.0.2", "10.0.1.2", 100, {"s1": 2, "s2": 3})
+        # Rerouting one flow away from s2 splits the aggregate there only
+        update = self.compiler.place("b", "10.0.0.2", "10.0.1.2", 100, {"s1": 2, "s3": 1})
+        self.assertEqual(update.switches(), {"s3"})
+        self.compiler.remove("a")
+        self.assertEqual(self.compiler.rules("s2"), [])
+        self.compiler.remove("b")
+        self.assertEqual(self.compiler.num_rules, 0)
+        self.assertEqual(self.compiler.num_entries, 0)
+
+    def test_random_flows_keep_their_actions(self):
+        rng = random.Random(3)
+        flows = {}
+        for step in range(400):
+            fid = f"f{rng.randrange(150)}"
+            if fid in flows and rng.random() < 0.3:
+                del flows[fid]
+                self.compiler.remove(fid)
+            else:
+                flows[fid] = (f"10.0.{rng.randrange(2)}.{rng.randrange(16)}",
+                              f"10.0.{rng.randrange(2, 4)}.{rng.randrange(16)}",
+                              rng.choice([100, 200, 300]), rng.randrange(3))
+                src, dst, priority, action = flows[fid]
+                self.compiler.place(fid, src, dst, priority, {"s1": action})
+        rules = self.compiler.rules("s1")
+        # The winning flow per (src, dst) is the highest priority one; ties are not generated
+        winners = {}
+        for src, dst, priority, action in flows.values():
+            if priority >= winners.get((src, dst), (-1, None))[0]:
+                winners[(src, dst)] = (priority, action)
+        for (src, dst), (priority, action) in winners.items():
+            if sum(1 for f in flows.values() if f[:3] == (src, dst, priority)) > 1:
+                continue
+            self.assertEqual(resolve(rules, src, dst), {action}, (src, dst))
+        self.assertLess(len(rules), len(flows))
+
+    def test_equal_priority_rules_with_other_actions_never_overlap(self):
+        rng = random.Random(5)
+        flows = {}
+        for step in range(600):
+            fid = f"f{rng.randrange(200)}"
+            if fid in flows and rng.random() < 0.2:
+                del flows[fid]
+                self.compiler.remove(fid)
+                continue
+            flows[fid] = (f"10.0.0.{rng.randrange(64)}", f"10.0.1.{rng.randrange(64)}",
+                          rng.choice([100, 200]), rng.randrange(4))
+            src, dst, priority, action = flows[fid]
+            self.compiler.place(fid, src, dst, priority, {"s1": action})
+            if step % 50:
+                continue
+            rules = self.compiler.rules("s1")
+            for i, a in enumerate(rules):
+                for b in rules[i + 1:]:
+                    if a.priority == b.priority and a.action != b.action:
+                        self.assertFalse((contains(a.src, b.src[0]) or contains(b.src, a.src[0])) and
+                                         (contains(a.dst, b.dst[0]) or contains(b.dst, a.dst[0])),
+                                         f"{a} overlaps {b}")
+        rules = self.compiler.rules("s1")
+        for src, dst, priority, action in flows.values():
+            if any(f[:3] == (src, dst, priority) and f[3] != action for f in flows.values()):
+                continue
+            if any(f[:2] == (src, dst) and f[2] > priority for f in flows.values()):
+                continue
+            self.assertEqual(resolve(rules, src, dst), {action}, (src, dst))
+        self.assertLess(len(rules), len(flows))
+
+
+if __name__ == '__main__':
+    unittest.main()
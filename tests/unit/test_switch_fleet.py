@@ -0,0 +1,180 @@
+import asyncio
+import unittest
+
+from controllers.path_engine import DEFAULT_TOPOLOGY_FILE, TopologyGraph
+from tests.fake_datapath import FakeOFProto, FakeParser
+from tests.fake_switch_fleet import SwitchFleet, synthetic_graph
+from tests.loopback_controller import ForwardingController
+from tests.ofp_wire import (OFPBRC_BAD_TYPE, OFPET_BAD_REQUEST, OFPT_BARRIER_REQUEST,
+                            decode_instructions, decode_match, encode_instructions, encode_match,
+                            message)
+
+
+class RecordingController(ForwardingController):
+    def __init__(self, graph):
+        super(RecordingController, self).__init__(graph)
+        self.errors = []
+        self.removed = []
+        self.replies = []
+
+    def on_error(self, msg):
+        self.errors.append(msg)
+
+    def on_flow_removed(self, msg):
+        self.removed.append(msg)
+
+    def on_flow_stats(self, msg):
+        super(RecordingController, self).on_flow_stats(msg)
+        self.replies.append(msg)
+
+
+async def until(predicate, timeout=10.0):
+    """Wait for ``predicate()``, failing the test if it never holds"""
+    for _ in range(int(timeout / 0.01)):
+        if predicate():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition never held")
+
+
+def flow_mod(datapath, command, priority, match, port=None, flags=0):
+    instructions = [] if port is None else [FakeParser.OFPInstructionActions(
+        FakeOFProto.OFPIT_APPLY_ACTIONS, [FakeParser.OFPActionOutput(port)])]
+    return FakeParser.OFPFlowMod(datapath, command=command, priority=priority, flags=flags,
+                                 match=FakeParser.OFPMatch(**match), instructions=instructions,
+                                 out_port=FakeOFProto.OFPP_ANY, out_group=FakeOFProto.OFPG_ANY)
+
+
+class TestSwitchFleet(unittest.TestCase):
+
+    def run_fleet(self, body, graph=None):
+        graph = graph or TopologyGraph.from_file(DEFAULT_TOPOLOGY_FILE)
+
+        async def main():
+            controller = RecordingController(graph)
+            port = await controller.start()
+            fleet = SwitchFleet(graph)
+            try:
+                await fleet.start(port=port)
+                self.assertEqual(await fleet.wait_ready(10), len(fleet))
+                await controller.settle()
+                return await body(controller, fleet)
+            finally:
+                fleet.stop()
+                controller.stop()
+        return asyncio.run(main())
+
+    def test_match_and_instructions_round_trip(self):
+        match = {'in_port': 3, 'eth_src': '00:00:00:00:00:01', 'eth_type': 0x0800,
+                 'ipv4_dst': ('10.0.3.0', '255.255.255.0'), 'tcp_dst': 443}
+        data = encode_match(match)
+        self.assertEqual(len(data) % 8, 0)
+        self.assertEqual(decode_match(data), (match, len(data)))
+        self.assertEqual(decode_match(encode_match({})), ({}, 8))
+        instructions = [FakeParser.OFPInstructionMeter(1, FakeOFProto.OFPIT_METER),
+                        FakeParser.OFPInstructionActions(FakeOFProto.OFPIT_APPLY_ACTIONS,
+                                                         [FakeParser.OFPActionOutput(2),
+                                                          FakeParser.OFPActionGroup(7)])]
+        self.assertEqual(repr(decode_instructions(encode_instructions(instructions))), repr(instructions))
+
+    def test_handshake_installs_the_meter_and_table_miss(self):
+        async def body(controller, fleet):
+            self.assertEqual(sorted(controller.datapaths), sorted(fleet.switches))
+            for switch in fleet.switches.values():
+                self.assertIn(1, switch.meter_table)
+                self.assertEqual([(m.command, m.priority, dict(m.match)) for m in switch.flow_mods],
+                                 [(FakeOFProto.OFPFC_ADD, 0, {})])
+                self.assertEqual(set(switch.ports), {1, 2, 3})
+                self.assertEqual(switch.host_port, 3)
+            self.assertEqual(controller.datapaths[1].ports[3].name, "s1-eth3")
+        self.run_fleet(body)
+
+    def test_flow_mods_follow_openflow_semantics(self):
+        async def body(controller, fleet):
+            datapath, switch = controller.datapaths[2], fleet[2]
+            barriers = switch.received[OFPT_BARRIER_REQUEST]
+            a = {'eth_type': 0x0800, 'ipv4_dst': '10.0.3.1'}
+            b = {'eth_type': 0x0800, 'ipv4_dst': '10.0.3.2'}
+            datapath.send_msg(flow_mod(datapath, FakeOFProto.OFPFC_ADD, 10, a, port=1,
+                                       flags=FakeOFProto.OFPFF_SEND_FLOW_REM))
+            datapath.send_msg(flow_mod(datapath, FakeOFProto.OFPFC_ADD, 10, b, port=1))
+            datapath.send_msg(flow_mod(datapath, FakeOFProto.OFPFC_MODIFY_STRICT, 10, a, port=2))
+            # Modifying an entry that is not there changes nothing
+            datapath.send_msg(flow_mod(datapath, FakeOFProto.OFPFC_MODIFY_STRICT, 11, a, port=2))
+            datapath.send_msg(FakeParser.OFPBarrierRequest(datapath))
+            await until(lambda: switch.received[OFPT_BARRIER_REQUEST] > barriers)
+            ports = {dict(key[2]).get('ipv4_dst'): flow.targets()[0]
+                     for key, flow in switch.flow_table.items() if key[1] == 10}
+            self.assertEqual(ports, {'10.0.3.1': {2}, '10.0.3.2': {1}})
+            self.assertEqual(len(switch.flow_table), 3)
+            # A non-strict delete removes every entry its match covers
+            datapath.send_msg(flow_mod(datapath, FakeOFProto.OFPFC_DELETE, 0, {'eth_type': 0x0800},
+                                       port=None))
+            await until(lambda: controller.removed)
+            self.assertEqual([key[1] for key in switch.flow_table], [0])
+            self.assertEqual([dict(msg.match) for msg in controller.removed], [a])
+        self.run_fleet(body)
+
+    def test_flow_stats_are_split_and_counters_grow(self):
+        async def body(controller, fleet):
+            datapath, switch = controller.datapaths[1], fleet[1]
+            for i in range(2000):
+                datapath.send_msg(flow_mod(datapath, FakeOFProto.OFPFC_ADD, 20,
+                                           {'eth_type': 0x0800, 'ipv4_dst': f"10.1.{i // 256}.{i % 256}"},
+                                           port=1))
+            controller.poll()
+            await until(lambda: len(controller.replies) == 4)
+            await asyncio.sleep(0.1)
+            controller.poll()
+            await until(lambda: len(controller.replies) == 8)
+            self.assertEqual(len(switch.flow_table), 2001)
+            # 2001 entries of 96 bytes do not fit in one 64 KB reply
+            first, second = [msg.body for msg in controller.replies if msg.datapath is datapath][-2:]
+            self.assertEqual(len(first), 2001)
+            before = {(s.priority, tuple(s.match.items())): s.packet_count for s in first}
+            grown = sum(1 for s in second if s.packet_count > before[(s.priority, tuple(s.match.items()))])
+            self.assertGreater(grown, 1900)
+            self.assertEqual(len(controller.flow_stats.top_flows(5)), 5)
+        self.run_fleet(body)
+
+    def test_link_down_is_reported_and_stops_its_counters(self):
+        async def body(controller, fleet):
+            graph = controller.graph
+            link = graph.link_id(("switch1", "switch2"))
+            fleet.set_link(link, False)
+            await until(lambda: not controller.path_engine.link_up[link])
+            self.assertFalse(controller.path_engine.link_up[link])
+            self.assertTrue(all(controller.path_engine.link_up[l] for l in range(graph.num_links) if l != link))
+            port = fleet[1].ports[graph.port_of[(graph.dpids[1], link)]]
+            self.assertFalse(port.up)
+            self.assertEqual(port.transmitted(0), port.transmitted(10 ** 9))
+            fleet.set_link(link, True)
+            await until(lambda: controller.path_engine.link_up[link])
+            self.assertTrue(controller.path_engine.link_up[link])
+        self.run_fleet(body)
+
+    def test_unsupported_messages_get_an_error(self):
+        async def body(controller, fleet):
+            datapath = controller.datapaths[3]
+            # OFPT_TABLE_MOD
+            datapath.transport.write(message(17, 99, b'\0' * 8))
+            await until(lambda: controller.errors)
+            self.assertEqual([(e.xid, e.type, e.code) for e in controller.errors],
+                             [(99, OFPET_BAD_REQUEST, OFPBRC_BAD_TYPE)])
+        self.run_fleet(body)
+
+    def test_synthetic_graph_is_cabled_on_both_ends(self):
+        graph = synthetic_graph(300, degree=4, seed=1)
+        self.assertEqual(sorted(graph.dpids), list(range(1, 301)))
+        for link, (u, v) in enumerate(graph.link_ends):
+            self.assertIn((u, link), graph.port_of)
+            self.assertIn((v, link), graph.port_of)
+        self.assertEqual(graph.node_for_host("10.1.10.7"), 266)
+
+        async def body(controller, fleet):
+            self.assertEqual(len(controller.datapaths), 300)
+        self.run_fleet(body, graph)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import threading
+import unittest
+
+import numpy as np
+
+from controllers.path_engine import PathEngine, TopologyGraph
+from controllers.te_optimizer import TrafficEngineeringOptimizer
+
+
+def diamond():
+    graph = TopologyGraph()
+    graph.add_link("switch1", "switch2", 100, 10)
+    graph.add_link("switch1", "switch3", 100, 15)
+    graph.add_link("switch2", "switch4", 50, 20)
+    graph.add_link("switch3", "switch4", 75, 25)
+    return graph
+
+
+class TestTrafficEngineeringOptimizer(unittest.TestCase):
+
+    def setUp(self):
+        self.optimizer = TrafficEngineeringOptimizer(PathEngine(diamond()))
+
+    def test_splits_commodity_across_paths(self):
+        placement = self.optimizer.optimise(["switch1"] * 10, ["switch4"] * 10, [10] * 10)
+        # All on the shortest path would load switch2-switch4 to 2.0
+        self.assertAlmostEqual(placement.max_utilisation, 0.8)
+        self.assertAlmostEqual(placement.link_load.sum(), 200.0)
+        routes = {tuple(placement.path_of(i).nodes) for i in range(10)}
+        self.assertEqual(len(routes), 2)
+
+    def test_single_flow_takes_least_utilised_path(self):
+        placement = self.optimizer.optimise(["switch1"], ["switch4"], [5])
+        # 5/75 on switch3-switch4 beats 5/50 on the lower-latency switch2-switch4
+        self.assertEqual(placement.path_of(0).nodes, ["switch1", "switch3", "switch4"])
+
+    def test_local_and_unreachable_flows(self):
+        graph = diamond()
+        graph.add_node("island")
+        optimizer = TrafficEngineeringOptimizer(PathEngine(graph))
+        placement = optimizer.optimise(["switch1", "switch1"], ["switch1", "island"], [5, 5])
+        self.assertEqual(placement.path_of(0).nodes, ["switch1"])
+        self.assertIsNone(placement.path_of(1))
+        self.assertEqual(placement.max_utilisation, 0.0)
+
+    def test_no_flows(self):
+        placement = self.optimizer.optimise([], [], [])
+        self.assertEqual(len(placement.flow_paths), 0)
+        self.assertEqual(placement.max_utilisation, 0.0)
+
+    def test_never_worse_than_shortest_path(self):
+        rng = np.random.default_rng(3)
+        src = rng.choice(["switch1", "switch2", "switch3", "switch4"], 500)
+        dst = rng.choice(["switch1", "switch2", "switch3", "switch4"], 500)
+        demand = rng.exponential(1.0, 500)
+        optimised = self.optimizer.optimise(src, dst, demand)
+        baseline = TrafficEngineeringOptimizer(self.optimizer.path_engine, iterations=0).optimise(src, dst, demand)
+        self.assertLessEqual(optimised.max_utilisation, baseline.max_utilisation + 1e-9)
+        self.assertGreater(optimised.link_load.sum(), 0.0)
+
+    def test_placement_is_consistent_while_links_change(self):
+        engine = self.optimizer.path_engine
+        stop = threading.Event()
+        errors = []
+
+        def churn():
+            rng = np.random.default_rng(4)
+            try:
+                for i in range(10 ** 6):
+                    if stop.is_set():
+                        return
+                    link = int(rng.integers(engine.graph.num_links))
+                    engine.set_utilisation(link, float(rng.random()))
+                    engine.set_link_state(link, i % 7 != 0)
+                    if i % 20 == 0:
+                        # Grow the graph between (and during) placements
+                        new = engine.add_link("switch4", f"edge{i}", 10, 1)
+                        engine.set_link_state(new, True)
+            except Exception as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=churn)
+        thread.start()
+        try:
+            for _ in range(100):
+                placement = self.optimizer.optimise(["switch1"] * 20, ["switch4"] * 20, [1] * 20)
+                self.assertEqual(len(placement.link_load), len(placement.capacity))
+                for i in range(20):
+                    path = placement.path_of(i)
+                    if path is not None:
+                        self.assertTrue(all(link < len(placement.capacity) for link in path.links))
+        finally:
+            stop.set()
+            thread.join()
+        self.assertEqual(errors, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from controllers.path_engine import DEFAULT_TOPOLOGY_FILE, PathEngine, TopologyGraph
+from controllers.topology_compiler import (DEFAULT_SWITCH_CONFIG_FILE, CompiledTopology,
+                                           compile_file, compile_topology, load_topology)
+
+
+class TestTopologyCompiler(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        with open(DEFAULT_TOPOLOGY_FILE) as f:
+            self.source = json.load(f)
+        self.path = compile_file(output_file=os.path.join(self.directory, 'topology.bin'))
+        self.compiled = CompiledTopology.open(self.path)
+
+    def test_json_view_matches_source(self):
+        self.assertEqual(self.compiled.to_dict(), self.source)
+        self.assertEqual(self.compiled.meta["default_flow"]["idle_timeout"], 30)
+        self.assertEqual(self.compiled.string('description', 0), "Main switch for handling traffic.")
+        self.assertEqual(self.compiled['node_of_port'].tolist(), [6633, 6633, 6633, -1])
+
+    def test_graph_matches_json_graph(self):
+        expected, graph = TopologyGraph.from_dict(self.source), self.compiled.graph()
+        for attr in ('names', 'adj', 'link_ends', 'bandwidth', 'latency', 'subnets', 'dpids',
+                     'ports', 'port_of'):
+            self.assertEqual(getattr(graph, attr), getattr(expected, attr), attr)
+        path = PathEngine(graph).shortest_path('switch1', 'switch4')
+        self.assertEqual(path.nodes, ['switch1', 'switch2', 'switch4'])
+
+    def test_json_view_round_trips_large_and_fractional_quantities(self):
+        quantities = {("switch1", "switch2"): ("1Tbps", "0.001ms"),
+                      ("switch1", "switch3"): ("2.5Gbps", "0.25s"),
+                      ("switch2", "switch4"): ("0.3Mbps", "12.345ms"),
+                      ("switch3", "switch4"): ("123456789.125Mbps", 1e-7)}
+        for switch in self.source["topology"]["switches"]:
+            for link in switch["links"]:
+                pair = tuple(sorted((switch["id"], link["target"])))
+                link["bandwidth"], link["latency"] = quantities[pair]
+        view = CompiledTopology(compile_topology(self.source)).to_dict()
+        self.assertIn('"1000000Mbps"', json.dumps(view))
+        expected, graph = TopologyGraph.from_dict(self.source), TopologyGraph.from_dict(view)
+        self.assertEqual(graph.bandwidth, expected.bandwidth)
+        self.assertEqual(graph.latency, expected.latency)
+
+    def test_columns_are_read_only_views_of_the_mapping(self):
+        for name, column in self.compiled.columns.items():
+            self.assertFalse(column.flags.owndata, name)
+            self.assertFalse(column.flags.writeable, name)
+        nodes, links, ports = self.compiled.neighbours(1)
+        self.assertEqual((nodes.tolist(), ports.tolist()), ([0, 3], [1, 2]))
+        self.assertTrue(np.shares_memory(nodes, self.compiled['adj_node']))
+
+    def test_in_memory_compile_and_bad_magic(self):
+        data = compile_topology(self.source)
+        self.assertEqual(CompiledTopology(data).num_links, 4)
+        with self.assertRaises(ValueError):
+            CompiledTopology(b'NOTATOPO' + data[8:])
+
+    def test_load_recompiles_when_source_changes(self):
+        topology_file = os.path.join(self.directory, 'topology.json')
+        compiled_file = os.path.join(self.directory, 'cached.bin')
+        shutil.copy(DEFAULT_TOPOLOGY_FILE, topology_file)
+        self.assertEqual(load_topology(topology_file, DEFAULT_SWITCH_CONFIG_FILE, compiled_file).num_nodes, 4)
+        self.source["topology"]["switches"].append({"id": "switch5", "links": [
+            {"target": "switch4", "bandwidth": "1Gbps", "latency": "2ms"}]})
+        with open(topology_file, 'w') as f:
+            json.dump(self.source, f)
+        os.utime(topology_file, (os.path.getmtime(compiled_file) + 10,) * 2)
+        compiled = load_topology(topology_file, DEFAULT_SWITCH_CONFIG_FILE, compiled_file)
+        self.assertEqual((compiled.num_nodes, compiled.num_links), (5, 5))
+        self.assertEqual(compiled['link_bandwidth'][-1], 1000.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
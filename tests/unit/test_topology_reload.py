@@ -0,0 +1,147 @@
+import copy
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from controllers.path_engine import DEFAULT_TOPOLOGY_FILE, PathEngine, TopologyGraph
+from controllers.topology_reload import ConfigWatcher, TopologyReloader, diff_graphs
+from controllers.topology_store import LINK_ADD, LINK_DOWN, LINK_UP, TopologyStore
+
+
+def switch(data, switch_id):
+    return next(s for s in data["topology"]["switches"] if s["id"] == switch_id)
+
+
+def link(data, a, b):
+    return next(l for l in switch(data, a)["links"] if l["target"] == b)
+
+
+def drop_link(data, a, b):
+    for x, y in ((a, b), (b, a)):
+        switch(data, x)["links"].remove(link(data, x, y))
+
+
+class TestTopologyReload(unittest.TestCase):
+
+    def setUp(self):
+        with open(DEFAULT_TOPOLOGY_FILE) as f:
+            self.source = json.load(f)
+        self.graph = TopologyGraph.from_dict(self.source)
+        self.store = TopologyStore.from_graph(self.graph)
+        self.engine = PathEngine(self.graph)
+        self.reloader = TopologyReloader(self.engine, self.store, assume_up=True)
+
+        def follow_store(events):
+            for event in events:
+                if event.kind in (LINK_ADD, LINK_UP, LINK_DOWN):
+                    dpid, port_no = event.data['link'][:2]
+                    link_id = self.graph.ports.get((self.graph.dpids.get(dpid), port_no))
+                    if link_id is not None:
+                        self.engine.set_link_state(link_id, event.kind == LINK_UP or
+                                                   event.data.get('up', False))
+        self.store.subscribe(follow_store)
+
+    def edited(self, edit):
+        data = copy.deepcopy(self.source)
+        edit(data)
+        return TopologyGraph.from_dict(data)
+
+    def test_diff_reports_structural_changes(self):
+        def edit(data):
+            drop_link(data, "switch1", "switch2")
+            link(data, "switch3", "switch4")["bandwidth"] = "40Mbps"
+            link(data, "switch4", "switch3")["bandwidth"] = "40Mbps"
+            switch(data, "switch2")["subnet"] = "10.0.9.0/24"
+        diff = diff_graphs(self.graph, self.edited(edit))
+        self.assertEqual(list(diff.removed_links), [("switch1", "switch2")])
+        self.assertEqual(list(diff.changed_links), [("switch3", "switch4")])
+        self.assertEqual((diff.added_links, diff.added_nodes), ({}, []))
+        self.assertEqual(diff.changed_nodes, ["switch2"])
+        self.assertEqual(diff.degraded_links(), [("switch1", "switch2"), ("switch3", "switch4")])
+        self.assertTrue(diff_graphs(self.graph, TopologyGraph.from_dict(self.source)).empty)
+
+    def test_removed_link_is_tombstoned_and_can_come_back(self):
+        self.assertEqual(self.engine.shortest_path("switch1", "switch4").nodes, ["switch1", "switch2", "switch4"])
+        link_id = self.graph.link_id(("switch1", "switch2"))
+        self.reloader.apply(self.edited(lambda d: drop_link(d, "switch1", "switch2")))
+
+        self.assertEqual(self.graph.num_links, 4)
+        self.assertFalse(self.engine.link_up[link_id])
+        self.assertEqual(len(self.store.links()), 3)
+        self.assertEqual(self.engine.shortest_path("switch1", "switch4").nodes, ["switch1", "switch3", "switch4"])
+        self.assertTrue(self.reloader.diff(self.edited(lambda d: drop_link(d, "switch1", "switch2"))).empty)
+
+        diff = self.reloader.apply(TopologyGraph.from_dict(self.source))
+        self.assertEqual(list(diff.added_links), [("switch1", "switch2")])
+        self.assertEqual(self.graph.link_id(("switch1", "switch2")), link_id)
+        self.assertTrue(self.engine.link_up[link_id])
+        self.assertEqual(len(self.store.links()), 4)
+        self.assertEqual(self.engine.shortest_path("switch1", "switch4").nodes, ["switch1", "switch2", "switch4"])
+
+    def test_new_switch_and_link(self):
+        self.engine.shortest_path("switch1", "switch4")
+
+        def edit(data):
+            data["topology"]["switches"].append({"id": "switch5", "dpid": 5, "subnet": "10.0.5.0/24", "links": [
+                {"target": "switch4", "port": 1, "bandwidth": "1Gbps", "latency": "1ms"}]})
+            switch(data, "switch4")["links"].append(
+                {"target": "switch5", "port": 9, "bandwidth": "1Gbps", "latency": "1ms"})
+        diff = self.reloader.apply(self.edited(edit))
+
+        self.assertEqual(diff.added_nodes, ["switch5"])
+        self.assertEqual(self.graph.node_for_host("10.0.5.7"), self.graph.index["switch5"])
+        self.assertIn(5, self.store.switches())
+        self.assertEqual(len(self.engine.link_up), 5)
+        path = self.engine.shortest_path("switch1", "switch5")
+        self.assertEqual(path.nodes, ["switch1", "switch2", "switch4", "switch5"])
+        self.assertEqual(self.graph.ports[(self.graph.index["switch4"], 9)], path.links[-1])
+
+    def test_capacity_change_reroutes(self):
+        def edit(data):
+            for a, b in (("switch2", "switch4"), ("switch4", "switch2")):
+                link(data, a, b)["latency"] = "100ms"
+        diff = self.reloader.apply(self.edited(edit))
+        self.assertEqual(diff.degraded_links(), [("switch2", "switch4")])
+        self.assertEqual(self.graph.latency[self.graph.link_id(("switch2", "switch4"))], 100.0)
+        self.assertEqual(self.engine.shortest_path("switch1", "switch4").nodes, ["switch1", "switch3", "switch4"])
+
+    def test_apply_waits_for_readers_holding_the_engine(self):
+        new_graph = self.edited(lambda d: drop_link(d, "switch1", "switch2"))
+        ports = dict(self.graph.ports)
+        apply = threading.Thread(target=self.reloader.apply, args=(new_graph,))
+        with self.engine.frozen():
+            apply.start()
+            apply.join(0.1)
+            # Nothing of the reload is visible while the engine is frozen
+            self.assertTrue(apply.is_alive())
+            self.assertEqual(self.graph.ports, ports)
+        apply.join(5)
+        self.assertFalse(apply.is_alive())
+        self.assertEqual(len(self.graph.ports), len(ports) - 2)
+
+
+class TestConfigWatcher(unittest.TestCase):
+
+    def test_reports_a_file_once_it_stops_changing(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "topology.json")
+        with open(path, "w") as f:
+            f.write("{}")
+        calls = []
+        watcher = ConfigWatcher([path, os.path.join(directory, "missing.json")], calls.append)
+
+        self.assertEqual(watcher.poll(), [])
+        with open(path, "w") as f:
+            f.write('{"topology": {}}')
+        self.assertEqual(watcher.poll(), [])
+        self.assertEqual(watcher.poll(), [path])
+        self.assertEqual(watcher.poll(), [])
+        self.assertEqual(calls, [[path]])
+
+
+if __name__ == '__main__':
+    unittest.main()
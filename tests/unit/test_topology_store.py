@@ -0,0 +1,72 @@
+import json
+import unittest
+
+from controllers.path_engine import DEFAULT_TOPOLOGY_FILE, TopologyGraph
+from controllers.topology_store import (LINK_ADD, LINK_DOWN, LINK_REMOVE, LINK_UP, PORT_DOWN,
+                                        SWITCH_ADD, TopologyStore, link_key)
+
+
+class TestTopologyStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = TopologyStore(log_size=8)
+        self.store.add_switch(1, ports=[1, 2])
+        self.store.add_switch(2, ports=[1])
+        self.store.add_link(1, 1, 2, 1)
+
+    def test_versions_and_events(self):
+        events = self.store.changes_since(0)
+        self.assertEqual([e.kind for e in events][:2], [SWITCH_ADD, 'port_up'])
+        self.assertEqual(events[-1].kind, LINK_ADD)
+        self.assertEqual([e.version for e in events], list(range(1, self.store.version + 1)))
+        self.assertEqual(self.store.changes_since(self.store.version), [])
+
+    def test_repeated_and_unknown_changes_are_noops(self):
+        version = self.store.version
+        self.assertEqual(self.store.port_up(1, 1), [])
+        self.assertEqual(self.store.add_link(2, 1, 1, 1), [])
+        self.assertEqual(self.store.port_up(99, 1), [])
+        self.assertEqual(self.store.remove_port(1, 42), [])
+        self.assertEqual(self.store.version, version)
+
+    def test_port_down_takes_link_down_and_back_up(self):
+        events = self.store.port_down(2, 1)
+        self.assertEqual([e.kind for e in events], [PORT_DOWN, LINK_DOWN])
+        self.assertEqual(events[1].data['link'], link_key(1, 1, 2, 1))
+        self.assertFalse(self.store.links()[link_key(1, 1, 2, 1)])
+        self.assertEqual([e.kind for e in self.store.port_up(2, 1)], ['port_up', LINK_UP])
+
+    def test_switch_removal_drops_its_links(self):
+        events = self.store.remove_switch(2)
+        self.assertEqual([e.kind for e in events], [LINK_REMOVE, 'switch_remove'])
+        self.assertEqual(self.store.links(), {})
+        self.assertIsNone(self.store.link_for_port(1, 1))
+
+    def test_log_overflow_requires_resync(self):
+        for _ in range(5):
+            self.store.port_down(1, 2)
+            self.store.port_up(1, 2)
+        self.assertIsNone(self.store.changes_since(0))
+        self.assertEqual(len(self.store.changes_since(self.store.version - 3)), 3)
+
+    def test_serialised_form_is_cached_per_version(self):
+        first = self.store.serialised()
+        self.assertIs(self.store.serialised(), first)
+        self.assertEqual(json.loads(first)['version'], self.store.version)
+        self.store.port_down(1, 2)
+        second = self.store.serialised()
+        self.assertIsNot(second, first)
+        self.assertEqual(self.store.snapshot()['switches'][0]['ports'][1], {"port_no": 2, "up": False})
+
+    def test_subscribers_and_graph_seeding(self):
+        store = TopologyStore.from_graph(TopologyGraph.from_file(DEFAULT_TOPOLOGY_FILE))
+        summary = store.summary()
+        self.assertEqual((summary['switches'], summary['links'], summary['links_up']), (4, 4, 4))
+        received = []
+        store.subscribe(received.extend)
+        store.port_down(1, 1)
+        self.assertEqual([e.kind for e in received], [PORT_DOWN, LINK_DOWN])
+
+
+if __name__ == '__main__':
+    unittest.main()
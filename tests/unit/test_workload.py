@@ -0,0 +1,161 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from controllers.flow_table import FlowTable
+from controllers.flow_timeouts import FlowTimeouts
+from controllers.workload import (FlashCrowd, Replayer, Trace, WorkloadGenerator, flash_crowd)
+
+SUBNETS = ["10.0.0.0/24", "10.0.1.0/24", "10.0.2.0/24", "10.0.3.0/24"]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class Monitor:
+    def __init__(self):
+        self.packets = 0
+
+    def count_packets(self, n=1):
+        self.packets += n
+
+
+class TestWorkloadGenerator(unittest.TestCase):
+
+    def test_same_seed_gives_the_same_trace(self):
+        def trace(seed):
+            return WorkloadGenerator(SUBNETS, rate=500, seed=seed, diurnal_amplitude=0.5,
+                                     flash_crowds=[(10, 5, 4)]).generate(60)
+        self.assertEqual(trace(1).flows.tobytes(), trace(1).flows.tobytes())
+        self.assertNotEqual(trace(1).flows.tobytes(), trace(2).flows.tobytes())
+
+    def test_arrivals_are_poisson_at_the_configured_rate(self):
+        trace = WorkloadGenerator(SUBNETS, rate=1000, seed=3).generate(100)
+        self.assertAlmostEqual(len(trace) / 100, 1000, delta=30)
+        gaps = np.diff(trace.flows['start'])
+        # Exponential gaps: the standard deviation equals the mean
+        self.assertAlmostEqual(gaps.std() / gaps.mean(), 1.0, delta=0.05)
+
+    def test_sizes_are_heavy_tailed(self):
+        trace = WorkloadGenerator(SUBNETS, rate=1000, seed=4, mean_size=1e5).generate(100)
+        sizes = np.sort(trace.flows['size'].astype(np.float64))[::-1]
+        # The largest 1% of the flows carry a large share of the bytes
+        self.assertGreater(sizes[:len(sizes) // 100].sum() / sizes.sum(), 0.2)
+        self.assertLess(np.median(sizes), 1e5)
+        exponential = WorkloadGenerator(SUBNETS, rate=1000, seed=4, mean_size=1e5,
+                                        size='exponential').generate(100)
+        self.assertAlmostEqual(exponential.flows['size'].mean(), 1e5, delta=5e3)
+
+    def test_diurnal_rate_peaks_at_the_configured_time(self):
+        generator = WorkloadGenerator(SUBNETS, rate=200, seed=5, diurnal_amplitude=0.8,
+                                      diurnal_period=100, diurnal_peak=12.5)
+        counts = np.histogram(generator.generate(100).flows['start'], bins=4, range=(0, 100))[0]
+        self.assertEqual(counts.argmax(), 0)
+        self.assertEqual(counts.argmin(), 2)
+        self.assertGreater(counts[0], 3 * counts[2])
+
+    def test_flash_crowd_converges_on_one_subnet(self):
+        generator = WorkloadGenerator(SUBNETS, rate=100, seed=6, skew=0,
+                                      flash_crowds=[FlashCrowd(20, 10, 10, dst=2)])
+        trace = generator.generate(60)
+        start, dst = trace.flows['start'], trace.subnet_index(trace.flows['dst'])
+        during = (start >= 20) & (start < 30)
+        self.assertAlmostEqual(during.sum() / 10, 1000, delta=60)
+        self.assertGreater((dst[during] == 2).mean(), 0.85)
+        self.assertLess((dst[~during] == 2).mean(), 0.5)
+        self.assertFalse((trace.subnet_index(trace.flows['src']) == dst).any())
+
+    def test_traffic_matrix_follows_the_subnet_weights(self):
+        generator = WorkloadGenerator(SUBNETS, rate=2000, seed=7, size='exponential')
+        trace = generator.generate(50)
+        matrix = trace.traffic_matrix()
+        self.assertEqual(np.trace(matrix), 0)
+        self.assertAlmostEqual(matrix.sum(), float(trace.flows['size'].sum()), delta=1)
+        share = matrix / matrix.sum()
+        self.assertLess(np.abs(share - generator.matrix).max(), 0.03)
+
+    def test_save_and_load_round_trip(self):
+        trace = WorkloadGenerator(SUBNETS, rate=100, seed=8, flash_crowds=[(5, 5, 3)]).generate(30)
+        with tempfile.TemporaryDirectory() as directory:
+            path = trace.save(os.path.join(directory, "trace.bin"))
+            # 34 bytes a flow after the header and parameters
+            self.assertLess(os.path.getsize(path) - len(trace) * 34, 1024)
+            loaded = Trace.load(path)
+            self.assertEqual(loaded.flows.tobytes(), trace.flows.tobytes())
+            self.assertEqual(loaded.subnets, trace.subnets)
+            self.assertEqual(loaded.params['seed'], 8)
+            self.assertEqual(loaded.params['flash_crowds'][0][:3], [5, 5, 3])
+            with open(path, 'r+b') as f:
+                f.write(b'NOTATRCE')
+            with self.assertRaises(ValueError):
+                Trace.load(path)
+
+    def test_events_put_every_departure_after_its_arrival(self):
+        trace = WorkloadGenerator(SUBNETS, rate=200, seed=9).generate(20)
+        times, order = trace.events()
+        n = len(trace)
+        self.assertEqual(len(times), 2 * n)
+        self.assertTrue((np.diff(times) >= 0).all())
+        position = np.empty(2 * n, dtype=np.int64)
+        position[order] = np.arange(2 * n)
+        self.assertTrue((position[:n] < position[n:]).all())
+
+    def test_flash_crowd_burst_carries_the_requested_packets(self):
+        trace = flash_crowd(SUBNETS, 5000, seed=1, duration=10)
+        self.assertAlmostEqual(int(trace.packets().sum()), 5000, delta=len(trace))
+        self.assertLessEqual(trace.duration, 20)
+        self.assertEqual(flash_crowd(SUBNETS, 5000, seed=1).flows.tobytes(), trace.flows.tobytes())
+
+
+class TestReplayer(unittest.TestCase):
+
+    def test_replay_applies_arrivals_and_departures_on_time(self):
+        trace = WorkloadGenerator(SUBNETS, rate=50, seed=10, max_duration=5).generate(20)
+        flows, monitor, clock = FlowTable(), Monitor(), FakeClock()
+        seen = []
+        flows.subscribe(lambda op, fid, record: seen.append((clock.now, op, fid)))
+        report = Replayer(trace, flows, monitor).run(speed=10, clock=clock, sleep=clock.sleep)
+        self.assertEqual(report.events, 2 * len(trace))
+        self.assertEqual(report.flows, len(trace))
+        self.assertEqual(len(flows), 0)
+        self.assertEqual(monitor.packets, int(trace.packets().sum()))
+        self.assertLessEqual(report.lag_max, 0.1 + 1e-9)
+        self.assertAlmostEqual(report.achieved_speed, 10, delta=0.5)
+        # The first flow arrives at time zero and leaves ten times faster than it lasts
+        first = trace.flows[0]
+        added = [t for t, op, fid in seen if fid == "wl0"]
+        self.assertEqual(len(added), 2)
+        self.assertAlmostEqual(added[1] - added[0], first['duration'] / 10, delta=0.11)
+        self.assertGreater(report.peak_flows, 0)
+
+    def test_replay_as_fast_as_possible_records_the_flows(self):
+        trace = WorkloadGenerator(SUBNETS, rate=1000, seed=11).generate(10)
+        flows = FlowTable()
+        added = {}
+        flows.subscribe(lambda op, fid, record: added.setdefault(fid, record) if op == 'add' else None)
+        report = Replayer(trace, flows, prefix="t").run(speed=None)
+        self.assertEqual(report.flows, len(trace))
+        record = added["t0"]
+        self.assertIn(record.dst.rsplit('.', 1)[0] + ".0/24", SUBNETS)
+        self.assertEqual(record.priority, int(trace.flows[0]['priority']))
+        self.assertEqual(record.extra['size_bytes'], int(trace.flows[0]['size']))
+        # The trace decides when flows leave, not the default timeouts
+        self.assertEqual((record.extra['idle_timeout'], record.extra['hard_timeout']), (0, 0))
+        timeouts = FlowTimeouts(idle_timeout=30, hard_timeout=60)
+        timeouts.add("t0", idle_timeout=record.extra['idle_timeout'],
+                     hard_timeout=record.extra['hard_timeout'])
+        self.assertNotIn("t0", timeouts)
+
+
+if __name__ == '__main__':
+    unittest.main()